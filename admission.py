@@ -0,0 +1,60 @@
+"""재시작 직후 학생 참여 속도 제한 (워밍업 구간에만)
+
+배포 뒤에는 모든 기기가 거의 동시에 다시 붙어 student_join(교사 조회, DELETE, INSERT)과
+get_message_history를 실행한다. 워커가 시작한 뒤 JOIN_WARMUP_SECONDS 동안은 이런 DB 작업을
+초당 JOIN_RATE개까지만 처리하고, 나머지는 순서대로 기다리게 한다. 기다릴 시간이
+JOIN_QUEUE_TIMEOUT을 넘으면 받지 않고 retry_after(초)를 돌려주며, 클라이언트는 그만큼(+ 지터) 뒤에 다시 시도한다.
+
+자리는 "다음 빈 시각"만 기억하는 가상 대기열이라 잠금이나 별도 그린렛/태스크가 필요 없다.
+세션 토큰으로 이어 붙는 참여(DB 조회 없음)는 여기를 거치지 않는다.
+"""
+import os
+import time
+
+import metrics
+
+JOIN_RATE = float(os.environ.get('JOIN_RATE', '50'))  # 0이면 제한 없음
+JOIN_WARMUP_SECONDS = float(os.environ.get('JOIN_WARMUP_SECONDS', '60'))
+JOIN_QUEUE_TIMEOUT = float(os.environ.get('JOIN_QUEUE_TIMEOUT', '10'))
+
+started = time.monotonic()
+next_slot = 0.0
+
+admitted = metrics.registry.counter('join_admitted_total', 'Joins/history loads admitted during warm-up', ('queued',))
+rejected = metrics.registry.counter('join_rejected_total', 'Joins/history loads turned away during warm-up (retry_after sent)')
+metrics.registry.gauge(
+    'join_queue_seconds', 'How long a new join would wait for admission right now',
+    callback=lambda: {(): round(max(0.0, next_slot - time.monotonic()), 3)})
+
+
+def start():
+    """워밍업 구간을 지금부터 다시 잰다 (워커 프로세스 시작 시)"""
+    global started, next_slot
+    started = time.monotonic()
+    next_slot = 0.0
+
+
+def warming_up():
+    return JOIN_RATE > 0 and time.monotonic() - started < JOIN_WARMUP_SECONDS
+
+
+def reserve():
+    """Reserve an admission slot. Returns seconds to wait before doing the work (0 = now),
+    or None if the queue is longer than JOIN_QUEUE_TIMEOUT."""
+    global next_slot
+    if not warming_up():
+        return 0.0
+    now = time.monotonic()
+    slot = max(now, next_slot)
+    wait = slot - now
+    if wait > JOIN_QUEUE_TIMEOUT:
+        rejected.inc()
+        return None
+    next_slot = slot + 1.0 / JOIN_RATE
+    admitted.inc('true' if wait > 0 else 'false')
+    return wait
+
+
+def retry_after():
+    """거절할 때 알려줄 대기 시간(초)"""
+    return round(max(1.0, next_slot - time.monotonic()), 1)
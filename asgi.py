@@ -0,0 +1,201 @@
+"""asyncio 실행 모드: python-socketio AsyncServer + psycopg 비동기 연결 풀 + uvicorn
+
+    uvicorn asgi:create_app --factory --host 0.0.0.0 --port 5000
+
+소켓 이벤트 처리는 gevent 스택과 같은 main.py의 핸들러(main.socket_handlers)를 그대로 쓴다. 핸들러는 입출력을
+모두 yield하는 제너레이터이고, 여기서는 AsyncEventIO(AsyncServer + 연결 풀)를 넘겨 drive_async()로 실행한다.
+HTTP 페이지(/teacher, /student, /metrics, /assets/ 등)는 main.create_app()의 Flask 앱을 a2wsgi로 감싸 제공하고,
+Flask 라우트(WSGI 스레드)의 socketio는 MainSocketBridge가 이 서버로 넘긴다. 접속 상태(teachers/students)와
+메트릭은 main 모듈의 것을 함께 쓴다.
+
+import만으로는 연결 풀/서버/Flask 앱을 만들지 않는다: create_app()이 만들고 풀은 시작 훅에서 연다.
+"""
+import asyncio
+import functools
+import inspect
+import os
+import threading
+import time
+
+import socketio
+from a2wsgi import WSGIMiddleware
+from psycopg import pq
+from psycopg_pool import AsyncConnectionPool
+
+import admission
+import logs
+import main
+import metrics
+
+ASGI_DB_MIN_CONNECTIONS = int(os.environ.get('ASGI_DB_MIN_CONNECTIONS', '2'))
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', '10'))  # Flask 페이지를 처리할 스레드 수
+
+
+async def drive_async(result):
+    """main.drive의 asyncio 판: yield한 값이 awaitable이면 await한 결과를, 실패하면 그 예외를 돌려보낸다.
+    취소(CancelledError)도 제너레이터 안으로 던지므로 finally의 연결 반납이 실행된다."""
+    if not inspect.isgenerator(result):
+        return result
+    value, error = None, None
+    while True:
+        try:
+            step = result.send(value) if error is None else result.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        value, error = step, None
+        if inspect.isawaitable(step):
+            try:
+                value = await step
+            except BaseException as e:
+                value, error = None, e
+
+
+class AsyncEventIO:
+    """asyncio 스택의 핸들러 입출력 (main.EventIO와 같은 메서드): 코루틴을 돌려주면 drive_async가 await한다"""
+
+    def __init__(self, sio, pool, sid=None):
+        self.sio = sio
+        self.pool = pool
+        self.sid = sid
+
+    def emit(self, event, data=None, room=None, skip_sid=None):
+        """room이 없으면 이벤트를 보낸 소켓에게만"""
+        return self.sio.emit(event, data, to=self.sid if room is None else room, skip_sid=skip_sid)
+
+    def enter_room(self, room):
+        return self.sio.enter_room(self.sid, room)
+
+    def disconnect(self, sid):
+        return self.sio.disconnect(sid)
+
+    def sleep(self, seconds):
+        return self.sio.sleep(seconds)
+
+    def start_background_task(self, handler, *args):
+        """handler(io, *args)를 새 태스크에서 끝까지 실행 (io는 sid 없는 어댑터)"""
+        self.sio.start_background_task(drive_async, handler(AsyncEventIO(self.sio, self.pool), *args))
+
+    def connect(self):
+        return self.pool.getconn()
+
+    async def release(self, conn):
+        # 핸들러가 커밋하지 않은(조회만 한) 연결은 되돌린 뒤 반납한다
+        if conn.info.transaction_status != pq.TransactionStatus.IDLE:
+            await conn.rollback()
+        await self.pool.putconn(conn)
+
+
+def event_runner(sio, pool, event, handler):
+    """AsyncServer에 등록할 함수: main.event_runner와 같은 인자로 공용 핸들러를 실행한다"""
+    async def run_event(sid, *args):
+        if event == 'connect':
+            args = args[1:]  # environ은 빼고 auth만 (Flask-SocketIO와 같게)
+        return await drive_async(handler(AsyncEventIO(sio, pool, sid), *args))
+    return functools.update_wrapper(run_event, handler)
+
+
+class MainSocketBridge:
+    """Flask 라우트(WSGI 스레드)에서 쓰는 main.socketio를 AsyncServer로 넘긴다.
+    main.py가 socketio에서 쓰는 emit/sleep/start_background_task를 모두 갖춘다 (tests/test_asgi_parity.py가 확인)."""
+
+    def __init__(self, sio):
+        self.sio = sio
+        self.loop = None  # 시작 훅에서 설정
+
+    def emit(self, event, *args, **kwargs):
+        coro = self.sio.emit(event, *args, **kwargs)
+        try:
+            return asyncio.get_running_loop().create_task(coro)
+        except RuntimeError:
+            return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def sleep(self, seconds):
+        time.sleep(seconds)  # WSGI 스레드 (/admin/profile)
+
+    def start_background_task(self, target, *args, **kwargs):
+        """라우트와 같은 동기 코드이므로 새 스레드에서 Flask 앱 컨텍스트 안에 실행한다"""
+        app = self.sio.flask_app
+
+        def run():
+            with app.app_context():
+                target(*args, **kwargs)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+class InstrumentedAsyncServer(socketio.AsyncServer):
+    """main.InstrumentedSocketIO와 같은 메트릭(이벤트 지연/오류, emit 횟수/바이트) 기록.
+    핸들러와 백그라운드 작업은 flask_app의 앱 컨텍스트 안에서 실행한다 (세션 토큰 등 main 함수가 앱 설정을 쓴다)."""
+
+    flask_app = None
+
+    def on(self, event, handler=None, namespace=None):
+        register = super().on(event, namespace=namespace)
+
+        def decorator(handler):
+            @functools.wraps(handler)
+            async def in_app_context(*args, **kwargs):
+                with self.flask_app.app_context():
+                    return await handler(*args, **kwargs)
+            register(metrics.track_async_event(event, in_app_context))
+            return handler
+        return decorator(handler) if handler else decorator
+
+    async def emit(self, event, *args, **kwargs):
+        metrics.record_emit(event)
+        return await super().emit(event, *args, **kwargs)
+
+    def start_background_task(self, target, *args, **kwargs):
+        async def in_app_context():
+            with self.flask_app.app_context():
+                return await target(*args, **kwargs)
+        return super().start_background_task(in_app_context)
+
+
+async def partition_maintenance_loop():
+    while True:
+        try:
+            await asyncio.to_thread(main.maintain_message_partitions)
+        except Exception as e:
+            logs.error('partition_maintenance_failed', error=e)
+        await asyncio.sleep(main.PARTITION_MAINTENANCE_INTERVAL)
+
+
+def create_app():
+    """uvicorn 앱 팩토리: 연결 풀, AsyncServer, Flask 앱을 만들고 main.socket_handlers를 등록한다"""
+    pool = AsyncConnectionPool(
+        os.environ.get('DATABASE_URL', ''),
+        kwargs={'sslmode': os.environ.get('DB_SSLMODE', 'prefer')},
+        min_size=ASGI_DB_MIN_CONNECTIONS,
+        max_size=max(main.DB_MAX_CONNECTIONS, ASGI_DB_MIN_CONNECTIONS),
+        timeout=main.DB_ACQUIRE_TIMEOUT,
+        open=False,
+    )
+    sio = InstrumentedAsyncServer(async_mode='asgi', cors_allowed_origins='*', serializer=main.MeteredPacket,
+                                  **main.ENGINEIO_OPTIONS)
+    bridge = MainSocketBridge(sio)
+    # HTTP 페이지용 Flask 앱: Flask-SocketIO 서버 대신 MainSocketBridge를 socketio로 쓴다
+    sio.flask_app = main.create_app(setup_db=False, background=False, socket_server=bridge)
+    for event, handler in main.socket_handlers:
+        sio.on(event, event_runner(sio, pool, event, handler))
+
+    async def startup():
+        bridge.loop = asyncio.get_running_loop()
+        if os.environ.get('SKIP_INIT_DB', 'false').lower() != 'true':
+            await asyncio.to_thread(main.init_db)
+        await pool.open(wait=True)
+        admission.start()
+        sio.start_background_task(partition_maintenance_loop)
+        sio.start_background_task(metrics.monitor_loop_lag_async)
+        logs.info('asgi_started', events=len(sio.handlers['/']), db_pool_max=pool.max_size)
+
+    async def shutdown():
+        await pool.close()
+
+    return socketio.ASGIApp(
+        sio,
+        other_asgi_app=WSGIMiddleware(sio.flask_app, workers=ASGI_WSGI_THREADS),
+        on_startup=startup,
+        on_shutdown=shutdown,
+    )
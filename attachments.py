@@ -0,0 +1,422 @@
+"""메시지 첨부 파일: 나눠 올리기(이어 올리기 가능), 내용 주소 저장, 썸네일
+
+파일은 내용의 SHA-256을 이름으로 ATTACHMENT_DIR/objects/ab/abcd... 에 한 번만 저장한다. 같은 학습지를 30명에게,
+또는 교사 10명이 보내도 디스크에는 한 벌이며, 클라이언트가 미리 해시를 알려주면 이미 있는 파일은 올리지 않는다.
+
+업로드는 HTTP로 나눠 보낸다: 시작(create_upload) → 조각(write_chunk, offset부터 이어 쓰기) → 다 받으면 finalize.
+진행 중인 업로드는 ATTACHMENT_DIR/partial/<upload_id>.part(받은 바이트) + .json(메타데이터)이라 끊기거나
+워커가 재시작되어도 파일 크기(= 받은 offset)부터 이어서 올릴 수 있다.
+이미지는 저장할 때 썸네일(JPEG)을 미리 만든다. Pillow가 없으면 썸네일만 건너뛴다. 해시와 썸네일 계산은 gevent
+워커에서는 허브의 스레드 풀에서 돌려 그동안에도 다른 소켓이 동작한다.
+내용이 같은 파일은 한 벌이지만 첨부를 쓸 수 있는 교사는 attachment_owners에 따로 기록한다 (해시만 아는 다른 교사는 못 씀).
+
+메시지에는 attachments 테이블의 id(해시)와 파일 이름만 message_attachments로 연결하고, receive_message에도
+{id, name, size, type, thumb, key} 참조만 싣는다. 파일은 main.py의 /files/<id>?key= 가 sendfile/Range/ETag로 보낸다
+(key는 서버가 id에 서명한 값이라 메시지를 받은 사람만 안다).
+DB 함수는 c.execute()의 결과를 돌려주므로 psycopg AsyncCursor(asgi.py)로 부르면 await하면 된다.
+"""
+import fcntl
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import time
+import uuid
+
+from psycopg import sql
+
+import metrics
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+try:
+    from gevent import get_hub, monkey
+except ImportError:
+    monkey = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ATTACHMENT_DIR = os.environ.get('ATTACHMENT_DIR', os.path.join(BASE_DIR, 'uploads'))
+ATTACHMENT_MAX_BYTES = int(os.environ.get('ATTACHMENT_MAX_BYTES', str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))  # 요청 하나에 받는 최대 바이트
+UPLOAD_EXPIRE_SECONDS = int(os.environ.get('UPLOAD_EXPIRE_SECONDS', str(24 * 60 * 60)))  # 끝나지 않은 업로드 보관 시간
+THUMBNAIL_SIZE = int(os.environ.get('THUMBNAIL_SIZE', '320'))
+MAX_ATTACHMENTS = 10  # 메시지 하나에 붙일 수 있는 파일 수
+NAME_MAX_LENGTH = 200
+READ_BLOCK = 256 * 1024
+
+# 브라우저에서 바로 보여 줄 이미지 형식 (SVG는 스크립트를 담을 수 있어 일반 파일로 취급)
+IMAGE_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'GIF': 'image/gif', 'WEBP': 'image/webp'}
+INLINE_TYPES = set(IMAGE_TYPES.values())
+ATTACHMENT_ID = re.compile(r'^[0-9a-f]{64}$')
+UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+uploaded_bytes = metrics.registry.counter('attachment_upload_bytes_total', 'Attachment bytes received in upload chunks')
+stored_files = metrics.registry.counter(
+    'attachments_stored_total', 'Finished attachment uploads by outcome (new file or already stored)', ('result',))
+removed_files = metrics.registry.counter('attachments_removed_total', 'Stored attachments removed because no message references them')
+
+
+class UploadError(Exception):
+    """업로드 요청이 잘못됨 (status: 돌려줄 HTTP 상태, offset: 409면 서버가 가진 바이트 수)"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def object_path(attachment_id):
+    return os.path.join(ATTACHMENT_DIR, 'objects', attachment_id[:2], attachment_id)
+
+
+def thumbnail_path(attachment_id):
+    return os.path.join(ATTACHMENT_DIR, 'thumbs', attachment_id[:2], attachment_id + '.jpg')
+
+
+def partial_path(upload_id, ext):
+    return os.path.join(ATTACHMENT_DIR, 'partial', f'{upload_id}.{ext}')
+
+
+def clean_name(name):
+    name = os.path.basename(str(name or '').replace('\\', '/')).strip()
+    return ''.join(ch for ch in name if ch.isprintable())[:NAME_MAX_LENGTH] or 'file'
+
+
+def ensure_table(c):
+    c.execute(
+        '''CREATE TABLE IF NOT EXISTS attachments
+           (id TEXT PRIMARY KEY,
+            size BIGINT NOT NULL,
+            content_type TEXT NOT NULL,
+            width INTEGER,
+            height INTEGER,
+            has_thumbnail BOOLEAN DEFAULT FALSE,
+            uploaded_by TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'''
+    )
+    c.execute("SELECT to_regclass('attachment_owners') IS NULL")
+    if c.fetchone()[0]:
+        c.execute(
+            '''CREATE TABLE attachment_owners
+               (attachment_id TEXT NOT NULL REFERENCES attachments (id) ON DELETE CASCADE,
+                teacher_code TEXT NOT NULL,
+                PRIMARY KEY (attachment_id, teacher_code))'''
+        )
+        # 이전 버전은 처음 올린 교사만 기록했다
+        c.execute(
+            '''INSERT INTO attachment_owners (attachment_id, teacher_code)
+               SELECT id, uploaded_by FROM attachments WHERE uploaded_by IS NOT NULL'''
+        )
+    c.execute(
+        '''CREATE TABLE IF NOT EXISTS message_attachments
+           (message_id INTEGER NOT NULL,
+            position SMALLINT NOT NULL,
+            attachment_id TEXT NOT NULL REFERENCES attachments (id),
+            filename TEXT NOT NULL,
+            PRIMARY KEY (message_id, position))'''
+    )
+
+
+# --- 업로드 ---
+
+def create_upload(teacher_code, name, size):
+    """Start a chunked upload and return its metadata (upload_id, offset=0, ...)."""
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+        raise UploadError('파일 크기가 올바르지 않습니다.')
+    if size > ATTACHMENT_MAX_BYTES:
+        raise UploadError(f'파일은 {ATTACHMENT_MAX_BYTES // (1024 * 1024)}MB까지 보낼 수 있습니다.', 413)
+    upload = {
+        'upload_id': uuid.uuid4().hex,
+        'teacher_code': teacher_code,
+        'name': clean_name(name),
+        'size': size,
+        'created': time.time(),
+    }
+    os.makedirs(os.path.join(ATTACHMENT_DIR, 'partial'), exist_ok=True)
+    open(partial_path(upload['upload_id'], 'part'), 'wb').close()
+    with open(partial_path(upload['upload_id'], 'json'), 'w') as f:
+        json.dump(upload, f)
+    return dict(upload, offset=0)
+
+
+def get_upload(upload_id, teacher_code):
+    """진행 중인 업로드 메타데이터 + 지금까지 받은 offset (없거나 다른 교사 것이면 UploadError 404)"""
+    try:
+        if not UPLOAD_ID.match(upload_id or ''):
+            raise FileNotFoundError
+        with open(partial_path(upload_id, 'json')) as f:
+            upload = json.load(f)
+        offset = os.path.getsize(partial_path(upload_id, 'part'))
+    except (FileNotFoundError, ValueError):
+        raise UploadError('업로드를 찾을 수 없습니다. 처음부터 다시 올려주세요.', 404) from None
+    if upload['teacher_code'] != teacher_code:
+        raise UploadError('업로드를 찾을 수 없습니다. 처음부터 다시 올려주세요.', 404)
+    return dict(upload, offset=offset)
+
+
+def write_chunk(upload, offset, stream, length):
+    """Append length bytes from stream at offset. Returns the new offset.
+
+    offset이 서버가 가진 크기와 다르면 409(UploadError.offset = 현재 크기). 중간에 끊기면 받은 만큼만 남고
+    클라이언트는 get_upload의 offset부터 다시 보낸다. 같은 업로드에 동시에 쓰면 한쪽은 409.
+    """
+    if length is None or length <= 0 or length > UPLOAD_CHUNK_SIZE:
+        raise UploadError(f'조각 크기는 1~{UPLOAD_CHUNK_SIZE}바이트여야 합니다.', 413)
+    if offset + length > upload['size']:
+        raise UploadError('파일 크기를 넘는 조각입니다.')
+    with open(partial_path(upload['upload_id'], 'part'), 'ab') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError('같은 업로드를 다른 요청이 쓰는 중입니다.', 409, upload['offset']) from None
+        current = f.seek(0, os.SEEK_END)
+        if current != offset:
+            raise UploadError('offset이 맞지 않습니다.', 409, current)
+        remaining = length
+        while remaining:
+            block = stream.read(min(READ_BLOCK, remaining))
+            if not block:
+                break
+            f.write(block)
+            remaining -= len(block)
+        received = length - remaining
+    uploaded_bytes.inc(amount=received)
+    return offset + received
+
+
+def finalize(upload):
+    """다 받은 업로드를 내용 해시 이름으로 옮기고(이미 있으면 버림) 썸네일을 만든다. 저장할 메타데이터를 돌려준다.
+    gevent 워커에서는 허브의 스레드 풀에서 실행한다 (20MB 해시/이미지 디코딩 동안 허브를 막지 않도록)."""
+    if monkey is not None and monkey.is_module_patched('threading'):
+        return get_hub().threadpool.apply(_finalize, (upload,))
+    return _finalize(upload)
+
+
+def _finalize(upload):
+    part = partial_path(upload['upload_id'], 'part')
+    digest = hashlib.sha256()
+    with open(part, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BLOCK), b''):
+            digest.update(block)
+    attachment_id = digest.hexdigest()
+    path = object_path(attachment_id)
+    if os.path.exists(path):
+        os.unlink(part)
+        os.utime(path)  # sweep_unreferenced가 방금 다시 올린 파일을 지우지 않도록
+        stored_files.inc('deduplicated')
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(part, path)
+        stored_files.inc('stored')
+    os.unlink(partial_path(upload['upload_id'], 'json'))
+    meta = describe(attachment_id, upload['name'])
+    meta['uploaded_by'] = upload['teacher_code']
+    return meta
+
+
+def describe(attachment_id, name):
+    """저장된 파일의 형식/크기를 확인하고, 이미지면 썸네일이 없을 때 만든다"""
+    path = object_path(attachment_id)
+    meta = {
+        'id': attachment_id,
+        'size': os.path.getsize(path),
+        'content_type': mimetypes.guess_type(name)[0] or 'application/octet-stream',
+        'width': None,
+        'height': None,
+        'has_thumbnail': False,
+    }
+    if Image is None:
+        return meta
+    try:
+        with Image.open(path) as img:
+            if img.format not in IMAGE_TYPES:
+                return meta
+            meta['content_type'] = IMAGE_TYPES[img.format]
+            meta['width'], meta['height'] = img.size
+            thumb = thumbnail_path(attachment_id)
+            if not os.path.exists(thumb):
+                make_thumbnail(img, thumb)
+            meta['has_thumbnail'] = True
+    except Exception:
+        # 이미지가 아니거나 깨진 파일: 일반 파일로 취급 (이름이 .png여도 inline으로 보내지 않음)
+        if meta['content_type'] in INLINE_TYPES:
+            meta['content_type'] = 'application/octet-stream'
+    return meta
+
+
+def make_thumbnail(img, dest):
+    img.draft('RGB', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))  # JPEG는 축소 디코딩
+    thumb = ImageOps.exif_transpose(img)
+    thumb.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    if thumb.mode not in ('RGB', 'L'):
+        thumb = thumb.convert('RGBA')
+        background = Image.new('RGB', thumb.size, (255, 255, 255))
+        background.paste(thumb, mask=thumb.getchannel('A'))
+        thumb = background
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = f'{dest}.{uuid.uuid4().hex}.tmp'
+    thumb.save(tmp, 'JPEG', quality=80, optimize=True)
+    os.replace(tmp, dest)
+
+
+def expire_uploads(max_age=None):
+    """끝나지 않고 오래된 업로드 조각을 지운다. 지운 개수를 돌려준다."""
+    directory = os.path.join(ATTACHMENT_DIR, 'partial')
+    cutoff = time.time() - (UPLOAD_EXPIRE_SECONDS if max_age is None else max_age)
+    removed = 0
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+                removed += name.endswith('.json')
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+# --- DB ---
+
+def save(c, meta):
+    """attachments에 한 행 (같은 내용이 이미 있으면 그대로 둠) + 올린 교사를 attachment_owners에"""
+    return c.execute(
+        '''WITH saved AS (
+             INSERT INTO attachments (id, size, content_type, width, height, has_thumbnail, uploaded_by)
+             VALUES (%(id)s, %(size)s, %(content_type)s, %(width)s, %(height)s, %(has_thumbnail)s, %(uploaded_by)s)
+             ON CONFLICT (id) DO NOTHING
+           )
+           INSERT INTO attachment_owners (attachment_id, teacher_code)
+           VALUES (%(id)s, %(uploaded_by)s)
+           ON CONFLICT DO NOTHING''',
+        meta
+    )
+
+
+def select(c, attachment_ids, teacher_code):
+    """Rows (id, size, content_type, has_thumbnail) for the given ids that teacher_code uploaded."""
+    return c.execute(
+        '''SELECT a.id, a.size, a.content_type, a.has_thumbnail
+           FROM attachments a
+           JOIN attachment_owners o ON o.attachment_id = a.id AND o.teacher_code = %s
+           WHERE a.id = ANY(%s)''',
+        (teacher_code, list(attachment_ids))
+    )
+
+
+def parse_refs(items):
+    """send_message의 attachments 값([{id, name}])을 검사해 [(id, name)]으로. 잘못된 항목은 버린다."""
+    refs = []
+    for item in (items if isinstance(items, list) else [])[:MAX_ATTACHMENTS]:
+        if isinstance(item, dict) and isinstance(item.get('id'), str) and ATTACHMENT_ID.match(item['id']):
+            refs.append((item['id'], clean_name(item.get('name'))))
+    return refs
+
+
+def build_refs(refs, rows):
+    """(id, name) 목록과 select() 결과로 receive_message에 실을 참조 목록 (저장되지 않은 id는 뺀다)"""
+    found = {row[0]: row for row in rows}
+    return [ref(attachment_id, name, found[attachment_id][1], found[attachment_id][2], found[attachment_id][3])
+            for attachment_id, name in refs if attachment_id in found]
+
+
+def ref(attachment_id, name, size, content_type, has_thumbnail):
+    """참조 하나. 보내기 전에 main.with_attachment_keys()가 key를 붙인다."""
+    return {'id': attachment_id, 'name': name, 'size': size, 'type': content_type, 'thumb': bool(has_thumbnail)}
+
+
+def link(c, message_id, refs):
+    """메시지와 첨부 참조를 연결 (build_refs 결과, 메시지 INSERT와 같은 트랜잭션에서)"""
+    return c.executemany(
+        '''INSERT INTO message_attachments (message_id, position, attachment_id, filename)
+           VALUES (%s, %s, %s, %s)''',
+        [(message_id, position, item['id'], item['name']) for position, item in enumerate(refs)]
+    )
+
+
+def unlink(c, message_ids):
+    """지우는 메시지의 첨부 연결을 지운다 (메시지 DELETE와 같은 트랜잭션에서). 파일은 sweep_unreferenced가 치운다."""
+    return c.execute('DELETE FROM message_attachments WHERE message_id = ANY(%s)', (list(message_ids),))
+
+
+def unlink_table(c, table):
+    """파티션(sql.Identifier)을 통째로 지우거나 보관하기 전에 그 안 메시지들의 첨부 연결을 지운다"""
+    return c.execute(
+        sql.SQL('DELETE FROM message_attachments ma USING {} m WHERE ma.message_id = m.id').format(table)
+    )
+
+
+def sweep_unreferenced(conn, max_age=None):
+    """어느 메시지도 가리키지 않는 첨부(행 + 파일 + 썸네일)를 지운다. 지운 개수를 돌려준다.
+
+    올린 뒤 아직 보내지 않은 파일을 지우지 않도록 UPLOAD_EXPIRE_SECONDS보다 오래된 것만 본다. 같은 내용을 다시
+    올리면 finalize가 파일 mtime을 새로 하므로, 파일 mtime도 그보다 오래돼야 지운다.
+    """
+    max_age = UPLOAD_EXPIRE_SECONDS if max_age is None else max_age
+    cutoff = time.time() - max_age
+    c = conn.cursor()
+    # 메시지와 함께 지우지 않던 이전 버전이 남긴 연결
+    c.execute(
+        '''DELETE FROM message_attachments ma
+           WHERE NOT EXISTS (SELECT 1 FROM messages m WHERE m.id = ma.message_id)'''
+    )
+    c.execute(
+        '''SELECT id FROM attachments a
+           WHERE a.created_at < NOW() - make_interval(secs => %s)
+             AND NOT EXISTS (SELECT 1 FROM message_attachments ma WHERE ma.attachment_id = a.id)''',
+        (max_age,)
+    )
+    candidates = [attachment_id for attachment_id, in c.fetchall() if _older_than(object_path(attachment_id), cutoff)]
+    if not candidates:
+        conn.commit()
+        return 0
+    c.execute(
+        '''DELETE FROM attachments a
+           WHERE a.id = ANY(%s)
+             AND NOT EXISTS (SELECT 1 FROM message_attachments ma WHERE ma.attachment_id = a.id)
+           RETURNING id''',
+        (candidates,)
+    )
+    removed = [attachment_id for attachment_id, in c.fetchall()]
+    conn.commit()
+    for attachment_id in removed:
+        for path in (object_path(attachment_id), thumbnail_path(attachment_id)):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+    removed_files.inc(amount=len(removed))
+    return len(removed)
+
+
+def _older_than(path, cutoff):
+    try:
+        return os.path.getmtime(path) < cutoff
+    except FileNotFoundError:
+        return True
+
+
+def select_for_messages(c, message_ids):
+    return c.execute(
+        '''SELECT ma.message_id, ma.attachment_id, ma.filename, a.size, a.content_type, a.has_thumbnail
+           FROM message_attachments ma
+           JOIN attachments a ON a.id = ma.attachment_id
+           WHERE ma.message_id = ANY(%s)
+           ORDER BY ma.message_id, ma.position''',
+        (list(message_ids),)
+    )
+
+
+def group_by_message(rows):
+    """select_for_messages() 결과 -> {message_id: [참조]}"""
+    grouped = {}
+    for message_id, *fields in rows:
+        grouped.setdefault(message_id, []).append(ref(*fields))
+    return grouped
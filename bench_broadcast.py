@@ -0,0 +1,72 @@
+"""학교 전체 공지 전달 시간 측정: 접속 소켓 N개(기본 5000)에 한 번에 보내기
+
+    python bench_broadcast.py [소켓 수] [반복 횟수]      (기본 5000 10)
+
+bench_memory.py와 같이 DB 없이 같은 프로세스에서 학생 폴링 연결을 열고(교사당 30명), main.deliver_announcement로
+SCHOOL_ROOM에 한 번 emit하는 시간과, 예전처럼 교사 코드마다 students_{code} 방으로 나눠 emit하는 시간을 비교한다.
+emit 시간은 모든 소켓의 전송 큐에 넣기까지이며, 이어서 모든 연결을 폴링해 빠짐없이 받았는지 확인한다
+(폴링으로 꺼내는 시간은 네트워크/웹소켓 전송을 대신하지 않으므로 참고용). 공지 한 행 저장(DB)은 포함하지 않는다.
+"""
+import statistics
+import sys
+import time
+
+import bench_memory
+import main
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def drain(client, eio_sids):
+    """모든 연결을 한 번씩 폴링해 공지를 받은 연결 수를 센다"""
+    received = 0
+    for eio_sid in eio_sids:
+        body = client.get(f'{bench_memory.ENGINEIO_PATH}&sid={eio_sid}').get_data(as_text=True)
+        received += body.count('"announcement"') > 0
+    return received
+
+
+def run(count, rounds):
+    app = bench_memory.make_app()
+    with app.app_context():
+        measure(app.test_client(), count, rounds)
+
+
+def measure(client, count, rounds):
+    started = time.perf_counter()
+    eio_sids = [bench_memory.open_student(client, i) for i in range(count)]
+    print(f'opened {count} sockets in {time.perf_counter() - started:.1f}s')
+    teacher_codes = sorted({info.teacher_code for info in main.students.values()})
+
+    def school_room(n):
+        main.deliver_announcement({'message_id': n, 'message': '공지', 'sender': '관리자',
+                                   'timestamp': main.now_kst_str(), 'announcement': 'school'}, [main.SCHOOL_ROOM])
+
+    def per_teacher(n):
+        payload = {'message_id': n, 'message': '공지', 'sender': '관리자',
+                   'timestamp': main.now_kst_str(), 'announcement': 'school'}
+        for code in teacher_codes:
+            main.socketio.emit('receive_message', payload, room=f'students_{code}')
+
+    print(f'{"method":>12} {"emits":>6} {"p50 ms":>8} {"p95 ms":>8} {"max ms":>8} {"drain s":>8} {"received":>9}')
+    for label, emits, send in (('school_room', 1, school_room), ('per_teacher', len(teacher_codes), per_teacher)):
+        times = []
+        drain_seconds = 0.0
+        received = 0
+        for n in range(rounds):
+            started = time.perf_counter()
+            send(n)
+            times.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            received = drain(client, eio_sids)
+            drain_seconds = time.perf_counter() - started
+        print(f'{label:>12} {emits:>6} {statistics.median(times):>8.2f} {percentile(times, 0.95):>8.2f} '
+              f'{max(times):>8.2f} {drain_seconds:>8.1f} {received:>9}')
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    run(args[0] if args else 5000, args[1] if len(args) > 1 else 10)
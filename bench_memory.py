@@ -0,0 +1,127 @@
+"""접속 수에 따른 메모리 측정: 연결 하나가 워커 메모리를 얼마나 쓰는지
+
+    python bench_memory.py [접속 수 ...]      (기본 10000 50000)
+    python bench_memory.py --rss-only 50000    (tracemalloc 없이 RSS만)
+
+DB 없이 같은 프로세스 안에서 main.create_app()으로 만든 앱(WSGI)에 engine.io 폴링 요청을 직접 보내 학생 연결을 연다:
+핸드셰이크 → Socket.IO connect → 세션 토큰으로 student_join(재접속 경로라 DB 조회 없음) → 응답 수신.
+접속 수가 각 단계에 이를 때마다 시작 전과 비교한 tracemalloc / RSS 증가량을 연결 수로 나눠 출력한다.
+engine.io 소켓, 핑 그린렛, 방 목록, students 레코드, 세션 토큰 처리까지 포함되며, 실제 웹소켓 그린렛과
+커널 소켓 버퍼는 포함되지 않는다. 마지막에 학생 레코드 하나를 dict로 둘 때와 비교한다.
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# 측정 중에 핑 타임아웃으로 끊기지 않도록 (소켓마다 핑 그린렛은 그대로 만들어진다)
+os.environ.setdefault('SOCKETIO_PING_INTERVAL', '3600')
+os.environ.setdefault('PRESENCE_FLUSH_INTERVAL', '3600')  # 접속 기록은 DB에 쓰지 않는다
+os.environ.setdefault('JOIN_RATE', '0')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import main
+import sessions
+
+STUDENTS_PER_TEACHER = 30
+ENGINEIO_PATH = '/socket.io/?EIO=4&transport=polling'
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def open_student(client, i):
+    """폴링 연결 하나를 열고 student_join까지 마친다. engine.io sid를 돌려준다."""
+    teacher_code = f'T{i // STUDENTS_PER_TEACHER:05d}'
+    student_name = f'학생{i % STUDENTS_PER_TEACHER + 1}'
+    main.teacher_settings[teacher_code] = True
+    token = main.issue_session_token(
+        sessions.StudentSession(teacher_code, '1', student_name, '', f'교사{teacher_code}', i + 1))
+
+    handshake = client.get(ENGINEIO_PATH).get_data(as_text=True)
+    eio_sid = json.loads(handshake[1:])['sid']
+    url = f'{ENGINEIO_PATH}&sid={eio_sid}'
+    client.post(url, data='40')
+    client.get(url)  # 40{"sid": ...}
+    event = ['student_join', {'teacher_code': teacher_code, 'student_name': student_name, 'session_token': token}]
+    client.post(url, data='42' + json.dumps(event, ensure_ascii=False))
+    reply = client.get(url).get_data(as_text=True)
+    if 'student_join_success' not in reply:
+        raise RuntimeError(f'student_join failed: {reply[:200]}')
+    return eio_sid
+
+
+def record_sizes(count=10000):
+    """학생 레코드 count개를 dict / __slots__로 만들었을 때 하나당 바이트"""
+    fields = [(f'T{i // STUDENTS_PER_TEACHER:05d}', '1', f'학생{i % STUDENTS_PER_TEACHER + 1}', f'sid{i:020d}', '교사', i + 1)
+              for i in range(count)]
+    sizes = {}
+    for label, build in (
+        ('dict', lambda f: {'teacher_code': f[0], 'class_number': f[1], 'student_name': f[2],
+                            'student_id': f[5], 'socket_id': f[3], 'teacher_name': f[4]}),
+        ('slots', lambda f: sessions.StudentSession(f[0], f[1], f[2], f[3], f[4], f[5])),
+    ):
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        records = [build(f) for f in fields]
+        sizes[label] = (tracemalloc.get_traced_memory()[0] - before) / count
+        del records
+    return sizes
+
+
+def make_app():
+    """DB/백그라운드 작업 없이 만든 앱. 세션 토큰 발급(main.issue_session_token)은 이 앱의 컨텍스트 안에서 한다."""
+    return main.create_app({'TESTING': True}, setup_db=False, background=False)
+
+
+def run(counts, trace=True):
+    app = make_app()
+    with app.app_context():
+        measure(app.test_client(), counts, trace)
+
+
+def measure(client, counts, trace):
+    open_student(client, 0)  # 첫 요청에서 생기는 캐시/지연 import는 기준에서 뺀다
+    gc.collect()
+    if trace:
+        tracemalloc.start()
+    base_traced = tracemalloc.get_traced_memory()[0] if trace else 0
+    base_rss = rss_bytes()
+    started = time.perf_counter()
+
+    opened = 0
+    print(f'{"connections":>11} {"traced B/conn":>14} {"RSS B/conn":>11} {"RSS MiB":>8} {"seconds":>8}')
+    for target in sorted(counts):
+        while opened < target:
+            opened += 1
+            open_student(client, opened)
+        gc.collect()
+        traced = (tracemalloc.get_traced_memory()[0] - base_traced) / opened if trace else float('nan')
+        rss = rss_bytes()
+        print(f'{opened:>11} {traced:>14.0f} {(rss - base_rss) / opened:>11.0f} '
+              f'{rss / 2 ** 20:>8.1f} {time.perf_counter() - started:>8.1f}')
+
+    print(f'students={len(main.students)} ping_interval={main.SOCKETIO_PING_INTERVAL} '
+          f'ping_timeout={main.SOCKETIO_PING_TIMEOUT} max_http_buffer_size={main.SOCKETIO_MAX_HTTP_BUFFER_SIZE}')
+    if trace:
+        sizes = record_sizes()
+        print(f'student record: dict {sizes["dict"]:.0f} B, __slots__ {sizes["slots"]:.0f} B')
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    run([int(arg) for arg in args] or [10000, 50000], trace='--rss-only' not in sys.argv)
@@ -0,0 +1,167 @@
+"""정적 파일 빌드: 외부 라이브러리 내려받기 → JS 압축(minify) → 내용 해시 파일명 → gzip/brotli 사본 → manifest.json
+
+    python build_assets.py
+
+static/ 아래 ASSET_SOURCES에 해당하는 파일을 static/dist/ 로 내보내고, 템플릿은 asset_url()로
+manifest의 해시 파일명을 찾는다. 내용이 바뀌면 파일명이 바뀌므로 /assets/ 응답은 immutable로 캐시한다.
+Bootstrap / Font Awesome / socket.io 클라이언트는 VENDOR_FILES의 고정 버전을 static/vendor/ 에 받아
+같은 출처에서 제공한다 (서비스 워커가 오프라인용으로 미리 캐시할 수 있도록).
+rjsmin / brotli 가 없으면 각각 압축(minify) / .br 생성만 건너뛴다.
+"""
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import urllib.parse
+import urllib.request
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+URL_PREFIX = '/assets/'
+
+# static/ 기준 경로 -> 내려받을 주소 (버전이 경로에 들어 있으므로 버전을 올리면 경로도 바꾼다)
+VENDOR_FILES = {
+    'vendor/bootstrap-5.1.3/css/bootstrap.min.css':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
+    'vendor/bootstrap-5.1.3/js/bootstrap.bundle.min.js':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js',
+    'vendor/fontawesome-6.0.0/css/all.min.css':
+        'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css',
+    'vendor/socket.io-4.0.1/socket.io.min.js':
+        'https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.0.1/socket.io.min.js',
+}
+CSS_URL_PATTERN = re.compile(r'url\((?![\'"]?(?:data:|https?:|/))[\'"]?([^)\'"?#]+)')
+
+# static/ 기준 상대 경로 glob (sw.js, manifest.json처럼 주소가 고정되어야 하는 파일은 제외)
+ASSET_SOURCES = ['js/*.js', 'vendor/*/css/*.css', 'vendor/*/js/*.js', 'vendor/*/*.js']
+# CSS가 상대 경로로 참조하는 파일은 이름을 바꾸지 않고 복사 (경로에 버전이 들어 있어 immutable 캐시 가능)
+COPY_SOURCES = ['vendor/*/webfonts/*']
+COMPRESSIBLE = ('.js', '.css', '.svg', '.json', '.txt', '.ttf')
+MIN_COMPRESS_SIZE = 512
+HASH_LENGTH = 10
+
+
+def minify(path, data):
+    if path.endswith('.js') and not path.endswith('.min.js') and rjsmin is not None:
+        return rjsmin.jsmin(data.decode('utf-8')).encode('utf-8')
+    return data
+
+
+def hashed_name(path, data):
+    root, ext = os.path.splitext(path)
+    if root.endswith('.min'):
+        root, ext = root[:-4], '.min' + ext
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}'
+
+
+def write_variants(target, data):
+    """Write target plus .gz / .br siblings for compressible assets."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+        f.write(data)
+    if not target.endswith(COMPRESSIBLE) or len(data) < MIN_COMPRESS_SIZE:
+        return
+    with open(target + '.gz', 'wb') as f:
+        # mtime=0: 같은 입력이면 같은 .gz (배포마다 ETag가 바뀌지 않도록)
+        with gzip.GzipFile(filename='', mode='wb', fileobj=f, compresslevel=9, mtime=0) as gz:
+            gz.write(data)
+    if brotli is not None:
+        with open(target + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def download(url, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with urllib.request.urlopen(url, timeout=30) as response:
+        data = response.read()
+    with open(target + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(target + '.tmp', target)
+    return data
+
+
+def fetch_vendor():
+    """Download missing VENDOR_FILES (and the fonts their CSS references). Returns the downloaded paths."""
+    fetched = []
+    for path, url in VENDOR_FILES.items():
+        target = os.path.join(STATIC_DIR, path)
+        if not os.path.isfile(target):
+            download(url, target)
+            fetched.append(path)
+        if not path.endswith('.css'):
+            continue
+        with open(target, encoding='utf-8') as f:
+            refs = sorted(set(CSS_URL_PATTERN.findall(f.read())))
+        for ref in refs:
+            ref_path = os.path.normpath(os.path.join(os.path.dirname(path), ref)).replace(os.sep, '/')
+            ref_target = os.path.join(STATIC_DIR, ref_path)
+            if not os.path.isfile(ref_target):
+                download(urllib.parse.urljoin(url, ref), ref_target)
+                fetched.append(ref_path)
+    return fetched
+
+
+def iter_sources(patterns):
+    for pattern in patterns:
+        for full in sorted(glob.glob(os.path.join(STATIC_DIR, pattern))):
+            if os.path.isfile(full):
+                yield os.path.relpath(full, STATIC_DIR).replace(os.sep, '/')
+
+
+def build(clean=True):
+    """Build static/dist and return the manifest {logical path: hashed path under dist/}."""
+    if clean and os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    manifest = {}
+    for path in iter_sources(ASSET_SOURCES):
+        with open(os.path.join(STATIC_DIR, path), 'rb') as f:
+            data = minify(path, f.read())
+        name = hashed_name(path, data)
+        write_variants(os.path.join(DIST_DIR, name), data)
+        manifest[path] = name
+    for path in iter_sources(COPY_SOURCES):
+        with open(os.path.join(STATIC_DIR, path), 'rb') as f:
+            write_variants(os.path.join(DIST_DIR, path), f.read())
+        manifest[path] = path
+    os.makedirs(DIST_DIR, exist_ok=True)
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest():
+    """Return the build manifest, or {} when build_assets.py has not been run (개발 환경)."""
+    try:
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+if __name__ == '__main__':
+    import sys
+
+    if '--no-fetch' not in sys.argv:
+        for path in fetch_vendor():
+            print(f'downloaded {path}')
+    for source, name in build().items():
+        print(f'{source} -> {URL_PREFIX}{name}')
+    if rjsmin is None:
+        print('rjsmin not installed: JS copied without minification')
+    if brotli is None:
+        print('brotli not installed: .br variants skipped')
@@ -0,0 +1,95 @@
+"""gevent 워커에서 DB 대기가 허브를 막지 않도록 하는 설정
+
+psycopg는 import 시점에 select가 gevent로 패치돼 있지 않으면 C 대기 함수(wait_c)를 고른다.
+wait_c는 libpq 소켓을 직접 poll하므로, 패치 전에 psycopg가 import되면 느린 쿼리 하나가
+워커의 모든 웹소켓(하트비트 포함)을 멈춘다.
+
+DB_IO_MODE
+    gevent   (기본) psycopg 대기를 패치된 select.poll / selectors로 고정해 쿼리를 기다리는 동안 다른 그린렛이 돈다.
+    threads  쿼리 대기(libpq I/O)를 전용 네이티브 스레드 풀(DB_THREADS개)에서 실행한다. 스레드가 모두 바쁘면
+             요청 그린렛이 자리를 기다리고, 기다리는 수는 연결 수 상한(DB_MAX_CONNECTIONS)으로 묶인다.
+             연결 수립은 gevent 경로 그대로 둔다.
+gevent 패치 없이 실행되면(스크립트, flask run) 아무것도 바꾸지 않는다.
+"""
+import os
+import selectors
+
+from psycopg import waiting
+
+import logs
+import metrics
+
+try:
+    from gevent import get_hub, monkey
+    from gevent.threadpool import ThreadPool
+except ImportError:
+    monkey = None
+
+DB_IO_MODE = os.environ.get('DB_IO_MODE', 'gevent').lower()
+DB_THREADS = int(os.environ.get('DB_THREADS', '10'))
+WAIT_INTERVAL = 0.1  # psycopg 기본값과 같게 (Ctrl-C 등 확인 주기)
+CANCEL_TIMEOUT = 5.0  # psycopg가 Ctrl-C 때 쓰는 취소 대기 시간과 같게
+
+mode = 'blocking'  # install() 이후 실제 적용된 방식: blocking | gevent | threads
+_pool = None
+
+io_mode = metrics.registry.gauge(
+    'db_io_mode', 'How database waits are performed (1 for the active mode)', ('mode',),
+    callback=lambda: {(mode,): 1})
+
+
+def gevent_patched():
+    return monkey is not None and monkey.is_module_patched('select')
+
+
+def install():
+    """Choose the wait strategy for this process. Call after monkey.patch_all(); safe to call again."""
+    global mode
+    if not gevent_patched():
+        mode = 'blocking'
+        return mode
+    # 패치 전에 psycopg가 import됐어도 패치된 select / selectors를 쓰도록 다시 묶는다
+    # (psycopg는 호출할 때마다 waiting 모듈 속성을 찾는다)
+    waiting.wait = waiting.wait_poll
+    waiting.DefaultSelector = selectors.DefaultSelector
+    mode = 'gevent'
+    if DB_IO_MODE == 'threads':
+        if getattr(waiting, 'wait_c', None) is None:
+            logs.warning('db_io_threads_unavailable', reason='psycopg C extension not installed')
+        else:
+            mode = 'threads'
+    elif DB_IO_MODE != 'gevent':
+        logs.warning('db_io_mode_unknown', value=DB_IO_MODE, using=mode)
+    return mode
+
+
+def wait_in_thread(gen, fileno, interval=WAIT_INTERVAL, cancel=None):
+    """Drive a psycopg generator to completion on the DB thread pool; the calling greenlet yields meanwhile.
+
+    If the calling greenlet is interrupted (kill, gevent.Timeout, Ctrl-C) while the query is still running,
+    cancel() is called and the thread is given CANCEL_TIMEOUT seconds to finish with the generator.
+    """
+    global _pool
+    # 풀은 현재 허브에 묶이므로 fork된 워커에서는 새로 만든다
+    if _pool is None or _pool.hub is not get_hub():
+        _pool = ThreadPool(DB_THREADS)
+    result = _pool.spawn(_drive, gen, fileno, interval)
+    try:
+        ok, value = result.get()
+    except BaseException:
+        if cancel is not None and not result.ready():
+            # 스레드는 계속 gen을 돌리고 있으므로 서버에서 쿼리를 취소하고, 스레드가 연결을 놓을 때까지 기다린다
+            cancel()
+            result.wait(CANCEL_TIMEOUT)
+        raise
+    if not ok:
+        raise value
+    return value
+
+
+def _drive(gen, fileno, interval):
+    # 예외도 값으로 돌려준다: 스레드 풀 작업이 예외로 끝나면 gevent 허브가 (호출자가 처리할 오류라도) traceback을 찍는다
+    try:
+        return True, waiting.wait_c(gen, fileno, interval)
+    except BaseException as exc:
+        return False, exc
@@ -0,0 +1,129 @@
+"""교사 → 학생 메시지 전달 추적 (샘플링된 메시지의 수신 확인 지연과 확인 비율 집계)
+
+서버는 추적 대상 메시지의 receive_message 페이로드에 trace(id, received, persisted, emitted; epoch ms)를
+싣고, 학생 클라이언트가 message_receipt로 확인을 보내면 emitted → 확인 도착까지의 지연을 기록한다.
+확인은 추적을 시작할 때 받은 대상 소켓(sid)에서 온 것만 센다. 확인을 기다리는 추적은
+TRACE_WINDOW_SECONDS 뒤에 마감되어 확인 비율이 집계된다.
+"""
+import collections
+import os
+import random
+import time
+import uuid
+
+import metrics
+
+DEFAULT_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.1'))
+TRACE_WINDOW_SECONDS = float(os.environ.get('TRACE_WINDOW_SECONDS', '30'))
+MAX_OPEN_TRACES = 5000
+SAMPLES_PER_TEACHER = 500
+
+delivery_latency = metrics.registry.histogram(
+    'message_delivery_seconds', 'Time from server emit to student receipt acknowledgement', ('teacher_code',),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+delivery_ack_ratio = metrics.registry.histogram(
+    'message_delivery_ack_ratio', 'Share of targeted sockets that acknowledged a traced message', ('teacher_code',),
+    buckets=(0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 1.0))
+traces_started = metrics.registry.counter(
+    'message_traces_started_total', 'Traced teacher messages', ('teacher_code',))
+
+sample_rates = {}  # teacher_code -> 교사가 대시보드에서 바꾼 샘플링 비율
+open_traces = collections.OrderedDict()  # trace_id -> Trace
+latency_samples = {}  # teacher_code -> deque[초]
+ack_ratio_samples = {}  # teacher_code -> deque[0~1]
+
+
+class Trace:
+    __slots__ = ('trace_id', 'teacher_code', 'message_id', 'emitted', 'expected', 'acked')
+
+    def __init__(self, trace_id, teacher_code, message_id, emitted, expected):
+        self.trace_id = trace_id
+        self.teacher_code = teacher_code
+        self.message_id = message_id
+        self.emitted = emitted
+        self.expected = expected  # 이 메시지를 보낸 학생 sid (frozenset)
+        self.acked = set()
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def get_sample_rate(teacher_code):
+    return sample_rates.get(teacher_code, DEFAULT_SAMPLE_RATE)
+
+
+def set_sample_rate(teacher_code, rate):
+    sample_rates[teacher_code] = max(0.0, min(float(rate), 1.0))
+    return sample_rates[teacher_code]
+
+
+def start(teacher_code, message_id, received, persisted, sids):
+    """Decide whether to trace this message sent to sids; return the payload 'trace' dict or None."""
+    expire()
+    expected = frozenset(sids)
+    if not expected or random.random() >= get_sample_rate(teacher_code):
+        return None
+    emitted = now_ms()
+    trace_id = uuid.uuid4().hex
+    open_traces[trace_id] = Trace(trace_id, teacher_code, message_id, emitted, expected)
+    while len(open_traces) > MAX_OPEN_TRACES:
+        finish(open_traces.popitem(last=False)[1])
+    traces_started.inc(teacher_code)
+    return {'id': trace_id, 'received': received, 'persisted': persisted, 'emitted': emitted}
+
+
+def ack(trace_id, sid):
+    """Record a student's receipt. Returns the delivery latency in seconds, or None if the trace is unknown,
+    the sid was not sent this message, or the sid already acknowledged."""
+    trace = open_traces.get(trace_id)
+    if trace is None or sid not in trace.expected or sid in trace.acked:
+        return None
+    trace.acked.add(sid)
+    latency = max(0, now_ms() - trace.emitted) / 1000
+    delivery_latency.observe(latency, trace.teacher_code)
+    latency_samples.setdefault(trace.teacher_code, collections.deque(maxlen=SAMPLES_PER_TEACHER)).append(latency)
+    if len(trace.acked) == len(trace.expected):
+        finish(open_traces.pop(trace_id))
+    return latency
+
+
+def finish(trace):
+    ratio = len(trace.acked) / len(trace.expected)
+    delivery_ack_ratio.observe(ratio, trace.teacher_code)
+    ack_ratio_samples.setdefault(trace.teacher_code, collections.deque(maxlen=SAMPLES_PER_TEACHER)).append(ratio)
+
+
+def expire():
+    cutoff = now_ms() - TRACE_WINDOW_SECONDS * 1000
+    while open_traces:
+        trace = next(iter(open_traces.values()))
+        if trace.emitted > cutoff:
+            break
+        finish(open_traces.popitem(last=False)[1])
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summary(teacher_code):
+    """Per-teacher delivery stats for the dashboard."""
+    expire()
+    latencies = list(latency_samples.get(teacher_code, ()))
+    ratios = list(ack_ratio_samples.get(teacher_code, ()))
+    pending = sum(1 for trace in open_traces.values() if trace.teacher_code == teacher_code)
+    to_ms = lambda v: None if v is None else round(v * 1000)
+    return {
+        'sample_rate': get_sample_rate(teacher_code),
+        'receipts': len(latencies),
+        'p50_ms': to_ms(percentile(latencies, 50)),
+        'p95_ms': to_ms(percentile(latencies, 95)),
+        'max_ms': to_ms(max(latencies) if latencies else None),
+        'ack_percent': round(sum(ratios) / len(ratios) * 100, 1) if ratios else None,
+        'traced_messages': len(ratios),
+        'pending_traces': pending,
+    }
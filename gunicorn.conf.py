@@ -0,0 +1,42 @@
+"""프로덕션 실행 설정: gunicorn -c gunicorn.conf.py
+
+마스터가 앱을 미리 불러오고(preload) 스키마 작업을 한 번만 실행한 뒤 gevent 워커를 fork한다.
+워커는 각자 백그라운드 작업(파티션 유지 관리, 루프 지연 측정)만 시작한다.
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import os
+import time
+
+_started = time.perf_counter()
+
+wsgi_app = 'main:create_app(setup_db=False, background=False)'
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = 'geventwebsocket.gunicorn.workers.GeventWebSocketWorker'
+
+# 접속 정보(teachers/students)가 프로세스 메모리에 있으므로 기본은 워커 1개.
+# 2개 이상으로 늘리려면 sticky session과 Socket.IO message_queue가 필요하다.
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+# 워커당 동시 클라이언트(웹소켓 포함) 수 상한
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', '2000'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+sendfile = True  # /assets/ 파일 응답을 sendfile(2)로
+preload_app = True
+
+
+def on_starting(server):
+    import main
+    if os.environ.get('SKIP_INIT_DB', 'false').lower() != 'true':
+        main.init_db()
+    main.startup_seconds.set('master', value=time.perf_counter() - _started)
+    server.log.info('startup: import %.3fs, master %.3fs, DB_MAX_CONNECTIONS=%s per worker, DB_IO_MODE=%s',
+                    main.startup_seconds.values.get(('import',), 0),
+                    time.perf_counter() - _started, main.DB_MAX_CONNECTIONS, main.db_io.mode)
+
+
+def post_worker_init(worker):
+    import main
+    main.start_background_tasks(worker.wsgi)
@@ -0,0 +1,184 @@
+"""학생 정수 id (student_identities): 교사 코드 + 반 + 이름마다 한 번 발급
+
+학생은 이름 문자열로만 구분했고 수신자는 'recipient_id LIKE %이름%', 숨김 기록은 "교사코드::이름" 키였다.
+명단을 가져올 때와 처음 참여할 때 id를 발급하고 접속 기록(students.student_id), 메시지 수신자
+(messages.recipient_student_ids, GIN 색인), 숨김(hidden_messages.student_id), 투표 응답의 키로 쓴다.
+같은 이름이어도 반이 다르면 다른 학생이다. 명단에 없는 학생은 반이 ''인 id를 받는다.
+한계: 반이 ''인 학생은 이름만으로 구분되므로, 명단에 없는 같은 이름의 학생 둘은 같은 id(같은 기록)를 쓴다.
+recipient_id에는 표시/검색용 이름 목록을 그대로 남긴다.
+DB 함수는 c.execute()의 결과를 돌려주므로 psycopg AsyncCursor(asgi.py)로 부르면 await하면 된다.
+"""
+from psycopg import sql
+
+
+def ensure_table(c):
+    """Create the identity table; issue ids for roster students the first time it is created."""
+    c.execute("SELECT to_regclass('student_identities') IS NULL")
+    created = c.fetchone()[0]
+    c.execute(
+        '''CREATE TABLE IF NOT EXISTS student_identities
+           (id SERIAL PRIMARY KEY,
+            teacher_code TEXT NOT NULL,
+            class_number TEXT NOT NULL DEFAULT '',
+            student_name TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(teacher_code, student_name, class_number))'''
+    )
+    if created:
+        c.execute(
+            '''INSERT INTO student_identities (teacher_code, class_number, student_name)
+               SELECT DISTINCT teacher_code, class_number, student_name FROM class_students
+               ON CONFLICT DO NOTHING'''
+        )
+
+
+def column_type(c, table, column):
+    c.execute(
+        '''SELECT data_type FROM information_schema.columns
+           WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s''',
+        (table, column)
+    )
+    row = c.fetchone()
+    return row[0] if row else None
+
+
+def migrate(c):
+    """이름 키로 된 기존 테이블을 한 번만 id로 옮긴다 (init_db에서 students/hidden_messages/messages를 만든 뒤)"""
+    if column_type(c, 'students', 'student_id') == 'text':
+        # 접속 기록은 시작할 때마다 비우므로 형식만 바꾼다
+        c.execute(
+            '''ALTER TABLE students
+               ALTER COLUMN student_id DROP DEFAULT,
+               ALTER COLUMN student_id TYPE INTEGER USING NULLIF(student_id, '')::integer'''
+        )
+    c.execute('CREATE INDEX IF NOT EXISTS students_student_id_idx ON students (student_id)')
+    # 고유 키가 (student_id, message_id)라 메시지 삭제/일괄 삭제/내보내기의 message_id 조회용 색인을 따로 둔다
+    c.execute('CREATE INDEX IF NOT EXISTS hidden_messages_message_id_idx ON hidden_messages (message_id)')
+
+    if column_type(c, 'hidden_messages', 'student_key') is not None:
+        # "교사코드::이름" → 그 이름의 모든 id (반마다 한 행). 예전에는 같은 이름이면 함께 숨겨졌다
+        c.execute('ALTER TABLE hidden_messages ADD COLUMN IF NOT EXISTS student_id INTEGER')
+        c.execute(
+            '''INSERT INTO student_identities (teacher_code, class_number, student_name)
+               SELECT DISTINCT h.teacher_code, '', substr(h.student_key, length(h.teacher_code) + 3)
+               FROM hidden_messages h
+               WHERE NOT EXISTS (
+                   SELECT 1 FROM student_identities i
+                   WHERE i.teacher_code = h.teacher_code
+                     AND i.student_name = substr(h.student_key, length(h.teacher_code) + 3))
+               ON CONFLICT DO NOTHING'''
+        )
+        c.execute('ALTER TABLE hidden_messages DROP CONSTRAINT IF EXISTS hidden_messages_message_id_student_key_key')
+        c.execute(
+            '''INSERT INTO hidden_messages (message_id, teacher_code, student_key, student_id, hidden_at)
+               SELECT h.message_id, h.teacher_code, h.student_key, i.id, h.hidden_at
+               FROM hidden_messages h
+               JOIN student_identities i
+                 ON i.teacher_code = h.teacher_code
+                AND i.student_name = substr(h.student_key, length(h.teacher_code) + 3)
+               WHERE h.student_id IS NULL'''
+        )
+        c.execute('DELETE FROM hidden_messages WHERE student_id IS NULL')
+        c.execute('ALTER TABLE hidden_messages DROP COLUMN student_key, ALTER COLUMN student_id SET NOT NULL')
+        c.execute(
+            '''CREATE UNIQUE INDEX IF NOT EXISTS hidden_messages_student_message_key
+               ON hidden_messages (student_id, message_id)'''
+        )
+
+    if column_type(c, 'messages', 'recipient_student_ids') is None:
+        c.execute('ALTER TABLE messages ADD COLUMN recipient_student_ids INTEGER[]')
+        backfill_recipients(c, sql.Identifier('messages'))
+        c.execute(
+            '''CREATE INDEX IF NOT EXISTS messages_recipient_ids_idx
+               ON messages USING GIN (recipient_student_ids)'''
+        )
+
+    if column_type(c, 'messages', 'sender_student_id') is None:
+        # 학생이 보낸 메시지의 보낸 학생 id. 예전에는 이름(sender_id)만 저장했다
+        c.execute('ALTER TABLE messages ADD COLUMN sender_student_id INTEGER')
+        backfill_senders(c, sql.Identifier('messages'))
+
+
+def backfill_recipients(c, table):
+    """이름 목록(recipient_id)만 있는 행에 recipient_student_ids를 채운다 (이전 파티션 복원에도 사용).
+    예전 LIKE 검색과 달리 이름이 정확히 같은 학생만 수신자가 된다."""
+    named = sql.SQL("m.recipient_type IN ('student', 'class') AND m.recipient_id <> 'all' "
+                    "AND m.recipient_student_ids IS NULL")
+    c.execute(
+        sql.SQL(
+            '''INSERT INTO student_identities (teacher_code, class_number, student_name)
+               SELECT DISTINCT m.teacher_code, '', n.name
+               FROM {} m, unnest(string_to_array(m.recipient_id, ',')) AS n(name)
+               WHERE {} AND n.name <> '' AND NOT EXISTS (
+                   SELECT 1 FROM student_identities i
+                   WHERE i.teacher_code = m.teacher_code AND i.student_name = n.name)
+               ON CONFLICT DO NOTHING'''
+        ).format(table, named)
+    )
+    c.execute(
+        sql.SQL(
+            '''UPDATE {} m
+               SET recipient_student_ids = ARRAY(
+                   SELECT i.id FROM student_identities i
+                   WHERE i.teacher_code = m.teacher_code
+                     AND i.student_name = ANY(string_to_array(m.recipient_id, ','))
+                   ORDER BY i.id)
+               WHERE {}'''
+        ).format(table, named)
+    )
+
+
+def backfill_senders(c, table):
+    """학생이 보낸 행에 sender_student_id를 채운다 (이전 파티션 복원에도 사용).
+    같은 교사에게 그 이름의 학생이 한 명뿐일 때만 채우고, 여럿이면 누가 보냈는지 알 수 없으므로 NULL로 둔다."""
+    c.execute(
+        sql.SQL(
+            '''UPDATE {} m
+               SET sender_student_id = i.id
+               FROM student_identities i
+               WHERE m.sender_type = 'student' AND m.sender_student_id IS NULL
+                 AND i.teacher_code = m.teacher_code AND i.student_name = m.sender_id
+                 AND NOT EXISTS (
+                   SELECT 1 FROM student_identities j
+                   WHERE j.teacher_code = i.teacher_code AND j.student_name = i.student_name AND j.id <> i.id)'''
+        ).format(table)
+    )
+
+
+def issue(c, teacher_code, class_number, student_name):
+    """학생 id 하나 (없으면 발급). fetchone()[0]이 id.
+    이미 있으면 DO UPDATE로 그 행을 돌려준다. DO NOTHING + SELECT는 한 스냅샷이라, 같은 학생이 동시에 참여하면
+    진 쪽이 먼저 발급된 행을 보지 못하고 빈 결과를 받는다."""
+    return c.execute(
+        '''INSERT INTO student_identities (teacher_code, class_number, student_name)
+           VALUES (%s, %s, %s)
+           ON CONFLICT (teacher_code, student_name, class_number) DO UPDATE SET student_name = EXCLUDED.student_name
+           RETURNING id''',
+        (teacher_code, class_number or '', student_name)
+    )
+
+
+def resolve_names(c, teacher_code, names):
+    """직접 입력한 수신자 이름 → 이미 있는 (id, 이름) 목록 (같은 이름이 여러 반에 있으면 모두).
+    입력한 이름으로 id를 발급하지는 않는다: 오타가 새 학생이 되지 않도록 못 찾은 이름은 호출한 쪽이 교사에게 돌려준다."""
+    return c.execute(
+        '''SELECT id, student_name FROM student_identities
+           WHERE teacher_code = %s AND student_name = ANY(%s)
+           ORDER BY student_name, id''',
+        (teacher_code, [name for name in names if name])
+    )
+
+
+def select_class_students(c, teacher_code, class_numbers):
+    """명단에 있는 반 학생 (id, 이름) 목록"""
+    return c.execute(
+        '''SELECT i.id, i.student_name
+           FROM class_students cs
+           JOIN student_identities i
+             ON i.teacher_code = cs.teacher_code
+            AND i.class_number = cs.class_number
+            AND i.student_name = cs.student_name
+           WHERE cs.teacher_code = %s AND cs.class_number = ANY(%s)
+           ORDER BY i.student_name, i.id''',
+        (teacher_code, list(class_numbers))
+    )
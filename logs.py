@@ -0,0 +1,156 @@
+"""구조화 로그: 레벨 판단 → 샘플링 → 큐 적재까지만 호출 그린렛에서 하고, 포맷/출력은 별도 스레드에서
+
+    logs.info('student_join', teacher_code=code, student=name)
+    if logs.enabled(logs.DEBUG):
+        ...  # 디버그 때만 필요한 추가 조회
+
+환경 변수
+- LOG_LEVEL: DEBUG / INFO / WARNING / ERROR (기본 INFO)
+- LOG_FORMAT: logfmt(기본) 또는 json
+- LOG_SAMPLE: 이벤트별 기록 비율, 예) "get_message_history=0.1,get_sent_messages=0.05"
+- LOG_QUEUE_SIZE: 출력 대기열 최대 길이 (넘치면 가장 오래된 기록부터 버림)
+"""
+import atexit
+import collections
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+try:
+    from gevent import monkey
+    _start_new_thread = monkey.get_original('_thread', 'start_new_thread')
+    _sleep = monkey.get_original('time', 'sleep')
+except ImportError:  # gevent 없이 실행될 때 (app.py 등)
+    import _thread
+    _start_new_thread = _thread.start_new_thread
+    _sleep = time.sleep
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+_level = {'DEBUG': DEBUG, 'INFO': INFO, 'WARNING': WARNING, 'ERROR': ERROR}.get(
+    os.environ.get('LOG_LEVEL', 'INFO').upper(), INFO)
+_json = os.environ.get('LOG_FORMAT', 'logfmt').lower() == 'json'
+_sample = {}
+for _item in filter(None, os.environ.get('LOG_SAMPLE', '').split(',')):
+    _name, _, _rate = _item.partition('=')
+    _sample[_name.strip()] = float(_rate or 1)
+
+# deque.append / popleft 는 원자적이라 gevent 그린렛과 네이티브 writer 스레드가 잠금 없이 공유 가능
+_queue = collections.deque(maxlen=int(os.environ.get('LOG_QUEUE_SIZE', '10000')))
+_dropped = 0
+_writer_started = False
+
+
+def set_level(level):
+    global _level
+    _level = level
+
+
+def enabled(level):
+    return level >= _level
+
+
+def set_sample_rate(event, rate):
+    _sample[event] = rate
+
+
+def _log(level, event, fields):
+    global _dropped
+    if level < _level:
+        return
+    rate = _sample.get(event)
+    if rate is not None and rate < 1 and random.random() >= rate:
+        return
+    if len(_queue) == _queue.maxlen:
+        _dropped += 1
+    _queue.append((time.time(), level, event, fields))
+    if not _writer_started:
+        _start_writer()
+
+
+def debug(event, **fields):
+    _log(DEBUG, event, fields)
+
+
+def info(event, **fields):
+    _log(INFO, event, fields)
+
+
+def warning(event, **fields):
+    _log(WARNING, event, fields)
+
+
+def error(event, **fields):
+    _log(ERROR, event, fields)
+
+
+def _format_value(value):
+    text = str(value)
+    if text == '' or any(ch in text for ch in ' ="\n'):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+
+def format_record(record):
+    ts, level, event, fields = record
+    stamp = datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec='milliseconds')
+    if _json:
+        return json.dumps(
+            {'ts': stamp, 'level': LEVEL_NAMES.get(level, level), 'event': event, **fields},
+            ensure_ascii=False, default=str
+        )
+    parts = [f'ts={stamp}', f'level={LEVEL_NAMES.get(level, level)}', f'event={_format_value(event)}']
+    parts.extend(f'{key}={_format_value(value)}' for key, value in fields.items())
+    return ' '.join(parts)
+
+
+def _drain(stream):
+    global _dropped
+    lines = []
+    while _queue:
+        try:
+            lines.append(format_record(_queue.popleft()))
+        except IndexError:
+            break
+        except Exception as e:  # 포맷 실패가 writer를 멈추지 않도록
+            lines.append(f'event=log_format_error error={_format_value(e)}')
+    if _dropped:
+        lines.append(f'event=log_dropped count={_dropped}')
+        _dropped = 0
+    if lines:
+        stream.write('\n'.join(lines) + '\n')
+        stream.flush()
+
+
+def _writer_loop():
+    while True:
+        try:
+            _drain(sys.stdout)
+        except Exception:
+            pass
+        _sleep(0.05)
+
+
+def _start_writer():
+    global _writer_started
+    _writer_started = True
+    _start_new_thread(_writer_loop, ())
+
+
+def flush():
+    _drain(sys.stdout)
+
+
+def _after_fork():
+    # gunicorn preload: 마스터에서 시작된 writer 스레드는 fork된 워커에 따라오지 않는다
+    global _writer_started
+    _writer_started = False
+
+
+atexit.register(flush)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -1,26 +1,300 @@
-from gevent import monkey
-monkey.patch_all()
+import time
+_import_started = time.perf_counter()
 
-from flask import Flask, render_template, request, session
-from flask_socketio import SocketIO, emit, join_room, disconnect
+if __name__ == '__main__':
+    # 개발 서버로 직접 실행할 때만 패치 (gunicorn은 gunicorn.conf.py에서 패치)
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import (Blueprint, Flask, Response, current_app, g, jsonify, render_template, request, send_file,
+                   send_from_directory, session, url_for)
+from flask_socketio import SocketIO
+from socketio import packet as socketio_packet
+from itsdangerous import BadSignature, Signer, URLSafeTimedSerializer
+from werkzeug.local import LocalProxy
 from werkzeug.security import generate_password_hash, check_password_hash
+import csv
+import functools
+import gzip
+import hashlib
+import hmac
+import inspect
+import io
+import json
+import mimetypes
 import os
 import random
+import threading
+import weakref
+import zlib
+from collections import OrderedDict
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 import psycopg
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-fallback-key-change-in-production')
+import admission
+import attachments
+import build_assets
+import db_io
+import identities
+import message_partitions
+import message_rollups
+import polls
+import delivery_trace
+import logs
+import metrics
+import profiler
+import sessions
+
+SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-fallback-key-change-in-production')
+# nginx 등 앞단 프록시가 X-Sendfile을 처리할 때만 켠다 (gunicorn 단독이면 wsgi.file_wrapper로 sendfile 사용)
+USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'
+
+# 라우트는 bp에, 소켓 이벤트 핸들러는 socket_handlers에 모아 두고 create_app()이 새 앱/서버마다 등록한다
+bp = Blueprint('main', __name__)
+socket_handlers = []  # (이벤트 이름, 핸들러)
+
+
+def on_event(event):
+    """@socketio.on 대신 쓰는 데코레이터: 핸들러를 socket_handlers에 기록만 한다"""
+    def decorator(handler):
+        socket_handlers.append((event, handler))
+        return handler
+    return decorator
+
+
+def current_socketio():
+    return current_app.extensions['socketio']
+
+
+# 라우트/백그라운드 작업 안에서 쓰는 socketio는 지금 앱 컨텍스트의 서버를 가리킨다
+socketio = LocalProxy(current_socketio)
+
+
+# 소켓 핸들러는 첫 인자로 어댑터(ctx)를 받고 입출력(emit, 방 참여, sleep, DB 연결과 커서 호출)을 모두 yield하는
+# 제너레이터다. 서버마다 어댑터와 실행기만 다르다: gevent는 EventIO + drive(), asyncio는 asgi.AsyncEventIO +
+# asgi.drive_async(). 동기 쪽은 yield한 값이 곧 결과이고, 비동기 쪽은 그 값을 await한 결과를 돌려보낸다.
+# ctx.start_background_task만 두 쪽 모두 바로 돌아오므로 yield하지 않는다.
+def drive(result):
+    """핸들러 결과를 끝까지 실행하고 반환값을 돌려준다 (제너레이터가 아니면 그 값 그대로)"""
+    if not inspect.isgenerator(result):
+        return result
+    value = None
+    while True:
+        try:
+            value = result.send(value)
+        except StopIteration as stop:
+            return stop.value
+
+
+class EventIO:
+    """gevent 스택의 핸들러 입출력: Flask-SocketIO 서버와 get_db() (asgi.AsyncEventIO와 같은 메서드).
+    sid는 이벤트를 보낸 소켓이고, 백그라운드 작업/라우트에서는 None이라 emit에 room을 꼭 준다."""
+
+    def __init__(self, server, sid=None):
+        self.server = server
+        self.sid = sid
+
+    def emit(self, event, data=None, room=None, skip_sid=None):
+        """room이 없으면 이벤트를 보낸 소켓에게만"""
+        return self.server.emit(event, data, to=self.sid if room is None else room, skip_sid=skip_sid)
+
+    def enter_room(self, room):
+        return self.server.server.enter_room(self.sid, room, namespace='/')
+
+    def disconnect(self, sid):
+        return self.server.server.disconnect(sid, namespace='/')
+
+    def sleep(self, seconds):
+        return self.server.sleep(seconds)
+
+    def start_background_task(self, handler, *args):
+        """handler(io, *args)를 새 그린렛에서 끝까지 실행 (io는 sid 없는 어댑터)"""
+        self.server.start_background_task(drive, handler(EventIO(self.server), *args))
+
+    def connect(self):
+        return get_db()
+
+    def release(self, conn):
+        conn.close()
+
+
+def route_io():
+    """Flask 라우트에서 공용 DB 함수를 부를 때 쓰는 어댑터 (asgi 모드면 socketio는 MainSocketBridge)"""
+    return EventIO(current_socketio())
 
-# gevent 모드 사용 (Render 배포용)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="gevent")
+
+def event_runner(server, handler):
+    """Flask-SocketIO에 등록할 함수: 이벤트를 보낸 소켓의 EventIO로 공용 핸들러를 실행한다"""
+    def run_event(*args):
+        return drive(handler(EventIO(server, request.sid), *args))
+    return functools.update_wrapper(run_event, handler)
+
+
+class InstrumentedSocketIO(SocketIO):
+    """모든 이벤트 핸들러의 지연/오류/DB 시간과 emit 횟수/바이트를 metrics에 기록"""
+
+    def init_app(self, app, **kwargs):
+        self.flask_app = app
+        super().init_app(app, **kwargs)
+
+    def on(self, message, namespace=None):
+        register = super().on(message, namespace)
+
+        def decorator(handler):
+            register(metrics.track_event(message, handler))
+            return handler
+        return decorator
+
+    def emit(self, event, *args, **kwargs):
+        metrics.record_emit(event)
+        return super().emit(event, *args, **kwargs)
+
+    def start_background_task(self, target, *args, **kwargs):
+        """백그라운드 작업도 이 앱의 컨텍스트 안에서 실행한다 (작업 안의 socketio가 이 서버를 가리키도록)"""
+        app = self.flask_app
+
+        def run():
+            with app.app_context():
+                return target(*args, **kwargs)
+        return super().start_background_task(run)
+
+
+class MeteredPacket(socketio_packet.Packet):
+    """emit 바이트는 python-socketio가 이미 인코딩한 패킷 길이로 잰다 (방 전체 emit도 인코딩은 한 번)"""
+
+    def encode(self):
+        encoded = super().encode()
+        if self.packet_type in (socketio_packet.EVENT, socketio_packet.BINARY_EVENT) and self.data:
+            metrics.record_packet_bytes(self.data[0], encoded)
+        return encoded
+
+
+# engine.io 연결 유지 설정. 켜 두기만 한 태블릿이 대부분이라 ping 간격이 길수록 유휴 연결이 싸다.
+# (클라이언트가 끊김을 알아채는 데 최대 ping_interval + ping_timeout 초가 걸린다)
+SOCKETIO_PING_INTERVAL = float(os.environ.get('SOCKETIO_PING_INTERVAL', '25'))
+SOCKETIO_PING_TIMEOUT = float(os.environ.get('SOCKETIO_PING_TIMEOUT', '20'))
+# 한 번에 받는 메시지(폴링 POST 포함) 최대 바이트. 이보다 큰 패킷을 보내면 연결을 끊는다.
+SOCKETIO_MAX_HTTP_BUFFER_SIZE = int(os.environ.get('SOCKETIO_MAX_HTTP_BUFFER_SIZE', '1000000'))
+ENGINEIO_OPTIONS = {
+    'ping_interval': SOCKETIO_PING_INTERVAL,
+    'ping_timeout': SOCKETIO_PING_TIMEOUT,
+    'max_http_buffer_size': SOCKETIO_MAX_HTTP_BUFFER_SIZE,
+}
 
 # In-memory connection tracking
 teachers = {}
 students = {}
 teacher_settings = {}  # teacher_code -> allow_student_messages
 
+# 메시지 파티션 유지 관리 설정
+PARTITION_MONTHS_AHEAD = int(os.environ.get('MESSAGE_PARTITION_MONTHS_AHEAD', '3'))
+MESSAGE_RETENTION_MONTHS = int(os.environ.get('MESSAGE_RETENTION_MONTHS', '0'))  # 0이면 보관 처리 안 함
+# 보관 기간이 지난 월 파티션을 내보낼 곳 (빈 값이면 파일 없이 파티션을 통째로 제거)
+MESSAGE_ARCHIVE_DIR = os.environ.get('MESSAGE_ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive'))
+PARTITION_MAINTENANCE_INTERVAL = 6 * 60 * 60
+
+# 메시지 내보내기: 서버 측 커서에서 한 번에 가져올 행 수
+EXPORT_BATCH_SIZE = 1000
+
+# 학생별 개별 메시지 일괄 전송 최대 항목 수
+BATCH_SEND_LIMIT = 500
+
+# 학생 오프라인 보관함 일괄 전송(send_messages_batch) 최대 항목 수와 재전송 방지 키 길이
+STUDENT_BATCH_LIMIT = 50
+CLIENT_KEY_MAX_LENGTH = 64
+CLIENT_KEY_RETENTION_DAYS = 7  # 이보다 오래된 키는 유지 관리 작업에서 삭제
+# send_message 재전송 방지: 최근 키 -> message_id를 워커 메모리에 LRU로 보관 (못 찾으면 message_client_keys 조회)
+CLIENT_KEY_CACHE_SIZE = int(os.environ.get('CLIENT_KEY_CACHE_SIZE', '10000'))
+recent_client_keys = OrderedDict()  # (teacher_code, client_key) -> message_id
+duplicate_sends = metrics.registry.counter(
+    'send_message_duplicates_total', 'send_message retries answered with the original message_id', ('source',))
+
+announcements_sent = metrics.registry.counter(
+    'announcements_sent_total', 'Admin announcements broadcast via /admin/broadcast', ('scope',))
+announcement_fanout = metrics.registry.histogram(
+    'announcement_fanout_seconds', 'Time to queue an admin announcement to every socket in its rooms', ('scope',))
+
+# 학생 → 교사 메시지 모아 보내기: 교사별로 첫 메시지는 바로 전달하고, 이후 이 시간(초) 안에 들어온
+# 메시지는 한 트랜잭션에 저장해 new_messages_from_students 한 번으로 보낸다 (0이면 끔)
+STUDENT_REPLY_WINDOW = float(os.environ.get('STUDENT_REPLY_WINDOW', '0.5'))
+student_reply_windows = {}  # teacher_code -> 창이 열려 있는 동안 모은 전송 목록
+
+# 투표 집계를 교사 화면에 보내는 최소 간격(초): 첫 답은 바로, 이후 바뀐 집계는 이 간격마다 한 번만
+POLL_TALLY_INTERVAL = float(os.environ.get('POLL_TALLY_INTERVAL', '1.0'))
+poll_tally_pushers = set()  # 집계 전송 그린렛이 돌고 있는 poll_id
+
+# 학생 세션 토큰: student_join 성공 시 서명해 건네고, 재접속 때 토큰을 보내면 DB 조회 없이 참여를 복원한다
+SESSION_TOKEN_MAX_AGE = int(os.environ.get('SESSION_TOKEN_MAX_AGE', str(12 * 60 * 60)))
+# 토큰으로 복원한 학생의 접속 기록(students 테이블)은 모아서 이 간격(초)마다 한 번에 쓴다
+PRESENCE_FLUSH_INTERVAL = float(os.environ.get('PRESENCE_FLUSH_INTERVAL', '1.0'))
+pending_presence = {}  # sid -> student_info
+presence_flush_scheduled = False
+
+# 학생 증분 동기화(after_id) 한 번에 보내는 최대 메시지 수 (학생 기기 캐시 상한과 같게)
+HISTORY_SYNC_LIMIT = 200
+
+# 일괄 삭제 미리보기: sid -> 최신 요청 번호 (번호가 바뀌면 대기 중인 미리보기는 취소)
+preview_requests = {}
+PREVIEW_DEBOUNCE_SECONDS = float(os.environ.get('PREVIEW_DEBOUNCE_SECONDS', '0.3'))
+EXPORT_COLUMNS = ['id', 'timestamp', 'sender_type', 'sender_id', 'recipient_type',
+                  'recipients', 'message', 'is_read', 'hidden_count']
+
+# 워커당 동시에 열 수 있는 DB 연결 수 (0이면 제한 없음), 자리가 날 때까지 기다리는 최대 시간
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', '20'))
+DB_ACQUIRE_TIMEOUT = float(os.environ.get('DB_ACQUIRE_TIMEOUT', '10'))
+db_slots = threading.BoundedSemaphore(DB_MAX_CONNECTIONS) if DB_MAX_CONNECTIONS > 0 else None
+
+# psycopg 대기 방식 (gevent 패치 후 import되므로 여기서 고정, db_io.py 참고)
+db_io.install()
+
+startup_seconds = metrics.registry.gauge(
+    'app_startup_seconds', 'Time spent in each startup phase', ('phase',))
+background_started = False
+
+
+class TimedCursor(psycopg.Cursor):
+    """쿼리 실행 시간을 현재 이벤트/요청의 DB 시간에 더하는 커서"""
+
+    def execute(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().execute(*args, **kwargs)
+        finally:
+            metrics.add_db_time(time.perf_counter() - start)
+
+    def executemany(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().executemany(*args, **kwargs)
+        finally:
+            metrics.add_db_time(time.perf_counter() - start)
+
+
+class TrackedConnection(psycopg.Connection):
+    """열린 연결 수를 metrics 게이지로 추적, DB_IO_MODE=threads면 쿼리 대기를 DB 스레드 풀에서 실행"""
+
+    def wait(self, gen, interval=db_io.WAIT_INTERVAL):
+        if db_io.mode == 'threads':
+            # psycopg의 wait를 건너뛰므로 중단 처리(쿼리 취소)도 여기서 한다
+            return db_io.wait_in_thread(gen, self.pgconn.socket, interval, cancel=self.cancel_active_query)
+        return super().wait(gen, interval)
+
+    def cancel_active_query(self):
+        if self.pgconn.transaction_status == psycopg.pq.TransactionStatus.ACTIVE:
+            try:
+                self.cancel_safe(timeout=db_io.CANCEL_TIMEOUT)
+            except Exception as exc:
+                logs.warning('db_query_cancel_failed', error=exc)
+
+    def close(self):
+        if not self.closed:
+            metrics.db_connections_open.dec()
+        super().close()
+        release = getattr(self, 'release_slot', None)
+        if release is not None:
+            release()  # weakref.finalize라 두 번 불려도 한 번만 반납
+
 
 def get_db():
     db_url = os.environ.get('DATABASE_URL')
@@ -28,7 +302,38 @@ def get_db():
         raise RuntimeError('DATABASE_URL is not set. Please configure DATABASE_URL for Postgres.')
     # sslmode can be configured via DB_SSLMODE if needed (e.g., require on Render)
     sslmode = os.environ.get('DB_SSLMODE', 'prefer')
-    return psycopg.connect(db_url, sslmode=sslmode)
+    start = time.perf_counter()
+    try:
+        if db_slots is not None and not db_slots.acquire(timeout=DB_ACQUIRE_TIMEOUT):
+            raise RuntimeError('database connection limit reached (DB_MAX_CONNECTIONS)')
+        try:
+            conn = TrackedConnection.connect(db_url, sslmode=sslmode, cursor_factory=TimedCursor)
+        except Exception:
+            if db_slots is not None:
+                db_slots.release()
+            raise
+    finally:
+        metrics.add_db_time(time.perf_counter() - start)
+    if db_slots is not None:
+        # close()를 빠뜨린 연결도 가비지 컬렉션 때 자리를 돌려준다
+        conn.release_slot = weakref.finalize(conn, db_slots.release)
+    metrics.db_connections_opened.inc()
+    metrics.db_connections_open.inc()
+    return conn
+
+
+def room_socket_counts():
+    """교사 코드별 접속 소켓 수 (교사 + 학생), /metrics 스크랩 시점에 계산"""
+    counts = {}
+    for info in list(teachers.values()) + list(students.values()):
+        key = (info.teacher_code or '',)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+metrics.registry.gauge(
+    'socketio_connected_sockets', 'Connected teacher and student sockets per teacher code',
+    ('teacher_code',), callback=room_socket_counts)
 
 
 def now_kst_str():
@@ -36,47 +341,194 @@ def now_kst_str():
     return datetime.now(timezone.utc).astimezone(ZoneInfo("Asia/Seoul")).strftime('%Y-%m-%d %H:%M:%S')
 
 
-def student_key(teacher_code, student_name):
-    return f"{teacher_code}::{student_name or ''}"
+# 방 계층: 학교(SCHOOL_ROOM, 모든 교사/학생 소켓) → 교사(teacher_{code}, students_{code}) → 반(class_{code}_{n})
+SCHOOL_ROOM = 'school'
+SCHOOL_TEACHER_CODE = '*'  # 학교 전체 공지의 messages.teacher_code (모든 학생의 기록에 포함)
 
 
-def get_teacher_allow_status(teacher_code):
-    if teacher_code in teacher_settings:
-        return teacher_settings[teacher_code]
+def class_room(teacher_code, class_number):
+    return f'class_{teacher_code}_{class_number}'
+
+
+ROSTER_HEADER_NAMES = {'class_number', 'class', '반', '반 번호', '반번호'}
+
+
+def parse_roster_csv(text):
+    """CSV(반 번호, 학생 이름[, 반 이름]) 텍스트를 (class_number, student_name, class_name) 목록으로 변환"""
+    rows = []
+    for i, record in enumerate(csv.reader(io.StringIO(text.lstrip('\ufeff')))):
+        record = [field.strip() for field in record]
+        if i == 0 and record and record[0].lower() in ROSTER_HEADER_NAMES:
+            continue
+        if len(record) < 2 or not record[0] or not record[1]:
+            continue
+        rows.append((record[0], record[1], record[2] if len(record) > 2 else ''))
+    return rows
+
+
+def import_roster(teacher_code, rows, replace=False):
+    """명단을 COPY로 임시 테이블에 적재한 뒤 한 트랜잭션에서 classes/class_students에 반영"""
     conn = get_db()
-    c = conn.cursor()
-    c.execute('SELECT allow_student_messages FROM teacher_settings WHERE teacher_code = %s', (teacher_code,))
-    row = c.fetchone()
-    if row is None:
-        allow = False
+    try:
+        c = conn.cursor()
+        c.execute(
+            '''CREATE TEMP TABLE roster_import
+               (class_number TEXT, student_name TEXT, class_name TEXT)
+               ON COMMIT DROP'''
+        )
+        with c.copy('COPY roster_import (class_number, student_name, class_name) FROM STDIN') as copy:
+            for row in rows:
+                copy.write_row(row)
+
+        if replace:
+            c.execute(
+                '''DELETE FROM class_students
+                   WHERE teacher_code = %s
+                     AND class_number IN (SELECT DISTINCT class_number FROM roster_import)''',
+                (teacher_code,)
+            )
+
+        c.execute(
+            '''INSERT INTO classes (teacher_code, class_number, class_name)
+               SELECT %s, class_number, MAX(class_name)
+               FROM roster_import
+               GROUP BY class_number
+               ON CONFLICT (teacher_code, class_number)
+               DO UPDATE SET class_name = CASE WHEN EXCLUDED.class_name <> ''
+                                               THEN EXCLUDED.class_name
+                                               ELSE classes.class_name END''',
+            (teacher_code,)
+        )
+        c.execute(
+            '''INSERT INTO class_students (teacher_code, class_number, student_name)
+               SELECT DISTINCT %s, class_number, student_name
+               FROM roster_import
+               ON CONFLICT (teacher_code, class_number, student_name) DO NOTHING''',
+            (teacher_code,)
+        )
+        imported = c.rowcount
+
+        # 학생 id 발급. 명단 없이 먼저 참여한 학생(반 '')은 명단에서 이름이 한 반에만 있으면 그 반으로 옮겨 id를 유지
+        c.execute(
+            '''UPDATE student_identities i SET class_number = r.class_number
+               FROM (SELECT student_name, MIN(class_number) AS class_number
+                     FROM roster_import
+                     GROUP BY student_name
+                     HAVING COUNT(DISTINCT class_number) = 1) r
+               WHERE i.teacher_code = %s AND i.class_number = '' AND i.student_name = r.student_name
+                 AND NOT EXISTS (
+                     SELECT 1 FROM student_identities x
+                     WHERE x.teacher_code = i.teacher_code
+                       AND x.class_number = r.class_number
+                       AND x.student_name = r.student_name)''',
+            (teacher_code,)
+        )
         c.execute(
-            '''INSERT INTO teacher_settings (teacher_code, allow_student_messages)
-               VALUES (%s, %s)
-               ON CONFLICT (teacher_code) DO NOTHING''',
-            (teacher_code, allow)
+            '''INSERT INTO student_identities (teacher_code, class_number, student_name)
+               SELECT DISTINCT %s, class_number, student_name
+               FROM roster_import
+               ON CONFLICT DO NOTHING''',
+            (teacher_code,)
         )
         conn.commit()
-    else:
-        allow = bool(row[0])
-    conn.close()
+        return imported
+    finally:
+        conn.close()
+
+
+def get_teacher_classes(ctx, teacher_code):
+    conn = yield ctx.connect()
+    try:
+        c = conn.cursor()
+        yield c.execute(
+            '''SELECT cl.class_number, cl.class_name, COUNT(cs.id)
+               FROM classes cl
+               LEFT JOIN class_students cs
+                 ON cs.teacher_code = cl.teacher_code AND cs.class_number = cl.class_number
+               WHERE cl.teacher_code = %s
+               GROUP BY cl.class_number, cl.class_name
+               ORDER BY cl.class_number''',
+            (teacher_code,)
+        )
+        rows = yield c.fetchall()
+    finally:
+        yield ctx.release(conn)
+    return [{'class_number': row[0], 'class_name': row[1] or '', 'student_count': row[2]} for row in rows]
+
+
+def get_class_students(ctx, teacher_code, class_numbers):
+    """명단의 반 학생 [(학생 id, 이름)]"""
+    conn = yield ctx.connect()
+    try:
+        c = conn.cursor()
+        yield identities.select_class_students(c, teacher_code, class_numbers)
+        return (yield c.fetchall())
+    finally:
+        yield ctx.release(conn)
+
+
+def resolve_student_names(ctx, teacher_code, names):
+    """직접 입력한 수신자 이름 -> 이미 id가 있는 [(학생 id, 이름)] (같은 이름이면 반마다 모두)"""
+    conn = yield ctx.connect()
+    try:
+        c = conn.cursor()
+        yield identities.resolve_names(c, teacher_code, names)
+        return (yield c.fetchall())
+    finally:
+        yield ctx.release(conn)
+
+
+def unknown_student_names(names, resolved):
+    """직접 입력한 이름 중 id가 없는 이름 (입력 순서, 중복 없이). 이런 이름으로는 보내지 않고 교사에게 돌려준다."""
+    found = {name for _, name in resolved}
+    return [name for name in dict.fromkeys(names) if name and name not in found]
+
+
+def unknown_names_error(unknown):
+    return {'status': 'error', 'message': f"명단에 없거나 아직 참여하지 않은 학생입니다: {', '.join(unknown)}",
+            'unknown_names': unknown}
+
+
+def get_teacher_allow_status(ctx, teacher_code):
+    if teacher_code in teacher_settings:
+        return teacher_settings[teacher_code]
+    conn = yield ctx.connect()
+    try:
+        c = conn.cursor()
+        yield c.execute('SELECT allow_student_messages FROM teacher_settings WHERE teacher_code = %s', (teacher_code,))
+        row = yield c.fetchone()
+        if row is None:
+            allow = False
+            yield c.execute(
+                '''INSERT INTO teacher_settings (teacher_code, allow_student_messages)
+                   VALUES (%s, %s)
+                   ON CONFLICT (teacher_code) DO NOTHING''',
+                (teacher_code, allow)
+            )
+            yield conn.commit()
+        else:
+            allow = bool(row[0])
+    finally:
+        yield ctx.release(conn)
     teacher_settings[teacher_code] = allow
     return allow
 
 
-def set_teacher_allow_status(teacher_code, allow):
+def set_teacher_allow_status(ctx, teacher_code, allow):
     teacher_settings[teacher_code] = bool(allow)
-    conn = get_db()
-    c = conn.cursor()
-    c.execute(
-        '''INSERT INTO teacher_settings (teacher_code, allow_student_messages, updated_at)
-           VALUES (%s, %s, CURRENT_TIMESTAMP)
-           ON CONFLICT (teacher_code)
-           DO UPDATE SET allow_student_messages = EXCLUDED.allow_student_messages,
-                         updated_at = CURRENT_TIMESTAMP''',
-        (teacher_code, bool(allow))
-    )
-    conn.commit()
-    conn.close()
+    conn = yield ctx.connect()
+    try:
+        yield conn.cursor().execute(
+            '''INSERT INTO teacher_settings (teacher_code, allow_student_messages, updated_at)
+               VALUES (%s, %s, CURRENT_TIMESTAMP)
+               ON CONFLICT (teacher_code)
+               DO UPDATE SET allow_student_messages = EXCLUDED.allow_student_messages,
+                             updated_at = CURRENT_TIMESTAMP''',
+            (teacher_code, bool(allow))
+        )
+        yield conn.commit()
+    finally:
+        yield ctx.release(conn)
 
 
 def generate_teacher_code():
@@ -102,6 +554,8 @@ def format_timestamp(ts):
 
 
 def init_db():
+    """스키마 생성/이전. 프로세스마다가 아니라 배포(마스터)당 한 번 실행한다."""
+    started = time.perf_counter()
     conn = get_db()
     c = conn.cursor()
 
@@ -137,23 +591,43 @@ def init_db():
             teacher_code TEXT NOT NULL,
             class_number TEXT NOT NULL,
             student_name TEXT NOT NULL,
-            student_id TEXT DEFAULT '',
+            student_id INTEGER,
             last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             socket_id TEXT DEFAULT '')'''
     )
 
+    # 반 명단 (classes 테이블의 반에 속한 학생, CSV로 일괄 등록)
     c.execute(
-        '''CREATE TABLE IF NOT EXISTS messages
+        '''CREATE TABLE IF NOT EXISTS class_students
            (id SERIAL PRIMARY KEY,
             teacher_code TEXT NOT NULL,
-            class_number TEXT,
-            sender_type TEXT NOT NULL,
-            sender_id TEXT NOT NULL,
-            recipient_type TEXT,
-            recipient_id TEXT,
-            message TEXT NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            is_read BOOLEAN DEFAULT FALSE)'''
+            class_number TEXT NOT NULL,
+            student_name TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(teacher_code, class_number, student_name))'''
+    )
+    c.execute(
+        '''CREATE INDEX IF NOT EXISTS class_students_name_idx
+           ON class_students (teacher_code, student_name)'''
+    )
+
+    # messages는 월 단위 RANGE 파티션 테이블 (기존 단일 테이블이면 자동 이전)
+    message_partitions.setup_messages_table(c, PARTITION_MONTHS_AHEAD)
+
+    # 교사별/일별 메시지 개수 집계 (삭제 미리보기, 사용 통계용)
+    message_rollups.ensure_table(c)
+
+    # 첨부 파일(내용 해시별 한 행)과 메시지 -> 첨부 연결
+    attachments.ensure_table(c)
+
+    # 클라이언트가 붙인 재전송 방지 키 -> 저장된 메시지 (같은 키로 다시 보내면 저장하지 않음)
+    c.execute(
+        '''CREATE TABLE IF NOT EXISTS message_client_keys
+           (teacher_code TEXT NOT NULL,
+            client_key TEXT NOT NULL,
+            message_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (teacher_code, client_key))'''
     )
 
     c.execute(
@@ -161,11 +635,15 @@ def init_db():
            (id SERIAL PRIMARY KEY,
             message_id INTEGER NOT NULL,
             teacher_code TEXT NOT NULL,
-            student_key TEXT NOT NULL,
+            student_id INTEGER NOT NULL,
             hidden_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(message_id, student_key))'''
+            UNIQUE(student_id, message_id))'''
     )
 
+    # 학생 정수 id (명단 등록/첫 참여 때 발급) 와 이름 키로 된 기존 행 이전
+    identities.ensure_table(c)
+    identities.migrate(c)
+
     c.execute(
         '''CREATE TABLE IF NOT EXISTS teacher_settings
            (teacher_code TEXT PRIMARY KEY,
@@ -182,24 +660,492 @@ def init_db():
             is_online BOOLEAN DEFAULT FALSE)'''
     )
 
+    # 마감한 투표/퀴즈 결과 (투표 하나당 한 행, responses: 학생 id -> 선택지 번호, 이름은 student_identities)
+    c.execute(
+        '''CREATE TABLE IF NOT EXISTS poll_results
+           (id SERIAL PRIMARY KEY,
+            teacher_code TEXT NOT NULL,
+            poll_id TEXT NOT NULL UNIQUE,
+            question TEXT NOT NULL,
+            options JSONB NOT NULL,
+            correct_option INTEGER,
+            counts JSONB NOT NULL,
+            total_votes INTEGER NOT NULL,
+            responses JSONB NOT NULL,
+            started_at TIMESTAMP,
+            closed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'''
+    )
+    c.execute('CREATE INDEX IF NOT EXISTS poll_results_teacher_idx ON poll_results (teacher_code, id DESC)')
+
     # 서버 시작 시 학생 목록 초기화 (재시작하면 모든 연결이 끊기므로)
+    # gunicorn에서는 마스터가 워커를 띄우기 전에 한 번만 실행되므로 실행 중인 워커의 접속 정보는 지워지지 않는다
     c.execute('DELETE FROM students')
 
     conn.commit()
     conn.close()
+    startup_seconds.set('init_db', value=time.perf_counter() - started)
+    logs.info('init_db_done', seconds=round(time.perf_counter() - started, 3))
+
+
+def maintain_message_partitions():
+    """미래 월 파티션을 미리 만들고, 보관 기간이 지난 파티션은 압축 파일로 내보낸 뒤(또는 바로) 제거한다.
+    끝나지 않은 업로드 조각과 어느 메시지도 쓰지 않는 첨부 파일도 여기서 지운다."""
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        message_partitions.lock(c)
+        message_partitions.ensure_partitions(c, PARTITION_MONTHS_AHEAD)
+        c.execute(
+            "DELETE FROM message_client_keys WHERE created_at < NOW() - make_interval(days => %s)",
+            (CLIENT_KEY_RETENTION_DAYS,)
+        )
+        conn.commit()
+        if MESSAGE_RETENTION_MONTHS > 0:
+            for expired in message_partitions.expire_partitions(conn, MESSAGE_RETENTION_MONTHS, MESSAGE_ARCHIVE_DIR):
+                logs.info('partition_archived' if MESSAGE_ARCHIVE_DIR else 'partition_dropped', partition=expired)
+    finally:
+        conn.close()
+    expired = attachments.expire_uploads()
+    if expired:
+        logs.info('attachment_uploads_expired', uploads=expired)
+    conn = get_db()
+    try:
+        removed = attachments.sweep_unreferenced(conn)
+    finally:
+        conn.close()
+    if removed:
+        logs.info('attachments_removed', attachments=removed)
+
+
+def partition_maintenance_loop():
+    while True:
+        try:
+            maintain_message_partitions()
+        except Exception as e:
+            logs.error('partition_maintenance_failed', error=e)
+        socketio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+
+
+@bp.before_app_request
+def start_request_timer():
+    metrics.begin_scope()
+    g.request_started = time.perf_counter()
+
+
+@bp.after_app_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = (request.endpoint or 'unknown').removeprefix(bp.name + '.')  # 라벨은 블루프린트 접두사 없이
+        metrics.http_latency.observe(time.perf_counter() - started, endpoint, request.method, str(response.status_code))
+        metrics.http_db_time.observe(metrics.end_scope(), endpoint)
+    return response
+
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 텍스트 형식 메트릭 (METRICS_TOKEN 설정 시 Bearer 토큰 필요)"""
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def is_admin_request():
+    """ADMIN_TOKEN이 설정되어 있고 Authorization: Bearer 헤더가 일치하는지 확인 (쿼리스트링 토큰은 로그에 남으므로 받지 않음)"""
+    token = os.environ.get('ADMIN_TOKEN')
+    if not token:
+        return False
+    supplied = request.headers.get('Authorization', '')
+    if not supplied.startswith('Bearer '):
+        return False
+    supplied = supplied[len('Bearer '):]
+    return hmac.compare_digest(supplied, token)
+
+
+@bp.route('/admin/profile')
+def admin_profile():
+    """실행 중인 워커를 seconds초 동안 샘플링해 collapsed stack과 이벤트별 CPU 시간을 돌려준다"""
+    if not is_admin_request():
+        return Response('forbidden\n', status=403, mimetype='text/plain')
+    seconds = request.args.get('seconds', 10, type=float)
+    interval_ms = request.args.get('interval', 5, type=float)
+    try:
+        result = profiler.run_profile(seconds, interval_ms / 1000, socketio.sleep)
+    except RuntimeError as e:
+        return Response(f'{e}\n', status=409, mimetype='text/plain')
+    if request.args.get('format') == 'collapsed':
+        return Response(result.collapsed(), mimetype='text/plain')
+    return jsonify({
+        'seconds': result.seconds,
+        'interval_ms': result.interval * 1000,
+        'samples': result.samples,
+        'switches': result.switches,
+        'greenlets': result.greenlet_breakdown(),
+        'collapsed': result.collapsed(),
+    })
+
+
+@bp.route('/admin/broadcast', methods=['POST'])
+def admin_broadcast():
+    """학교 전체(또는 교사 한 명 / 반 하나)에 공지. JSON: {"message", "teacher_code"(선택), "class_number"(선택)}
+
+    메시지는 한 행만 저장하고(학교 전체면 teacher_code = SCHOOL_TEACHER_CODE), 모든 수신자의 기록 조회가 그 행을 함께 읽는다.
+    전달은 계층 방 하나(또는 교사 방 + 하위 방)로 한 번 emit하며, 패킷은 한 번만 인코딩되어 소켓마다 큐에 들어간다.
+    """
+    if not is_admin_request():
+        return Response('forbidden\n', status=403, mimetype='text/plain')
+    data = request.get_json(silent=True) or {}
+    message = (data.get('message') or '').strip()
+    teacher_code = str(data.get('teacher_code') or '').strip()
+    class_number = str(data.get('class_number') or '').strip()
+    if not message:
+        return jsonify({'status': 'error', 'message': '공지 내용을 입력해주세요.'}), 400
+    if class_number and not teacher_code:
+        return jsonify({'status': 'error', 'message': '반을 지정하려면 교사 코드가 필요합니다.'}), 400
+
+    if class_number:
+        scope = 'class'
+        recipients = drive(get_class_students(route_io(), teacher_code, [class_number]))
+        if not recipients:
+            return jsonify({'status': 'error', 'message': '해당 반에 등록된 학생이 없습니다.'}), 404
+        rooms = [f'teacher_{teacher_code}', class_room(teacher_code, class_number)]
+    elif teacher_code:
+        scope = 'teacher'
+        recipients = None
+        rooms = [f'teacher_{teacher_code}', f'students_{teacher_code}']
+    else:
+        scope = 'school'
+        recipients = None
+        rooms = [SCHOOL_ROOM]
+
+    try:
+        msg_id = save_announcement(teacher_code or SCHOOL_TEACHER_CODE, scope, recipients, message)
+    except Exception as e:
+        logs.error('announcement_save_failed', scope=scope, teacher_code=teacher_code, error=e)
+        return jsonify({'status': 'error', 'message': '공지를 저장하지 못했습니다.'}), 500
+    if msg_id is None:
+        return jsonify({'status': 'error', 'message': '유효하지 않은 교사 코드입니다.'}), 404
+
+    started = time.perf_counter()
+    deliver_announcement({
+        'message_id': msg_id,
+        'message': message,
+        'sender': '관리자',
+        'timestamp': now_kst_str(),
+        'announcement': scope,
+    }, rooms)
+    elapsed = time.perf_counter() - started
+    announcements_sent.inc(scope)
+    announcement_fanout.observe(elapsed, scope)
+    logs.info('announcement_sent', scope=scope, teacher_code=teacher_code, class_number=class_number,
+              message_id=msg_id, fanout_ms=round(elapsed * 1000, 2))
+    return jsonify({'status': 'success', 'message_id': msg_id, 'scope': scope})
+
+
+def save_announcement(teacher_code, scope, recipients, message):
+    """공지 한 행 저장 (recipients: 반 공지의 [(학생 id, 이름)], 아니면 None = 전체). 없는 교사면 저장하지 않고 None."""
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        if teacher_code != SCHOOL_TEACHER_CODE:
+            c.execute('SELECT 1 FROM teachers WHERE teacher_code = %s', (teacher_code,))
+            if c.fetchone() is None:
+                return None
+        c.execute(
+            '''INSERT INTO messages
+               (teacher_code, sender_type, sender_id, recipient_type, recipient_id, recipient_student_ids, message)
+               VALUES (%s, 'admin', '관리자', %s, %s, %s, %s)
+               RETURNING id''',
+            (teacher_code, scope, recipient_str(recipients), recipient_ids(recipients), message)
+        )
+        msg_id = c.fetchone()[0]
+        message_rollups.record_insert(c, teacher_code, 'admin')
+        conn.commit()
+        return msg_id
+    finally:
+        conn.close()
+
+
+def deliver_announcement(payload, rooms):
+    """공지를 방들로 보낸다 (asgi 모드에서 socketio는 AsyncServer로 넘기는 어댑터)"""
+    socketio.emit('receive_message', payload, to=rooms)
+
+
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+ATTACHMENT_MAX_AGE = int(os.environ.get('ATTACHMENT_MAX_AGE', str(7 * 24 * 60 * 60)))  # 첨부의 브라우저(private) 캐시
+HTML_COMPRESS_MIN_SIZE = 1024
+asset_manifest = None
+
+
+@bp.app_template_global()
+def asset_url(path):
+    """static/ 기준 경로를 빌드된 해시 파일 주소로 (빌드 전이면 일반 /static/ 주소)"""
+    global asset_manifest
+    if asset_manifest is None:
+        asset_manifest = build_assets.load_manifest()
+    name = asset_manifest.get(path)
+    if name:
+        return build_assets.URL_PREFIX + name
+    if path in build_assets.VENDOR_FILES and not os.path.isfile(os.path.join(build_assets.STATIC_DIR, path)):
+        return build_assets.VENDOR_FILES[path]  # 빌드 전 개발 환경: CDN 사용
+    return url_for('static', filename=path)
+
+
+@bp.route('/assets/<path:filename>')
+def hashed_asset(filename):
+    """해시 파일명 자산: Accept-Encoding에 맞춰 미리 압축한 .br/.gz를 보내고 1년 immutable 캐시"""
+    encoding, suffix = None, ''
+    for name, ext in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[name] and os.path.isfile(os.path.join(build_assets.DIST_DIR, filename + ext)):
+            encoding, suffix = name, ext
+            break
+    response = send_from_directory(
+        build_assets.DIST_DIR, filename + suffix,
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        max_age=ASSET_MAX_AGE,
+    )
+    response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def upload_error(e):
+    body = {'status': 'error', 'message': str(e)}
+    if e.offset is not None:
+        body['offset'] = e.offset
+    return jsonify(body), e.status
+
+
+@bp.route('/uploads', methods=['POST'])
+def start_upload():
+    """첨부 업로드 시작. JSON: {name, size, sha256(선택)}
+
+    sha256이 이미 저장된 파일과 같으면 올리지 않고 바로 첨부 참조를 돌려준다(complete).
+    아니면 upload_id를 돌려주고, 클라이언트는 PUT /uploads/<id>?offset=N 으로 chunk_size 이하 조각을 보낸다.
+    """
+    teacher_code = session.get('teacher_code')
+    if not teacher_code:
+        return jsonify({'status': 'error', 'message': '교사 로그인이 필요합니다.'}), 401
+    data = request.get_json(silent=True) or {}
+    name = attachments.clean_name(data.get('name'))
+    known = data.get('sha256')
+    if isinstance(known, str) and attachments.ATTACHMENT_ID.match(known):
+        # 이 교사가 올린 적 있는 파일만 (해시만 아는 다른 교사의 파일은 다시 올리게 한다)
+        found = drive(find_attachments(route_io(), teacher_code, [(known, name)]))
+        if found and os.path.isfile(attachments.object_path(known)):
+            attachments.stored_files.inc('skipped_upload')
+            return jsonify({'status': 'success', 'complete': True, 'attachment': found[0]})
+    try:
+        upload = attachments.create_upload(teacher_code, name, data.get('size'))
+    except attachments.UploadError as e:
+        return upload_error(e)
+    return jsonify({'status': 'success', 'complete': False, 'upload_id': upload['upload_id'],
+                    'offset': 0, 'chunk_size': attachments.UPLOAD_CHUNK_SIZE})
+
+
+@bp.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """이어 올리기: 서버가 지금까지 받은 바이트 수(offset)"""
+    teacher_code = session.get('teacher_code')
+    if not teacher_code:
+        return jsonify({'status': 'error', 'message': '교사 로그인이 필요합니다.'}), 401
+    try:
+        upload = attachments.get_upload(upload_id, teacher_code)
+    except attachments.UploadError as e:
+        return upload_error(e)
+    return jsonify({'status': 'success', 'upload_id': upload_id, 'offset': upload['offset'], 'size': upload['size']})
+
+
+@bp.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """조각 하나 (본문 = 파일 바이트, ?offset=). 마지막 조각이면 저장을 마치고 첨부 참조를 돌려준다."""
+    teacher_code = session.get('teacher_code')
+    if not teacher_code:
+        return jsonify({'status': 'error', 'message': '교사 로그인이 필요합니다.'}), 401
+    offset = request.args.get('offset', type=int)
+    if offset is None or offset < 0:
+        return jsonify({'status': 'error', 'message': 'offset이 필요합니다.'}), 400
+    try:
+        upload = attachments.get_upload(upload_id, teacher_code)
+        offset = attachments.write_chunk(upload, offset, request.stream, request.content_length)
+        if offset < upload['size']:
+            return jsonify({'status': 'success', 'complete': False, 'offset': offset})
+        meta = attachments.finalize(upload)  # gevent 워커에서는 스레드 풀에서 실행
+    except attachments.UploadError as e:
+        return upload_error(e)
+
+    conn = get_db()
+    try:
+        attachments.save(conn.cursor(), meta)
+        conn.commit()
+    finally:
+        conn.close()
+    logs.info('attachment_uploaded', teacher_code=teacher_code, attachment_id=meta['id'][:12], size=meta['size'],
+              content_type=meta['content_type'], thumbnail=meta['has_thumbnail'])
+    ref = attachments.ref(meta['id'], upload['name'], meta['size'], meta['content_type'], meta['has_thumbnail'])
+    return jsonify({'status': 'success', 'complete': True, 'offset': offset, 'attachment': with_attachment_keys([ref])[0]})
+
+
+def find_attachments(ctx, teacher_code, refs):
+    """[(id, 이름)] 중 이 교사가 올린 첨부의 참조 목록 (send_message에서 받은 참조 확인용)"""
+    if not refs:
+        return []
+    conn = yield ctx.connect()
+    try:
+        c = conn.cursor()
+        yield attachments.select(c, [attachment_id for attachment_id, _ in refs], teacher_code)
+        rows = yield c.fetchall()
+    finally:
+        yield ctx.release(conn)
+    return with_attachment_keys(attachments.build_refs(refs, rows))
+
+
+def with_attachment_keys(refs):
+    """참조마다 /files 주소에 붙일 key(id 서명)를 넣는다. 메시지를 받은 학생과 보낸 교사만 key를 안다."""
+    signer = current_app.extensions['attachment_keys']
+    for item in refs:
+        item['key'] = signer.get_signature(item['id']).decode()
+    return refs
 
 
-@app.route('/')
+def attachment_key_valid(attachment_id):
+    return current_app.extensions['attachment_keys'].verify_signature(attachment_id, request.args.get('key') or '')
+
+
+@functools.lru_cache(maxsize=4096)
+def attachment_content_type(attachment_id):
+    """내용이 바뀌지 않으므로 한 번 찾은 형식은 워커 메모리에 둔다 (없으면 KeyError, 캐시되지 않음)"""
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute('SELECT content_type FROM attachments WHERE id = %s', (attachment_id,))
+        row = c.fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        raise KeyError(attachment_id)
+    return row[0]
+
+
+def private_file(response):
+    # 주소(key)를 아는 사람만 받을 수 있으므로 공유 캐시(CDN/프록시)에는 두지 않는다
+    response.headers['Cache-Control'] = f'private, max-age={ATTACHMENT_MAX_AGE}'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['Content-Security-Policy'] = "default-src 'none'; sandbox"
+    return response
+
+
+@bp.route('/files/<attachment_id>')
+def attachment_file(attachment_id):
+    """첨부 파일 (?key=가 이 id의 서명이어야 함). 주소가 내용 해시라 ETag도 해시이고 브라우저에만 캐시한다.
+    Range 요청(206)을 지원하며 전체 응답은 wsgi.file_wrapper(sendfile) 또는 USE_X_SENDFILE로 보낸다.
+    이미지는 바로 보여 주고 나머지는 ?name= 이름으로 내려받게 한다."""
+    if not attachments.ATTACHMENT_ID.match(attachment_id):
+        return Response('not found\n', status=404, mimetype='text/plain')
+    if not attachment_key_valid(attachment_id):
+        return Response('forbidden\n', status=403, mimetype='text/plain')
+    try:
+        content_type = attachment_content_type(attachment_id)
+    except KeyError:
+        return Response('not found\n', status=404, mimetype='text/plain')
+    inline = content_type in attachments.INLINE_TYPES
+    return private_file(send_file(
+        attachments.object_path(attachment_id),
+        mimetype=content_type,
+        as_attachment=not inline,
+        download_name=attachments.clean_name(request.args.get('name') or attachment_id),
+        conditional=True,
+        etag=attachment_id,
+        max_age=ATTACHMENT_MAX_AGE,
+    ))
+
+
+@bp.route('/files/<attachment_id>/thumb')
+def attachment_thumbnail(attachment_id):
+    """업로드할 때 만들어 둔 이미지 썸네일 (JPEG, 원본과 같은 key)"""
+    if not attachments.ATTACHMENT_ID.match(attachment_id):
+        return Response('not found\n', status=404, mimetype='text/plain')
+    if not attachment_key_valid(attachment_id):
+        return Response('forbidden\n', status=403, mimetype='text/plain')
+    path = attachments.thumbnail_path(attachment_id)
+    if not os.path.isfile(path):
+        return Response('not found\n', status=404, mimetype='text/plain')
+    return private_file(send_file(path, mimetype='image/jpeg', conditional=True,
+                                  etag=f'{attachment_id}-thumb', max_age=ATTACHMENT_MAX_AGE))
+
+
+# 학생 앱(/student)을 오프라인에서도 바로 띄우는 데 필요한 파일 (서비스 워커가 설치 시 미리 캐시)
+STUDENT_SHELL = '/student'
+STUDENT_PRECACHE_ASSETS = [
+    'vendor/bootstrap-5.1.3/css/bootstrap.min.css',
+    'vendor/fontawesome-6.0.0/css/all.min.css',
+    'vendor/bootstrap-5.1.3/js/bootstrap.bundle.min.js',
+    'vendor/socket.io-4.0.1/socket.io.min.js',
+    'js/reconnect.js',
+    'js/student.js',
+    'images/icon-192x192.png',
+]
+service_worker_cache = None  # (버전, 본문)
+
+
+def build_service_worker():
+    """빌드 manifest에서 미리 캐시할 주소 목록을 만들고, 목록+템플릿 내용 해시를 캐시 버전으로 쓴다."""
+    urls = [asset_url(path) for path in STUDENT_PRECACHE_ASSETS]
+    if asset_manifest:
+        urls += [build_assets.URL_PREFIX + name for path, name in sorted(asset_manifest.items())
+                 if path.startswith('vendor/fontawesome-6.0.0/webfonts/') and path.endswith('.woff2')]
+    urls = [url for url in urls if url.startswith('/')]  # CDN 주소는 미리 캐시하지 않음
+    with open(os.path.join(current_app.root_path, current_app.template_folder, 'sw.js'), 'rb') as f:
+        source = f.read()
+    digest = hashlib.sha256(source + json.dumps(urls).encode('utf-8')).hexdigest()[:12]
+    body = render_template('sw.js', version=digest, precache=urls, shell=STUDENT_SHELL,
+                           asset_prefix=build_assets.URL_PREFIX)
+    return digest, body
+
+
+@bp.route('/sw.js')
+def service_worker():
+    """서비스 워커 (루트 범위). 매번 재검증하도록 no-cache, 내용이 같으면 304"""
+    global service_worker_cache
+    if service_worker_cache is None or current_app.debug:
+        service_worker_cache = build_service_worker()
+    version, body = service_worker_cache
+    response = Response(body, mimetype='text/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(version)
+    return response.make_conditional(request)
+
+
+@bp.after_app_request
+def compress_html(response):
+    """템플릿으로 그린 HTML 응답을 gzip으로 압축 (스트리밍 응답은 제외)"""
+    if (response.mimetype != 'text/html' or response.status_code != 200 or response.direct_passthrough
+            or response.is_streamed or 'Content-Encoding' in response.headers
+            or not request.accept_encodings['gzip']):
+        return response
+    data = response.get_data()
+    if len(data) < HTML_COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers.add('Vary', 'Accept-Encoding')
+    return response
+
+
+@bp.route('/')
 def index():
     return render_template('index.html')
 
 
-@app.route('/teacher/register')
+@bp.route('/teacher/register')
 def teacher_register():
     return render_template('teacher_register.html')
 
 
-@app.route('/teacher/register', methods=['POST'])
+@bp.route('/teacher/register', methods=['POST'])
 def teacher_register_post():
     teacher_name = request.form.get('teacher_name', '').strip()
     password = request.form.get('password', '')
@@ -235,12 +1181,12 @@ def teacher_register_post():
         return render_template('teacher_register.html', error=f'등록 실패: {str(e)}')
 
 
-@app.route('/teacher/login')
+@bp.route('/teacher/login')
 def teacher_login():
     return render_template('teacher_login.html')
 
 
-@app.route('/teacher/login', methods=['POST'])
+@bp.route('/teacher/login', methods=['POST'])
 def teacher_login_post():
     teacher_code = request.form.get('teacher_code', '').strip()
     password = request.form.get('password', '')
@@ -276,12 +1222,12 @@ def teacher_login_post():
         return render_template('teacher_login.html', error=f'로그인 실패: {str(e)}')
 
 
-@app.route('/teacher/find-code')
+@bp.route('/teacher/find-code')
 def teacher_find_code():
     return render_template('teacher_find_code.html')
 
 
-@app.route('/teacher/find-code', methods=['POST'])
+@bp.route('/teacher/find-code', methods=['POST'])
 def teacher_find_code_post():
     teacher_name = request.form.get('teacher_name', '').strip()
     password = request.form.get('password', '')
@@ -317,7 +1263,7 @@ def teacher_find_code_post():
         return render_template('teacher_find_code.html', error=f'코드 찾기 실패: {str(e)}')
 
 
-@app.route('/teacher')
+@bp.route('/teacher')
 def teacher():
     teacher_code = session.get('teacher_code')
     teacher_name = session.get('teacher_name')
@@ -332,77 +1278,234 @@ def teacher():
     return render_template('teacher.html', teacher_code=teacher_code, teacher_name=teacher_name)
 
 
-@app.route('/student')
+@bp.route('/student')
 def student():
     return render_template('student.html')
 
 
-@socketio.on('connect')
-def on_connect():
-    print(f'클라이언트 연결: {request.sid}')
+@bp.route('/benchmark/lists')
+def list_benchmark():
+    """교사 대시보드 목록 렌더링 프레임 시간 측정 페이지 (합성 데이터, ?n=2000)"""
+    try:
+        count = max(10, min(int(request.args.get('n', 2000)), 50000))
+    except ValueError:
+        count = 2000
+    return render_template('list_benchmark.html', count=count)
+
+
+def iter_export_rows(teacher_code, start_date=None, end_date=None):
+    """교사 메시지를 이름 있는 서버 측 커서로 배치 단위 조회 (전체를 메모리에 올리지 않음)"""
+    query = '''SELECT m.id, m.timestamp, m.sender_type, m.sender_id, m.recipient_type,
+                      m.recipient_id, m.message, m.is_read,
+                      (SELECT COUNT(*) FROM hidden_messages h WHERE h.message_id = m.id)
+               FROM messages m
+               WHERE m.teacher_code = %s'''
+    params = [teacher_code]
+    if start_date:
+        query += ' AND m.timestamp >= %s'
+        params.append(start_date)
+    if end_date:
+        query += ' AND m.timestamp <= %s'
+        params.append(end_date + ' 23:59:59')
+    query += ' ORDER BY m.timestamp, m.id'
+
+    conn = get_db()
+    try:
+        c = conn.cursor(name='teacher_export')
+        c.itersize = EXPORT_BATCH_SIZE
+        c.execute(query, params)
+        while True:
+            rows = c.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            yield [
+                {
+                    'id': row[0],
+                    'timestamp': format_timestamp(row[1]),
+                    'sender_type': row[2],
+                    'sender_id': row[3],
+                    'recipient_type': row[4],
+                    'recipients': [] if not row[5] else row[5].split(','),
+                    'message': row[6],
+                    'is_read': bool(row[7]),
+                    'hidden_count': row[8],
+                }
+                for row in rows
+            ]
+        c.close()
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def encode_export_batch(batch, fmt, write_header):
+    if fmt == 'csv':
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        if write_header:
+            buf.write('\ufeff')  # 엑셀에서 한글이 깨지지 않도록 BOM
+            writer.writerow(EXPORT_COLUMNS)
+        for item in batch:
+            writer.writerow([
+                ';'.join(item[col]) if col == 'recipients' else item[col]
+                for col in EXPORT_COLUMNS
+            ])
+        return buf.getvalue().encode('utf-8')
+    return ''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in batch).encode('utf-8')
+
+
+@bp.route('/teacher/export')
+@bp.route('/teacher/export/<fmt>')
+def teacher_export(fmt=None):
+    """교사 메시지 기록을 NDJSON/CSV로 스트리밍 내보내기 (?gzip=1 이면 .gz 파일)"""
+    teacher_code = session.get('teacher_code')
+    if not teacher_code:
+        return Response('교사 로그인이 필요합니다.', status=401, mimetype='text/plain')
+
+    fmt = (fmt or request.args.get('format', 'ndjson')).lower()
+    if fmt not in ('ndjson', 'csv'):
+        return Response('지원하지 않는 형식입니다. (ndjson, csv)', status=400, mimetype='text/plain')
+    use_gzip = request.args.get('gzip') == '1'
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+
+    def generate():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+        first = True
+        for batch in iter_export_rows(teacher_code, start_date, end_date):
+            chunk = encode_export_batch(batch, fmt, first)
+            first = False
+            if compressor:
+                chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if chunk:
+                yield chunk
+        if first and fmt == 'csv':
+            chunk = encode_export_batch([], fmt, True)
+            yield compressor.compress(chunk) if compressor else chunk
+        if compressor:
+            yield compressor.flush()
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    filename = f'messages_{teacher_code}.{fmt}'
+    if use_gzip:
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    response = Response(generate(), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@bp.route('/teacher/roster', methods=['POST'])
+def teacher_roster_import():
+    """반 명단 CSV 업로드 (반 번호, 학생 이름[, 반 이름])"""
+    teacher_code = session.get('teacher_code')
+    if not teacher_code:
+        return jsonify({'status': 'error', 'message': '교사 로그인이 필요합니다.'}), 401
+
+    upload = request.files.get('roster')
+    text = upload.read().decode('utf-8-sig', errors='replace') if upload else request.form.get('roster_text', '')
+    rows = parse_roster_csv(text)
+    if not rows:
+        return jsonify({'status': 'error', 'message': '명단에서 학생을 찾을 수 없습니다.'}), 400
+
+    try:
+        imported = import_roster(teacher_code, rows, replace=request.form.get('replace') == '1')
+    except Exception as e:
+        logs.error('roster_import_failed', teacher_code=teacher_code, error=e)
+        return jsonify({'status': 'error', 'message': '명단 가져오기 중 오류가 발생했습니다.'}), 500
+
+    classes = drive(get_teacher_classes(route_io(), teacher_code))
+    socketio.emit('class_list_update', classes, room=f'teacher_{teacher_code}')
+    return jsonify({'status': 'success', 'imported': imported, 'rows': len(rows), 'classes': classes})
 
 
-@socketio.on('disconnect')
-def on_disconnect():
-    print(f'클라이언트 연결 해제: {request.sid}')
+@on_event('connect')
+def on_connect(ctx, auth=None):
+    logs.debug('socket_connected', sid=ctx.sid)
 
-    if request.sid in teachers:
-        del teachers[request.sid]
-    elif request.sid in students:
-        student_info = students[request.sid]
-        teacher_code = student_info.get('teacher_code')
-        student_name = student_info.get('student_name')
-        del students[request.sid]
 
-        # DB에서도 학생 레코드 삭제
-        if teacher_code and student_name:
+@on_event('disconnect')
+def on_disconnect(ctx):
+    logs.debug('socket_disconnected', sid=ctx.sid)
+
+    preview_requests.pop(ctx.sid, None)
+    pending_presence.pop(ctx.sid, None)
+    if ctx.sid in teachers:
+        del teachers[ctx.sid]
+    elif ctx.sid in students:
+        student_info = students[ctx.sid]
+        teacher_code = student_info.teacher_code
+        student_name = student_info.student_name
+        del students[ctx.sid]
+
+        # DB에서도 학생 레코드 삭제 (그사이 같은 학생이 새 소켓으로 다시 참여했으면 그 기록은 둔다)
+        if student_info.student_id:
             try:
-                conn = get_db()
-                c = conn.cursor()
-                c.execute(
-                    'DELETE FROM students WHERE teacher_code = %s AND student_name = %s',
-                    (teacher_code, student_name)
-                )
-                conn.commit()
-                conn.close()
+                conn = yield ctx.connect()
+                try:
+                    yield conn.cursor().execute(
+                        'DELETE FROM students WHERE student_id = %s AND socket_id = %s',
+                        (student_info.student_id, ctx.sid)
+                    )
+                    yield conn.commit()
+                finally:
+                    yield ctx.release(conn)
             except Exception as e:
-                print(f'학생 DB 삭제 오류: {e}')
+                logs.error('student_presence_delete_failed', teacher_code=teacher_code, error=e)
 
         if teacher_code:
             teacher_room = f'teacher_{teacher_code}'
-            socketio.emit('student_disconnected', student_info, room=teacher_room)
-            print(f"학생 연결 해제: {student_name} -> 교사 {teacher_code}")
+            yield ctx.emit('student_disconnected', student_info.as_dict(), room=teacher_room)
+            logs.info('student_left', teacher_code=teacher_code, student=student_name)
+
+
+def merge_pending_students(teacher_code, student_list):
+    """세션 토큰으로 복원돼 접속 기록이 아직 쓰이지 않은 학생을 목록에 더하고, 같은 학생의 끊긴 기록은 뺀다"""
+    listed = {entry['socket_id'] for entry in student_list}
+    for sid, info in list(students.items()):
+        if info.teacher_code == teacher_code and sid not in listed:
+            student_list.append({
+                'class_number': info.class_number,
+                'student_name': info.student_name,
+                'student_id': info.student_id,
+                'socket_id': sid,
+                'last_seen': now_kst_str(),
+                'is_online': True,
+                'display_name': info.student_name
+            })
+    online_ids = {entry['student_id'] for entry in student_list if entry['is_online']}
+    return [entry for entry in student_list if entry['is_online'] or entry['student_id'] not in online_ids]
 
 
-@socketio.on('teacher_join')
-def on_teacher_join(data):
+@on_event('teacher_join')
+def on_teacher_join(ctx, data):
     teacher_code = data.get('teacher_code')
     teacher_name = data.get('teacher_name', '교사')
 
-    teachers[request.sid] = {
-        'teacher_code': teacher_code,
-        'teacher_name': teacher_name,
-        'socket_id': request.sid
-    }
+    teachers[ctx.sid] = sessions.TeacherSession(teacher_code, teacher_name, ctx.sid)
 
-    allow_messages = get_teacher_allow_status(teacher_code)
+    allow_messages = yield from get_teacher_allow_status(ctx, teacher_code)
 
     teacher_room = f'teacher_{teacher_code}'
-    join_room(teacher_room)
+    yield ctx.enter_room(teacher_room)
+    yield ctx.enter_room(SCHOOL_ROOM)
 
-    conn = None
     try:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute(
-            '''SELECT class_number, student_name, student_id, socket_id, last_seen
-               FROM students
-               WHERE teacher_code = %s
-               ORDER BY student_name''',
-            (teacher_code,)
-        )
-
-        db_students = c.fetchall()
+        conn = yield ctx.connect()
+        try:
+            c = conn.cursor()
+            yield c.execute(
+                '''SELECT class_number, student_name, student_id, socket_id, last_seen
+                   FROM students
+                   WHERE teacher_code = %s
+                   ORDER BY student_name''',
+                (teacher_code,)
+            )
+            db_students = yield c.fetchall()
+        finally:
+            yield ctx.release(conn)
 
         student_list = []
         for db_student in db_students:
@@ -411,281 +1514,936 @@ def on_teacher_join(data):
             student_list.append({
                 'class_number': class_number,
                 'student_name': student_name,
-                'student_id': student_id or '',
+                'student_id': student_id,
                 'socket_id': socket_id,
                 'last_seen': format_timestamp(last_seen),
                 'is_online': is_online,
                 'display_name': student_name
             })
+        student_list = merge_pending_students(teacher_code, student_list)
 
-        emit('student_list_update', student_list)
-        print(f'교사 연결: {teacher_name} ({teacher_code}) - 학생 {len(student_list)}명')
+        yield ctx.emit('student_list_update', student_list)
+        logs.info('teacher_joined', teacher_code=teacher_code, students=len(student_list))
     except Exception as e:
-        print(f'교사 연결 오류: {e}')
-        emit('student_list_update', [])
-    finally:
-        if conn:
-            conn.close()
+        logs.error('teacher_join_failed', teacher_code=teacher_code, error=e)
+        yield ctx.emit('student_list_update', [])
 
-    emit('receive_status', {'allow': allow_messages})
+    try:
+        classes = yield from get_teacher_classes(ctx, teacher_code)
+        yield ctx.emit('class_list_update', classes)
+    except Exception as e:
+        logs.error('class_list_failed', teacher_code=teacher_code, error=e)
 
+    yield ctx.emit('receive_status', {'allow': allow_messages})
 
-@socketio.on('student_join')
-def on_student_join(data):
-    teacher_code = data.get('teacher_code')
-    student_name = data.get('student_name')
+    poll = polls.get(teacher_code)
+    if poll is not None:
+        yield ctx.emit('poll_state', dict(poll.results(), closed=False))
+
+
+def issue_session_token(student_info):
+    return current_app.extensions['session_tokens'].dumps({
+        'teacher_code': student_info.teacher_code,
+        'student_name': student_info.student_name,
+        'student_id': student_info.student_id,
+        'class_number': student_info.class_number,
+        'teacher_name': student_info.teacher_name,
+    })
 
-    conn = None
+
+def load_session_token(token, teacher_code, student_name):
+    """서명/만료를 확인하고 같은 교사 코드/이름이면 토큰 내용을, 아니면 None (학생 id가 없는 예전 토큰도 None)"""
+    if not isinstance(token, str):
+        return None
     try:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute('SELECT teacher_name FROM teachers WHERE teacher_code = %s', (teacher_code,))
-        teacher = c.fetchone()
+        session_info = current_app.extensions['session_tokens'].loads(token, max_age=SESSION_TOKEN_MAX_AGE)
+    except BadSignature:  # 만료(SignatureExpired)도 여기에 포함
+        return None
+    if session_info.get('teacher_code') != teacher_code or session_info.get('student_name') != student_name:
+        return None
+    if not isinstance(session_info.get('student_id'), int):
+        return None
+    return session_info
 
-        if not teacher:
-            emit('student_join_error', {'error': '유효하지 않은 교사 코드입니다.'})
-            return
 
-        teacher_name_db = teacher[0]
-        class_number = ''
-        student_id = ''
+def queue_presence(ctx, student_info):
+    global presence_flush_scheduled
+    pending_presence[student_info.socket_id] = student_info
+    if not presence_flush_scheduled:
+        presence_flush_scheduled = True
+        ctx.start_background_task(flush_presence)
 
-        c.execute(
-            '''DELETE FROM students
-               WHERE teacher_code = %s AND student_name = %s''',
-            (teacher_code, student_name)
-        )
 
-        c.execute(
-            '''INSERT INTO students
-               (teacher_code, class_number, student_name, student_id, socket_id, last_seen)
-               VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)''',
-            (teacher_code, class_number, student_name, student_id, request.sid)
-        )
-        conn.commit()
+def flush_presence(ctx):
+    """모인 접속 기록을 한 트랜잭션으로 쓴다 (그사이 연결이 끊긴 학생은 뺀다)"""
+    global presence_flush_scheduled
+    yield ctx.sleep(PRESENCE_FLUSH_INTERVAL)
+    presence_flush_scheduled = False
+    batch = [info for sid, info in pending_presence.items() if sid in students]
+    pending_presence.clear()
+    if not batch:
+        return
+    try:
+        conn = yield ctx.connect()
+        try:
+            yield save_presence(conn.cursor(), batch)
+            yield conn.commit()
+        finally:
+            yield ctx.release(conn)
+        logs.debug('student_presence_flushed', students=len(batch))
+    except Exception as e:
+        logs.error('student_presence_flush_failed', students=len(batch), error=e)
+
+
+def save_presence(c, batch):
+    """students 테이블에 학생별 한 행 (AsyncCursor면 await할 값을 돌려줌)"""
+    return c.execute(
+        '''WITH v AS (
+             SELECT * FROM unnest(%s::text[], %s::text[], %s::text[], %s::int[], %s::text[])
+               AS v(teacher_code, class_number, student_name, student_id, socket_id)
+           ), removed AS (
+             DELETE FROM students AS s USING v
+             WHERE s.student_id = v.student_id
+           )
+           INSERT INTO students (teacher_code, class_number, student_name, student_id, socket_id, last_seen)
+           SELECT teacher_code, class_number, student_name, student_id, socket_id, CURRENT_TIMESTAMP FROM v''',
+        ([info.teacher_code for info in batch], [info.class_number for info in batch],
+         [info.student_name for info in batch], [info.student_id for info in batch],
+         [info.socket_id for info in batch])
+    )
 
-        student_info = {
-            'teacher_code': teacher_code,
-            'class_number': class_number,
-            'student_name': student_name,
-            'student_id': student_id,
-            'socket_id': request.sid,
-            'teacher_name': teacher_name_db
-        }
 
-        students[request.sid] = student_info
+@on_event('student_join')
+def on_student_join(ctx, data):
+    teacher_code = data.get('teacher_code')
+    student_name = data.get('student_name')
 
-        teacher_room = f'teacher_{teacher_code}'
-        student_room = f'students_{teacher_code}'
-        join_room(student_room)
+    # 재접속: 서명된 세션 토큰이면 교사 조회/DELETE/INSERT 없이 복원 (접속 기록은 모아서 씀)
+    session_info = load_session_token(data.get('session_token'), teacher_code, student_name)
+    if session_info:
+        student_info = sessions.StudentSession(
+            teacher_code, session_info.get('class_number'), student_name, ctx.sid, session_info.get('teacher_name'),
+            session_info['student_id'])
+        students[ctx.sid] = student_info
+        queue_presence(ctx, student_info)
+        yield from finish_student_join(ctx, student_info, resumed=True)
+        return
 
-        allow_messages = get_teacher_allow_status(teacher_code)
+    wait = admission.reserve()
+    if wait is None:
+        yield ctx.emit('student_join_error', {'error': '접속이 몰려 잠시 후 다시 연결합니다.', 'retry_after': admission.retry_after()})
+        return
+    if wait:
+        yield ctx.sleep(wait)
 
-        emit('student_join_success', {
-            'status': 'success',
-            'student_info': student_info,
-            'teacher_name': teacher_name_db,
-            'allow_messages': allow_messages
-        })
+    try:
+        conn = yield ctx.connect()
+        try:
+            c = conn.cursor()
+            yield c.execute('SELECT teacher_name FROM teachers WHERE teacher_code = %s', (teacher_code,))
+            teacher = yield c.fetchone()
+
+            if not teacher:
+                yield ctx.emit('student_join_error', {'error': '유효하지 않은 교사 코드입니다.'})
+                return
+
+            teacher_name_db = teacher[0]
+
+            # 명단에 등록된 학생이면 소속 반을 찾아 반 방에 참여 (클라이언트가 반을 알려주면 그 반만)
+            requested_class = (data.get('class_number') or '').strip()
+            yield c.execute(
+                '''SELECT class_number FROM class_students
+                   WHERE teacher_code = %s AND student_name = %s
+                   ORDER BY class_number''',
+                (teacher_code, student_name)
+            )
+            rows = yield c.fetchall()
+            class_numbers = [row[0] for row in rows]
+            if requested_class in class_numbers:
+                class_numbers = [requested_class]
+            if len(class_numbers) > 1:
+                # 같은 이름이 여러 반에 있으면 서로 다른 학생이므로 반을 골라 다시 참여하게 한다
+                yield ctx.emit('student_join_error', {'error': '같은 이름의 학생이 여러 반에 있습니다. 반을 선택해주세요.',
+                                                      'classes': class_numbers})
+                return
+            class_number = class_numbers[0] if class_numbers else ''
+
+            yield identities.issue(c, teacher_code, class_number, student_name)
+            student_id = (yield c.fetchone())[0]
+            yield c.execute('DELETE FROM students WHERE student_id = %s', (student_id,))
+
+            yield c.execute(
+                '''INSERT INTO students
+                   (teacher_code, class_number, student_name, student_id, socket_id, last_seen)
+                   VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)''',
+                (teacher_code, class_number, student_name, student_id, ctx.sid)
+            )
+            yield conn.commit()
+        finally:
+            yield ctx.release(conn)
+
+        student_info = sessions.StudentSession(
+            teacher_code, class_number, student_name, ctx.sid, teacher_name_db, student_id)
 
-        socketio.emit('student_connected', student_info, room=teacher_room)
-        print(f"학생 연결: {student_name} -> 교사 {teacher_name_db} ({teacher_code})")
+        students[ctx.sid] = student_info
+        yield from finish_student_join(ctx, student_info)
     except Exception as e:
-        print(f'학생 연결 오류: {e}')
-        emit('student_join_error', {'error': '연결 중 오류가 발생했습니다.'})
-    finally:
-        if conn:
-            conn.close()
+        logs.error('student_join_failed', teacher_code=teacher_code, error=e)
+        yield ctx.emit('student_join_error', {'error': '연결 중 오류가 발생했습니다.'})
 
 
-@socketio.on('kick_student')
-def on_kick_student(data):
-    teacher_info = teachers.get(request.sid)
+def finish_student_join(ctx, student_info, resumed=False):
+    """방 참여, 참여 결과(+ 새 세션 토큰) 전송, 교사에게 알림"""
+    teacher_code = student_info.teacher_code
+    student_name = student_info.student_name
+    teacher_room = f'teacher_{teacher_code}'
+    student_room = f'students_{teacher_code}'
+    yield ctx.enter_room(SCHOOL_ROOM)
+    yield ctx.enter_room(student_room)
+    for number in student_info.class_numbers():
+        yield ctx.enter_room(class_room(teacher_code, number))
+
+    allow_messages = yield from get_teacher_allow_status(ctx, teacher_code)  # 교사별로 워커 메모리에 캐시됨
+
+    yield ctx.emit('student_join_success', {
+        'status': 'success',
+        'student_info': student_info.as_dict(),
+        'teacher_name': student_info.teacher_name,
+        'allow_messages': allow_messages,
+        'session_token': issue_session_token(student_info),
+        'resumed': resumed,
+    })
+
+    # 진행 중인 투표가 있으면 문제와 (재접속이면) 이미 고른 답을 함께 보낸다
+    poll = polls.get(teacher_code)
+    if poll is not None:
+        yield ctx.emit('poll_started', dict(poll.public(), my_option=poll.votes.get(student_info.student_id)))
+
+    yield ctx.emit('student_connected', student_info.as_dict(), room=teacher_room)
+    logs.info('student_joined', teacher_code=teacher_code, student=student_name, resumed=resumed)
+
+
+@on_event('kick_student')
+def on_kick_student(ctx, data):
+    teacher_info = teachers.get(ctx.sid)
     if not teacher_info:
-        emit('kick_result', {'status': 'error', 'message': '교사 인증에 실패했습니다.'})
+        yield ctx.emit('kick_result', {'status': 'error', 'message': '교사 인증에 실패했습니다.'})
         return
 
     student_sid = data.get('student_socket_id')
     if not student_sid or student_sid not in students:
-        emit('kick_result', {'status': 'error', 'message': '해당 학생을 찾을 수 없습니다.'})
+        yield ctx.emit('kick_result', {'status': 'error', 'message': '해당 학생을 찾을 수 없습니다.'})
         return
 
     student_info = students.get(student_sid)
-    if student_info.get('teacher_code') != teacher_info.get('teacher_code'):
-        emit('kick_result', {'status': 'error', 'message': '해당 학생을 내보낼 권한이 없습니다.'})
+    if student_info.teacher_code != teacher_info.teacher_code:
+        yield ctx.emit('kick_result', {'status': 'error', 'message': '해당 학생을 내보낼 권한이 없습니다.'})
         return
 
-    socketio.emit('kicked', {'reason': 'teacher_kick'}, room=student_sid)
-    disconnect(student_sid)
-    emit('kick_result', {'status': 'success', 'student_name': student_info.get('student_name', '')})
+    yield ctx.emit('kicked', {'reason': 'teacher_kick'}, room=student_sid)
+    yield ctx.disconnect(student_sid)
+    yield ctx.emit('kick_result', {'status': 'success', 'student_name': student_info.student_name})
 
 
-@socketio.on('get_message_history')
-def on_get_message_history(data):
-    student_name = data.get('student_name')
-    teacher_code = data.get('teacher_code')
-    skey = student_key(teacher_code, student_name)
-    print(f'[DEBUG] get_message_history 호출: teacher_code={teacher_code}, student_name={student_name}')
+@on_event('get_message_history')
+def on_get_message_history(ctx, data):
+    """학생 메시지 기록. after_id가 있으면 그 이후 메시지만 보내고(증분 동기화), since_id 이상에서
+    아직 보이는 메시지 id 목록(visible_ids)을 함께 보내 클라이언트가 삭제/숨김을 맞출 수 있게 한다.
+    학생은 참여한 소켓의 학생 id로 찾는다."""
+    student_info = students.get(ctx.sid)
+    if not student_info:
+        yield ctx.emit('message_history', {'messages': [], 'error': True})
+        return
+    teacher_code = student_info.teacher_code
+    student_name = student_info.student_name
+    after_id = data.get('after_id')
+    since_id = data.get('since_id')
+    incremental = isinstance(after_id, int) and after_id > 0
+
+    wait = admission.reserve()
+    if wait is None:
+        yield ctx.emit('message_history', {'messages': [], 'error': True, 'retry_after': admission.retry_after()})
+        return
+    if wait:
+        yield ctx.sleep(wait)
 
-    conn = None
     try:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute(
-            '''SELECT id, sender_type, sender_id, message, timestamp
-               FROM messages
-               WHERE teacher_code = %s
-                 AND (recipient_id = 'all' OR recipient_id LIKE %s)
-                 AND id NOT IN (
-                    SELECT message_id FROM hidden_messages
-                    WHERE teacher_code = %s AND student_key = %s
-                 )
-               ORDER BY timestamp DESC
-               LIMIT 50''',
-            (teacher_code, f'%{student_name}%', teacher_code, skey)
-        )
+        conn = yield ctx.connect()
+        try:
+            c = conn.cursor()
+            visible_filter = '''teacher_code IN (%s, %s)
+                     AND (recipient_id = 'all' OR recipient_student_ids @> ARRAY[%s::integer])
+                     AND id NOT IN (
+                        SELECT message_id FROM hidden_messages WHERE student_id = %s
+                     )'''
+            params = (teacher_code, SCHOOL_TEACHER_CODE, student_info.student_id, student_info.student_id)
+            if incremental:
+                yield c.execute(
+                    f'''SELECT id, sender_type, sender_id, message, timestamp
+                       FROM messages
+                       WHERE {visible_filter} AND id > %s
+                       ORDER BY id DESC
+                       LIMIT %s''',
+                    params + (after_id, HISTORY_SYNC_LIMIT)
+                )
+            else:
+                yield c.execute(
+                    f'''SELECT id, sender_type, sender_id, message, timestamp
+                       FROM messages
+                       WHERE {visible_filter}
+                       ORDER BY timestamp DESC
+                       LIMIT 50''',
+                    params
+                )
 
-        messages = []
-        for row in c.fetchall():
-            messages.append({
-                'id': row[0],
-                'sender': '교사' if row[1] == 'teacher' else row[2],
-                'message': row[3],
-                'timestamp': format_timestamp(row[4])
-            })
-        
-        print(f'[DEBUG] get_message_history 결과: {len(messages)}개 메시지 발견')
-        if len(messages) > 0:
-            print(f'[DEBUG] 첫 메시지: {messages[0]}')
+            rows = yield c.fetchall()
+            refs = {}
+            if rows:
+                yield attachments.select_for_messages(c, [row[0] for row in rows])
+                refs = attachments.group_by_message((yield c.fetchall()))
+                for message_refs in refs.values():
+                    with_attachment_keys(message_refs)
+            messages = []
+            for row in rows:
+                entry = {
+                    'id': row[0],
+                    'sender': '교사' if row[1] == 'teacher' else row[2],
+                    'message': row[3],
+                    'timestamp': format_timestamp(row[4])
+                }
+                if row[0] in refs:
+                    entry['attachments'] = refs[row[0]]
+                messages.append(entry)
+
+            payload = {'messages': messages}
+            if incremental:
+                payload['incremental'] = True
+                payload['after_id'] = after_id
+                if isinstance(since_id, int) and 0 < since_id <= after_id:
+                    yield c.execute(
+                        f'''SELECT id FROM messages
+                           WHERE {visible_filter} AND id >= %s AND id <= %s
+                           ORDER BY id DESC
+                           LIMIT %s''',
+                        params + (since_id, after_id, HISTORY_SYNC_LIMIT)
+                    )
+                    visible = yield c.fetchall()
+                    payload['since_id'] = since_id
+                    payload['visible_ids'] = [row[0] for row in visible]
+        finally:
+            yield ctx.release(conn)
 
-        emit('message_history', {'messages': messages})
+        logs.debug('get_message_history', teacher_code=teacher_code, student=student_name,
+                   count=len(messages), after_id=after_id)
+
+        yield ctx.emit('message_history', payload)
     except Exception as e:
-        print(f'[오류] 메시지 조회 오류: {e}')
-        emit('message_history', {'messages': []})
-    finally:
-        if conn:
-            conn.close()
+        logs.error('message_history_failed', teacher_code=teacher_code, error=e)
+        yield ctx.emit('message_history', {'messages': [], 'error': True})
 
 
-@socketio.on('send_message')
-def on_send_message(data):
+def receive_message_payload(msg_id, message, trace=None, attachment_refs=None):
+    payload = {
+        'message_id': msg_id,
+        'message': message,
+        'sender': '교사',
+        'timestamp': now_kst_str()
+    }
+    if trace:
+        payload['trace'] = trace
+    if attachment_refs:
+        payload['attachments'] = attachment_refs  # 참조만 (파일은 /files/<id>)
+    return payload
+
+
+@on_event('send_message')
+def on_send_message(ctx, data):
+    received_at = delivery_trace.now_ms()
     sender_type = data.get('sender_type')
     message = data.get('message')
     recipients = data.get('recipients', [])
     teacher_code = data.get('teacher_code')
     is_manual_recipient = data.get('is_manual_recipient', False)
+    target_classes = [str(n) for n in data.get('target_classes') or [] if n]
+
+    client_key = data.get('client_key')
+    if not valid_client_key(client_key):
+        client_key = None
 
     if sender_type == 'teacher' and teacher_code:
+        # 재접속 후 같은 키로 다시 보낸 전송: 저장/전달 없이 처음 message_id만 돌려줌
+        msg_id = recall_client_key(teacher_code, client_key) if client_key else None
+        if msg_id is not None:
+            duplicate_sends.inc('cache')
+            yield ctx.emit('message_sent', {'status': 'success', 'message_id': msg_id, 'client_key': client_key, 'duplicate': True})
+            return
+        # 첨부는 미리 올려 둔 파일의 참조({id, name})만 받는다 (저장되지 않은 id는 뺀다)
+        attachment_refs = yield from find_attachments(ctx, teacher_code, attachments.parse_refs(data.get('attachments')))
+        if data.get('attachments') and not attachment_refs:
+            yield ctx.emit('message_sent', {'status': 'error', 'message': '첨부 파일을 찾을 수 없습니다. 다시 올려주세요.', 'client_key': client_key})
+            return
         student_room = f'students_{teacher_code}'
-        recipient_names = []
-
-        if 'all' in recipients:
-            recipient_names = [info.get('student_name', '') for info in students.values() if info.get('teacher_code') == teacher_code]
-            msg_id = save_message_multi_teacher(teacher_code, 'teacher', 'student', recipient_names or ['all'], message)
-            socketio.emit(
-                    'receive_message',
-                    {
-                        'message_id': msg_id,
-                        'message': message,
-                        'sender': '교사',
-                        'timestamp': now_kst_str()
-                    },
-                    room=student_room
-                )
+
+        if target_classes:
+            # 반 단위 전송: 명단 기준으로 수신자를 정확히 기록하고 반 방으로만 전달
+            recipients = yield from get_class_students(ctx, teacher_code, target_classes)
+            if not recipients:
+                yield ctx.emit('message_sent', {'status': 'error', 'message': '선택한 반에 등록된 학생이 없습니다.', 'client_key': client_key})
+                return
+            msg_id, created = yield from save_message_multi_teacher(
+                ctx, teacher_code, 'teacher', 'student', recipients, message, client_key, attachment_refs)
+            if not created:
+                return (yield from reply_duplicate_send(ctx, msg_id, client_key))
+            class_sids = [
+                sid for sid, info in students.items()
+                if info.teacher_code == teacher_code
+                and set((info.class_number or '').split(',')) & set(target_classes)
+            ]
+            trace = delivery_trace.start(teacher_code, msg_id, received_at, delivery_trace.now_ms(), class_sids)
+            yield ctx.emit(
+                'receive_message',
+                receive_message_payload(msg_id, message, trace, attachment_refs),
+                room=[class_room(teacher_code, n) for n in target_classes]
+            )
+        elif 'all' in recipients:
+            online = {sid: info for sid, info in students.items() if info.teacher_code == teacher_code}
+            msg_id, created = yield from save_message_multi_teacher(
+                ctx, teacher_code, 'teacher', 'student',
+                [(info.student_id, info.student_name) for info in online.values()] or None,
+                message, client_key, attachment_refs)
+            if not created:
+                return (yield from reply_duplicate_send(ctx, msg_id, client_key))
+            trace = delivery_trace.start(teacher_code, msg_id, received_at, delivery_trace.now_ms(), online)
+            yield ctx.emit('receive_message', receive_message_payload(msg_id, message, trace, attachment_refs), room=student_room)
         elif is_manual_recipient:
-            # 수동 입력된 수신자 이름 처리 (오프라인 학생용)
-            recipient_names = recipients  # 이미 이름 리스트임
-            msg_id = save_message_multi_teacher(teacher_code, 'teacher', 'student', recipient_names, message)
-            
-            # 해당 이름의 학생이 현재 접속 중이면 실시간 전송
-            for sid, info in students.items():
-                if info.get('teacher_code') == teacher_code and info.get('student_name') in recipient_names:
-                    socketio.emit(
-                        'receive_message',
-                        {
-                            'message_id': msg_id,
-                            'message': message,
-                            'sender': '교사',
-                            'timestamp': now_kst_str()
-                        },
-                        room=sid
-                    )
+            # 수동 입력된 수신자 이름 처리 (오프라인 학생용): 이름의 학생 id로 저장 (모르는 이름이 있으면 보내지 않음)
+            resolved = yield from resolve_student_names(ctx, teacher_code, recipients)
+            unknown = unknown_student_names(recipients, resolved)
+            if unknown:
+                yield ctx.emit('message_sent', dict(unknown_names_error(unknown), client_key=client_key))
+                return
+            msg_id, created = yield from save_message_multi_teacher(
+                ctx, teacher_code, 'teacher', 'student', resolved, message, client_key, attachment_refs)
+            if not created:
+                return (yield from reply_duplicate_send(ctx, msg_id, client_key))
+
+            # 해당 학생이 현재 접속 중이면 실시간 전송
+            resolved_ids = {student_id for student_id, _ in resolved}
+            online_sids = [
+                sid for sid, info in students.items()
+                if info.teacher_code == teacher_code and info.student_id in resolved_ids
+            ]
+            trace = delivery_trace.start(teacher_code, msg_id, received_at, delivery_trace.now_ms(), online_sids)
+            payload = receive_message_payload(msg_id, message, trace, attachment_refs)
+            for sid in online_sids:
+                yield ctx.emit('receive_message', payload, room=sid)
         else:
+            selected_sids = [sid for sid in recipients if sid in students]
+            selected = [(students[sid].student_id, students[sid].student_name) for sid in selected_sids]
+            msg_id, created = yield from save_message_multi_teacher(
+                ctx, teacher_code, 'teacher', 'student', selected, message, client_key, attachment_refs)
+            if not created:
+                return (yield from reply_duplicate_send(ctx, msg_id, client_key))
+            trace = delivery_trace.start(teacher_code, msg_id, received_at, delivery_trace.now_ms(), selected_sids)
+            payload = receive_message_payload(msg_id, message, trace, attachment_refs)
             for student_socket_id in recipients:
-                info = students.get(student_socket_id)
-                if info:
-                    recipient_names.append(info.get('student_name', ''))
-            msg_id = save_message_multi_teacher(teacher_code, 'teacher', 'student', recipient_names, message)
-            for student_socket_id in recipients:
-                socketio.emit(
-                        'receive_message',
-                        {
-                            'message_id': msg_id,
-                            'message': message,
-                            'sender': '교사',
-                            'timestamp': now_kst_str()
-                        },
-                        room=student_socket_id
-                    )
+                yield ctx.emit('receive_message', payload, room=student_socket_id)
 
-        emit('message_sent', {'status': 'success', 'message_id': msg_id})
+        yield ctx.emit('message_sent', {'status': 'success', 'message_id': msg_id, 'client_key': client_key})
     elif sender_type == 'student' and teacher_code:
-        if not get_teacher_allow_status(teacher_code):
-            emit('student_message_error', {'message': '교사가 현재 메시지 수신을 허용하지 않습니다.'})
+        # 보낸 학생은 이 소켓이 참여한 학생이다 (페이로드의 student_name/teacher_code는 쓰지 않음)
+        student_info = students.get(ctx.sid)
+        if not student_info:
+            yield ctx.emit('student_message_error', {'message': '먼저 교사 코드로 접속해주세요.'})
             return
-        student_name = data.get('student_name') or '학생'
-        try:
-            conn = get_db()
-            c = conn.cursor()
-            c.execute(
-                '''INSERT INTO messages (teacher_code, sender_type, sender_id, recipient_type, recipient_id, message)
-                   VALUES (%s, %s, %s, %s, %s, %s)
-                   RETURNING id''',
-                (teacher_code, 'student', student_name, 'teacher', teacher_code, message)
-            )
-            msg_id = c.fetchone()[0]
+        teacher_code = student_info.teacher_code
+        if not (yield from get_teacher_allow_status(ctx, teacher_code)):
+            yield ctx.emit('student_message_error', {'message': '교사가 현재 메시지 수신을 허용하지 않습니다.'})
+            return
+        msg_id = recall_client_key(teacher_code, client_key) if client_key else None
+        if msg_id is not None:
+            duplicate_sends.inc('cache')
+            yield ctx.emit('student_message_sent', {'status': 'success', 'message_id': msg_id, 'duplicate': True})
+            return
+        yield from queue_student_messages(ctx, teacher_code, {
+            'sid': ctx.sid, 'student_id': student_info.student_id, 'student_name': student_info.student_name or '학생',
+            'items': [(client_key, message)], 'batch': False, 'more': False,
+        })
 
-            c.execute(
-                '''DELETE FROM messages
-                   WHERE id IN (
-                     SELECT id FROM messages
-                     WHERE teacher_code = %s AND recipient_type = 'teacher'
-                     ORDER BY id DESC
-                     OFFSET 1000
-                   )''',
-                (teacher_code,)
-            )
-            conn.commit()
-            conn.close()
 
-            teacher_room = f'teacher_{teacher_code}'
-            socketio.emit('new_message_from_student', {
-                'id': msg_id,
-                'student_name': student_name,
-                'message': message,
-                'timestamp': now_kst_str()
-            }, room=teacher_room)
+def reply_duplicate_send(ctx, msg_id, client_key):
+    duplicate_sends.inc('db')
+    yield ctx.emit('message_sent', {'status': 'success', 'message_id': msg_id, 'client_key': client_key, 'duplicate': True})
 
-            emit('student_message_sent', {'status': 'success', 'message_id': msg_id})
-        except Exception as e:
-            print(f'학생 메시지 전송 오류: {e}')
-            emit('student_message_error', {'message': '메시지 전송 중 오류가 발생했습니다.'})
 
+def valid_client_key(key):
+    return isinstance(key, str) and 0 < len(key) <= CLIENT_KEY_MAX_LENGTH
 
-def save_message_multi_teacher(teacher_code, sender_type, recipient_type, recipient_names, message):
-    recipient_str = 'all' if recipient_names == ['all'] else ','.join(recipient_names)
-    conn = get_db()
-    c = conn.cursor()
-    c.execute(
-        '''INSERT INTO messages (teacher_code, sender_type, sender_id, recipient_type, recipient_id, message)
-           VALUES (%s, %s, %s, %s, %s, %s)
+
+def recall_client_key(teacher_code, client_key):
+    """LRU에 있는 키면 처음 저장한 message_id (없으면 None)"""
+    cache_key = (teacher_code, client_key)
+    msg_id = recent_client_keys.get(cache_key)
+    if msg_id is not None:
+        recent_client_keys.move_to_end(cache_key)
+    return msg_id
+
+
+def remember_client_key(teacher_code, client_key, msg_id):
+    if not client_key or msg_id is None or CLIENT_KEY_CACHE_SIZE <= 0:
+        return
+    recent_client_keys[(teacher_code, client_key)] = msg_id
+    recent_client_keys.move_to_end((teacher_code, client_key))
+    while len(recent_client_keys) > CLIENT_KEY_CACHE_SIZE:
+        recent_client_keys.popitem(last=False)
+
+
+def claim_client_keys(c, teacher_code, keys):
+    """client_key 목록을 한 문장으로 선점 (AsyncCursor면 await할 값을 돌려줌, gevent/asyncio 스택 공용).
+
+    결과 행: (client_key, message_id, 이번에 선점했는지). 같은 키를 다른 트랜잭션이 저장 중이면 그 트랜잭션이 끝날
+    때까지 기다린 뒤 그 행을 돌려준다. 이미 있던 키는 message_id가 NULL이어도(처리 중이거나 id가 기록되지 않음)
+    중복으로 본다. keys 안에 같은 키가 두 번 있으면 안 된다.
+    """
+    return c.execute(
+        '''INSERT INTO message_client_keys (teacher_code, client_key)
+           SELECT %s, key FROM unnest(%s::text[]) AS key
+           ON CONFLICT (teacher_code, client_key) DO UPDATE SET client_key = EXCLUDED.client_key
+           RETURNING client_key, message_id, xmax = 0''',
+        (teacher_code, keys)
+    )
+
+
+def set_client_key_ids(c, teacher_code, keyed):
+    """선점한 키에 저장한 message_id를 기록 (keyed: [(client_key, message_id)], AsyncCursor면 await할 값을 돌려줌)"""
+    return c.execute(
+        '''UPDATE message_client_keys AS k SET message_id = v.id
+           FROM unnest(%s::text[], %s::int[]) AS v(key, id)
+           WHERE k.teacher_code = %s AND k.client_key = v.key''',
+        ([key for key, _ in keyed], [msg_id for _, msg_id in keyed], teacher_code)
+    )
+
+
+def recipient_str(recipients):
+    """messages.recipient_id: 표시/검색용 이름 목록 (recipients가 None이면 'all')"""
+    return 'all' if recipients is None else ','.join(name for _, name in recipients)
+
+
+def recipient_ids(recipients):
+    """messages.recipient_student_ids: 학생 기록 조회는 이 id 배열로 찾는다"""
+    return None if recipients is None else [student_id for student_id, _ in recipients]
+
+
+def save_message_multi_teacher(ctx, teacher_code, sender_type, recipient_type, recipients, message, client_key=None,
+                               attachment_refs=None):
+    """recipients: [(학생 id, 이름)], 전체면 None.
+    반환값: (message_id, 새로 저장했는지). 이미 처리한 client_key면 저장하지 않고 처음 id를 돌려준다."""
+    conn = yield ctx.connect()
+    try:
+        c = conn.cursor()
+        if client_key:
+            yield claim_client_keys(c, teacher_code, [client_key])
+            _, msg_id, claimed = yield c.fetchone()
+            if not claimed:
+                yield conn.rollback()
+                remember_client_key(teacher_code, client_key, msg_id)
+                return msg_id, False
+        yield c.execute(
+            '''INSERT INTO messages
+               (teacher_code, sender_type, sender_id, recipient_type, recipient_id, recipient_student_ids, message)
+               VALUES (%s, %s, %s, %s, %s, %s, %s)
+               RETURNING id''',
+            (teacher_code, sender_type, teacher_code, recipient_type, recipient_str(recipients),
+             recipient_ids(recipients), message)
+        )
+        msg_id = (yield c.fetchone())[0]
+        if client_key:
+            yield set_client_key_ids(c, teacher_code, [(client_key, msg_id)])
+        if attachment_refs:
+            yield attachments.link(c, msg_id, attachment_refs)
+        yield message_rollups.record_insert(c, teacher_code, sender_type)
+        yield conn.commit()
+    finally:
+        yield ctx.release(conn)
+    remember_client_key(teacher_code, client_key, msg_id)
+    return msg_id, True
+
+
+def insert_teacher_messages(c, teacher_code, rows):
+    """([(학생 id, 이름)], message) 목록을 저장 (executemany returning, AsyncCursor면 await할 값을 돌려줌)"""
+    return c.executemany(
+        '''INSERT INTO messages
+           (teacher_code, sender_type, sender_id, recipient_type, recipient_id, recipient_student_ids, message)
+           VALUES (%s, 'teacher', %s, 'student', %s, %s, %s)
            RETURNING id''',
-        (teacher_code, sender_type, teacher_code, recipient_type, recipient_str, message)
+        [(teacher_code, teacher_code, recipient_str(recipients), recipient_ids(recipients), message)
+         for recipients, message in rows],
+        returning=True
     )
-    msg_id = c.fetchone()[0]
-    conn.commit()
-    conn.close()
-    return msg_id
+
+
+def save_teacher_messages_batch(ctx, teacher_code, rows):
+    """([(학생 id, 이름)], message) 목록을 한 트랜잭션에 저장하고 입력 순서대로 id 목록을 반환"""
+    conn = yield ctx.connect()
+    try:
+        c = conn.cursor()
+        yield insert_teacher_messages(c, teacher_code, rows)
+        ids = []
+        while True:
+            ids.append((yield c.fetchone())[0])
+            if not c.nextset():
+                break
+        yield message_rollups.record_insert(c, teacher_code, 'teacher', len(rows))
+        yield conn.commit()
+        return ids
+    finally:
+        yield ctx.release(conn)
+
+
+def message_batch_items(data):
+    """send_message_batch 항목 목록, 개수가 맞지 않으면 (None, 오류 결과)"""
+    items = (data or {}).get('items') or []
+    if not items or len(items) > BATCH_SEND_LIMIT:
+        return None, {'status': 'error', 'message': f'한 번에 1~{BATCH_SEND_LIMIT}개까지 보낼 수 있습니다.'}
+    return items, None
+
+
+def manual_batch_names(items):
+    """직접 입력한 이름은 모든 항목을 모아 한 번에 학생 id로 바꾼다"""
+    return [name for item in items if item.get('is_manual_recipient') for name in item.get('recipients') or [] if name]
+
+
+def plan_message_batch(teacher_code, items, manual_names, resolved_names):
+    """항목마다 (수신자, 메시지)와 전달할 sid 목록을 만든다. 반환값: (rows, targets, 오류 결과 또는 None)
+
+    resolved_names: resolve_student_names(manual_names) 결과.
+    """
+    unknown = unknown_student_names(manual_names, resolved_names)
+    if unknown:
+        return None, None, unknown_names_error(unknown)
+    by_name = {}
+    for student_id, name in resolved_names:
+        by_name.setdefault(name, []).append(student_id)
+
+    # 접속 중인 학생 색인을 한 번만 만든다: 학생 id -> [sid]
+    online = {}
+    for sid, info in students.items():
+        if info.teacher_code == teacher_code:
+            online.setdefault(info.student_id, []).append(sid)
+
+    rows = []
+    targets = []  # 항목별 전달 대상 sid 목록
+    for item in items:
+        message = (item.get('message') or '').strip()
+        recipients = item.get('recipients') or []
+        if item.get('is_manual_recipient'):
+            resolved = [(student_id, name) for name in dict.fromkeys(recipients) if name
+                        for student_id in by_name.get(name, [])]
+        else:
+            resolved = [(students[sid].student_id, students[sid].student_name) for sid in recipients
+                        if sid in students and students[sid].teacher_code == teacher_code]
+        rows.append((resolved, message))
+        targets.append([sid for student_id, _ in resolved for sid in online.get(student_id, [])])
+
+    if any(not message or not resolved for resolved, message in rows):
+        return None, None, {'status': 'error', 'message': '수신자나 내용이 비어 있는 항목이 있습니다.'}
+    return rows, targets, None
+
+
+def message_batch_result(ids, rows, targets):
+    return {
+        'status': 'success',
+        'items': [
+            {'message_id': msg_id, 'recipients': list(dict.fromkeys(name for _, name in resolved)), 'delivered': len(sids)}
+            for msg_id, (resolved, _), sids in zip(ids, rows, targets)
+        ]
+    }
+
+
+@on_event('send_message_batch')
+def on_send_message_batch(ctx, data):
+    """학생별로 다른 메시지를 한 번에 전송: [{recipients, message, is_manual_recipient}, ...]"""
+    received_at = delivery_trace.now_ms()
+    teacher_info = teachers.get(ctx.sid)
+    if not teacher_info:
+        result = {'status': 'error', 'message': '교사 인증에 실패했습니다.'}
+        yield ctx.emit('message_batch_sent', result)
+        return result
+    teacher_code = teacher_info.teacher_code
+
+    items, result = message_batch_items(data)
+    if result:
+        yield ctx.emit('message_batch_sent', result)
+        return result
+    manual_names = manual_batch_names(items)
+    try:
+        resolved_names = (yield from resolve_student_names(ctx, teacher_code, manual_names)) if manual_names else []
+    except Exception as e:
+        logs.error('message_batch_failed', teacher_code=teacher_code, items=len(items), error=e)
+        result = {'status': 'error', 'message': '메시지 저장 중 오류가 발생했습니다.'}
+        yield ctx.emit('message_batch_sent', result)
+        return result
+    rows, targets, result = plan_message_batch(teacher_code, items, manual_names, resolved_names)
+    if result:
+        yield ctx.emit('message_batch_sent', result)
+        return result
+
+    try:
+        ids = yield from save_teacher_messages_batch(ctx, teacher_code, rows)
+    except Exception as e:
+        logs.error('message_batch_failed', teacher_code=teacher_code, items=len(rows), error=e)
+        result = {'status': 'error', 'message': '메시지 저장 중 오류가 발생했습니다.'}
+        yield ctx.emit('message_batch_sent', result)
+        return result
+
+    persisted_at = delivery_trace.now_ms()
+    for msg_id, (_, message), sids in zip(ids, rows, targets):
+        trace = delivery_trace.start(teacher_code, msg_id, received_at, persisted_at, sids)
+        payload = receive_message_payload(msg_id, message, trace)
+        for sid in sids:
+            yield ctx.emit('receive_message', payload, room=sid)
+
+    result = message_batch_result(ids, rows, targets)
+    yield ctx.emit('message_batch_sent', result)
+    return result
+
+
+def split_claimed_entries(entries, claims):
+    """claim_client_keys 결과로 새로 저장할 항목 번호와 이미 처리한 키의 message_id를 나눈다.
+    entries: [(sender, client_key 또는 None, message)], 목록 안에서 같은 키가 또 나오면 중복으로 처리."""
+    claimed = {key for key, _, new in claims if new}
+    known = {key: msg_id for key, msg_id, new in claims if not new}
+    fresh = []
+    for index, (_, key, _) in enumerate(entries):
+        if key is None or key in claimed:
+            fresh.append(index)
+            claimed.discard(key)
+    return fresh, known
+
+
+def insert_student_messages(c, teacher_code, rows):
+    """[((학생 id, 이름), message)]를 저장 (executemany returning, AsyncCursor면 await할 값을 돌려줌).
+    sender_id는 표시용 이름이고, 보낸 학생은 sender_student_id로 구분한다 (같은 이름의 학생이 여럿일 수 있음)."""
+    return c.executemany(
+        '''INSERT INTO messages
+           (teacher_code, sender_type, sender_id, sender_student_id, recipient_type, recipient_id, message)
+           VALUES (%s, 'student', %s, %s, 'teacher', %s, %s)
+           RETURNING id''',
+        [(teacher_code, student_name, student_id, teacher_code, message)
+         for (student_id, student_name), message in rows],
+        returning=True
+    )
+
+
+def student_message_results(teacher_code, entries, fresh, ids, known):
+    """항목 순서대로 (message_id, 새로 저장했는지). 중복 항목은 처음 저장한 id, 키는 LRU에도 기억한다."""
+    results = [None] * len(entries)
+    for index, msg_id in zip(fresh, ids):
+        results[index] = (msg_id, True)
+        if entries[index][1]:
+            known[entries[index][1]] = msg_id
+    for index, (_, key, _) in enumerate(entries):
+        if results[index] is None:
+            results[index] = (known.get(key), False)
+        remember_client_key(teacher_code, key, results[index][0])
+    return results
+
+
+def save_student_messages(ctx, teacher_code, entries):
+    """학생 메시지 [((학생 id, 이름), client_key 또는 None, message)]를 한 트랜잭션에 저장 (trim도 한 번).
+
+    이미 처리한 client_key(같은 목록 안의 중복 포함)는 저장하지 않고 처음 저장한 message_id를 돌려준다.
+    반환값: 항목 순서대로 (message_id, 새로 저장했는지)
+    """
+    keys = list({key: None for _, key, _ in entries if key})
+    conn = yield ctx.connect()
+    try:
+        c = conn.cursor()
+        claims = []
+        if keys:
+            yield claim_client_keys(c, teacher_code, keys)
+            claims = yield c.fetchall()
+        fresh, known = split_claimed_entries(entries, claims)
+        ids = []
+        if fresh:
+            yield insert_student_messages(c, teacher_code, [(entries[i][0], entries[i][2]) for i in fresh])
+            for _ in fresh:
+                ids.append((yield c.fetchone())[0])
+                c.nextset()
+            keyed = [(entries[i][1], msg_id) for i, msg_id in zip(fresh, ids) if entries[i][1]]
+            if keyed:
+                yield set_client_key_ids(c, teacher_code, keyed)
+            yield message_rollups.record_insert(c, teacher_code, 'student', len(fresh))
+            yield trim_student_messages(c, teacher_code)
+        yield conn.commit()
+    finally:
+        yield ctx.release(conn)
+    return student_message_results(teacher_code, entries, fresh, ids, known)
+
+
+def student_message_entries(submissions):
+    """submission 목록을 save_student_messages 항목으로 펼친다"""
+    return [((sub['student_id'], sub['student_name']), key, message)
+            for sub in submissions for key, message in sub['items']]
+
+
+def student_message_errors(submissions):
+    """저장이 실패했을 때 학생마다 보낼 (sid, 이벤트, 페이로드)"""
+    replies = []
+    for sub in submissions:
+        if sub['batch']:
+            replies.append((sub['sid'], 'student_messages_batch_result',
+                            {'status': 'error', 'message': '메시지 전송 중 오류가 발생했습니다.'}))
+        else:
+            replies.append((sub['sid'], 'student_message_error', {'message': '메시지 전송 중 오류가 발생했습니다.'}))
+    return replies
+
+
+def student_message_replies(teacher_code, submissions, results):
+    """저장 결과로 교사 방에 보낼 (이벤트, 페이로드)와 학생마다 보낼 (sid, 이벤트, 페이로드) 목록을 만든다.
+    새 메시지가 한 개면 new_message_from_student, 여러 개면 new_messages_from_students, 없으면 교사 이벤트는 None."""
+    results = iter(results)
+    timestamp = now_kst_str()
+    new_messages = []
+    replies = []
+    for sub in submissions:
+        sub_results = [next(results) for _ in sub['items']]
+        accepted, duplicates = {}, {}
+        for (key, message), (msg_id, created) in zip(sub['items'], sub_results):
+            if created:
+                accepted[key] = msg_id
+                new_messages.append({'id': msg_id, 'student_id': sub['student_id'], 'student_name': sub['student_name'],
+                                     'message': message, 'timestamp': timestamp})
+            else:
+                duplicates[key] = msg_id
+        if sub['batch']:
+            replies.append((sub['sid'], 'student_messages_batch_result', {
+                'status': 'success', 'accepted': accepted, 'duplicates': duplicates, 'more': sub['more'],
+            }))
+        else:
+            # send_message 한 건의 전송은 항목이 하나뿐이다
+            (msg_id, created), = sub_results
+            replies.append((sub['sid'], 'student_message_sent',
+                            {'status': 'success', 'message_id': msg_id, 'duplicate': not created}))
+    teacher_event = None
+    if len(new_messages) == 1:
+        teacher_event = ('new_message_from_student', new_messages[0])
+    elif new_messages:
+        teacher_event = ('new_messages_from_students', {'messages': new_messages})
+    logs.info('student_messages_saved', teacher_code=teacher_code, submissions=len(submissions),
+              saved=len(new_messages), duplicates=sum(len(sub['items']) for sub in submissions) - len(new_messages))
+    return teacher_event, replies
+
+
+def deliver_student_messages(ctx, teacher_code, submissions):
+    """모은 학생 전송을 한 번에 저장하고 교사 방에는 한 번만 알린 뒤, 보낸 학생마다 결과를 보낸다.
+
+    submission: {'sid', 'student_id', 'student_name', 'items': [(client_key 또는 None, message)], 'batch': send_messages_batch 여부, 'more'}
+    """
+    entries = student_message_entries(submissions)
+    try:
+        results = yield from save_student_messages(ctx, teacher_code, entries)
+    except Exception as e:
+        logs.error('student_message_failed', teacher_code=teacher_code, items=len(entries), error=e)
+        for sid, event, payload in student_message_errors(submissions):
+            yield ctx.emit(event, payload, room=sid)
+        return
+
+    teacher_event, replies = student_message_replies(teacher_code, submissions, results)
+    if teacher_event:
+        event, payload = teacher_event
+        yield ctx.emit(event, payload, room=f'teacher_{teacher_code}')
+    for sid, event, payload in replies:
+        yield ctx.emit(event, payload, room=sid)
+
+
+def queue_student_messages(ctx, teacher_code, submission):
+    """교사별 창이 닫혀 있으면 바로 전달하고 창을 연다. 창이 열려 있는 동안 온 전송은 창이 닫힐 때 한 번에 전달."""
+    pending = student_reply_windows.get(teacher_code)
+    if pending is not None:
+        pending.append(submission)
+        return
+    if STUDENT_REPLY_WINDOW > 0:
+        student_reply_windows[teacher_code] = []
+        ctx.start_background_task(flush_student_messages, teacher_code)
+    yield from deliver_student_messages(ctx, teacher_code, [submission])
+
+
+def flush_student_messages(ctx, teacher_code):
+    """창이 닫힐 때마다 모인 전송을 한 번에 전달하고, 그동안 새 전송이 있었으면 창을 다시 연다"""
+    try:
+        while True:
+            yield ctx.sleep(STUDENT_REPLY_WINDOW)
+            submissions = student_reply_windows.get(teacher_code)
+            if not submissions:
+                return
+            student_reply_windows[teacher_code] = []
+            yield from deliver_student_messages(ctx, teacher_code, submissions)
+    finally:
+        student_reply_windows.pop(teacher_code, None)
+
+
+def trim_student_messages(c, teacher_code):
+    """교사별 학생 메시지는 최근 1000개만 보관 (AsyncCursor면 await할 값을 돌려줌)"""
+    return message_rollups.delete_returning(
+        c,
+        '''DELETE FROM messages
+           WHERE id IN (
+             SELECT id FROM messages
+             WHERE teacher_code = %s AND recipient_type = 'teacher'
+             ORDER BY id DESC
+             OFFSET 1000
+           )
+           RETURNING teacher_code, timestamp, sender_type''',
+        (teacher_code,)
+    )
+
+
+@on_event('send_messages_batch')
+def on_send_messages_batch(ctx, data):
+    """학생 오프라인 보관함 전송: {messages: [{client_key, message}, ...]}
+
+    키로 중복을 걸러 저장하고 결과는 student_messages_batch_result로 보낸다. 다른 학생들의 전송과 함께
+    모아 저장/전달될 수 있다 (queue_student_messages).
+    """
+    info = students.get(ctx.sid)
+    if not info:
+        result = {'status': 'error', 'message': '먼저 교사 코드로 접속해주세요.'}
+        yield ctx.emit('student_messages_batch_result', result)
+        return result
+    teacher_code = info.teacher_code
+    student_name = info.student_name or '학생'
+
+    items, rejected, more = student_batch_items(data)
+    if not items:
+        result = {'status': 'error', 'message': '보낼 메시지가 없습니다.'}
+        yield ctx.emit('student_messages_batch_result', result)
+        return result
+    if not (yield from get_teacher_allow_status(ctx, teacher_code)):
+        # 보관함에 남겨 두었다가 교사가 허용하면 다시 보내도록 키를 돌려주지 않음
+        result = {'status': 'blocked', 'message': '교사가 현재 메시지 수신을 허용하지 않습니다.'}
+        yield ctx.emit('student_messages_batch_result', result)
+        return result
+
+    if rejected:
+        logs.debug('student_batch_rejected', teacher_code=teacher_code, student=student_name, rejected=rejected)
+    yield from queue_student_messages(ctx, teacher_code, {
+        'sid': ctx.sid, 'student_id': info.student_id, 'student_name': student_name, 'items': items, 'batch': True,
+        'more': more,
+    })
+
+
+def student_batch_items(data):
+    """보관함 전송 항목 [(client_key, message)] (키 중복 제거), 버린 항목 수, STUDENT_BATCH_LIMIT을 넘어 남은 게 있는지"""
+    entries = (data or {}).get('messages') or []
+    items = {}
+    for entry in entries[:STUDENT_BATCH_LIMIT]:
+        key = entry.get('client_key') if isinstance(entry, dict) else None
+        message = (entry.get('message') or '').strip() if isinstance(entry, dict) else ''
+        if valid_client_key(key) and message:
+            items.setdefault(key, message)
+    items = list(items.items())
+    return items, len(entries[:STUDENT_BATCH_LIMIT]) - len(items), len(entries) > STUDENT_BATCH_LIMIT
 
 
 def save_message(sender_type, sender_id, recipient_type, recipient_ids, message):
@@ -697,297 +2455,405 @@ def save_message(sender_type, sender_id, recipient_type, recipient_ids, message)
            VALUES (%s, %s, %s, %s, %s, %s)''',
         ('000000', sender_type, sender_id, recipient_type, recipient_str, message)
     )
+    message_rollups.record_insert(c, '000000', sender_type)
     conn.commit()
     conn.close()
 
 
-@socketio.on('delete_message')
-def delete_message(data):
-    teacher_code = data.get('teacher_code')
-    student_name = data.get('student_name')
+@on_event('message_receipt')
+def on_message_receipt(ctx, data):
+    """학생 클라이언트의 수신 확인 (추적 대상 메시지를 받은 소켓의 확인만 센다)"""
+    trace_id = (data or {}).get('trace_id')
+    if not trace_id:
+        return
+    latency = delivery_trace.ack(trace_id, ctx.sid)
+    if latency is not None:
+        logs.debug('message_receipt', trace_id=trace_id, message_id=data.get('message_id'),
+                   latency_ms=round(latency * 1000), client_ts=data.get('client_ts'))
+
+
+@on_event('get_delivery_stats')
+def on_get_delivery_stats(ctx, data=None):
+    teacher_info = teachers.get(ctx.sid)
+    if not teacher_info:
+        return
+    yield ctx.emit('delivery_stats', delivery_trace.summary(teacher_info.teacher_code))
+
+
+@on_event('set_trace_sample_rate')
+def on_set_trace_sample_rate(ctx, data):
+    teacher_info = teachers.get(ctx.sid)
+    if not teacher_info:
+        return
+    teacher_code = teacher_info.teacher_code
+    try:
+        delivery_trace.set_sample_rate(teacher_code, (data or {}).get('rate', delivery_trace.DEFAULT_SAMPLE_RATE))
+    except (TypeError, ValueError):
+        pass
+    yield ctx.emit('delivery_stats', delivery_trace.summary(teacher_code))
+
+
+@on_event('delete_message')
+def delete_message(ctx, data):
+    student_info = students.get(ctx.sid)
     message_id = data.get('message_id')
 
-    if not (teacher_code and student_name and message_id):
-        emit('delete_result', {'status': 'error', 'message': '필수 값이 누락되었습니다.'})
+    if not (student_info and message_id):
+        yield ctx.emit('delete_result', {'status': 'error', 'message': '필수 값이 누락되었습니다.'})
         return
 
-    skey = student_key(teacher_code, student_name)
-    print(f'[DEBUG] delete_message 호출: teacher_code={teacher_code}, student_name={student_name}, message_id={message_id}, key={skey}')
+    teacher_code = student_info.teacher_code
+    student_id = student_info.student_id
 
-    conn = None
     try:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute(
-            '''INSERT INTO hidden_messages (message_id, teacher_code, student_key)
-               VALUES (%s, %s, %s)
-               ON CONFLICT (message_id, student_key) DO NOTHING''',
-            (message_id, teacher_code, skey)
-        )
-        conn.commit()
-        
-        # 저장 확인용 로그
-        c.execute('SELECT * FROM hidden_messages WHERE message_id = %s AND student_key = %s', (message_id, skey))
-        saved = c.fetchone()
-        print(f'[DEBUG] hidden_messages 저장 확인: {saved}')
+        conn = yield ctx.connect()
+        try:
+            c = conn.cursor()
+            yield c.execute(
+                '''INSERT INTO hidden_messages (message_id, teacher_code, student_id)
+                   VALUES (%s, %s, %s)
+                   ON CONFLICT (student_id, message_id) DO NOTHING''',
+                (message_id, teacher_code, student_id)
+            )
+            yield conn.commit()
 
-        emit('delete_result', {'status': 'success', 'message_id': message_id})
+            # 저장 확인용 로그 (디버그 레벨일 때만 추가 조회)
+            if logs.enabled(logs.DEBUG):
+                yield c.execute('SELECT * FROM hidden_messages WHERE student_id = %s AND message_id = %s', (student_id, message_id))
+                logs.debug('delete_message', teacher_code=teacher_code, message_id=message_id, student_id=student_id,
+                           saved=(yield c.fetchone()))
+        finally:
+            yield ctx.release(conn)
+
+        yield ctx.emit('delete_result', {'status': 'success', 'message_id': message_id})
     except Exception as e:
-        print(f'[오류] 메시지 삭제 오류: {e}')
-        emit('delete_result', {'status': 'error', 'message': '삭제 중 오류가 발생했습니다.'})
-    finally:
-        if conn:
-            conn.close()
+        logs.error('hide_message_failed', teacher_code=teacher_code, message_id=message_id, error=e)
+        yield ctx.emit('delete_result', {'status': 'error', 'message': '삭제 중 오류가 발생했습니다.'})
 
 
-@socketio.on('delete_message_teacher')
-def delete_message_teacher(data):
-    teacher_info = teachers.get(request.sid)
+@on_event('delete_message_teacher')
+def delete_message_teacher(ctx, data):
+    teacher_info = teachers.get(ctx.sid)
     if not teacher_info:
-        emit('delete_result_teacher', {'status': 'error', 'message': '교사 인증에 실패했습니다.'})
+        yield ctx.emit('delete_result_teacher', {'status': 'error', 'message': '교사 인증에 실패했습니다.'})
         return
 
     message_id = data.get('message_id')
-    teacher_code = teacher_info.get('teacher_code')
+    teacher_code = teacher_info.teacher_code
 
     if not message_id:
-        emit('delete_result_teacher', {'status': 'error', 'message': '메시지 ID가 없습니다.'})
+        yield ctx.emit('delete_result_teacher', {'status': 'error', 'message': '메시지 ID가 없습니다.'})
         return
 
-    conn = None
     try:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute('SELECT teacher_code FROM messages WHERE id = %s', (message_id,))
-        row = c.fetchone()
-        if not row or row[0] != teacher_code:
-            emit('delete_result_teacher', {'status': 'error', 'message': '삭제 권한이 없거나 메시지가 없습니다.'})
-            return
-
-        c.execute('DELETE FROM messages WHERE id = %s', (message_id,))
-        c.execute('DELETE FROM hidden_messages WHERE message_id = %s', (message_id,))
-        conn.commit()
+        conn = yield ctx.connect()
+        try:
+            c = conn.cursor()
+            yield c.execute('SELECT teacher_code FROM messages WHERE id = %s', (message_id,))
+            row = yield c.fetchone()
+            if not row or row[0] != teacher_code:
+                yield ctx.emit('delete_result_teacher', {'status': 'error', 'message': '삭제 권한이 없거나 메시지가 없습니다.'})
+                return
+
+            yield message_rollups.delete_returning(
+                c,
+                'DELETE FROM messages WHERE id = %s RETURNING teacher_code, timestamp, sender_type',
+                (message_id,)
+            )
+            yield c.execute('DELETE FROM hidden_messages WHERE message_id = %s', (message_id,))
+            yield attachments.unlink(c, [message_id])
+            yield conn.commit()
+        finally:
+            yield ctx.release(conn)
 
         student_room = f'students_{teacher_code}'
-        socketio.emit('message_deleted', {'message_id': message_id}, room=student_room)
+        yield ctx.emit('message_deleted', {'message_id': message_id}, room=student_room)
 
-        emit('delete_result_teacher', {'status': 'success', 'message_id': message_id})
+        yield ctx.emit('delete_result_teacher', {'status': 'success', 'message_id': message_id})
     except Exception as e:
-        print(f'교사용 메시지 삭제 오류: {e}')
-        emit('delete_result_teacher', {'status': 'error', 'message': '삭제 중 오류가 발생했습니다.'})
-    finally:
-        if conn:
-            conn.close()
+        logs.error('delete_message_failed', teacher_code=teacher_code, message_id=message_id, error=e)
+        yield ctx.emit('delete_result_teacher', {'status': 'error', 'message': '삭제 중 오류가 발생했습니다.'})
 
 
-@socketio.on('bulk_delete_messages')
-def bulk_delete_messages(data):
+@on_event('bulk_delete_messages')
+def bulk_delete_messages(ctx, data):
     """메시지 일괄 삭제: 전체, 특정 수신자, 기간 필터"""
-    teacher_info = teachers.get(request.sid)
+    teacher_info = teachers.get(ctx.sid)
     if not teacher_info:
-        emit('bulk_delete_result', {'status': 'error', 'message': '교사 인증에 실패했습니다.'})
+        yield ctx.emit('bulk_delete_result', {'status': 'error', 'message': '교사 인증에 실패했습니다.'})
+        return
+
+    teacher_code = teacher_info.teacher_code
+    try:
+        message_ids = yield from delete_messages_bulk(ctx, teacher_code, data or {})
+    except Exception as e:
+        logs.error('bulk_delete_failed', teacher_code=teacher_code, error=e)
+        yield ctx.emit('bulk_delete_result', {'status': 'error', 'message': f'삭제 중 오류: {str(e)}'})
+        return
+    if not message_ids:
+        yield ctx.emit('bulk_delete_result', {'status': 'error', 'message': '삭제할 메시지가 없습니다.'})
         return
 
-    teacher_code = teacher_info.get('teacher_code')
-    filter_type = data.get('filter_type')  # 'all', 'recipient', 'date_range'
+    # 학생들에게 삭제 알림
+    student_room = f'students_{teacher_code}'
+    for mid in message_ids:
+        yield ctx.emit('message_deleted', {'message_id': mid}, room=student_room)
+
+    yield ctx.emit('bulk_delete_result', {'status': 'success', 'deleted_count': len(message_ids)})
+
 
-    conn = None
+def delete_messages_bulk(ctx, teacher_code, data):
+    """교사가 보낸 메시지를 필터(filter_type: 'all', 'recipient', 'date_range')대로 지우고 지운 id 목록을 돌려준다.
+    월 파티션은 모든 교사가 함께 쓰므로 교사 한 명의 삭제는 행 단위로 하고, 월 전체 제거는 배포 단위 보관 작업
+    (MESSAGE_RETENTION_MONTHS)이 맡는다."""
+    filter_type = data.get('filter_type')
+    conn = yield ctx.connect()
     try:
-        conn = get_db()
         c = conn.cursor()
 
         # 기본 조건: 해당 교사가 보낸 메시지
         base_query = "DELETE FROM messages WHERE teacher_code = %s AND sender_type = 'teacher'"
-        count_query = "SELECT COUNT(*) FROM messages WHERE teacher_code = %s AND sender_type = 'teacher'"
+        id_query = "SELECT id FROM messages WHERE teacher_code = %s AND sender_type = 'teacher'"
         params = [teacher_code]
 
         if filter_type == 'recipient':
             recipient_name = data.get('recipient_name', '')
             if recipient_name:
-                base_query += " AND (recipient_id = %s OR recipient_id LIKE %s)"
-                count_query += " AND (recipient_id = %s OR recipient_id LIKE %s)"
-                params.extend([recipient_name, f'%{recipient_name}%'])
+                student_ids = yield from recipient_student_ids(c, teacher_code, recipient_name)
+                base_query += " AND recipient_student_ids && %s::integer[]"
+                id_query += " AND recipient_student_ids && %s::integer[]"
+                params.append(student_ids)
         elif filter_type == 'date_range':
             start_date = data.get('start_date')
             end_date = data.get('end_date')
             if start_date:
                 base_query += " AND timestamp >= %s"
-                count_query += " AND timestamp >= %s"
+                id_query += " AND timestamp >= %s"
                 params.append(start_date)
             if end_date:
                 base_query += " AND timestamp <= %s"
-                count_query += " AND timestamp <= %s"
+                id_query += " AND timestamp <= %s"
                 params.append(end_date + ' 23:59:59')
 
-        # 삭제할 메시지 ID 목록 가져오기 (학생에게 알리기 위해)
-        id_query = count_query.replace("SELECT COUNT(*)", "SELECT id")
-        c.execute(id_query, params)
-        message_ids = [row[0] for row in c.fetchall()]
+        # 삭제할 메시지 ID 목록 (학생에게 알리기 위해)
+        yield c.execute(id_query, params)
+        rows = yield c.fetchall()
+        message_ids = [row[0] for row in rows]
+        if not message_ids:
+            return []
 
-        # 삭제 전 개수 확인
-        c.execute(count_query, params)
-        count = c.fetchone()[0]
+        # 메시지 삭제 + 집계 차감
+        yield message_rollups.delete_returning(c, base_query + ' RETURNING teacher_code, timestamp, sender_type', params)
 
-        if count == 0:
-            emit('bulk_delete_result', {'status': 'error', 'message': '삭제할 메시지가 없습니다.'})
-            return
+        # 관련 hidden_messages와 첨부 연결도 삭제
+        yield c.execute(
+            "DELETE FROM hidden_messages WHERE message_id = ANY(%s)",
+            (message_ids,)
+        )
+        yield attachments.unlink(c, message_ids)
 
-        # 메시지 삭제
-        c.execute(base_query, params)
-        
-        # 관련 hidden_messages도 삭제
-        if message_ids:
-            c.execute(
-                "DELETE FROM hidden_messages WHERE message_id = ANY(%s)",
-                (message_ids,)
-            )
+        yield conn.commit()
+        return message_ids
+    finally:
+        yield ctx.release(conn)
 
-        conn.commit()
 
-        # 학생들에게 삭제 알림
-        student_room = f'students_{teacher_code}'
-        for mid in message_ids:
-            socketio.emit('message_deleted', {'message_id': mid}, room=student_room)
+def recipient_student_ids(c, teacher_code, recipient_name):
+    """일괄 삭제의 수신자 필터: 이름이 정확히 같은 학생 id 목록 (같은 이름이면 반마다 모두, 없으면 빈 목록)"""
+    yield identities.resolve_names(c, teacher_code, [recipient_name])
+    return [row[0] for row in (yield c.fetchall())]
 
-        emit('bulk_delete_result', {'status': 'success', 'deleted_count': count})
 
-    except Exception as e:
-        print(f'메시지 일괄 삭제 오류: {e}')
-        emit('bulk_delete_result', {'status': 'error', 'message': f'삭제 중 오류: {str(e)}'})
+def count_bulk_delete_targets(ctx, teacher_code, data):
+    """삭제 대상 개수: 전체/기간은 일별 집계 테이블에서 O(일수)로, 수신자 필터는 학생 id로 (GIN 색인)"""
+    filter_type = data.get('filter_type')
+    conn = yield ctx.connect()
+    try:
+        c = conn.cursor()
+        if filter_type == 'recipient' and data.get('recipient_name'):
+            student_ids = yield from recipient_student_ids(c, teacher_code, data.get('recipient_name'))
+            if not student_ids:
+                return 0
+            yield c.execute(
+                '''SELECT COUNT(*) FROM messages
+                   WHERE teacher_code = %s AND sender_type = 'teacher'
+                     AND recipient_student_ids && %s::integer[]''',
+                (teacher_code, student_ids)
+            )
+        elif filter_type == 'date_range':
+            yield message_rollups.count_messages(
+                c, teacher_code, 'teacher', data.get('start_date') or None, data.get('end_date') or None
+            )
+        else:
+            yield message_rollups.count_messages(c, teacher_code, 'teacher')
+        return int((yield c.fetchone())[0])
     finally:
-        if conn:
-            conn.close()
+        yield ctx.release(conn)
+
+
+def run_bulk_delete_preview(ctx, sid, token, teacher_code, data):
+    yield ctx.sleep(PREVIEW_DEBOUNCE_SECONDS)
+    if preview_requests.get(sid) != token:
+        return  # 더 최근 요청이 들어왔거나 취소됨
+    try:
+        count = yield from count_bulk_delete_targets(ctx, teacher_code, data)
+    except Exception as e:
+        logs.error('bulk_delete_preview_failed', teacher_code=teacher_code, error=e)
+        count = 0
+    if preview_requests.get(sid) == token:
+        yield ctx.emit('bulk_delete_preview', {'count': count}, room=sid)
 
 
-@socketio.on('get_bulk_delete_preview')
-def get_bulk_delete_preview(data):
-    """삭제할 메시지 개수 미리보기"""
-    teacher_info = teachers.get(request.sid)
+@on_event('get_bulk_delete_preview')
+def get_bulk_delete_preview(ctx, data):
+    """삭제할 메시지 개수 미리보기 (짧은 지연 후 마지막 요청만 처리)"""
+    teacher_info = teachers.get(ctx.sid)
     if not teacher_info:
-        emit('bulk_delete_preview', {'count': 0})
+        yield ctx.emit('bulk_delete_preview', {'count': 0})
         return
 
-    teacher_code = teacher_info.get('teacher_code')
-    filter_type = data.get('filter_type')
+    token = next_preview_token(ctx.sid)
+    ctx.start_background_task(
+        run_bulk_delete_preview, ctx.sid, token, teacher_info.teacher_code, dict(data or {})
+    )
 
-    conn = None
-    try:
-        conn = get_db()
-        c = conn.cursor()
 
-        count_query = "SELECT COUNT(*) FROM messages WHERE teacher_code = %s AND sender_type = 'teacher'"
-        params = [teacher_code]
+@on_event('cancel_bulk_delete_preview')
+def cancel_bulk_delete_preview(ctx, data=None):
+    if ctx.sid in preview_requests:
+        next_preview_token(ctx.sid)
 
-        if filter_type == 'recipient':
-            recipient_name = data.get('recipient_name', '')
-            if recipient_name:
-                count_query += " AND (recipient_id = %s OR recipient_id LIKE %s)"
-                params.extend([recipient_name, f'%{recipient_name}%'])
-        elif filter_type == 'date_range':
-            start_date = data.get('start_date')
-            end_date = data.get('end_date')
-            if start_date:
-                count_query += " AND timestamp >= %s"
-                params.append(start_date)
-            if end_date:
-                count_query += " AND timestamp <= %s"
-                params.append(end_date + ' 23:59:59')
 
-        c.execute(count_query, params)
-        count = c.fetchone()[0]
-        emit('bulk_delete_preview', {'count': count})
+def next_preview_token(sid):
+    """이 sid의 미리보기 요청 번호를 올린다 (이전 요청은 끝나도 결과를 보내지 않음)"""
+    token = preview_requests.get(sid, 0) + 1
+    preview_requests[sid] = token
+    return token
 
-    except Exception as e:
-        print(f'미리보기 오류: {e}')
-        emit('bulk_delete_preview', {'count': 0})
+
+@bp.route('/teacher/stats')
+def teacher_stats():
+    """일별 메시지 사용량 통계 (집계 테이블 기반, ?days=30)"""
+    teacher_code = session.get('teacher_code')
+    if not teacher_code:
+        return jsonify({'status': 'error', 'message': '교사 로그인이 필요합니다.'}), 401
+    try:
+        days = max(1, min(int(request.args.get('days', 30)), 366))
+    except ValueError:
+        days = 30
+
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute('SELECT CURRENT_DATE - %s::int + 1', (days,))
+        start = c.fetchone()[0]
+        daily = {}
+        totals = {'teacher': 0, 'student': 0}
+        for day, direction, count in message_rollups.daily_stats(c, teacher_code, start):
+            entry = daily.setdefault(day.isoformat(), {'date': day.isoformat(), 'sent': 0, 'received': 0})
+            entry['sent' if direction == 'teacher' else 'received'] += count
+            totals[direction] = totals.get(direction, 0) + count
+        all_time = {}
+        for direction in ('teacher', 'student'):
+            message_rollups.count_messages(c, teacher_code, direction)
+            all_time[direction] = int(c.fetchone()[0])
+        return jsonify({
+            'status': 'success',
+            'days': days,
+            'daily': list(daily.values()),
+            'sent_total': totals['teacher'],
+            'received_total': totals['student'],
+            'all_time_sent': all_time['teacher'],
+            'all_time_received': all_time['student'],
+        })
     finally:
-        if conn:
-            conn.close()
+        conn.close()
 
-@socketio.on('teacher_toggle_receive')
-def teacher_toggle_receive(data):
-    teacher_info = teachers.get(request.sid)
+
+@on_event('teacher_toggle_receive')
+def teacher_toggle_receive(ctx, data):
+    teacher_info = teachers.get(ctx.sid)
     teacher_code = None
     if teacher_info:
-        teacher_code = teacher_info.get('teacher_code')
+        teacher_code = teacher_info.teacher_code
     else:
         # fallback: 클라이언트가 코드 전달했다면 활용
         teacher_code = data.get('teacher_code')
     if not teacher_code:
-        emit('receive_status', {'allow': False})
+        yield ctx.emit('receive_status', {'allow': False})
         return
 
     allow = bool(data.get('allow'))
-    set_teacher_allow_status(teacher_code, allow)
-    emit('receive_status', {'allow': allow})
+    yield from set_teacher_allow_status(ctx, teacher_code, allow)
+    yield ctx.emit('receive_status', {'allow': allow})
     student_room = f'students_{teacher_code}'
-    socketio.emit('receive_status', {'allow': allow}, room=student_room)
+    yield ctx.emit('receive_status', {'allow': allow}, room=student_room)
 
 
-@socketio.on('get_teacher_messages')
-def get_teacher_messages(data):
-    teacher_info = teachers.get(request.sid)
+@on_event('get_teacher_messages')
+def get_teacher_messages(ctx, data):
+    teacher_info = teachers.get(ctx.sid)
     if not teacher_info:
-        print('[DEBUG] get_teacher_messages: teacher_info 없음')
-        emit('teacher_messages', {'messages': []})
+        logs.debug('get_teacher_messages', status='no_teacher')
+        yield ctx.emit('teacher_messages', {'messages': []})
         return
-    teacher_code = teacher_info.get('teacher_code')
-    print(f'[DEBUG] get_teacher_messages 호출: teacher_code={teacher_code}')
-    conn = None
+    teacher_code = teacher_info.teacher_code
     try:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute(
-            '''SELECT id, sender_id, message, timestamp
-               FROM messages
-               WHERE teacher_code = %s AND recipient_type = 'teacher'
-               ORDER BY id DESC
-               LIMIT 100''',
-            (teacher_code,)
-        )
-        rows = c.fetchall()
-        print(f'[DEBUG] get_teacher_messages 결과: {len(rows)}개 메시지 발견')
+        conn = yield ctx.connect()
+        try:
+            c = conn.cursor()
+            yield c.execute(
+                '''SELECT id, sender_id, message, timestamp, sender_student_id
+                   FROM messages
+                   WHERE teacher_code = %s AND recipient_type = 'teacher'
+                   ORDER BY id DESC
+                   LIMIT 100''',
+                (teacher_code,)
+            )
+            rows = yield c.fetchall()
+        finally:
+            yield ctx.release(conn)
+        logs.debug('get_teacher_messages', teacher_code=teacher_code, count=len(rows))
         msgs = []
         for row in rows:
             msgs.append({
                 'id': row[0],
+                'student_id': row[4],
                 'student_name': row[1],
                 'message': row[2],
                 'timestamp': format_timestamp(row[3])
             })
-        emit('teacher_messages', {'messages': msgs})
+        yield ctx.emit('teacher_messages', {'messages': msgs})
     except Exception as e:
-        print(f'[오류] 교사 메시지 조회 오류: {e}')
-        emit('teacher_messages', {'messages': []})
-    finally:
-        if conn:
-            conn.close()
+        logs.error('teacher_messages_failed', teacher_code=teacher_code, error=e)
+        yield ctx.emit('teacher_messages', {'messages': []})
 
 
-@socketio.on('get_sent_messages')
-def get_sent_messages(data):
+@on_event('get_sent_messages')
+def get_sent_messages(ctx, data):
     """교사가 보낸 메시지 히스토리 조회"""
-    teacher_info = teachers.get(request.sid)
+    teacher_info = teachers.get(ctx.sid)
     if not teacher_info:
-        print('[DEBUG] get_sent_messages: teacher_info 없음')
-        emit('sent_messages', {'messages': []})
+        logs.debug('get_sent_messages', status='no_teacher')
+        yield ctx.emit('sent_messages', {'messages': []})
         return
-    teacher_code = teacher_info.get('teacher_code')
-    print(f'[DEBUG] get_sent_messages 호출: teacher_code={teacher_code}')
-    conn = None
+    teacher_code = teacher_info.teacher_code
     try:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute(
-            '''SELECT id, recipient_id, message, timestamp
-               FROM messages
-               WHERE teacher_code = %s AND sender_type = 'teacher'
-               ORDER BY id DESC
-               LIMIT 100''',
-            (teacher_code,)
-        )
-        rows = c.fetchall()
-        print(f'[DEBUG] get_sent_messages 결과: {len(rows)}개 메시지 발견')
+        conn = yield ctx.connect()
+        try:
+            c = conn.cursor()
+            yield c.execute(
+                '''SELECT id, recipient_id, message, timestamp
+                   FROM messages
+                   WHERE teacher_code = %s AND sender_type = 'teacher'
+                   ORDER BY id DESC
+                   LIMIT 100''',
+                (teacher_code,)
+            )
+            rows = yield c.fetchall()
+        finally:
+            yield ctx.release(conn)
+        logs.debug('get_sent_messages', teacher_code=teacher_code, count=len(rows))
         msgs = []
         for row in rows:
             msgs.append({
@@ -996,22 +2862,239 @@ def get_sent_messages(data):
                 'message': row[2],
                 'timestamp': format_timestamp(row[3])
             })
-        emit('sent_messages', {'messages': msgs})
+        yield ctx.emit('sent_messages', {'messages': msgs})
     except Exception as e:
-        print(f'[오류] 전송 메시지 조회 오류: {e}')
-        emit('sent_messages', {'messages': []})
+        logs.error('sent_messages_failed', teacher_code=teacher_code, error=e)
+        yield ctx.emit('sent_messages', {'messages': []})
+
+
+def emit_poll_tally(ctx, poll):
+    poll.dirty = False
+    yield ctx.emit('poll_tally', poll.tally(), room=f'teacher_{poll.teacher_code}')
+
+
+def schedule_poll_tally(ctx, poll):
+    """집계가 바뀌었을 때: 전송 작업이 없으면 바로 보내고 작업을 띄운다 (있으면 다음 주기에 묶여 나감)"""
+    if poll.poll_id in poll_tally_pushers:
+        return
+    poll_tally_pushers.add(poll.poll_id)
+    yield from emit_poll_tally(ctx, poll)
+    ctx.start_background_task(push_poll_tallies, poll)
+
+
+def push_poll_tallies(ctx, poll):
+    """POLL_TALLY_INTERVAL마다 바뀐 집계만 보내고, 한 주기 동안 변화가 없거나 투표가 마감되면 끝낸다"""
+    try:
+        while True:
+            yield ctx.sleep(POLL_TALLY_INTERVAL)
+            if not poll.dirty or polls.get(poll.teacher_code, poll.poll_id) is None:
+                return
+            yield from emit_poll_tally(ctx, poll)
     finally:
-        if conn:
-            conn.close()
+        poll_tally_pushers.discard(poll.poll_id)
+
+
+POLL_RESULTS_INSERT = '''INSERT INTO poll_results
+       (teacher_code, poll_id, question, options, correct_option, counts, total_votes, responses, started_at)
+       VALUES (%s, %s, %s, %s::jsonb, %s, %s::jsonb, %s, %s::jsonb, to_timestamp(%s)::timestamp)
+       ON CONFLICT (poll_id) DO NOTHING'''
+
+
+def poll_results_params(poll):
+    responses = {str(student_id): option for student_id, option in poll.votes.items()}
+    return (poll.teacher_code, poll.poll_id, poll.question,
+            json.dumps(poll.options, ensure_ascii=False), poll.correct_option,
+            json.dumps(poll.counts), len(poll.votes),
+            json.dumps(responses, ensure_ascii=False), poll.started)
+
+
+def save_poll_results(ctx, poll):
+    """마감한 투표 결과를 한 행으로 저장 (responses: 학생 id -> 선택지 번호)"""
+    conn = yield ctx.connect()
+    try:
+        yield conn.cursor().execute(POLL_RESULTS_INSERT, poll_results_params(poll))
+        yield conn.commit()
+    finally:
+        yield ctx.release(conn)
+
+
+@on_event('create_poll')
+def on_create_poll(ctx, data):
+    """교사: 투표/퀴즈 시작 (correct_option을 주면 퀴즈)"""
+    teacher_info = teachers.get(ctx.sid)
+    if not teacher_info:
+        result = {'status': 'error', 'message': '교사 인증이 필요합니다.'}
+        yield ctx.emit('create_poll_result', result)
+        return result
+    teacher_code = teacher_info.teacher_code
+    try:
+        poll = polls.start(teacher_code, *polls.parse(data or {}))
+    except ValueError as e:
+        result = {'status': 'error', 'message': str(e)}
+        yield ctx.emit('create_poll_result', result)
+        return result
+
+    yield ctx.emit('poll_started', poll.public(), room=f'students_{teacher_code}')
+    result = {'status': 'success', 'poll': dict(poll.results(), closed=False)}
+    yield ctx.emit('poll_state', result['poll'], room=f'teacher_{teacher_code}', skip_sid=ctx.sid)
+    yield ctx.emit('create_poll_result', result)
+    logs.info('poll_started', teacher_code=teacher_code, poll_id=poll.poll_id,
+              options=len(poll.options), quiz=poll.correct_option is not None)
+    return result
+
+
+@on_event('submit_poll_answer')
+def on_submit_poll_answer(ctx, data):
+    """학생: 투표 답 제출/변경 (메모리에서만 집계)"""
+    data = data or {}
+    student_info = students.get(ctx.sid)
+    poll_id = data.get('poll_id')
+    if not student_info:
+        result = {'status': 'error', 'poll_id': poll_id, 'message': '학생 연결 정보가 없습니다.'}
+        yield ctx.emit('poll_answer_result', result)
+        return result
+    teacher_code = student_info.teacher_code
+    poll = polls.get(teacher_code, poll_id)
+    if poll is None:
+        result = {'status': 'error', 'poll_id': poll_id, 'message': '이미 마감된 투표입니다.'}
+        yield ctx.emit('poll_answer_result', result)
+        return result
+    try:
+        changed = polls.vote(poll, student_info.student_id, data.get('option'))
+    except ValueError as e:
+        result = {'status': 'error', 'poll_id': poll_id, 'message': str(e)}
+        yield ctx.emit('poll_answer_result', result)
+        return result
+
+    if changed:
+        yield from schedule_poll_tally(ctx, poll)
+    result = {'status': 'success', 'poll_id': poll_id, 'option': data.get('option')}
+    yield ctx.emit('poll_answer_result', result)
+    return result
+
+
+@on_event('close_poll')
+def on_close_poll(ctx, data):
+    """교사: 투표 마감 -> 결과를 한 번 저장하고 교사/학생에게 최종 결과를 보낸다"""
+    teacher_info = teachers.get(ctx.sid)
+    if not teacher_info:
+        result = {'status': 'error', 'message': '교사 인증이 필요합니다.'}
+        yield ctx.emit('close_poll_result', result)
+        return result
+    teacher_code = teacher_info.teacher_code
+    poll = polls.close(teacher_code, (data or {}).get('poll_id'))
+    if poll is None:
+        result = {'status': 'error', 'message': '진행 중인 투표가 없습니다.'}
+        yield ctx.emit('close_poll_result', result)
+        return result
+
+    results = dict(poll.results(), closed=True)
+    try:
+        yield from save_poll_results(ctx, poll)
+        saved = True
+    except Exception as e:
+        saved = False
+        logs.error('poll_save_failed', teacher_code=teacher_code, poll_id=poll.poll_id, error=e)
+
+    yield ctx.emit('poll_closed', results, room=f'students_{teacher_code}')
+    yield ctx.emit('poll_state', results, room=f'teacher_{teacher_code}', skip_sid=ctx.sid)
+    result = {'status': 'success', 'poll': results, 'saved': saved}
+    yield ctx.emit('close_poll_result', result)
+    logs.info('poll_closed', teacher_code=teacher_code, poll_id=poll.poll_id, votes=len(poll.votes), saved=saved)
+    return result
+
+
+@on_event('get_poll_results')
+def on_get_poll_results(ctx, data=None):
+    """교사: 최근 마감한 투표 결과 목록"""
+    teacher_info = teachers.get(ctx.sid)
+    if not teacher_info:
+        yield ctx.emit('poll_results', {'polls': []})
+        return
+    teacher_code = teacher_info.teacher_code
+    try:
+        conn = yield ctx.connect()
+        try:
+            c = conn.cursor()
+            yield c.execute(
+                '''SELECT poll_id, question, options, correct_option, counts, total_votes, closed_at
+                   FROM poll_results
+                   WHERE teacher_code = %s
+                   ORDER BY id DESC
+                   LIMIT 20''',
+                (teacher_code,)
+            )
+            rows = yield c.fetchall()
+        finally:
+            yield ctx.release(conn)
+        yield ctx.emit('poll_results', {'polls': [{
+            'poll_id': row[0],
+            'question': row[1],
+            'options': row[2],
+            'is_quiz': row[3] is not None,
+            'correct_option': row[3],
+            'counts': row[4],
+            'total': row[5],
+            'closed_at': format_timestamp(row[6]),
+            'closed': True,
+        } for row in rows]})
+    except Exception as e:
+        logs.error('poll_results_failed', teacher_code=teacher_code, error=e)
+        yield ctx.emit('poll_results', {'polls': []})
+
+
+def start_background_tasks(app):
+    """워커 프로세스마다 한 번: 파티션 유지 관리와 루프 지연 측정 그린렛 시작"""
+    global background_started
+    if background_started:
+        return
+    background_started = True
+    admission.start()
+    server = app.extensions['socketio']
+    server.start_background_task(partition_maintenance_loop)
+    server.start_background_task(metrics.monitor_loop_lag, server.sleep)
+
+
+def create_app(config=None, setup_db=True, background=True, socket_server=None):
+    """앱 팩토리: 부를 때마다 새 Flask 앱과 SocketIO 서버를 만들어 라우트와 소켓 핸들러를 등록한다.
+
+    gunicorn은 'main:create_app(setup_db=False, background=False)'로 불러오고 스키마 작업과 백그라운드
+    작업은 gunicorn.conf.py 훅에서 따로 실행한다. 모듈 import 자체는 DB 접속이나 백그라운드 작업을 시작하지 않는다.
+    접속 상태(teachers/students)는 프로세스 메모리라 여러 앱을 만들어도 함께 쓴다.
+    socket_server를 주면 Flask-SocketIO 서버를 만들지 않고 그것을 socketio로 쓴다 (asgi.py: 라우트의
+    socketio.emit을 실제로 돌고 있는 AsyncServer로 보냄). 이때 소켓 이벤트는 그 서버가 socket_handlers를 등록해 처리한다.
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = SECRET_KEY
+    app.config['USE_X_SENDFILE'] = USE_X_SENDFILE
+    app.config['SOCKETIO_ASYNC_MODE'] = 'gevent'  # Render 배포용
+    app.config.update(config or {})
+    app.register_blueprint(bp)
+    app.extensions['session_tokens'] = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='student-session')
+    app.extensions['attachment_keys'] = Signer(app.config['SECRET_KEY'], salt='attachment')
+
+    if socket_server is not None:
+        app.extensions['socketio'] = socket_server
+    else:
+        server = InstrumentedSocketIO(app, cors_allowed_origins="*", async_mode=app.config['SOCKETIO_ASYNC_MODE'],
+                                      serializer=MeteredPacket, **ENGINEIO_OPTIONS)
+        for event, handler in socket_handlers:
+            server.on(event)(event_runner(server, handler))
+
+    if setup_db:
+        init_db()
+    if background:
+        start_background_tasks(app)
+    return app
 
 
-# 앱 시작 시 DB 초기화 (프로덕션/로컬 모두 실행)
-init_db()
+startup_seconds.set('import', value=time.perf_counter() - _import_started)
 
 if __name__ == '__main__':
+    app = create_app()
     print("서버 시작...")
     print("교사용 페이지: http://localhost:5000/teacher")
     print("학생용 페이지: http://localhost:5000/student")
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_DEBUG', 'false').lower() == 'true'
-    socketio.run(app, debug=debug, host='0.0.0.0', port=port)
+    app.extensions['socketio'].run(app, debug=debug, host='0.0.0.0', port=port)
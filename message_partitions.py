@@ -0,0 +1,302 @@
+"""messages 테이블 월 단위 파티션 관리 (생성, 보관, 복원)"""
+import csv
+import gzip
+import os
+from datetime import date, datetime
+
+import psycopg
+from psycopg import sql
+
+import attachments
+import identities
+import message_rollups
+
+PARTITION_LOCK_ID = 726001  # pg_advisory_xact_lock 키 (워커 간 DDL 직렬화)
+PARTITION_PREFIX = 'messages_p'
+DEFAULT_PARTITION = 'messages_default'  # 월 파티션이 아직 없는 시각의 행을 받아 두는 곳 (유지 작업이 옮김)
+
+MESSAGE_COLUMNS = (
+    'id', 'teacher_code', 'class_number', 'sender_type', 'sender_id',
+    'recipient_type', 'recipient_id', 'message', 'timestamp', 'is_read', 'recipient_student_ids', 'sender_student_id'
+)
+
+
+def month_start(value):
+    """Return the first day of the month containing value (date, datetime or 'YYYY-MM[-DD]')."""
+    if isinstance(value, str):
+        value = datetime.strptime(value[:7], '%Y-%m').date()
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.replace(day=1)
+
+
+def add_months(month, n):
+    total = month.year * 12 + (month.month - 1) + n
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{PARTITION_PREFIX}{month.year:04d}{month.month:02d}'
+
+
+def lock(c):
+    c.execute('SELECT pg_advisory_xact_lock(%s)', (PARTITION_LOCK_ID,))
+
+
+def is_partitioned(c):
+    c.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('messages')")
+    row = c.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def partition_bounds(month):
+    # DDL은 서버 측 파라미터를 받지 않으므로 경계값은 리터럴로 넣는다
+    return sql.SQL('FOR VALUES FROM ({}) TO ({})').format(sql.Literal(month), sql.Literal(add_months(month, 1)))
+
+
+def create_partition(c, month):
+    c.execute(
+        sql.SQL('CREATE TABLE IF NOT EXISTS {} PARTITION OF messages {}').format(
+            sql.Identifier(partition_name(month)), partition_bounds(month)
+        )
+    )
+
+
+def drain_default_partition(c):
+    """Move rows that fell into the default partition into their own month partitions.
+
+    A month partition cannot be created while the default partition holds rows for that month,
+    so each month is filled as a standalone table first and attached afterwards.
+    """
+    c.execute(
+        sql.SQL("SELECT DISTINCT date_trunc('month', timestamp)::date FROM {} ORDER BY 1").format(
+            sql.Identifier(DEFAULT_PARTITION)
+        )
+    )
+    months = [row[0] for row in c.fetchall()]
+    columns = sql.SQL(', ').join(map(sql.Identifier, MESSAGE_COLUMNS))
+    for month in months:
+        table = sql.Identifier(partition_name(month))
+        c.execute(sql.SQL('CREATE TABLE {} (LIKE messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS)').format(table))
+        c.execute(
+            sql.SQL(
+                '''WITH moved AS (
+                     DELETE FROM {} WHERE timestamp >= %s AND timestamp < %s RETURNING {}
+                   )
+                   INSERT INTO {} ({}) SELECT {} FROM moved'''
+            ).format(sql.Identifier(DEFAULT_PARTITION), columns, table, columns, columns),
+            (month, add_months(month, 1))
+        )
+        c.execute(sql.SQL('ALTER TABLE messages ATTACH PARTITION {} {}').format(table, partition_bounds(month)))
+    return months
+
+
+def ensure_partitions(c, months_ahead=3, start=None):
+    """Create partitions from start (default: this month) up to months_ahead months in the future."""
+    drain_default_partition(c)
+    month = month_start(start or date.today())
+    last = add_months(month_start(date.today()), months_ahead)
+    while month <= last:
+        create_partition(c, month)
+        month = add_months(month, 1)
+
+
+def list_partitions(c):
+    """Return [(partition_name, month_start)] for attached partitions, oldest first."""
+    c.execute(
+        '''SELECT child.relname
+           FROM pg_inherits
+           JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+           JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+           WHERE parent.oid = to_regclass('messages')
+           ORDER BY child.relname'''
+    )
+    partitions = []
+    for (name,) in c.fetchall():
+        if name.startswith(PARTITION_PREFIX):
+            suffix = name[len(PARTITION_PREFIX):]
+            partitions.append((name, date(int(suffix[:4]), int(suffix[4:6]), 1)))
+    return partitions
+
+
+def setup_messages_table(c, months_ahead=3):
+    """Create the partitioned messages table, migrating a legacy heap table in place if present."""
+    lock(c)
+    c.execute('CREATE SEQUENCE IF NOT EXISTS messages_id_seq')
+
+    legacy = False
+    c.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('messages')")
+    row = c.fetchone()
+    if row is not None and row[0] == 'r':
+        # 기존 단일 테이블: 시퀀스를 분리한 뒤 이름을 바꿔 두고 새 파티션 테이블로 복사
+        legacy = True
+        c.execute('ALTER SEQUENCE messages_id_seq OWNED BY NONE')
+        c.execute('ALTER TABLE messages RENAME TO messages_legacy')
+        c.execute('ALTER INDEX IF EXISTS messages_pkey RENAME TO messages_legacy_pkey')
+
+    c.execute(
+        '''CREATE TABLE IF NOT EXISTS messages
+           (id INTEGER NOT NULL DEFAULT nextval('messages_id_seq'),
+            teacher_code TEXT NOT NULL,
+            class_number TEXT,
+            sender_type TEXT NOT NULL,
+            sender_id TEXT NOT NULL,
+            recipient_type TEXT,
+            recipient_id TEXT,
+            message TEXT NOT NULL,
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            is_read BOOLEAN DEFAULT FALSE,
+            PRIMARY KEY (id, timestamp))
+           PARTITION BY RANGE (timestamp)'''
+    )
+    c.execute('ALTER SEQUENCE messages_id_seq OWNED BY messages.id')
+    # 유지 작업이 밀려 이번 달 파티션이 없더라도 저장이 실패하지 않도록
+    c.execute(
+        sql.SQL('CREATE TABLE IF NOT EXISTS {} PARTITION OF messages DEFAULT').format(sql.Identifier(DEFAULT_PARTITION))
+    )
+    c.execute('CREATE INDEX IF NOT EXISTS messages_teacher_ts_idx ON messages (teacher_code, timestamp)')
+
+    if legacy:
+        c.execute('SELECT MIN(timestamp) FROM messages_legacy')
+        oldest = c.fetchone()[0]
+        ensure_partitions(c, months_ahead, start=oldest)
+        c.execute(
+            '''INSERT INTO messages
+               (id, teacher_code, class_number, sender_type, sender_id,
+                recipient_type, recipient_id, message, timestamp, is_read)
+               SELECT id, teacher_code, class_number, sender_type, sender_id,
+                      recipient_type, recipient_id, message,
+                      COALESCE(timestamp, CURRENT_TIMESTAMP), is_read
+               FROM messages_legacy'''
+        )
+        c.execute("SELECT setval('messages_id_seq', GREATEST((SELECT COALESCE(MAX(id), 0) FROM messages), 1))")
+        c.execute('DROP TABLE messages_legacy')
+    else:
+        ensure_partitions(c, months_ahead)
+
+
+def drop_partition(c, month):
+    """Drop a month's partition without archiving it (deployment-wide retention, never per teacher)."""
+    table = sql.Identifier(partition_name(month))
+    c.execute('SELECT to_regclass(%s) IS NOT NULL', (partition_name(month),))
+    if c.fetchone()[0]:
+        message_rollups.apply_rows(
+            c, sql.SQL('SELECT teacher_code, timestamp, sender_type FROM {}').format(table), sign=-1
+        )
+        attachments.unlink_table(c, table)
+    c.execute(sql.SQL('DROP TABLE IF EXISTS {}').format(table))
+
+
+def archive_path(archive_dir, month):
+    return os.path.join(archive_dir, f'{partition_name(month)}.csv.gz')
+
+
+def archive_partition(conn, month, archive_dir):
+    """Detach a month's partition, export it to a gzip CSV file and drop it. Returns the file path."""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = archive_path(archive_dir, month)
+    table = sql.Identifier(partition_name(month))
+    columns = sql.SQL(', ').join(map(sql.Identifier, MESSAGE_COLUMNS))
+    c = conn.cursor()
+    lock(c)
+    c.execute(sql.SQL('ALTER TABLE messages DETACH PARTITION {}').format(table))
+    # 커밋이 끝난 뒤에만 보관 파일 이름으로 옮긴다: 커밋이 실패해 파티션이 되돌려지면 파일도 남기지 않는다
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with gzip.open(tmp_path, 'wb') as f:
+            with c.copy(sql.SQL('COPY {} ({}) TO STDOUT (FORMAT csv, HEADER true)').format(table, columns)) as copy:
+                for chunk in copy:
+                    f.write(chunk)
+        message_rollups.apply_rows(
+            c, sql.SQL('SELECT teacher_code, timestamp, sender_type FROM {}').format(table), sign=-1
+        )
+        # 첨부 연결은 보관 파일에 넣지 않는다 (복원한 메시지는 본문만, 파일은 sweep_unreferenced가 치움)
+        attachments.unlink_table(c, table)
+        c.execute(sql.SQL('DROP TABLE {}').format(table))
+        conn.commit()
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return path
+
+
+def restore_partition(conn, month, archive_dir):
+    """Reload an archived month from its gzip CSV file and attach it back to messages."""
+    path = archive_path(archive_dir, month)
+    table = sql.Identifier(partition_name(month))
+    c = conn.cursor()
+    lock(c)
+    c.execute(sql.SQL('CREATE TABLE {} (LIKE messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS)').format(table))
+    with gzip.open(path, 'rb') as f:
+        # 보관 당시의 열 목록(헤더)대로 읽는다. 학생 id 열이 없던 파일이면 이름으로 채운다
+        header = next(csv.reader([f.readline().decode()]))
+        f.seek(0)
+        columns = sql.SQL(', ').join(map(sql.Identifier, header))
+        with c.copy(sql.SQL('COPY {} ({}) FROM STDIN (FORMAT csv, HEADER true)').format(table, columns)) as copy:
+            while chunk := f.read(65536):
+                copy.write(chunk)
+    if 'recipient_student_ids' not in header:
+        identities.backfill_recipients(c, table)
+    if 'sender_student_id' not in header:
+        identities.backfill_senders(c, table)
+    c.execute(sql.SQL('ALTER TABLE messages ATTACH PARTITION {} {}').format(table, partition_bounds(month)))
+    message_rollups.apply_rows(c, sql.SQL('SELECT teacher_code, timestamp, sender_type FROM {}').format(table))
+    conn.commit()
+
+
+def expire_partitions(conn, retention_months, archive_dir=None):
+    """Archive (or, without archive_dir, drop) every partition older than retention_months.
+    Returns the written file paths, or the dropped partition names."""
+    cutoff = add_months(month_start(date.today()), -retention_months)
+    c = conn.cursor()
+    expired = [month for _, month in list_partitions(c) if month < cutoff]
+    conn.commit()
+    if archive_dir:
+        return [archive_partition(conn, month, archive_dir) for month in expired]
+    dropped = []
+    for month in expired:
+        c = conn.cursor()
+        lock(c)
+        drop_partition(c, month)
+        conn.commit()
+        dropped.append(partition_name(month))
+    return dropped
+
+
+if __name__ == '__main__':
+    import sys
+
+    usage = ('usage: python message_partitions.py '
+             '(ensure | list | archive YYYY-MM | restore YYYY-MM | drop YYYY-MM | expire MONTHS)')
+    if len(sys.argv) < 2:
+        sys.exit(usage)
+    db_url = os.environ.get('DATABASE_URL')
+    if not db_url:
+        sys.exit('DATABASE_URL is not set.')
+    archive_dir = os.environ.get('MESSAGE_ARCHIVE_DIR', 'archive')
+    command = sys.argv[1]
+    with psycopg.connect(db_url, sslmode=os.environ.get('DB_SSLMODE', 'prefer')) as conn:
+        if command == 'ensure':
+            cur = conn.cursor()
+            lock(cur)
+            ensure_partitions(cur)
+            conn.commit()
+        elif command == 'list':
+            for name, _ in list_partitions(conn.cursor()):
+                print(name)
+        elif command == 'archive' and len(sys.argv) > 2:
+            print(archive_partition(conn, month_start(sys.argv[2]), archive_dir))
+        elif command == 'restore' and len(sys.argv) > 2:
+            restore_partition(conn, month_start(sys.argv[2]), archive_dir)
+        elif command == 'drop' and len(sys.argv) > 2:
+            cur = conn.cursor()
+            lock(cur)
+            drop_partition(cur, month_start(sys.argv[2]))
+            conn.commit()
+        elif command == 'expire' and len(sys.argv) > 2:
+            for path in expire_partitions(conn, int(sys.argv[2]), archive_dir):
+                print(path)
+        else:
+            sys.exit(usage)
@@ -0,0 +1,94 @@
+"""교사별/일별/방향별 메시지 개수 집계 (message_daily_counts)
+
+direction은 messages.sender_type 값('teacher' = 교사 → 학생, 'student' = 학생 → 교사, 'admin' = 관리자 공지)을 그대로 쓴다.
+쓰기 함수와 count_messages는 c.execute()의 결과를 돌려주므로 psycopg AsyncCursor(asgi.py)로 부르면 await하면 된다.
+"""
+from psycopg import sql
+
+UPSERT_SQL = '''INSERT INTO message_daily_counts (teacher_code, day, direction, message_count)
+                {source}
+                ON CONFLICT (teacher_code, day, direction)
+                DO UPDATE SET message_count = message_daily_counts.message_count + EXCLUDED.message_count'''
+
+
+def ensure_table(c):
+    """Create the rollup table; backfill it from messages the first time it is created."""
+    c.execute("SELECT to_regclass('message_daily_counts') IS NULL")
+    created = c.fetchone()[0]
+    c.execute(
+        '''CREATE TABLE IF NOT EXISTS message_daily_counts
+           (teacher_code TEXT NOT NULL,
+            day DATE NOT NULL,
+            direction TEXT NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (teacher_code, direction, day))'''
+    )
+    if created:
+        rebuild(c)
+
+
+def rebuild(c):
+    c.execute('DELETE FROM message_daily_counts')
+    c.execute(
+        '''INSERT INTO message_daily_counts (teacher_code, day, direction, message_count)
+           SELECT teacher_code, timestamp::date, sender_type, COUNT(*)
+           FROM messages
+           GROUP BY teacher_code, timestamp::date, sender_type'''
+    )
+
+
+def record_insert(c, teacher_code, direction, count=1):
+    """Count newly saved messages on today's row (call in the same transaction as the INSERT)."""
+    return c.execute(
+        UPSERT_SQL.format(source='VALUES (%s, CURRENT_DATE, %s, %s)'),
+        (teacher_code, direction, count)
+    )
+
+
+def apply_rows(c, rows_sql, params=(), sign=1):
+    """Add (sign=1) or subtract (sign=-1) the rows produced by rows_sql.
+
+    rows_sql must yield teacher_code, timestamp, sender_type; it may be a DELETE ... RETURNING,
+    in which case the delete and the rollup update happen in a single statement.
+    """
+    if isinstance(rows_sql, str):
+        rows_sql = sql.SQL(rows_sql)
+    source = f'''SELECT teacher_code, timestamp::date, sender_type, {'' if sign > 0 else '-'}COUNT(*)
+                 FROM changed GROUP BY teacher_code, timestamp::date, sender_type'''
+    return c.execute(
+        sql.SQL('WITH changed AS ({}) ').format(rows_sql) + sql.SQL(UPSERT_SQL.format(source=source)),
+        params
+    )
+
+
+def delete_returning(c, delete_sql, params=()):
+    """Run a DELETE ... RETURNING teacher_code, timestamp, sender_type and subtract the removed rows."""
+    return apply_rows(c, delete_sql, params, sign=-1)
+
+
+def count_messages(c, teacher_code, direction, start_date=None, end_date=None):
+    """Sum message counts for a teacher/direction, optionally limited to [start_date, end_date].
+
+    Fetch the single (count,) row from the cursor afterwards.
+    """
+    query = '''SELECT COALESCE(SUM(message_count), 0) FROM message_daily_counts
+               WHERE teacher_code = %s AND direction = %s'''
+    params = [teacher_code, direction]
+    if start_date:
+        query += ' AND day >= %s'
+        params.append(start_date)
+    if end_date:
+        query += ' AND day <= %s'
+        params.append(end_date)
+    return c.execute(query, params)
+
+
+def daily_stats(c, teacher_code, start_date):
+    """Return [(day, direction, count)] since start_date, oldest first."""
+    c.execute(
+        '''SELECT day, direction, message_count FROM message_daily_counts
+           WHERE teacher_code = %s AND day >= %s AND message_count <> 0
+           ORDER BY day, direction''',
+        (teacher_code, start_date)
+    )
+    return c.fetchall()
@@ -0,0 +1,233 @@
+"""프로세스 내 메트릭 레지스트리와 Prometheus 텍스트 형식 출력
+
+외부 의존성 없이 Counter / Gauge / Histogram만 제공한다. 기록은 dict 조회와 정수 덧셈
+수준이라 이벤트마다 켜 두어도 부담이 작다 (워커 프로세스별로 집계됨).
+"""
+import asyncio
+import bisect
+import threading
+import time
+
+# 소켓 이벤트/HTTP 요청 지연 시간 버킷 (초)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    inner = ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"'))
+        for k, v in pairs
+    )
+    return '{' + inner + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in list(self.values.items()):
+            yield self.name, _format_labels(self.label_names, labels), value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels=(), callback=None):
+        super().__init__(name, help_text, labels)
+        self.callback = callback  # 스크랩 시점에 {labels: value} 를 돌려주는 함수
+
+    def set(self, *labels, value):
+        self.values[labels] = value
+
+    def dec(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def samples(self):
+        values = self.callback() if self.callback else self.values
+        for labels, value in list(values.items()):
+            yield self.name, _format_labels(self.label_names, labels), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for labels, series in list(self.series.items()):
+            cumulative = 0
+            for i, bound in enumerate(self.buckets + (float('inf'),)):
+                cumulative += series[i]
+                yield (self.name + '_bucket',
+                       _format_labels(self.label_names, labels, ('le', _format_value(float(bound)))),
+                       cumulative)
+            yield self.name + '_count', _format_labels(self.label_names, labels), cumulative
+            yield self.name + '_sum', _format_labels(self.label_names, labels), series[-1]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=(), callback=None):
+        return self.register(Gauge(name, help_text, labels, callback))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+event_latency = registry.histogram(
+    'socketio_event_duration_seconds', 'Socket.IO event handler latency', ('event',))
+event_errors = registry.counter(
+    'socketio_event_errors_total', 'Socket.IO event handlers that raised', ('event',))
+event_db_time = registry.histogram(
+    'socketio_event_db_seconds', 'Time spent in database calls per Socket.IO event', ('event',))
+http_latency = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency', ('endpoint', 'method', 'status'))
+http_db_time = registry.histogram(
+    'http_request_db_seconds', 'Time spent in database calls per HTTP request', ('endpoint',))
+emits_total = registry.counter(
+    'socketio_emits_total', 'Socket.IO emits by event name', ('event',))
+emit_bytes_total = registry.counter(
+    'socketio_emit_bytes_total', 'Encoded Socket.IO packet bytes emitted by event name (once per emit, not per recipient)', ('event',))
+db_connections_opened = registry.counter(
+    'db_connections_opened_total', 'Database connections opened')
+db_connections_open = registry.gauge(
+    'db_connections_open', 'Database connections currently open')
+loop_lag = registry.histogram(
+    'gevent_loop_lag_seconds', 'Extra delay of a periodic hub timer beyond its scheduled sleep',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+# 현재 그린렛(요청/이벤트)에서 누적된 DB 시간 (monkey.patch_all 이후에는 그린렛 단위 local)
+_current = threading.local()
+
+
+def begin_scope():
+    _current.db_time = 0.0
+
+
+def end_scope():
+    spent = getattr(_current, 'db_time', 0.0)
+    _current.db_time = None
+    return spent
+
+
+def add_db_time(seconds):
+    if getattr(_current, 'db_time', None) is not None:
+        _current.db_time += seconds
+
+
+def record_emit(event):
+    emits_total.inc(event)
+
+
+def record_packet_bytes(event, encoded):
+    """Count the size of an already encoded event packet (str, or [str, bytes...] for binary events)."""
+    if isinstance(encoded, list):
+        size = sum(len(part) for part in encoded)
+    else:
+        size = len(encoded)
+    emit_bytes_total.inc(event, amount=size)
+
+
+def track_event(event, handler):
+    """Wrap a Socket.IO handler so its latency, DB time and errors are recorded."""
+    def wrapper(*args, **kwargs):
+        begin_scope()
+        start = time.perf_counter()
+        try:
+            return handler(*args, **kwargs)
+        except Exception:
+            event_errors.inc(event)
+            raise
+        finally:
+            event_latency.observe(time.perf_counter() - start, event)
+            event_db_time.observe(end_scope(), event)
+    wrapper.__name__ = handler.__name__
+    wrapper.__doc__ = handler.__doc__
+    wrapper.__wrapped__ = handler
+    return wrapper
+
+
+def track_async_event(event, handler):
+    """track_event for coroutine handlers (asgi.py). DB time is not attributed: tasks share one thread."""
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await handler(*args, **kwargs)
+        except Exception:
+            event_errors.inc(event)
+            raise
+        finally:
+            event_latency.observe(time.perf_counter() - start, event)
+    wrapper.__name__ = handler.__name__
+    wrapper.__doc__ = handler.__doc__
+    wrapper.__wrapped__ = handler
+    return wrapper
+
+
+def monitor_loop_lag(sleep, interval=0.5):
+    """Run forever: sleep interval seconds and record how late the wake-up was."""
+    while True:
+        start = time.perf_counter()
+        sleep(interval)
+        loop_lag.observe(max(0.0, time.perf_counter() - start - interval))
+
+
+async def monitor_loop_lag_async(interval=0.5):
+    """monitor_loop_lag for the asyncio event loop (asgi.py)."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(0.0, time.perf_counter() - start - interval))
@@ -0,0 +1,107 @@
+"""교사별 실시간 투표/퀴즈 (메모리 집계)
+
+교사당 진행 중인 투표는 하나. 학생 답은 학생 id별로 하나만 세며, 답을 바꾸면 이전 선택지에서
+빼고 새 선택지에 더한다. 답은 messages 테이블을 거치지 않고, 투표를 마감할 때 결과만 poll_results에 한 번 저장한다.
+교사 화면에 보내는 집계는 호출하는 쪽(main.py)이 POLL_TALLY_INTERVAL 간격으로 묶어서 보낸다.
+"""
+import time
+import uuid
+
+import metrics
+
+MAX_OPTIONS = 10
+QUESTION_MAX_LENGTH = 500
+OPTION_MAX_LENGTH = 100
+
+polls_started = metrics.registry.counter('polls_started_total', 'Polls opened by teachers')
+poll_votes = metrics.registry.counter('poll_votes_total', 'Poll answers received (including changed answers)')
+
+active_polls = {}  # teacher_code -> Poll
+
+
+class Poll:
+    __slots__ = ('poll_id', 'teacher_code', 'question', 'options', 'correct_option', 'counts', 'votes',
+                 'started', 'dirty')
+
+    def __init__(self, teacher_code, question, options, correct_option=None):
+        self.poll_id = uuid.uuid4().hex
+        self.teacher_code = teacher_code
+        self.question = question
+        self.options = options
+        self.correct_option = correct_option
+        self.counts = [0] * len(options)
+        self.votes = {}  # 학생 id -> 선택지 번호
+        self.started = time.time()
+        self.dirty = False  # 마지막으로 교사에게 보낸 뒤 바뀐 집계가 있는지
+
+    def public(self):
+        """학생에게 보내는 문제 (정답 제외)"""
+        return {'poll_id': self.poll_id, 'question': self.question, 'options': self.options,
+                'is_quiz': self.correct_option is not None}
+
+    def tally(self):
+        return {'poll_id': self.poll_id, 'counts': list(self.counts), 'total': len(self.votes)}
+
+    def results(self):
+        """마감 결과 (교사/학생 공용, 정답 포함)"""
+        return dict(self.public(), **self.tally(), correct_option=self.correct_option)
+
+
+def parse(data):
+    """Validate a create_poll payload. Returns (question, options, correct_option) or raises ValueError."""
+    question = (data.get('question') or '').strip()
+    options = [str(option).strip() for option in data.get('options') or [] if str(option).strip()]
+    if not question or len(question) > QUESTION_MAX_LENGTH:
+        raise ValueError('질문을 입력해주세요.')
+    if not 2 <= len(options) <= MAX_OPTIONS or any(len(option) > OPTION_MAX_LENGTH for option in options):
+        raise ValueError(f'선택지는 2~{MAX_OPTIONS}개를 입력해주세요.')
+    correct = data.get('correct_option')
+    if correct is not None and correct != '':
+        try:
+            correct = int(correct)
+        except (TypeError, ValueError):
+            raise ValueError('정답 번호가 올바르지 않습니다.') from None
+        if not 0 <= correct < len(options):
+            raise ValueError('정답 번호가 선택지 범위를 벗어났습니다.')
+    else:
+        correct = None
+    return question, options, correct
+
+
+def start(teacher_code, question, options, correct_option=None):
+    if teacher_code in active_polls:
+        raise ValueError('진행 중인 투표를 먼저 마감해주세요.')
+    poll = active_polls[teacher_code] = Poll(teacher_code, question, options, correct_option)
+    polls_started.inc()
+    return poll
+
+
+def get(teacher_code, poll_id=None):
+    poll = active_polls.get(teacher_code)
+    if poll is None or (poll_id is not None and poll.poll_id != poll_id):
+        return None
+    return poll
+
+
+def vote(poll, student_id, option):
+    """Record or change a student's answer. Returns True if the tally changed."""
+    if not isinstance(option, int) or isinstance(option, bool) or not 0 <= option < len(poll.options):
+        raise ValueError('잘못된 선택지입니다.')
+    previous = poll.votes.get(student_id)
+    poll_votes.inc()
+    if previous == option:
+        return False
+    if previous is not None:
+        poll.counts[previous] -= 1
+    poll.counts[option] += 1
+    poll.votes[student_id] = option
+    poll.dirty = True
+    return True
+
+
+def close(teacher_code, poll_id=None):
+    """Remove and return the active poll (None if there is none / the id does not match)."""
+    poll = get(teacher_code, poll_id)
+    if poll is not None:
+        del active_polls[teacher_code]
+    return poll
@@ -0,0 +1,142 @@
+"""실행 중인 워커용 샘플링 프로파일러
+
+네이티브 스레드가 interval마다 메인(허브) 스레드의 현재 프레임을 떠서 collapsed-stack 형식
+(flamegraph.pl / speedscope 호환)으로 누적하고, 같은 기간 greenlet 전환 추적으로 그린렛별 CPU 시간을
+Socket.IO 이벤트 이름 단위로 합산한다. 이벤트 이름은 metrics.track_event 래퍼 프레임의 지역 변수에서
+읽으므로 평소 이벤트 처리 경로에는 추가 비용이 없다.
+"""
+import os
+import sys
+import time
+import weakref
+
+import metrics
+
+try:
+    import greenlet
+except ImportError:  # gevent 없이 실행될 때
+    greenlet = None
+
+try:
+    from gevent import monkey
+    _start_new_thread = monkey.get_original('_thread', 'start_new_thread')
+    _get_ident = monkey.get_original('_thread', 'get_ident')
+    _sleep = monkey.get_original('time', 'sleep')
+except ImportError:
+    import _thread
+    _start_new_thread = _thread.start_new_thread
+    _get_ident = _thread.get_ident
+    _sleep = time.sleep
+
+MAX_SECONDS = 60
+MAX_DEPTH = 128
+
+_WRAPPER_CODE = metrics.track_event('', lambda: None).__code__
+_running = False
+
+
+def frame_label(frame):
+    """Return the Socket.IO event name if the stack runs inside a tracked handler."""
+    while frame is not None:
+        if frame.f_code is _WRAPPER_CODE:
+            return f"event:{frame.f_locals.get('event', '?')}"
+        frame = frame.f_back
+    return None
+
+
+def collapse(frame):
+    names = []
+    label = None
+    while frame is not None and len(names) < MAX_DEPTH:
+        code = frame.f_code
+        if code is _WRAPPER_CODE and label is None:
+            label = f"event:{frame.f_locals.get('event', '?')}"
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)})')
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join([label or 'other'] + names)
+
+
+class Profile:
+    def __init__(self, seconds, interval):
+        self.seconds = seconds
+        self.interval = interval
+        self.target_thread = _get_ident()
+        self.stacks = {}
+        self.samples = 0
+        self.cpu = {}  # label -> CPU 초
+        self.switches = 0
+        self._labels = weakref.WeakKeyDictionary()
+        self._stop = False
+        self._finished = False
+        self._last_cpu = time.thread_time()
+
+    # 샘플러 (네이티브 스레드)
+    def _sample_loop(self):
+        while not self._stop:
+            frame = sys._current_frames().get(self.target_thread)
+            if frame is not None:
+                key = collapse(frame)
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+            del frame
+            _sleep(self.interval)
+        self._finished = True
+
+    # greenlet 전환 추적 (메인 스레드, 프로파일 동안만 설치)
+    def _label_of(self, glet):
+        label = self._labels.get(glet)
+        if label:
+            return label
+        if type(glet).__name__ == 'Hub':
+            label = 'hub'
+        else:
+            label = frame_label(getattr(glet, 'gr_frame', None))
+        if label:
+            self._labels[glet] = label
+        return label or 'other'
+
+    def _tracer(self, event, args):
+        if event in ('switch', 'throw'):
+            origin, _ = args
+            now = time.thread_time()
+            label = self._label_of(origin)
+            self.cpu[label] = self.cpu.get(label, 0.0) + (now - self._last_cpu)
+            self._last_cpu = now
+            self.switches += 1
+
+    def run(self, sleep):
+        previous = greenlet.settrace(self._tracer) if greenlet else None
+        _start_new_thread(self._sample_loop, ())
+        try:
+            sleep(self.seconds)
+        finally:
+            self._stop = True
+            if greenlet:
+                greenlet.settrace(previous)
+            while not self._finished:
+                sleep(self.interval)
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(self.stacks.items()))
+
+    def greenlet_breakdown(self):
+        total = sum(self.cpu.values()) or 1.0
+        return [
+            {'label': label, 'cpu_seconds': round(seconds, 6), 'percent': round(seconds / total * 100, 2)}
+            for label, seconds in sorted(self.cpu.items(), key=lambda item: item[1], reverse=True)
+        ]
+
+
+def run_profile(seconds, interval, sleep):
+    """Profile the calling process for seconds; sleep must yield to other greenlets (socketio.sleep)."""
+    global _running
+    if _running:
+        raise RuntimeError('profile already running')
+    _running = True
+    try:
+        profile = Profile(min(max(seconds, 0.1), MAX_SECONDS), max(interval, 0.001))
+        profile.run(sleep)
+        return profile
+    finally:
+        _running = False
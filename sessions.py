@@ -0,0 +1,41 @@
+"""접속 중인 교사/학생 소켓 정보 (main.teachers / main.students 의 값)
+
+연결마다 dict를 두면 키 문자열 참조와 해시 테이블이 연결 수만큼 생기므로 __slots__ 레코드로 둔다.
+교사 코드/이름, 학생 이름, 반 번호처럼 여러 연결이 같은 값을 갖는 문자열은 sys.intern으로 한 객체를 함께 쓴다
+(socket_id는 연결마다 달라서 그대로 둔다). 클라이언트에 보낼 때는 as_dict()로 기존 dict 모양을 만든다.
+"""
+import sys
+
+
+def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class TeacherSession:
+    __slots__ = ('teacher_code', 'teacher_name', 'socket_id')
+
+    def __init__(self, teacher_code, teacher_name, socket_id):
+        self.teacher_code = intern(teacher_code)
+        self.teacher_name = intern(teacher_name)
+        self.socket_id = socket_id
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class StudentSession:
+    __slots__ = ('teacher_code', 'class_number', 'student_name', 'student_id', 'socket_id', 'teacher_name')
+
+    def __init__(self, teacher_code, class_number, student_name, socket_id, teacher_name, student_id=None):
+        self.teacher_code = intern(teacher_code)
+        self.class_number = intern(class_number or '')
+        self.student_name = intern(student_name)
+        self.student_id = student_id  # student_identities.id (정수)
+        self.socket_id = socket_id
+        self.teacher_name = intern(teacher_name or '')
+
+    def class_numbers(self):
+        return [number for number in self.class_number.split(',') if number]
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
@@ -0,0 +1,41 @@
+// Socket.IO 재접속: 지수 백오프 + full jitter
+//
+// 서버가 재시작되면 모든 기기가 같은 순간에 끊기므로, socket.io 기본 재접속(거의 같은 간격)은
+// 다시 한꺼번에 몰린다. 대신 시도마다 0 ~ min(cap, base * 2^attempt) 사이에서 무작위로 기다린다.
+// 서버가 끊은 경우(io server disconnect, 강제 퇴장)와 직접 끊은 경우에는 다시 붙지 않는다.
+function jitteredDelay(attempt, base = 1000, cap = 30000) {
+    return Math.random() * Math.min(cap, base * 2 ** attempt);
+}
+
+function createReconnectingSocket(options = {}) {
+    const base = options.base ?? 1000;
+    const cap = options.cap ?? 30000;
+    const socket = io({ reconnection: false });
+    let attempt = 0;
+    let timer = null;
+
+    function schedule() {
+        if (timer) return;
+        const delay = jitteredDelay(attempt++, base, cap);
+        timer = setTimeout(() => {
+            timer = null;
+            if (!socket.connected) socket.connect();
+        }, delay);
+    }
+
+    socket.on('connect', () => {
+        attempt = 0;
+        clearTimeout(timer);
+        timer = null;
+    });
+    socket.on('connect_error', schedule);
+    socket.on('disconnect', (reason) => {
+        if (reason !== 'io server disconnect' && reason !== 'io client disconnect') schedule();
+    });
+    return socket;
+}
+
+// 서버가 retry_after(초)로 다시 오라고 할 때: 대기열이 빌 시각 이후 같은 길이의 구간에 흩어서 다시 시도
+function retryAfter(seconds, fn) {
+    return setTimeout(fn, seconds * 1000 * (1 + Math.random()));
+}
@@ -1,9 +1,24 @@
-// Socket.IO 연결
-const socket = io();
+// Socket.IO 연결 (끊기면 지수 백오프 + 지터로 재접속, reconnect.js)
+const socket = createReconnectingSocket();
 
 let studentInfo = { teacherCode: '', name: '', teacherName: '', connected: false };
 let messages = [];
+let messagesOwner = '';
 let allowStudentMessages = false;
+let autoRejoin = false; // 참여한 뒤 직접 끊기 전까지: 재접속하면 세션 토큰으로 다시 참여
+let currentPoll = null; // { poll_id, question, options, is_quiz, my_option, (마감 후) counts, total, correct_option, closed }
+
+// IndexedDB 메시지 캐시 (교사 코드 + 학생 이름별), 개수와 보관 기간으로 제한
+const MESSAGE_DB_NAME = 'student-messages';
+const MESSAGE_STORE = 'messages';
+const OUTBOX_STORE = 'outbox';
+const OUTBOX_BATCH_SIZE = 50;
+const OUTBOX_RETRY_MS = 10000;
+let outboxFlushing = false;
+let outboxRetryTimer = null;
+const MESSAGE_CACHE_LIMIT = 200;
+const MESSAGE_CACHE_MAX_AGE = 30 * 24 * 60 * 60 * 1000;
+let messageDbPromise = null;
 
 // DOM
 const connectionStatus = document.getElementById('connectionStatus');
@@ -11,6 +26,8 @@ const loginScreen = document.getElementById('loginScreen');
 const messageScreen = document.getElementById('messageScreen');
 const teacherCodeInput = document.getElementById('teacherCode');
 const studentNameInput = document.getElementById('studentName');
+const classChoice = document.getElementById('classChoice');
+const classNumberSelect = document.getElementById('classNumberSelect');
 const connectBtn = document.getElementById('connectBtn');
 const disconnectBtn = document.getElementById('disconnectBtn');
 const displayName = document.getElementById('displayName');
@@ -23,6 +40,8 @@ const studentSendCard = document.getElementById('studentSendCard');
 const studentMessageInput = document.getElementById('studentMessageInput');
 const sendToTeacherBtn = document.getElementById('sendToTeacherBtn');
 const sendStatus = document.getElementById('sendStatus');
+const pollCard = document.getElementById('pollCard');
+const pollOptionsEl = document.getElementById('pollOptions');
 
 document.addEventListener('DOMContentLoaded', () => {
     initEvents();
@@ -62,16 +81,202 @@ function loadStoredData() {
         studentInfo.name = data.name || '';
         studentInfo.teacherName = data.teacherName || '';
     }
-    const storedMessages = localStorage.getItem('studentMessages');
-    if (storedMessages) {
-        messages = JSON.parse(storedMessages);
+    // 서버 응답을 기다리지 않고 기기에 저장된 메시지부터 표시
+    loadCachedMessages(cacheOwner()).then(() => {
         if (messages.length > 0) displayMessages();
+    });
+}
+
+function cacheOwner() {
+    return studentInfo.teacherCode && studentInfo.name ? `${studentInfo.teacherCode}::${studentInfo.name}` : '';
+}
+
+function openMessageDb() {
+    if (!('indexedDB' in window)) return Promise.resolve(null);
+    if (!messageDbPromise) {
+        messageDbPromise = new Promise((resolve) => {
+            const request = indexedDB.open(MESSAGE_DB_NAME, 2);
+            request.onupgradeneeded = () => {
+                const db = request.result;
+                if (!db.objectStoreNames.contains(MESSAGE_STORE)) {
+                    db.createObjectStore(MESSAGE_STORE, { keyPath: ['owner', 'id'] }).createIndex('owner', 'owner');
+                }
+                // 보내지 못한 학생 메시지 (재전송 방지 키 포함)
+                if (!db.objectStoreNames.contains(OUTBOX_STORE)) {
+                    db.createObjectStore(OUTBOX_STORE, { keyPath: 'key' }).createIndex('owner', 'owner');
+                }
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => resolve(null);
+            request.onblocked = () => resolve(null);
+        });
     }
+    return messageDbPromise;
+}
+
+function messageStore(db, mode) {
+    return db.transaction(MESSAGE_STORE, mode).objectStore(MESSAGE_STORE);
+}
+
+// owner의 캐시를 읽어 messages에 넣음 (오래되었거나 개수를 넘는 기록은 정리)
+function loadCachedMessages(owner) {
+    messagesOwner = owner;
+    if (!owner) { messages = []; return Promise.resolve(messages); }
+    return openMessageDb().then((db) => {
+        if (!db) {
+            // IndexedDB를 쓸 수 없는 브라우저: 예전처럼 localStorage 사용
+            messages = JSON.parse(localStorage.getItem('studentMessages') || '[]');
+            return messages;
+        }
+        return new Promise((resolve) => {
+            const request = messageStore(db, 'readonly').index('owner').getAll(owner);
+            request.onsuccess = () => {
+                if (messagesOwner !== owner) { resolve(messages); return; }
+                const records = request.result || [];
+                // 예전 localStorage 기록은 처음 한 번 IndexedDB로 옮김
+                const legacy = JSON.parse(localStorage.getItem('studentMessages') || '[]');
+                const migrate = legacy.length > 0 && records.length === 0;
+                if (migrate) records.push(...legacy);
+                localStorage.removeItem('studentMessages');
+                messages = pruneMessages(records.filter((m) => !m.hidden), records);
+                if (migrate) saveMessages();
+                resolve(messages);
+            };
+            request.onerror = () => resolve(messages);
+        });
+    });
+}
+
+function sortMessages(list) {
+    return list.sort((a, b) => new Date(b.timestamp) - new Date(a.timestamp) || (Number(b.id) || 0) - (Number(a.id) || 0));
+}
+
+// 개수/기간 제한을 넘는 기록을 캐시에서 지우고 남길 목록을 돌려줌
+function pruneMessages(list, allRecords = list) {
+    const cutoff = Date.now() - MESSAGE_CACHE_MAX_AGE;
+    const kept = sortMessages(list.filter((m) => !m.cachedAt || m.cachedAt >= cutoff)).slice(0, MESSAGE_CACHE_LIMIT);
+    const keep = new Set(kept.map((m) => String(m.id)));
+    const expired = allRecords.filter((m) => !keep.has(String(m.id)) && !(m.hidden && m.cachedAt >= cutoff));
+    if (expired.length > 0) removeCachedMessages(expired.map((m) => m.id));
+    return kept;
+}
+
+function saveMessages() {
+    const owner = messagesOwner;
+    openMessageDb().then((db) => {
+        if (!db) {
+            localStorage.setItem('studentMessages', JSON.stringify(messages));
+            return;
+        }
+        const store = messageStore(db, 'readwrite');
+        const now = Date.now();
+        messages.forEach((m) => {
+            if (!m.cachedAt) m.cachedAt = now;
+            store.put({ ...m, owner });
+        });
+    });
+}
+
+function removeCachedMessages(ids) {
+    const owner = messagesOwner;
+    return openMessageDb().then((db) => {
+        if (!db || ids.length === 0) return;
+        const store = messageStore(db, 'readwrite');
+        ids.forEach((id) => store.delete([owner, id]));
+    });
+}
+
+// 숨김 표시만 남겨 두고(오프라인이면 재접속 때 다시 요청) 서버 목록에서 빠지면 지움
+function markCachedHidden(message) {
+    const owner = messagesOwner;
+    openMessageDb().then((db) => {
+        if (db) messageStore(db, 'readwrite').put({ ...message, owner, hidden: true, cachedAt: message.cachedAt || Date.now() });
+    });
+}
+
+function pendingHiddenIds() {
+    const owner = messagesOwner;
+    return openMessageDb().then((db) => {
+        if (!db) return [];
+        return new Promise((resolve) => {
+            const request = messageStore(db, 'readonly').index('owner').getAll(owner);
+            request.onsuccess = () => resolve((request.result || []).filter((m) => m.hidden).map((m) => m.id));
+            request.onerror = () => resolve([]);
+        });
+    });
+}
+
+// 학생 → 교사 메시지 보관함: 연결이 끊겨 있어도 잃지 않고, 재접속하면 send_messages_batch로 한 번에 보냄
+function newClientKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+}
+
+function readOutbox(owner) {
+    return openMessageDb().then((db) => {
+        if (!db) return JSON.parse(localStorage.getItem('studentOutbox') || '[]').filter((item) => item.owner === owner);
+        return new Promise((resolve) => {
+            const request = db.transaction(OUTBOX_STORE, 'readonly').objectStore(OUTBOX_STORE).index('owner').getAll(owner);
+            request.onsuccess = () => resolve((request.result || []).sort((a, b) => a.createdAt - b.createdAt));
+            request.onerror = () => resolve([]);
+        });
+    });
+}
+
+function addToOutbox(item) {
+    return openMessageDb().then((db) => {
+        if (!db) {
+            const items = JSON.parse(localStorage.getItem('studentOutbox') || '[]');
+            items.push(item);
+            localStorage.setItem('studentOutbox', JSON.stringify(items));
+            return;
+        }
+        return new Promise((resolve) => {
+            const tx = db.transaction(OUTBOX_STORE, 'readwrite');
+            tx.objectStore(OUTBOX_STORE).put(item);
+            tx.oncomplete = resolve;
+            tx.onerror = resolve;
+        });
+    });
+}
+
+function removeFromOutbox(keys) {
+    return openMessageDb().then((db) => {
+        if (!db) {
+            const items = JSON.parse(localStorage.getItem('studentOutbox') || '[]');
+            localStorage.setItem('studentOutbox', JSON.stringify(items.filter((item) => !keys.includes(item.key))));
+            return;
+        }
+        return new Promise((resolve) => {
+            const tx = db.transaction(OUTBOX_STORE, 'readwrite');
+            keys.forEach((key) => tx.objectStore(OUTBOX_STORE).delete(key));
+            tx.oncomplete = resolve;
+            tx.onerror = resolve;
+        });
+    });
+}
+
+function flushOutbox() {
+    if (!studentInfo.connected || outboxFlushing) return;
+    readOutbox(cacheOwner()).then((items) => {
+        if (items.length === 0 || !studentInfo.connected || outboxFlushing) return;
+        outboxFlushing = true;
+        // 응답 없이 연결이 끊기면 다음 재접속 때 같은 키로 다시 보냄 (서버가 중복 제거)
+        clearTimeout(outboxRetryTimer);
+        outboxRetryTimer = setTimeout(() => { outboxFlushing = false; }, OUTBOX_RETRY_MS);
+        socket.emit('send_messages_batch', {
+            messages: items.slice(0, OUTBOX_BATCH_SIZE).map((item) => ({ client_key: item.key, message: item.message }))
+        });
+    });
+}
+
+function serverMessageIds() {
+    return messages.map((m) => m.id).filter((id) => Number.isInteger(id));
 }
 
 function setupPWA() {
     if ('serviceWorker' in navigator) {
-        navigator.serviceWorker.register('/static/sw.js').catch(() => { });
+        navigator.serviceWorker.register('/sw.js').catch(() => { });
     }
     if ('Notification' in window && Notification.permission === 'default') {
         Notification.requestPermission();
@@ -86,21 +291,39 @@ function connectToServer() {
     if (teacherCode.length !== 6 || !/^\d{6}$/.test(teacherCode)) { showFloatingNotification('교사 코드는 6자리 숫자입니다', 'warning'); teacherCodeInput.focus(); return; }
     if (!name) { showFloatingNotification('이름을 입력해주세요', 'warning'); studentNameInput.focus(); return; }
 
-    studentInfo = { teacherCode, name, teacherName: '', connected: false };
+    // 같은 교사/이름으로 다시 접속하면 이전에 배정된 반을 함께 보냄
+    const stored = JSON.parse(localStorage.getItem('studentInfo') || '{}');
+    const sameStudent = stored.teacherCode === teacherCode && stored.name === name;
+    const chosenClass = classChoice.classList.contains('d-none') ? '' : classNumberSelect.value;
+    studentInfo = {
+        teacherCode, name, teacherName: '', classNumber: chosenClass || (sameStudent ? (stored.classNumber || '') : ''),
+        sessionToken: sameStudent ? (stored.sessionToken || '') : '', connected: false
+    };
     localStorage.setItem('studentInfo', JSON.stringify(studentInfo));
+    if (cacheOwner() !== messagesOwner) {
+        loadCachedMessages(cacheOwner()).then(() => displayMessages());
+    }
 
-    // 소켓이 끊겨있으면 다시 연결
+    // 소켓이 끊겨있으면 다시 연결 (연결되면 connect 이벤트에서 참여)
+    autoRejoin = true;
     if (!socket.connected) {
         socket.connect();
+        return;
     }
+    emitStudentJoin();
+}
 
+function emitStudentJoin() {
     socket.emit('student_join', {
-        teacher_code: teacherCode,
-        student_name: name
+        teacher_code: studentInfo.teacherCode,
+        student_name: studentInfo.name,
+        class_number: studentInfo.classNumber,
+        session_token: studentInfo.sessionToken || undefined
     });
 }
 
 function disconnectFromServer() {
+    autoRejoin = false;
     if (studentInfo.connected) {
         socket.disconnect();
         studentInfo.connected = false;
@@ -113,28 +336,75 @@ function disconnectFromServer() {
 socket.on('connect', () => {
     connectionStatus.textContent = '연결됨';
     connectionStatus.className = 'badge bg-success fs-6';
+    // 서버 재시작 등으로 끊겼다가 다시 붙으면 토큰으로 참여를 복원 (DB 조회 없이 처리됨)
+    if (autoRejoin && !studentInfo.connected) emitStudentJoin();
 });
 
 socket.on('student_join_success', (data) => {
     if (data.status === 'success') {
         studentInfo.connected = true;
+        classChoice.classList.add('d-none');
         studentInfo.teacherName = data.teacher_name;
         studentInfo.teacherCode = data.student_info?.teacher_code || studentInfo.teacherCode;
+        studentInfo.classNumber = data.student_info?.class_number || '';
+        studentInfo.sessionToken = data.session_token || '';
         localStorage.setItem('studentInfo', JSON.stringify(studentInfo));
 
         showMessageScreen();
-        showFloatingNotification(`${data.teacher_name} 선생님과 연결되었습니다`, 'success');
+        if (!data.resumed) showFloatingNotification(`${data.teacher_name} 선생님과 연결되었습니다`, 'success');
         updateSendToTeacherUI(data.allow_messages);
+        // 진행 중인 투표가 있으면 서버가 바로 이어서 poll_started를 다시 보낸다
+        if (currentPoll && !currentPoll.closed) {
+            currentPoll = null;
+            renderPoll();
+        }
         requestMessageHistory();
+        flushOutbox();
     }
 });
 
 socket.on('student_join_error', (data) => {
+    if (data.retry_after) {
+        // 서버 재시작 직후 접속 대기열이 가득 참: 잠시 뒤 다시 참여
+        showFloatingNotification(data.error, 'info');
+        retryAfter(data.retry_after, () => { if (autoRejoin && socket.connected && !studentInfo.connected) emitStudentJoin(); });
+        return;
+    }
+    if (Array.isArray(data.classes)) {
+        // 같은 이름의 학생이 여러 반에 있음: 반을 골라 다시 연결
+        autoRejoin = false;
+        classNumberSelect.innerHTML = data.classes.map((n) => `<option value="${escapeHtml(n)}">${escapeHtml(n)}반</option>`).join('');
+        classChoice.classList.remove('d-none');
+        showFloatingNotification(data.error, 'warning');
+        return;
+    }
     showFloatingNotification(data.error || '연결에 실패했습니다', 'error');
 });
 
 socket.on('receive_status', (data) => {
     updateSendToTeacherUI(!!data.allow);
+    if (data.allow) flushOutbox();
+});
+
+socket.on('student_messages_batch_result', (data) => {
+    outboxFlushing = false;
+    clearTimeout(outboxRetryTimer);
+    if (data.status !== 'success') {
+        if (data.status === 'blocked') {
+            showFloatingNotification('교사가 수신을 허용하면 보관 중인 메시지를 보냅니다', 'warning');
+        } else {
+            showFloatingNotification(data.message || '메시지 전송에 실패했습니다', 'warning');
+        }
+        return;
+    }
+    const sent = Object.keys(data.accepted || {});
+    const done = sent.concat(Object.keys(data.duplicates || {}));
+    removeFromOutbox(done).then(() => {
+        if (sent.length > 0) {
+            showFloatingNotification(sent.length === 1 ? '교사에게 메시지를 보냈습니다' : `교사에게 메시지 ${sent.length}개를 보냈습니다`, 'success');
+        }
+        flushOutbox();  // 남은 항목(50개 초과분, 전송 중에 추가된 메시지)
+    });
 });
 
 socket.on('student_message_sent', (data) => {
@@ -147,17 +417,26 @@ socket.on('student_message_error', (data) => {
 });
 
 socket.on('message_history', (data) => {
+    if (data.retry_after) retryAfter(data.retry_after, requestMessageHistory);
+    if (data.error) return;  // 서버 오류면 기기에 저장된 메시지를 그대로 둠
+    if (data.incremental) {
+        applyIncrementalHistory(data);
+        return;
+    }
     if (data.messages) {
         const fresh = data.messages.map((m) => ({
             id: m.id || Date.now() + Math.random(),
             sender: m.sender,
             message: m.message,
+            attachments: m.attachments || [],
             timestamp: m.timestamp,
             isRead: true,
             receivedAt: m.timestamp,
             isFromHistory: true
         }));
         fresh.sort((a, b) => new Date(b.timestamp) - new Date(a.timestamp));
+        const freshIds = new Set(fresh.map((m) => String(m.id)));
+        removeCachedMessages(messages.filter((m) => !freshIds.has(String(m.id))).map((m) => m.id));
         messages = fresh;
         saveMessages();
         displayMessages();
@@ -167,7 +446,47 @@ socket.on('message_history', (data) => {
     }
 });
 
+// after_id 이후 메시지만 받아 합치고, visible_ids에 없는 캐시 메시지(삭제/숨김됨)는 지움
+function applyIncrementalHistory(data) {
+    const known = new Set(messages.map((m) => String(m.id)));
+    const added = (data.messages || []).filter((m) => !known.has(String(m.id))).map((m) => ({
+        id: m.id,
+        sender: m.sender,
+        message: m.message,
+        attachments: m.attachments || [],
+        timestamp: m.timestamp,
+        isRead: false,
+        receivedAt: m.timestamp
+    }));
+    let removed = [];
+    if (Array.isArray(data.visible_ids)) {
+        const visible = new Set(data.visible_ids.map(String));
+        removed = messages.filter((m) => Number.isInteger(m.id) && m.id >= data.since_id && m.id <= data.after_id && !visible.has(String(m.id)));
+        const removedIds = new Set(removed.map((m) => String(m.id)));
+        messages = messages.filter((m) => !removedIds.has(String(m.id)));
+        pendingHiddenIds().then((hiddenIds) => {
+            // 오프라인 중에 숨긴 메시지가 아직 보이면 숨김 요청을 다시 보내고, 반영되었으면 기록 삭제
+            const stillVisible = hiddenIds.filter((id) => visible.has(String(id)));
+            stillVisible.forEach((id) => socket.emit('delete_message', {
+                teacher_code: studentInfo.teacherCode,
+                student_name: studentInfo.name,
+                message_id: id
+            }));
+            removeCachedMessages(hiddenIds.filter((id) => !visible.has(String(id)) && id >= data.since_id));
+        });
+    }
+    removeCachedMessages(removed.map((m) => m.id));
+    if (added.length === 0 && removed.length === 0) return;
+    messages = pruneMessages(messages.concat(added));
+    saveMessages();
+    displayMessages();
+    if (added.length > 0) {
+        showFloatingNotification(`새 메시지 ${added.length}개를 받았습니다`, 'info');
+    }
+}
+
 socket.on('disconnect', () => {
+    outboxFlushing = false;
     connectionStatus.textContent = '연결 끊김';
     connectionStatus.className = 'badge bg-danger fs-6';
     studentInfo.connected = false;
@@ -190,17 +509,23 @@ socket.on('delete_result', (data) => {
 });
 
 socket.on('receive_message', (data) => {
+    // 추적 대상 메시지면 수신 시각을 서버에 알림 (전달 지연 집계용)
+    if (data.trace && data.trace.id) {
+        socket.emit('message_receipt', { trace_id: data.trace.id, message_id: data.message_id, client_ts: Date.now() });
+    }
     const mid = data.message_id || Date.now() + Math.random();
     const message = {
         id: mid,
         sender: data.sender,
         message: data.message,
+        attachments: data.attachments || [],
         timestamp: data.timestamp,
         isRead: false,
         receivedAt: new Date().toLocaleString('ko-KR')
     };
 
     messages.unshift(message);
+    messages = pruneMessages(messages);
     saveMessages();
     displayMessages();
     showMessageNotification(message);
@@ -218,12 +543,81 @@ socket.on('message_deleted', (data) => {
     const before = messages.length;
     messages = messages.filter((m) => String(m.id) !== String(mid));
     if (messages.length !== before) {
+        removeCachedMessages([mid]);
         saveMessages();
         displayMessages();
         showFloatingNotification('메시지가 삭제되었습니다', 'warning');
     }
 });
 
+// 투표 / 퀴즈
+socket.on('poll_started', (poll) => {
+    currentPoll = { ...poll, my_option: poll.my_option ?? null };
+    renderPoll();
+    if (poll.my_option == null) showFloatingNotification(poll.is_quiz ? '퀴즈가 시작되었습니다' : '투표가 시작되었습니다', 'info');
+});
+
+socket.on('poll_answer_result', (data) => {
+    if (!currentPoll || currentPoll.poll_id !== data.poll_id) return;
+    if (data.status === 'success') {
+        currentPoll.my_option = data.option;
+    } else {
+        showFloatingNotification(data.message || '답을 보내지 못했습니다', 'warning');
+    }
+    currentPoll.pending = null;
+    renderPoll();
+});
+
+socket.on('poll_closed', (results) => {
+    const myOption = currentPoll && currentPoll.poll_id === results.poll_id ? currentPoll.my_option : null;
+    currentPoll = { ...results, my_option: myOption, closed: true };
+    renderPoll();
+});
+
+function submitPollAnswer(option) {
+    if (!currentPoll || currentPoll.closed || !studentInfo.connected) return;
+    currentPoll.pending = option;
+    renderPoll();
+    socket.emit('submit_poll_answer', { poll_id: currentPoll.poll_id, option });
+}
+
+function renderPoll() {
+    const poll = currentPoll;
+    pollCard.style.display = poll ? 'block' : 'none';
+    if (!poll) return;
+    document.getElementById('pollTitle').textContent = poll.is_quiz ? '퀴즈' : '투표';
+    const badge = document.getElementById('pollBadge');
+    badge.textContent = poll.closed ? '마감' : (poll.my_option != null ? '응답 완료' : '진행 중');
+    document.getElementById('pollQuestion').textContent = poll.question;
+
+    pollOptionsEl.replaceChildren(...poll.options.map((option, i) => {
+        const button = document.createElement('button');
+        const mine = (poll.pending ?? poll.my_option) === i;
+        let style = mine ? 'btn-primary' : 'btn-outline-primary';
+        let label = `${i + 1}. ${escapeHtml(option)}`;
+        if (poll.closed) {
+            const count = poll.counts[i] || 0;
+            const percent = poll.total ? Math.round(count * 100 / poll.total) : 0;
+            if (poll.correct_option === i) style = 'btn-success';
+            else if (mine && poll.correct_option != null) style = 'btn-danger';
+            label += ` <span class="float-end">${count}명 (${percent}%)</span>`;
+        }
+        button.className = `btn ${style} text-start`;
+        button.disabled = poll.closed;
+        button.innerHTML = label;
+        button.addEventListener('click', () => submitPollAnswer(i));
+        return button;
+    }));
+
+    if (poll.closed) {
+        const close = document.createElement('button');
+        close.className = 'btn btn-link btn-sm text-muted';
+        close.textContent = '닫기';
+        close.addEventListener('click', () => { currentPoll = null; renderPoll(); });
+        pollOptionsEl.appendChild(close);
+    }
+}
+
 // UI
 function showLoginScreen() {
     loginScreen.style.display = 'block';
@@ -273,11 +667,15 @@ function displayMessages() {
     updateMessageCount();
 }
 
+// 캐시가 있으면 가장 최근에 받은 메시지 이후만 요청 (증분 동기화)
 function requestMessageHistory() {
     if (studentInfo.connected) {
+        const ids = messagesOwner === cacheOwner() ? serverMessageIds() : [];
         socket.emit('get_message_history', {
             teacher_code: studentInfo.teacherCode,
-            student_name: studentInfo.name
+            student_name: studentInfo.name,
+            after_id: ids.length > 0 ? Math.max(...ids) : null,
+            since_id: ids.length > 0 ? Math.min(...ids) : null
         });
     }
 }
@@ -301,6 +699,7 @@ function addMessageToList(message) {
             <small class="text-muted">${escapeHtml(message.timestamp)}</small>
         </div>
         <div class="message-content" style="word-break: break-word; line-height: 1.5;">${messageWithLinks}</div>
+        ${renderAttachments(message.attachments)}
         <div class="text-end mt-2">
             <small class="text-muted">수신: ${escapeHtml(message.receivedAt)}</small>
         </div>
@@ -313,6 +712,32 @@ function addMessageToList(message) {
     messageList.appendChild(messageElement);
 }
 
+// 첨부: 이미지는 미리 만든 썸네일, 나머지는 내려받기 링크 (원본은 누를 때만 받음)
+function renderAttachments(list) {
+    if (!list || list.length === 0) return '';
+    const items = list.map((a) => {
+        const id = encodeURIComponent(a.id);
+        const key = encodeURIComponent(a.key || '');  // 서버가 서명한 값이 있어야 받을 수 있다
+        const url = `/files/${id}?key=${key}&name=${encodeURIComponent(a.name)}`;
+        if (a.thumb) {
+            return `<a href="${url}" target="_blank" rel="noopener noreferrer"><img src="/files/${id}/thumb?key=${key}" alt="${escapeHtml(a.name)}" loading="lazy" class="img-thumbnail" style="max-width: 160px; max-height: 160px;"></a>`;
+        }
+        return `<a href="${url}" class="btn btn-sm btn-outline-primary" download><i class="fas fa-paperclip"></i> ${escapeHtml(a.name)} <small class="text-muted">${formatBytes(a.size)}</small></a>`;
+    });
+    return `<div class="message-attachments d-flex flex-wrap gap-2 mt-2">${items.join('')}</div>`;
+}
+
+function formatBytes(size) {
+    if (size >= 1024 * 1024) return `${(size / 1024 / 1024).toFixed(1)}MB`;
+    if (size >= 1024) return `${Math.round(size / 1024)}KB`;
+    return `${size}B`;
+}
+
+function messagePreview(message) {
+    const count = (message.attachments || []).length;
+    return count && !message.message ? `첨부 파일 ${count}개` : message.message;
+}
+
 // 상태 업데이트
 function markMessageRead(messageId) {
     const msg = messages.find((m) => m.id === messageId);
@@ -351,6 +776,7 @@ function clearAllMessages() {
         return;
     }
     if (confirm('모든 메시지를 지우시겠습니까?')) {
+        removeCachedMessages(messages.map((m) => m.id));
         messages = [];
         saveMessages();
         displayMessages();
@@ -365,8 +791,6 @@ function updateMessageCount() {
     document.title = unread > 0 ? `(${unread}) 학생용 메시지` : '학생용 메시지';
 }
 
-function saveMessages() { localStorage.setItem('studentMessages', JSON.stringify(messages)); }
-
 // 학생 측 메시지 숨김 처리: 로컬에서 제거 후 서버에 hidden 기록 요청
 function hideMessage(messageId) {
     const numericId = Number(messageId);
@@ -374,9 +798,10 @@ function hideMessage(messageId) {
         showFloatingNotification('메시지 ID가 없어 숨김만 처리했습니다', 'warning');
         return;
     }
-    const before = messages.length;
-    messages = messages.filter((m) => String(m.id) !== String(messageId));
-    if (messages.length !== before) {
+    const hidden = messages.find((m) => String(m.id) === String(messageId));
+    if (hidden) {
+        messages = messages.filter((m) => m !== hidden);
+        markCachedHidden(hidden);
         saveMessages();
         displayMessages();
     }
@@ -396,12 +821,14 @@ function sendMessageToTeacher() {
     const msg = studentMessageInput.value.trim();
     if (!msg) { showFloatingNotification('메시지를 입력하세요', 'warning'); return; }
 
-    socket.emit('send_message', {
-        sender_type: 'student',
-        teacher_code: studentInfo.teacherCode,
-        student_name: studentInfo.name,
-        message: msg,
-        recipients: []
+    // 먼저 보관함에 저장하고 보냄 (연결이 끊겨 있으면 재접속 후 자동 전송)
+    addToOutbox({ key: newClientKey(), owner: cacheOwner(), message: msg, createdAt: Date.now() }).then(() => {
+        studentMessageInput.value = '';
+        if (studentInfo.connected) {
+            flushOutbox();
+        } else {
+            showFloatingNotification('연결되면 교사에게 보냅니다', 'info');
+        }
     });
 }
 
@@ -428,13 +855,13 @@ function showMessageNotification(message) {
     if (notificationSound) {
         notificationSound.play().catch(() => { });
     }
-    showFloatingNotification(`${message.sender}: ${message.message.substring(0, 50)}...`, 'success');
+    showFloatingNotification(`${message.sender}: ${messagePreview(message).substring(0, 50)}...`, 'success');
 }
 
 function showBrowserNotification(message) {
     if ('Notification' in window && Notification.permission === 'granted') {
         const notification = new Notification(`새 메시지 - ${message.sender}`, {
-            body: message.message,
+            body: messagePreview(message),
             icon: '/static/images/icon-192x192.png',
             badge: '/static/images/icon-192x192.png',
             tag: 'student-message',
@@ -1,5 +1,6 @@
-// Socket.IO 연결
-const socket = io();
+// Socket.IO 연결 (끊기면 지수 백오프 + 지터로 재접속, reconnect.js)
+const socket = createReconnectingSocket();
+let hasConnected = false;
 
 // 상태
 let selectedStudents = new Set();
@@ -10,6 +11,11 @@ let lastMessageId = null;
 let allowStudentMessages = false;
 let sentMessages = []; // 교사 → 학생 전체 목록
 let studentMessages = []; // 학생 → 교사 전체 목록
+let teacherClasses = []; // 명단에 등록된 반 목록
+let selectedClasses = new Set();
+let pendingSends = new Map(); // client_key -> send_message 페이로드 (응답 전에 끊기면 재접속 후 같은 키로 다시 보냄)
+let pendingAttachments = []; // 첨부할 파일 { key, name, size, progress, ref(올리기 끝나면 {id, name, ...}), error }
+let currentPoll = null; // 진행 중이거나 방금 마감한 투표 (poll_state / poll_tally로 갱신)
 
 // DOM
 const connectionStatus = document.getElementById('connectionStatus');
@@ -18,6 +24,7 @@ const studentList = document.getElementById('studentList');
 const messageText = document.getElementById('messageText');
 const sendToAllCheckbox = document.getElementById('sendToAll');
 const sendMessageBtn = document.getElementById('sendMessageBtn');
+const sendIndividualBtn = document.getElementById('sendIndividualBtn');
 const recipientInfo = document.getElementById('recipientInfo');
 const recipientTooltipBtn = document.getElementById('recipientTooltipBtn');
 const messageHistoryDiv = document.getElementById('messageHistory');
@@ -29,16 +36,51 @@ const allowStudentMessagesToggle = document.getElementById('allowStudentMessages
 const studentMessageHistory = document.getElementById('studentMessageHistory');
 const studentMessageStatus = document.getElementById('studentMessageStatus');
 const loadStudentMessagesBtn = document.getElementById('loadStudentMessagesBtn');
+const classListDiv = document.getElementById('classList');
+const deliveryStatsEl = document.getElementById('deliveryStats');
+const traceSampleRateSelect = document.getElementById('traceSampleRate');
+const importRosterBtn = document.getElementById('importRosterBtn');
+const rosterFileInput = document.getElementById('rosterFileInput');
+const attachBtn = document.getElementById('attachBtn');
+const attachmentInput = document.getElementById('attachmentInput');
+const attachmentList = document.getElementById('attachmentList');
+const pollStatus = document.getElementById('pollStatus');
+const pollForm = document.getElementById('pollForm');
+const pollQuestion = document.getElementById('pollQuestion');
+const pollOptions = document.getElementById('pollOptions');
+const pollCorrect = document.getElementById('pollCorrect');
+const pollLive = document.getElementById('pollLive');
+const pollTally = document.getElementById('pollTally');
+const pollTotal = document.getElementById('pollTotal');
+const closePollBtn = document.getElementById('closePollBtn');
+const newPollBtn = document.getElementById('newPollBtn');
 
 // 모달
 let modalEl = null;
 let modalBody = null;
 let modalTitle = null;
+let modalList = null;   // 더보기 모달의 가상 목록
+let modalSource = null; // 'sent' | 'student' (열려 있는 동안 새 메시지를 반영)
+
+// 가상 목록 (보이는 행만 DOM에 유지)
+let rosterList = null;
+const EMPTY_ROSTER_HTML = `
+    <div class="text-center text-muted p-3">
+        <i class="fas fa-user-friends fa-2x mb-2"></i>
+        <p>아직 연결된 학생이 없습니다</p>
+    </div>
+`;
 
 const toast = new bootstrap.Toast(notificationToast);
 
 document.addEventListener('DOMContentLoaded', function () {
     initModal();
+    rosterList = new VirtualList(studentList, {
+        key: studentKey,
+        render: renderStudentCard,
+        estimate: 58,
+        emptyHtml: EMPTY_ROSTER_HTML
+    });
     initializeEventListeners();
     connectToServer();
 });
@@ -54,7 +96,7 @@ function initModal() {
                 <h5 class="modal-title" id="logModalTitle"></h5>
                 <button type="button" class="btn-close" data-bs-dismiss="modal" aria-label="Close"></button>
               </div>
-              <div class="modal-body" id="logModalBody"></div>
+              <div class="modal-body p-0"><div id="logModalBody" class="p-3" style="height: 70vh;"></div></div>
             </div>
           </div>
         </div>`;
@@ -63,10 +105,22 @@ function initModal() {
     modalEl = new bootstrap.Modal(document.getElementById('logModal'));
     modalBody = document.getElementById('logModalBody');
     modalTitle = document.getElementById('logModalTitle');
+    modalList = new VirtualList(modalBody, {
+        key: msg => msg.id,
+        render: msg => renderMessageItem(msg, modalSource === 'sent'),
+        estimate: 90,
+        emptyHtml: '<p class="text-muted">기록이 없습니다.</p>'
+    });
+    document.getElementById('logModal').addEventListener('shown.bs.modal', () => modalList.schedule());
+    document.getElementById('logModal').addEventListener('hidden.bs.modal', () => {
+        modalSource = null;
+        modalList.setItems([]);
+    });
 }
 
 function initializeEventListeners() {
     sendMessageBtn.addEventListener('click', sendMessage);
+    sendIndividualBtn.addEventListener('click', openIndividualMessageModal);
     messageText.addEventListener('keypress', function (e) {
         if (e.key === 'Enter' && e.ctrlKey) sendMessage();
     });
@@ -75,7 +129,9 @@ function initializeEventListeners() {
         updateRecipientInfo();
         if (this.checked) {
             selectedStudents.clear();
+            selectedClasses.clear();
             updateStudentSelection();
+            renderClassList();
         }
     });
 
@@ -91,6 +147,26 @@ function initializeEventListeners() {
     });
 
     loadStudentMessagesBtn.addEventListener('click', requestTeacherMessages);
+
+    traceSampleRateSelect.addEventListener('change', function () {
+        socket.emit('set_trace_sample_rate', { rate: Number(this.value) });
+    });
+    setInterval(() => { if (socket.connected) socket.emit('get_delivery_stats'); }, 15000);
+
+    importRosterBtn.addEventListener('click', () => rosterFileInput.click());
+    rosterFileInput.addEventListener('change', uploadRoster);
+    attachBtn.addEventListener('click', () => attachmentInput.click());
+    attachmentInput.addEventListener('change', addAttachments);
+
+    pollOptions.addEventListener('input', updatePollCorrectOptions);
+    document.getElementById('startPollBtn').addEventListener('click', startPoll);
+    closePollBtn.addEventListener('click', () => {
+        if (currentPoll && confirm('투표를 마감할까요?')) socket.emit('close_poll', { poll_id: currentPoll.poll_id });
+    });
+    newPollBtn.addEventListener('click', () => { currentPoll = null; renderPoll(); });
+    document.getElementById('pollHistory').addEventListener('toggle', function () {
+        if (this.open) socket.emit('get_poll_results');
+    });
 }
 
 function connectToServer() {
@@ -112,6 +188,11 @@ socket.on('connect', function () {
     connectionStatus.textContent = '연결됨';
     connectionStatus.className = 'badge bg-success';
     showNotification('서버와 연결되었습니다', 'success');
+    // 재접속이면 교사 방에 다시 참여하고 학생 목록을 새로 받음
+    if (hasConnected) connectToServer();
+    hasConnected = true;
+    // 응답을 못 받은 전송은 같은 키로 다시 보냄 (이미 저장됐으면 서버가 처음 message_id만 돌려줌)
+    pendingSends.forEach(payload => socket.emit('send_message', payload));
 });
 
 socket.on('disconnect', function () {
@@ -125,23 +206,31 @@ socket.on('student_list_update', function (students) {
 });
 
 socket.on('student_connected', function (student) {
-    // 동일 이름으로 이전에 남아있던 카드/소켓 정보를 제거해 중복 표시를 막음
-    removeStudentByName(student.student_name);
-    connectedStudents.set(student.socket_id, student);
-    addStudentToList(student);
+    // 같은 학생(학생 id)의 이전 카드/소켓 정보를 제거해 중복 표시를 막음 (이름이 같아도 다른 학생은 그대로)
+    removeStudentById(student.student_id);
+    connectedStudents.set(studentKey(student), student);
+    renderRoster();
     updateStudentCount();
     showNotification(`${student.student_name} 학생이 연결되었습니다`, 'info');
 });
 
 socket.on('student_disconnected', function (student) {
-    connectedStudents.delete(student.socket_id);
-    removeStudentFromList(student.socket_id);
+    connectedStudents.delete(studentKey(student));
+    renderRoster();
     selectedStudents.delete(student.socket_id);
     updateStudentCount();
     updateRecipientInfo();
     showNotification(`${student.student_name} 학생의 연결이 해제되었습니다`, 'warning');
 });
 
+socket.on('class_list_update', function (classes) {
+    teacherClasses = classes || [];
+    const known = new Set(teacherClasses.map(c => c.class_number));
+    selectedClasses.forEach(n => { if (!known.has(n)) selectedClasses.delete(n); });
+    renderClassList();
+    updateRecipientInfo();
+});
+
 socket.on('kick_result', function (data) {
     if (data.status === 'success') {
         showNotification(`${data.student_name || '학생'}을 내보냈습니다`, 'success');
@@ -159,6 +248,19 @@ socket.on('receive_status', function (data) {
     // 페이지 로드 시 메시지 히스토리 자동 조회
     requestTeacherMessages();
     requestSentMessages();
+    socket.emit('get_delivery_stats');
+});
+
+// 전달 현황 (샘플링된 메시지의 수신 확인 지연/비율)
+socket.on('delivery_stats', function (stats) {
+    const rate = String(stats.sample_rate);
+    if ([...traceSampleRateSelect.options].some(o => o.value === rate)) traceSampleRateSelect.value = rate;
+    if (!stats.receipts) {
+        deliveryStatsEl.textContent = '전달 현황: 아직 확인된 수신이 없습니다';
+        return;
+    }
+    const ack = stats.ack_percent === null ? '-' : `${stats.ack_percent}%`;
+    deliveryStatsEl.textContent = `전달 현황: 중앙값 ${stats.p50_ms}ms · 95% ${stats.p95_ms}ms · 수신 확인 ${ack}`;
 });
 
 socket.on('new_message_from_student', function (data) {
@@ -167,6 +269,26 @@ socket.on('new_message_from_student', function (data) {
     showNotification(`학생 메시지 도착: ${data.student_name}`, 'info');
 });
 
+// 여러 학생 메시지를 한 번에 받음 (서버가 짧은 시간에 몰린 학생 답장을 모아 보냄, 보관함 전송 등)
+socket.on('new_messages_from_students', function (payload) {
+    const msgs = payload.messages || [];
+    if (msgs.length === 0) return;
+    studentMessages = msgs.slice().reverse().concat(studentMessages);
+    renderStudentPreview();
+    const names = [...new Set(msgs.map(m => m.student_name))];
+    showNotification(
+        names.length === 1
+            ? `학생 메시지 ${msgs.length}개 도착: ${names[0]}`
+            : `학생 메시지 ${msgs.length}개 도착: ${names.slice(0, 3).join(', ')}${names.length > 3 ? ' 외' : ''}`,
+        'info'
+    );
+});
+
+// 관리자 공지 (학교 전체 방 또는 이 교사의 방으로 옴)
+socket.on('receive_message', function (data) {
+    if (data.announcement) showNotification(`관리자 공지: ${data.message}`, 'warning');
+});
+
 socket.on('teacher_messages', function (payload) {
     studentMessages = payload.messages || [];
     renderStudentPreview();
@@ -197,8 +319,18 @@ socket.on('delete_result_teacher', function (data) {
 });
 
 socket.on('message_sent', function (data) {
+    const sent = data.client_key ? pendingSends.get(data.client_key) : null;
+    if (data.client_key) {
+        if (!sent) return; // 이미 처리한 전송에 대한 재전송 응답
+        pendingSends.delete(data.client_key);
+    }
+    if (data.status === 'error') {
+        showNotification(data.message || '메시지 전송에 실패했습니다', 'warning');
+        return;
+    }
     if (data.status === 'success') {
-        const message = messageText.value;
+        const sentFiles = sent && sent.attachments ? sent.attachments : [];
+        const message = [sent ? sent.message : messageText.value, ...sentFiles.map(a => `📎 ${a.name}`)].filter(Boolean).join(' ');
         const recipientNames = lastSentNames.length ? lastSentNames : buildSelectedNames();
         lastMessageId = data.message_id || null;
         // 히스토리 배열 관리
@@ -213,41 +345,40 @@ socket.on('message_sent', function (data) {
         sentMessages.unshift(entry);
         if (sentMessages.length > 200) sentMessages = sentMessages.slice(0, 200);
         renderSentPreview();
-        messageText.value = '';
+        if (!sent || messageText.value.trim() === sent.message) messageText.value = ''; // 재전송 응답이면 새로 쓰던 글은 유지
+        if (sentFiles.length) {
+            const sentIds = new Set(sentFiles.map(a => a.id));
+            pendingAttachments = pendingAttachments.filter(a => !(a.ref && sentIds.has(a.ref.id)));
+            renderAttachments();
+        }
         showNotification('메시지가 성공적으로 전송되었습니다', 'success');
     }
 });
 
-// 학생 목록
+// 학생 목록 (가나다순, 가상 목록으로 보이는 카드만 그림)
+function studentKey(student) {
+    return student.socket_id || `name:${student.student_name}`;
+}
+
+function renderRoster() {
+    const sorted = [...connectedStudents.values()].sort((a, b) =>
+        a.student_name.localeCompare(b.student_name, 'ko-KR')
+    );
+    rosterList.setItems(sorted);
+}
+
 function updateStudentList(students) {
     connectedStudents.clear();
-    students.forEach(student => connectedStudents.set(student.socket_id, student));
-    if (students.length === 0) {
-        studentList.innerHTML = `
-            <div class="text-center text-muted p-3">
-                <i class="fas fa-user-friends fa-2x mb-2"></i>
-                <p>아직 연결된 학생이 없습니다</p>
-            </div>
-        `;
-    } else {
-        studentList.innerHTML = '';
-        // 한글 가나다순 정렬
-        const sortedStudents = [...students].sort((a, b) =>
-            a.student_name.localeCompare(b.student_name, 'ko-KR')
-        );
-        sortedStudents.forEach(addStudentToList);
-    }
+    students.forEach(student => connectedStudents.set(studentKey(student), student));
+    renderRoster();
     updateStudentCount();
 }
 
-function addStudentToList(student) {
-    const placeholder = studentList.querySelector('.text-center');
-    if (placeholder) {
-        placeholder.remove();
-    }
+function renderStudentCard(student) {
     const isOnline = student.is_online !== false;
     const card = document.createElement('div');
-    card.className = 'card student-card mb-2';
+    card.className = 'card student-card';
+    if (selectedStudents.has(student.socket_id)) card.classList.add('selected');
     card.dataset.socketId = student.socket_id;
     card.dataset.studentName = student.student_name;
     const statusIcon = isOnline ? 'fa-circle status-online' : 'fa-circle status-offline';
@@ -256,7 +387,7 @@ function addStudentToList(student) {
     card.innerHTML = `
         <div class="card-body p-2">
             <div class="d-flex justify-content-between align-items-center">
-                <div><strong>${student.student_name}</strong></div>
+                <div><strong>${escapeHtml(student.student_name)}</strong></div>
                 <div class="d-flex align-items-center gap-2">
                     <i class="fas ${statusIcon}"></i>
                     <small class="${statusClass}">${statusText}</small>
@@ -272,40 +403,22 @@ function addStudentToList(student) {
     } else {
         card.style.opacity = '0.6'; card.style.cursor = 'not-allowed';
     }
-    studentList.appendChild(card);
+    return card;
 }
 
-// 동일 이름의 학생이 이전 소켓으로 남아 있으면 제거 (재접속 시 중복 카드 방지)
-function removeStudentByName(studentName) {
-    for (const [sid, info] of connectedStudents.entries()) {
-        if (info && info.student_name === studentName) {
-            connectedStudents.delete(sid);
+// 같은 학생이 이전 소켓으로 남아 있으면 제거 (재접속 시 중복 카드 방지)
+function removeStudentById(studentId) {
+    for (const [key, info] of connectedStudents.entries()) {
+        if (info && info.student_id === studentId) {
+            connectedStudents.delete(key);
         }
     }
-    const selector = `[data-student-name="${CSS.escape(studentName)}"]`;
-    let card = document.querySelector(selector);
-    while (card) {
-        card.remove();
-        card = document.querySelector(selector);
-    }
-}
-
-function removeStudentFromList(socketId) {
-    const card = document.querySelector(`[data-socket-id="${socketId}"]`);
-    if (card) card.remove();
-    if (connectedStudents.size === 0) {
-        studentList.innerHTML = `
-            <div class="text-center text-muted p-3">
-                <i class="fas fa-user-friends fa-2x mb-2"></i>
-                <p>아직 연결된 학생이 없습니다</p>
-            </div>
-        `;
-    }
 }
 
 // 선택/토글
 function toggleStudentSelection(socketId, cardElement) {
     if (sendToAllCheckbox.checked) sendToAllCheckbox.checked = false;
+    if (selectedClasses.size > 0) { selectedClasses.clear(); renderClassList(); }
     if (selectedStudents.has(socketId)) {
         selectedStudents.delete(socketId);
         cardElement.classList.remove('selected');
@@ -318,8 +431,8 @@ function toggleStudentSelection(socketId, cardElement) {
 function selectAllStudents() {
     sendToAllCheckbox.checked = false;
     selectedStudents.clear();
-    connectedStudents.forEach((student, socketId) => {
-        if (student.is_online !== false) selectedStudents.add(socketId);
+    connectedStudents.forEach(student => {
+        if (student.is_online !== false) selectedStudents.add(student.socket_id);
     });
     updateStudentSelection();
     updateRecipientInfo();
@@ -331,9 +444,7 @@ function clearAllStudents() {
     updateRecipientInfo();
 }
 function updateStudentSelection() {
-    document.querySelectorAll('.student-card').forEach(card => {
-        card.classList.toggle('selected', selectedStudents.has(card.dataset.socketId));
-    });
+    rosterList.refresh();
 }
 
 // 수신자 표시
@@ -343,6 +454,12 @@ function updateRecipientInfo() {
         recipientInfo.textContent = `전체 학생 (${connectedStudents.size}명)에게 전송`;
         recipientInfo.className = 'text-success';
         recipientTooltipBtn.style.display = 'none';
+    } else if (selectedClasses.size > 0) {
+        const chosen = teacherClasses.filter(c => selectedClasses.has(c.class_number));
+        const total = chosen.reduce((sum, c) => sum + (c.student_count || 0), 0);
+        recipientInfo.textContent = `${chosen.map(formatClassLabel).join(', ')} (${total}명)에게 전송`;
+        recipientInfo.className = 'text-primary';
+        recipientTooltipBtn.style.display = 'none';
     } else if (selectedStudents.size > 0) {
         const selectedArray = Array.from(selectedStudents).map(id => connectedStudents.get(id)).filter(Boolean);
         const first = selectedArray[0]?.student_name || '선택된 학생';
@@ -374,12 +491,18 @@ function updateStudentCount() { studentCount.textContent = connectedStudents.siz
 // 전송 (교사→학생)
 function sendMessage() {
     const message = messageText.value.trim();
-    if (!message) { showNotification('메시지를 입력해주세요', 'warning'); return; }
+    if (pendingAttachments.some(a => !a.ref && !a.error)) { showNotification('파일을 올리는 중입니다. 잠시 후 보내주세요', 'warning'); return; }
+    if (!message && attachmentRefs().length === 0) { showNotification('메시지를 입력해주세요', 'warning'); return; }
     let recipients = [];
     const recipientNames = [];
+    let targetClasses = [];
     if (sendToAllCheckbox.checked) {
         recipients = ['all'];
         connectedStudents.forEach((student) => recipientNames.push(student.student_name));
+    } else if (selectedClasses.size > 0) {
+        targetClasses = Array.from(selectedClasses);
+        teacherClasses.filter(c => selectedClasses.has(c.class_number))
+            .forEach(c => recipientNames.push(formatClassLabel(c)));
     } else if (selectedStudents.size > 0) {
         recipients = Array.from(selectedStudents);
         recipients.forEach((sid) => {
@@ -393,14 +516,261 @@ function sendMessage() {
     }
     lastSentNames = recipientNames.slice();
     lastSentAll = sendToAllCheckbox.checked;
-    socket.emit('send_message', {
+    emitSendMessage({
         sender_type: 'teacher',
         teacher_code: window.teacherCode,
         message: message,
-        recipients: recipients
+        recipients: recipients,
+        target_classes: targetClasses,
+        attachments: attachmentRefs()
+    });
+}
+
+// 첨부 파일: HTTP로 조각내어 올리고(끊기면 서버가 받은 offset부터 이어서), 전송에는 {id, name} 참조만 싣는다
+function addAttachments() {
+    Array.from(attachmentInput.files).forEach(file => {
+        const item = { key: newClientKey(), name: file.name, size: file.size, progress: 0, ref: null, error: null };
+        pendingAttachments.push(item);
+        uploadAttachment(file, item)
+            .then(ref => { item.ref = ref; })
+            .catch(e => {
+                item.error = e.message || '업로드 실패';
+                showNotification(`${file.name}: ${item.error}`, 'warning');
+            })
+            .finally(renderAttachments);
+    });
+    attachmentInput.value = '';
+    renderAttachments();
+}
+
+function attachmentRefs() {
+    return pendingAttachments.filter(a => a.ref).map(a => ({ id: a.ref.id, name: a.ref.name }));
+}
+
+function renderAttachments() {
+    attachmentList.innerHTML = pendingAttachments.map(a => {
+        const state = a.error ? `<span class="text-danger">${escapeHtml(a.error)}</span>`
+            : a.ref ? '<i class="fas fa-check text-success"></i>' : `${a.progress}%`;
+        return `<span class="badge bg-light text-dark border">
+            <i class="fas fa-paperclip"></i> ${escapeHtml(a.name)} ${state}
+            <button type="button" class="btn-close ms-1" style="font-size: 0.6rem;" data-key="${a.key}" aria-label="삭제"></button>
+        </span>`;
+    }).join('');
+    attachmentList.querySelectorAll('.btn-close').forEach(btn => btn.addEventListener('click', () => {
+        pendingAttachments = pendingAttachments.filter(a => a.key !== btn.dataset.key);
+        renderAttachments();
+    }));
+}
+
+// 같은 파일이 이미 서버에 있으면 올리지 않도록 내용 해시를 먼저 알려줌 (http 출처라 crypto.subtle이 없으면 생략)
+async function sha256Hex(file) {
+    if (!(window.crypto && crypto.subtle)) return null;
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+}
+
+const UPLOAD_MAX_RETRIES = 8;
+
+async function uploadAttachment(file, item) {
+    const start = await fetch('/uploads', {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ name: file.name, size: file.size, sha256: await sha256Hex(file) })
+    }).then(res => res.json());
+    if (start.status !== 'success') throw new Error(start.message);
+    if (start.complete) return start.attachment;
+
+    let offset = start.offset;
+    let failures = 0;
+    for (;;) {
+        let response;
+        try {
+            response = await fetch(`/uploads/${start.upload_id}?offset=${offset}`, {
+                method: 'PUT', credentials: 'same-origin', body: file.slice(offset, offset + start.chunk_size)
+            });
+        } catch (e) {
+            // 네트워크 끊김: 잠시 뒤 서버가 실제로 받은 offset을 물어 그 자리부터 이어서 올림
+            if (++failures > UPLOAD_MAX_RETRIES) throw new Error('업로드가 끊겼습니다');
+            await new Promise(resolve => setTimeout(resolve, jitteredDelay(failures)));
+            const status = await fetch(`/uploads/${start.upload_id}`, { credentials: 'same-origin' })
+                .then(res => res.json()).catch(() => null);
+            if (status && typeof status.offset === 'number') offset = status.offset;
+            continue;
+        }
+        const result = await response.json();
+        if (response.status === 409 && typeof result.offset === 'number') {
+            offset = result.offset;
+            continue;
+        }
+        if (result.status !== 'success') throw new Error(result.message || '업로드 실패');
+        failures = 0;
+        if (result.complete) return result.attachment;
+        offset = result.offset;
+        item.progress = Math.floor(offset * 100 / file.size);
+        renderAttachments();
+    }
+}
+
+// 전송마다 키를 붙여 보내고 응답이 올 때까지 보관 (서버는 같은 키를 한 번만 저장/전달)
+function newClientKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+}
+
+function emitSendMessage(payload) {
+    payload.client_key = newClientKey();
+    pendingSends.set(payload.client_key, payload);
+    socket.emit('send_message', payload);
+}
+
+// 반 목록/선택
+function formatClassLabel(cls) {
+    return cls.class_name ? `${cls.class_name}` : `${cls.class_number}반`;
+}
+
+function renderClassList() {
+    if (teacherClasses.length === 0) {
+        classListDiv.innerHTML = `
+            <div class="text-center text-muted p-3">
+                <small>등록된 반이 없습니다</small>
+            </div>
+        `;
+        return;
+    }
+    classListDiv.innerHTML = '';
+    const wrap = document.createElement('div');
+    wrap.className = 'd-flex flex-wrap gap-2';
+    teacherClasses.forEach(cls => {
+        const btn = document.createElement('button');
+        btn.type = 'button';
+        btn.className = `btn btn-sm ${selectedClasses.has(cls.class_number) ? 'btn-primary' : 'btn-outline-primary'}`;
+        btn.textContent = `${formatClassLabel(cls)} (${cls.student_count}명)`;
+        btn.addEventListener('click', () => toggleClassSelection(cls.class_number));
+        wrap.appendChild(btn);
+    });
+    classListDiv.appendChild(wrap);
+}
+
+function toggleClassSelection(classNumber) {
+    sendToAllCheckbox.checked = false;
+    if (selectedStudents.size > 0) { selectedStudents.clear(); updateStudentSelection(); }
+    if (selectedClasses.has(classNumber)) selectedClasses.delete(classNumber);
+    else selectedClasses.add(classNumber);
+    renderClassList();
+    updateRecipientInfo();
+}
+
+// 명단 CSV 업로드 (반 번호, 이름[, 반 이름])
+function uploadRoster() {
+    const file = rosterFileInput.files[0];
+    if (!file) return;
+    const form = new FormData();
+    form.append('roster', file);
+    fetch('/teacher/roster', { method: 'POST', body: form, credentials: 'same-origin' })
+        .then(res => res.json())
+        .then(data => {
+            if (data.status === 'success') {
+                teacherClasses = data.classes || [];
+                renderClassList();
+                showNotification(`명단 ${data.rows}명을 가져왔습니다`, 'success');
+            } else {
+                showNotification(data.message || '명단 가져오기에 실패했습니다', 'warning');
+            }
+        })
+        .catch(() => showNotification('명단 가져오기에 실패했습니다', 'danger'))
+        .finally(() => { rosterFileInput.value = ''; });
+}
+
+// 개별 전송: 선택한 학생마다 다른 메시지를 한 번의 요청으로 전송
+function openIndividualMessageModal() {
+    const targets = Array.from(selectedStudents).map(sid => connectedStudents.get(sid)).filter(Boolean);
+    if (targets.length === 0) {
+        showNotification('개별 메시지를 보낼 학생을 선택해주세요', 'warning');
+        return;
+    }
+    let modal = document.getElementById('individualMessageModal');
+    if (!modal) {
+        modal = document.createElement('div');
+        modal.id = 'individualMessageModal';
+        modal.className = 'modal fade';
+        modal.tabIndex = -1;
+        modal.innerHTML = `
+            <div class="modal-dialog modal-lg modal-dialog-centered modal-dialog-scrollable">
+                <div class="modal-content">
+                    <div class="modal-header bg-success text-white">
+                        <h5 class="modal-title"><i class="fas fa-user-edit me-2"></i>개별 메시지 전송</h5>
+                        <button type="button" class="btn-close btn-close-white" data-bs-dismiss="modal"></button>
+                    </div>
+                    <div class="modal-body" id="individualMessageBody"></div>
+                    <div class="modal-footer">
+                        <button type="button" class="btn btn-secondary" data-bs-dismiss="modal">취소</button>
+                        <button type="button" class="btn btn-success" id="sendIndividualMessagesBtn">전송</button>
+                    </div>
+                </div>
+            </div>
+        `;
+        document.body.appendChild(modal);
+        document.getElementById('sendIndividualMessagesBtn').addEventListener('click', function () {
+            const items = [];
+            modal.querySelectorAll('textarea[data-socket-id]').forEach(area => {
+                const text = area.value.trim();
+                if (text) items.push({ recipients: [area.dataset.socketId], message: text, name: area.dataset.studentName });
+            });
+            if (items.length === 0) {
+                showNotification('메시지를 입력해주세요', 'warning');
+                return;
+            }
+            pendingBatchItems = items;
+            socket.emit('send_message_batch', {
+                items: items.map(({ recipients, message }) => ({ recipients, message }))
+            });
+            bootstrap.Modal.getInstance(modal).hide();
+        });
+    }
+    const body = document.getElementById('individualMessageBody');
+    body.innerHTML = '';
+    const defaultText = messageText.value.trim();
+    targets.forEach(student => {
+        const row = document.createElement('div');
+        row.className = 'mb-3';
+        row.innerHTML = `
+            <label class="form-label fw-bold">${escapeHtml(student.student_name)}</label>
+            <textarea class="form-control" rows="2"></textarea>
+        `;
+        const area = row.querySelector('textarea');
+        area.dataset.socketId = student.socket_id;
+        area.dataset.studentName = student.student_name;
+        area.value = defaultText;
+        body.appendChild(row);
     });
+    new bootstrap.Modal(modal).show();
 }
 
+let pendingBatchItems = [];
+socket.on('message_batch_sent', function (data) {
+    if (data.status !== 'success') {
+        showNotification(data.message || '개별 메시지 전송에 실패했습니다', 'warning');
+        return;
+    }
+    const timestamp = new Date().toLocaleString('ko-KR');
+    (data.items || []).forEach((item, i) => {
+        const names = item.recipients || [];
+        sentMessages.unshift({
+            id: item.message_id,
+            label: formatRecipientLabel(names, false),
+            recipients: names,
+            isAll: false,
+            message: pendingBatchItems[i] ? pendingBatchItems[i].message : '',
+            timestamp: timestamp
+        });
+    });
+    if (sentMessages.length > 200) sentMessages = sentMessages.slice(0, 200);
+    pendingBatchItems = [];
+    renderSentPreview();
+    showNotification(`개별 메시지 ${(data.items || []).length}개를 전송했습니다`, 'success');
+});
+
 // 수동 수신자 입력 모달
 function openManualRecipientModal(message) {
     let modal = document.getElementById('manualRecipientModal');
@@ -441,12 +811,13 @@ function openManualRecipientModal(message) {
             const pendingMessage = modal.dataset.pendingMessage;
             lastSentNames = [recipientName];
             lastSentAll = false;
-            socket.emit('send_message', {
+            emitSendMessage({
                 sender_type: 'teacher',
                 teacher_code: window.teacherCode,
                 message: pendingMessage,
                 recipients: [recipientName],
-                is_manual_recipient: true
+                is_manual_recipient: true,
+                attachments: attachmentRefs()
             });
             bootstrap.Modal.getInstance(modal).hide();
             document.getElementById('manualRecipientName').value = '';
@@ -499,81 +870,60 @@ function hideTooltip(tooltipId) {
     if (existing) existing.remove();
 }
 
+// 프리뷰 영역: [keyed 목록][빈 안내][버튼] 구조를 한 번만 만들고 이후엔 바뀐 행만 갱신
+function ensurePreviewLayout(container, emptyHtml, buttons) {
+    if (container._previewList) return container._previewList;
+    container.innerHTML = '';
+    const list = document.createElement('div');
+    const empty = document.createElement('div');
+    empty.innerHTML = emptyHtml;
+    const btnContainer = document.createElement('div');
+    btnContainer.className = 'd-flex gap-2 mt-2';
+    buttons.forEach(btn => btnContainer.appendChild(btn));
+    container.append(list, empty, btnContainer);
+    container._previewList = { list, empty };
+    return container._previewList;
+}
+
+function makeButton(className, html, onClick) {
+    const btn = document.createElement('button');
+    btn.className = className;
+    btn.innerHTML = html;
+    btn.addEventListener('click', onClick);
+    return btn;
+}
+
 // 교사 전송 기록: 프리뷰 3개 + 더보기 모달
 function renderSentPreview() {
-    const preview = sentMessages.slice(0, 3);
-    if (preview.length === 0) {
-        messageHistoryDiv.innerHTML = `
+    const { list, empty } = ensurePreviewLayout(messageHistoryDiv, `
             <div class="text-center text-muted p-3">
                 <i class="fas fa-envelope fa-2x mb-2"></i>
                 <p>아직 전송한 메시지가 없습니다</p>
             </div>
-        `;
-    } else {
-        messageHistoryDiv.innerHTML = '';
-        preview.forEach(msg => {
-            const item = document.createElement('div');
-            item.className = 'message-item';
-            item.innerHTML = `
-                <div class="d-flex justify-content-between mb-2">
-                    <strong>수신자: ${escapeHtml(msg.label)}</strong>
-                    <div class="d-flex align-items-center gap-2">
-                        <small class="text-muted">${escapeHtml(msg.timestamp)}</small>
-                        <button class="btn btn-sm btn-outline-danger delete-sent-btn" data-id="${msg.id}" title="삭제">
-                            <i class="fas fa-trash-alt"></i>
-                        </button>
-                    </div>
-                </div>
-                <div style="word-break: break-word; line-height: 1.5;">${convertUrlsToLinks(escapeHtml(msg.message))}</div>
-            `;
-            messageHistoryDiv.appendChild(item);
-        });
-        // 삭제 버튼 이벤트 바인딩
-        messageHistoryDiv.querySelectorAll('.delete-sent-btn').forEach(btn => {
-            btn.addEventListener('click', (e) => {
-                e.stopPropagation();
-                confirmDeleteMessage(btn.dataset.id);
-            });
-        });
-    }
-    // 더보기 버튼 + 일괄 삭제 버튼
-    const btnContainer = document.createElement('div');
-    btnContainer.className = 'd-flex gap-2 mt-2';
-
-    const btn = document.createElement('button');
-    btn.className = 'btn btn-outline-primary btn-sm';
-    btn.textContent = '더보기';
-    btn.addEventListener('click', () => openModal('전송 기록', sentMessages, true));
-    btnContainer.appendChild(btn);
-
-    const bulkBtn = document.createElement('button');
-    bulkBtn.className = 'btn btn-outline-danger btn-sm';
-    bulkBtn.innerHTML = '<i class="fas fa-trash-alt me-1"></i>일괄 삭제';
-    bulkBtn.addEventListener('click', openBulkDeleteModal);
-    btnContainer.appendChild(bulkBtn);
-
-    messageHistoryDiv.appendChild(btnContainer);
+        `, [
+        makeButton('btn btn-outline-primary btn-sm', '더보기', () => openModal('전송 기록', sentMessages, true)),
+        makeButton('btn btn-outline-danger btn-sm', '<i class="fas fa-trash-alt me-1"></i>일괄 삭제', openBulkDeleteModal)
+    ]);
+    const preview = sentMessages.slice(0, 3);
+    empty.style.display = preview.length === 0 ? '' : 'none';
+    syncKeyedList(list, preview, msg => msg.id, msg => renderMessageItem(msg, true));
+    if (modalSource === 'sent') modalList.setItems(sentMessages);
 }
 
 // 학생 → 교사: 프리뷰 3개 + 모달
 function renderStudentPreview() {
-    const preview = studentMessages.slice(0, 3);
-    if (preview.length === 0) {
-        studentMessageHistory.innerHTML = `
+    const { list, empty } = ensurePreviewLayout(studentMessageHistory, `
             <div class="text-center text-muted p-3">
                 <i class="fas fa-comment-dots fa-2x mb-2"></i>
                 <p>아직 받은 학생 메시지가 없습니다</p>
             </div>
-        `;
-    } else {
-        studentMessageHistory.innerHTML = '';
-        preview.forEach(prependStudentMessage);
-    }
-    const btn = document.createElement('button');
-    btn.className = 'btn btn-outline-primary btn-sm mt-2';
-    btn.textContent = '더보기';
-    btn.addEventListener('click', () => openModal('학생 메시지', studentMessages, false));
-    studentMessageHistory.appendChild(btn);
+        `, [
+        makeButton('btn btn-outline-primary btn-sm', '더보기', () => openModal('학생 메시지', studentMessages, false))
+    ]);
+    const preview = studentMessages.slice(0, 3);
+    empty.style.display = preview.length === 0 ? '' : 'none';
+    syncKeyedList(list, preview, msg => msg.id, msg => renderMessageItem(msg, false));
+    if (modalSource === 'student') modalList.setItems(studentMessages);
 }
 
 // 학생 메시지 전체 조회 요청
@@ -586,54 +936,36 @@ function requestSentMessages() {
     socket.emit('get_sent_messages', {});
 }
 
-// 학생 메시지 카드를 추가하는 헬퍼
-function prependStudentMessage(msg) {
-    const container = studentMessageHistory;
+// 메시지 한 건 (프리뷰, 더보기 모달 공용). 보낸 메시지에는 삭제 버튼
+function renderMessageItem(msg, isSent) {
     const item = document.createElement('div');
     item.className = 'message-item mb-2';
-    const safeMsg = escapeHtml(msg.message || '');
+    const senderLabel = isSent ? `수신자: ${escapeHtml(msg.label || '')}` : `${escapeHtml(msg.student_name || '학생')}`;
+    const deleteBtn = isSent ? `<button class="btn btn-sm btn-outline-danger delete-sent-btn" data-id="${msg.id}" title="삭제"><i class="fas fa-trash-alt"></i></button>` : '';
     item.innerHTML = `
         <div class="d-flex justify-content-between mb-2">
-            <strong>${escapeHtml(msg.student_name || '학생')}</strong>
-            <small class="text-muted">${escapeHtml(msg.timestamp || '')}</small>
+            <strong>${senderLabel}</strong>
+            <div class="d-flex align-items-center gap-2">
+                <small class="text-muted">${escapeHtml(msg.timestamp || '')}</small>
+                ${deleteBtn}
+            </div>
         </div>
-        <div style="word-break: break-word; line-height: 1.5;">${convertUrlsToLinks(safeMsg)}</div>
+        <div style="word-break: break-word; line-height: 1.5;">${convertUrlsToLinks(escapeHtml(msg.message || ''))}</div>
     `;
-    container.appendChild(item);
+    if (isSent) {
+        item.querySelector('.delete-sent-btn').addEventListener('click', (e) => {
+            e.stopPropagation();
+            confirmDeleteMessage(msg.id);
+        });
+    }
+    return item;
 }
 
 function openModal(title, items, isSent) {
     modalTitle.textContent = title;
-    if (!items || items.length === 0) {
-        modalBody.innerHTML = '<p class="text-muted">기록이 없습니다.</p>';
-    } else {
-        modalBody.innerHTML = items.map(msg => {
-            const senderLabel = isSent ? `수신자: ${escapeHtml(msg.label || '')}` : `${escapeHtml(msg.student_name || '학생')}`;
-            const ts = escapeHtml(msg.timestamp || '');
-            const body = escapeHtml(msg.message || '');
-            const deleteBtn = isSent ? `<button class="btn btn-sm btn-outline-danger delete-sent-btn ms-2" data-id="${msg.id}" title="삭제"><i class="fas fa-trash-alt"></i></button>` : '';
-            return `
-                <div class="message-item mb-2">
-                    <div class="d-flex justify-content-between mb-2">
-                        <strong>${senderLabel}</strong>
-                        <div class="d-flex align-items-center gap-2">
-                            <small class="text-muted">${ts}</small>
-                            ${deleteBtn}
-                        </div>
-                    </div>
-                    <div style="word-break: break-word; line-height: 1.5;">${convertUrlsToLinks(body)}</div>
-                </div>`;
-        }).join('');
-        // 삭제 버튼 이벤트 바인딩
-        if (isSent) {
-            modalBody.querySelectorAll('.delete-sent-btn').forEach(btn => {
-                btn.addEventListener('click', (e) => {
-                    e.stopPropagation();
-                    confirmDeleteMessage(btn.dataset.id);
-                });
-            });
-        }
-    }
+    modalSource = isSent ? 'sent' : 'student';
+    modalBody.scrollTop = 0;
+    modalList.setItems(items || []);
     modalEl.show();
 }
 
@@ -765,10 +1097,14 @@ function openBulkDeleteModal() {
         bulkModal.querySelectorAll('input[name="bulkDeleteFilter"]').forEach(radio => {
             radio.addEventListener('change', handleBulkFilterChange);
         });
-        document.getElementById('bulkRecipientName').addEventListener('input', updateBulkDeletePreview);
+        document.getElementById('bulkRecipientName').addEventListener('input', scheduleBulkDeletePreview);
         document.getElementById('bulkStartDate').addEventListener('change', updateBulkDeletePreview);
         document.getElementById('bulkEndDate').addEventListener('change', updateBulkDeletePreview);
         document.getElementById('executeBulkDeleteBtn').addEventListener('click', executeBulkDelete);
+        bulkModal.addEventListener('hidden.bs.modal', () => {
+            clearTimeout(bulkPreviewTimer);
+            socket.emit('cancel_bulk_delete_preview');
+        });
     }
 
     // 초기화
@@ -788,7 +1124,15 @@ function handleBulkFilterChange() {
     updateBulkDeletePreview();
 }
 
+// 입력 중에는 요청을 모았다가 마지막 값만 전송
+let bulkPreviewTimer = null;
+function scheduleBulkDeletePreview() {
+    clearTimeout(bulkPreviewTimer);
+    bulkPreviewTimer = setTimeout(updateBulkDeletePreview, 250);
+}
+
 function updateBulkDeletePreview() {
+    clearTimeout(bulkPreviewTimer);
     const filterType = document.querySelector('input[name="bulkDeleteFilter"]:checked').value;
     const data = { filter_type: filterType };
 
@@ -832,3 +1176,116 @@ socket.on('bulk_delete_result', function (data) {
         showNotification(data.message || '삭제 실패', 'warning');
     }
 });
+
+// 투표 / 퀴즈
+function pollOptionLines() {
+    return pollOptions.value.split('\n').map(line => line.trim()).filter(Boolean);
+}
+
+function updatePollCorrectOptions() {
+    const selected = pollCorrect.value;
+    pollCorrect.innerHTML = '<option value="">정답 없음 (투표)</option>' + pollOptionLines()
+        .map((option, i) => `<option value="${i}">정답: ${i + 1}. ${escapeHtml(option)}</option>`).join('');
+    if (selected !== '' && Number(selected) < pollCorrect.options.length - 1) pollCorrect.value = selected;
+}
+
+function startPoll() {
+    const question = pollQuestion.value.trim();
+    const options = pollOptionLines();
+    if (!question || options.length < 2) {
+        showNotification('질문과 선택지 2개 이상을 입력해주세요', 'warning');
+        return;
+    }
+    socket.emit('create_poll', {
+        question,
+        options,
+        correct_option: pollCorrect.value === '' ? null : Number(pollCorrect.value)
+    });
+}
+
+function renderPollBars(container, poll) {
+    const total = poll.total || 0;
+    container.innerHTML = poll.options.map((option, i) => {
+        const count = poll.counts[i] || 0;
+        const percent = total ? Math.round(count * 100 / total) : 0;
+        const correct = poll.correct_option === i;
+        return `
+            <div class="mb-1">
+                <div class="d-flex justify-content-between small">
+                    <span>${i + 1}. ${escapeHtml(option)}${correct ? ' <i class="fas fa-check text-success"></i>' : ''}</span>
+                    <span>${count}명 (${percent}%)</span>
+                </div>
+                <div class="progress poll-bar">
+                    <div class="progress-bar ${correct ? 'bg-success' : ''}" style="width: ${percent}%"></div>
+                </div>
+            </div>`;
+    }).join('');
+}
+
+function renderPoll() {
+    const poll = currentPoll;
+    pollForm.style.display = poll ? 'none' : '';
+    pollLive.style.display = poll ? '' : 'none';
+    if (!poll) {
+        pollStatus.textContent = '대기';
+        return;
+    }
+    pollStatus.textContent = poll.closed ? '마감' : (poll.is_quiz ? '퀴즈 진행 중' : '투표 진행 중');
+    document.getElementById('pollLiveQuestion').textContent = poll.question;
+    renderPollBars(pollTally, poll);
+    pollTotal.textContent = `응답 ${poll.total || 0}명 / 접속 ${connectedStudents.size}명`;
+    closePollBtn.style.display = poll.closed ? 'none' : '';
+    newPollBtn.style.display = poll.closed ? '' : 'none';
+}
+
+socket.on('create_poll_result', function (data) {
+    if (data.status !== 'success') {
+        showNotification(data.message || '투표를 시작하지 못했습니다', 'warning');
+        return;
+    }
+    currentPoll = data.poll;
+    pollQuestion.value = '';
+    pollOptions.value = '';
+    updatePollCorrectOptions();
+    renderPoll();
+});
+
+socket.on('poll_state', function (poll) {
+    currentPoll = poll;
+    renderPoll();
+});
+
+socket.on('poll_tally', function (tally) {
+    if (!currentPoll || currentPoll.poll_id !== tally.poll_id || currentPoll.closed) return;
+    currentPoll.counts = tally.counts;
+    currentPoll.total = tally.total;
+    renderPoll();
+});
+
+socket.on('close_poll_result', function (data) {
+    if (data.status !== 'success') {
+        showNotification(data.message || '투표를 마감하지 못했습니다', 'warning');
+        return;
+    }
+    currentPoll = data.poll;
+    renderPoll();
+    if (!data.saved) showNotification('결과 저장에 실패했습니다', 'warning');
+    if (document.getElementById('pollHistory').open) socket.emit('get_poll_results');
+});
+
+socket.on('poll_results', function (data) {
+    const list = document.getElementById('pollHistoryList');
+    const items = data.polls || [];
+    if (items.length === 0) {
+        list.innerHTML = '<p class="text-muted mb-0">저장된 결과가 없습니다.</p>';
+        return;
+    }
+    list.replaceChildren(...items.map(poll => {
+        const el = document.createElement('div');
+        el.className = 'border-bottom pb-2 mb-2';
+        el.innerHTML = `<div class="d-flex justify-content-between"><strong>${escapeHtml(poll.question)}</strong>
+            <span class="text-muted">${escapeHtml(poll.closed_at || '')}</span></div><div></div>`;
+        renderPollBars(el.lastElementChild, poll);
+        return el;
+    }));
+});
@@ -0,0 +1,160 @@
+// 목록 렌더링 도우미 (교사 대시보드, /benchmark/lists 에서 사용)
+//
+// VirtualList: 스크롤 영역에 보이는 행(+ 여유분)만 DOM에 두는 가상 목록.
+//  - 행은 key로 재사용하고, 항목 객체가 바뀐 행만 다시 그린다 (같은 객체면 손대지 않음)
+//  - setItems / refresh 는 requestAnimationFrame 한 번으로 모아서 그린다
+//  - 행 높이는 처음엔 추정값을 쓰고, 그려진 뒤 실제 높이를 재서 기억한다
+class VirtualList {
+    constructor(container, options) {
+        this.container = container;
+        this.key = options.key;
+        this.render = options.render;          // item -> Element
+        this.emptyHtml = options.emptyHtml || '';
+        this.estimate = options.estimate || 60;
+        this.overscan = options.overscan ?? 5;
+        this.gap = options.gap ?? 8;
+        this.items = [];
+        this.heights = new Map();              // key -> 측정한 높이(px, gap 포함)
+        this.rows = new Map();                 // key -> { el, item, top }
+        this.stale = new Set();                // refresh()로 다시 그릴 key
+        this.staleAll = false;
+        this.frame = 0;
+        this.renderCount = 0;                  // 벤치마크용: 새로 그린 행 수
+
+        container.classList.add('virtual-list');
+        this.spacer = document.createElement('div');
+        this.spacer.className = 'virtual-list-spacer';
+        this.empty = document.createElement('div');
+        this.empty.innerHTML = this.emptyHtml;
+        container.replaceChildren(this.spacer);
+        container.addEventListener('scroll', () => this.schedule(), { passive: true });
+        if (window.ResizeObserver) {
+            new ResizeObserver(() => this.schedule()).observe(container);
+        }
+    }
+
+    setItems(items) {
+        this.items = items;
+        this.schedule();
+    }
+
+    // 항목 객체는 그대로지만 표시 상태(선택 등)가 바뀌었을 때: keys 생략 시 보이는 행 전체
+    refresh(keys) {
+        if (keys) keys.forEach(k => this.stale.add(String(k)));
+        else this.staleAll = true;
+        this.schedule();
+    }
+
+    schedule() {
+        if (this.frame) return;
+        this.frame = requestAnimationFrame(() => {
+            this.frame = 0;
+            this.flush();
+        });
+    }
+
+    heightOf(key) {
+        return this.heights.get(key) || this.estimate;
+    }
+
+    flush() {
+        const items = this.items;
+        if (items.length === 0) {
+            this.rows.forEach(row => row.el.remove());
+            this.rows.clear();
+            this.spacer.style.height = '0px';
+            if (!this.empty.isConnected) this.container.appendChild(this.empty);
+            return;
+        }
+        if (this.empty.isConnected) this.empty.remove();
+
+        // 1) 보이는 구간 계산 (추정/측정 높이 누적)
+        const viewTop = this.container.scrollTop;
+        const viewBottom = viewTop + (this.container.clientHeight || this.estimate * 10);
+        const keys = items.map(item => String(this.key(item)));
+        let top = 0;
+        let start = -1;
+        let end = items.length;
+        for (let i = 0; i < items.length; i++) {
+            const h = this.heightOf(keys[i]);
+            if (start < 0 && top + h > viewTop) start = i;
+            if (top > viewBottom) { end = i; break; }
+            top += h;
+        }
+        if (start < 0) start = Math.max(0, items.length - 1);
+        start = Math.max(0, start - this.overscan);
+        end = Math.min(items.length, end + this.overscan);
+
+        // 2) 구간 밖 행 제거, 안쪽 행은 재사용하거나 새로 그림 (DOM 쓰기만)
+        const visible = new Set(keys.slice(start, end));
+        this.rows.forEach((row, key) => {
+            if (!visible.has(key)) { row.el.remove(); this.rows.delete(key); }
+        });
+        const measure = [];
+        for (let i = start; i < end; i++) {
+            const key = keys[i];
+            const item = items[i];
+            let row = this.rows.get(key);
+            if (!row) {
+                const el = document.createElement('div');
+                el.className = 'virtual-list-row';
+                el.style.paddingBottom = `${this.gap}px`;
+                row = { el, item: null, top: -1 };
+                this.rows.set(key, row);
+                this.container.appendChild(el);
+            }
+            if (row.item !== item || this.staleAll || this.stale.has(key)) {
+                row.el.replaceChildren(this.render(item));
+                row.item = item;
+                this.renderCount++;
+                measure.push(key);
+            } else if (!this.heights.has(key)) {
+                measure.push(key);  // 숨겨진 상태(모달 닫힘 등)에서 그려져 아직 못 잰 행
+            }
+        }
+        this.stale.clear();
+        this.staleAll = false;
+
+        // 3) 새로 그린 행 높이 측정 (읽기를 한곳에 모아 레이아웃 1회)
+        measure.forEach(key => {
+            const height = this.rows.get(key).el.offsetHeight;
+            if (height) this.heights.set(key, height);
+            else this.heights.delete(key);
+        });
+
+        // 4) 위치 지정 (쓰기)
+        top = 0;
+        for (let i = 0; i < items.length; i++) {
+            if (i >= start && i < end) {
+                const row = this.rows.get(keys[i]);
+                if (row.top !== top) {
+                    row.el.style.transform = `translateY(${top}px)`;
+                    row.top = top;
+                }
+            }
+            top += this.heightOf(keys[i]);
+        }
+        this.spacer.style.height = `${top}px`;
+    }
+}
+
+// 짧은 목록용: key가 같은 자식은 재사용하고 바뀐 항목만 다시 그려 순서를 맞춤
+function syncKeyedList(container, items, key, render) {
+    const previous = container._keyedRows || new Map();
+    const next = new Map();
+    items.forEach((item, index) => {
+        const k = String(key(item));
+        let row = previous.get(k);
+        if (!row || row.item !== item) {
+            const el = render(item);
+            if (row) row.el.replaceWith(el);
+            row = { el, item };
+        }
+        next.set(k, row);
+        if (container.children[index] !== row.el) {
+            container.insertBefore(row.el, container.children[index] || null);
+        }
+    });
+    previous.forEach((row, k) => { if (!next.has(k)) row.el.remove(); });
+    container._keyedRows = next;
+}
@@ -0,0 +1,151 @@
+// 서비스 워커 - /sw.js 요청 때 서버가 생성 (빌드된 자산 목록이 바뀌면 버전도 바뀜)
+const CACHE_PREFIX = 'student-message-';
+const CACHE_NAME = CACHE_PREFIX + {{ version|tojson }};
+const APP_SHELL = {{ shell|tojson }};
+const ASSET_PREFIX = {{ asset_prefix|tojson }};
+const PRECACHE_URLS = {{ precache|tojson }};
+
+// 설치 이벤트: 앱 셸과 해시 파일명 자산을 미리 캐시
+self.addEventListener('install', event => {
+  event.waitUntil(
+    caches.open(CACHE_NAME)
+      .then(cache => cache.addAll([APP_SHELL, ...PRECACHE_URLS]))
+      .then(() => self.skipWaiting())
+      .catch(error => {
+        console.log('캐시 설치 오류:', error);
+      })
+  );
+});
+
+// 활성화 이벤트: 이전 버전 캐시 삭제
+self.addEventListener('activate', event => {
+  event.waitUntil(
+    caches.keys()
+      .then(cacheNames => Promise.all(
+        cacheNames
+          .filter(cacheName => cacheName.startsWith(CACHE_PREFIX) && cacheName !== CACHE_NAME)
+          .map(cacheName => {
+            console.log('오래된 캐시 삭제:', cacheName);
+            return caches.delete(cacheName);
+          })
+      ))
+      .then(() => self.clients.claim())
+  );
+});
+
+function isCacheable(response) {
+  return response && response.status === 200 && response.type === 'basic';
+}
+
+// 정적 자산: 캐시 우선 (해시 파일명이라 내용이 바뀌면 주소가 바뀜)
+function cacheFirst(request) {
+  return caches.match(request).then(cached => {
+    if (cached) {
+      return cached;
+    }
+    return fetch(request).then(response => {
+      if (isCacheable(response)) {
+        const responseToCache = response.clone();
+        caches.open(CACHE_NAME).then(cache => cache.put(request, responseToCache));
+      }
+      return response;
+    });
+  });
+}
+
+// 앱 셸: 캐시를 바로 보여주고 뒤에서 새 버전으로 갱신 (다음 실행 때 반영)
+function staleWhileRevalidate(event, cacheKey) {
+  const network = fetch(event.request)
+    .then(response => {
+      if (isCacheable(response)) {
+        const responseToCache = response.clone();
+        caches.open(CACHE_NAME).then(cache => cache.put(cacheKey, responseToCache));
+      }
+      return response;
+    });
+  event.waitUntil(network.catch(() => { }));
+  return caches.match(cacheKey).then(cached => cached || network);
+}
+
+// 패치 이벤트 (네트워크 요청 처리)
+self.addEventListener('fetch', event => {
+  const request = event.request;
+  if (request.method !== 'GET') {
+    return;
+  }
+  const url = new URL(request.url);
+  // 다른 출처, 소켓, 교사/관리 페이지와 API는 네트워크만 사용
+  if (url.origin !== self.location.origin) {
+    return;
+  }
+  if (url.pathname.startsWith(ASSET_PREFIX)) {
+    event.respondWith(cacheFirst(request));
+  } else if (url.pathname === APP_SHELL) {
+    event.respondWith(staleWhileRevalidate(event, APP_SHELL));
+  } else if (url.pathname.startsWith('/static/')) {
+    // 해시가 없는 /static/ 파일(아이콘, 빌드 전 JS)은 주소가 그대로라 뒤에서 갱신
+    event.respondWith(staleWhileRevalidate(event, request));
+  }
+});
+
+// 푸시 알림 처리
+self.addEventListener('push', event => {
+  if (event.data) {
+    const data = event.data.json();
+    const options = {
+      body: data.message,
+      icon: '/static/images/icon-192x192.png',
+      badge: '/static/images/icon-192x192.png',
+      vibrate: [100, 50, 100],
+      data: {
+        dateOfArrival: Date.now(),
+        primaryKey: 1
+      },
+      actions: [
+        {
+          action: 'explore',
+          title: '확인',
+          icon: '/static/images/checkmark.png'
+        },
+        {
+          action: 'close',
+          title: '닫기',
+          icon: '/static/images/xmark.png'
+        }
+      ]
+    };
+    
+    event.waitUntil(
+      self.registration.showNotification(data.title || '새 메시지', options)
+    );
+  }
+});
+
+// 알림 클릭 처리
+self.addEventListener('notificationclick', event => {
+  event.notification.close();
+  
+  if (event.action === 'explore') {
+    // 앱 열기
+    event.waitUntil(
+      clients.openWindow('/student')
+    );
+  }
+});
+
+// 백그라운드 동기화 (온라인 복귀 시)
+self.addEventListener('sync', event => {
+  if (event.tag === 'background-sync') {
+    event.waitUntil(
+      // 백그라운드에서 할 작업 (예: 메시지 동기화)
+      console.log('백그라운드 동기화 수행')
+    );
+  }
+});
+
+// 메시지 처리 (메인 스레드와 통신)
+self.addEventListener('message', event => {
+  if (event.data && event.data.type === 'SKIP_WAITING') {
+    self.skipWaiting();
+  }
+});
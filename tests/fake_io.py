@@ -0,0 +1,216 @@
+"""DB와 소켓 서버 없이 main의 공용 소켓 핸들러를 실행하는 가짜 입출력
+
+FakeDB는 SQL에 들어 있는 문자열로 고른 응답 행을 돌려주고, 실행한 문장/커밋/반납과 서버의 emit/방 참여/sleep/
+백그라운드 작업을 한 log에 순서대로 남긴다. SyncStack은 main.EventIO + main.drive()(gevent 스택),
+AsyncStack은 asgi.AsyncEventIO + asgi.drive_async()(asyncio 스택)로 같은 핸들러를 실행한다.
+백그라운드 작업은 바로 실행하지 않고 쌓아 두었다가 drain()에서 차례로 끝까지 돌린다 (sleep은 기록만 한다).
+"""
+import asyncio
+import collections
+import os
+import sys
+import types
+
+from psycopg import pq
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import admission  # noqa: E402
+import delivery_trace  # noqa: E402
+import main  # noqa: E402
+import polls  # noqa: E402
+
+
+class FakeDB:
+    """rules: (SQL에 들어 있는 문자열, 응답 행 목록 또는 params -> 행 목록). 처음 맞는 규칙을 쓰고 없으면 빈 결과."""
+
+    def __init__(self, *rules):
+        self.rules = list(rules)
+        self.log = []
+
+    def respond(self, query, params):
+        text = query if isinstance(query, str) else query.as_string()
+        text = ' '.join(text.split())
+        self.log.append(('sql', text, params))
+        for pattern, rows in self.rules:
+            if pattern in text:
+                return list(rows(params) if callable(rows) else rows)
+        return []
+
+    def statements(self, pattern):
+        """pattern이 들어 있는 문장의 params 목록"""
+        return [entry[2] for entry in self.log if entry[0] == 'sql' and pattern in entry[1]]
+
+    def emits(self, event=None):
+        """(event, data, to) 목록"""
+        return [entry[1:4] for entry in self.log if entry[0] == 'emit' and event in (None, entry[1])]
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.results = [[]]
+
+    def execute(self, query, params=None):
+        self.results = [self.conn.db.respond(query, params)]
+        return self.conn.result(self)
+
+    def executemany(self, query, params_seq, returning=False):
+        self.results = [self.conn.db.respond(query, params) for params in params_seq] or [[]]
+        return self.conn.result(None)
+
+    def fetchone(self):
+        rows = self.results[0]
+        return self.conn.result(rows.pop(0) if rows else None)
+
+    def fetchall(self):
+        rows, self.results[0] = self.results[0], []
+        return self.conn.result(rows)
+
+    def nextset(self):
+        if len(self.results) < 2:
+            return None
+        self.results.pop(0)
+        return True
+
+
+class FakeConnection:
+    """asynchronous면 AsyncConnection처럼 커서/연결 메서드가 코루틴을 돌려준다"""
+
+    def __init__(self, db, asynchronous=False):
+        self.db = db
+        self.asynchronous = asynchronous
+        self.info = types.SimpleNamespace(transaction_status=pq.TransactionStatus.IDLE)
+
+    def result(self, value):
+        if not self.asynchronous:
+            return value
+
+        async def done():
+            return value
+        return done()
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.db.log.append(('commit',))
+        return self.result(None)
+
+    def rollback(self):
+        self.db.log.append(('rollback',))
+        return self.result(None)
+
+    def close(self):
+        self.db.log.append(('release',))
+
+
+class FakePool:
+    def __init__(self, db):
+        self.db = db
+
+    async def getconn(self):
+        return FakeConnection(self.db, asynchronous=True)
+
+    async def putconn(self, conn):
+        self.db.log.append(('release',))
+
+
+class FakeSocketIO:
+    """Flask-SocketIO 서버 대신 (EventIO가 쓰는 emit/sleep/start_background_task와 server.enter_room/disconnect)"""
+
+    def __init__(self, log, tasks):
+        self.log = log
+        self.tasks = tasks
+        self.server = self
+
+    def emit(self, event, data=None, to=None, skip_sid=None):
+        self.log.append(('emit', event, data, to, skip_sid))
+
+    def enter_room(self, sid, room, namespace=None):
+        self.log.append(('enter_room', sid, room))
+
+    def disconnect(self, sid, namespace=None):
+        self.log.append(('disconnect', sid))
+
+    def sleep(self, seconds):
+        self.log.append(('sleep', seconds))
+
+    def start_background_task(self, target, *args):
+        self.log.append(('background', args[0].__name__))
+        self.tasks.append((target, args))
+
+
+class FakeAsyncServer(FakeSocketIO):
+    """socketio.AsyncServer 대신: emit/disconnect/sleep은 코루틴, enter_room/start_background_task는 동기"""
+
+    async def emit(self, event, data=None, to=None, skip_sid=None):
+        super().emit(event, data, to, skip_sid)
+
+    async def disconnect(self, sid, namespace=None):
+        super().disconnect(sid)
+
+    async def sleep(self, seconds):
+        super().sleep(seconds)
+
+
+class SyncStack:
+    name = 'gevent'
+
+    def __init__(self, db, monkeypatch):
+        self.db = db
+        self.tasks = []
+        self.server = FakeSocketIO(db.log, self.tasks)
+        monkeypatch.setattr(main, 'get_db', lambda: FakeConnection(db))
+
+    def call(self, sid, handler, *args):
+        return main.drive(handler(main.EventIO(self.server, sid), *args))
+
+    def drain(self):
+        while self.tasks:
+            target, args = self.tasks.pop(0)
+            target(*args)
+
+
+class AsyncStack:
+    name = 'asgi'
+
+    def __init__(self, db, monkeypatch):
+        import asgi
+        self.asgi = asgi
+        self.db = db
+        self.tasks = []
+        self.server = FakeAsyncServer(db.log, self.tasks)
+        self.pool = FakePool(db)
+
+    def call(self, sid, handler, *args):
+        return asyncio.run(self.asgi.drive_async(handler(self.asgi.AsyncEventIO(self.server, self.pool, sid), *args)))
+
+    def drain(self):
+        while self.tasks:
+            target, args = self.tasks.pop(0)
+            asyncio.run(target(*args))
+
+
+STACKS = (SyncStack, AsyncStack)
+
+
+def reset_state(monkeypatch):
+    """main의 접속 상태/캐시를 비우고, 실행마다 달라지는 값(시각, 세션 토큰, 추적 표본)을 고정한다"""
+    for name, value in (('teachers', {}), ('students', {}), ('teacher_settings', {}),
+                        ('recent_client_keys', collections.OrderedDict()), ('student_reply_windows', {}),
+                        ('preview_requests', {}), ('pending_presence', {}), ('presence_flush_scheduled', False),
+                        ('poll_tally_pushers', set())):
+        monkeypatch.setattr(main, name, value)
+    monkeypatch.setattr(main, 'now_kst_str', lambda: '2026-01-01 09:00:00')
+    monkeypatch.setattr(main, 'issue_session_token', lambda info: f'token-{info.student_id}')
+    monkeypatch.setattr(polls, 'active_polls', {})
+    monkeypatch.setattr(admission, 'JOIN_RATE', 0)
+    monkeypatch.setattr(delivery_trace, 'DEFAULT_SAMPLE_RATE', 0.0)
+    monkeypatch.setattr(delivery_trace, 'sample_rates', {})
+    monkeypatch.setattr(delivery_trace, 'open_traces', collections.OrderedDict())
+
+
+def handler(event):
+    return dict(main.socket_handlers)[event]
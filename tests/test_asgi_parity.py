@@ -0,0 +1,391 @@
+"""gevent 스택(main.py)과 asyncio 스택(asgi.py)이 같은 이벤트를 같은 결과로 처리하는지 확인
+
+- asgi.create_app()이 main.socket_handlers를 그대로 등록하고, Flask 라우트의 socketio(MainSocketBridge)가
+  main.py가 socketio에서 쓰는 메서드를 모두 갖췄는지 (DB 없이 확인)
+- DB 계층을 가짜(fake_io)로 바꿔 같은 핸들러를 두 실행기(main.drive, asgi.drive_async)로 돌리고, 실행한 SQL/커밋/
+  연결 반납과 emit/방 참여/백그라운드 작업이 순서까지 같은지 (DB 없이 확인)
+- DATABASE_URL이 있으면 두 서버를 자식 프로세스로 띄워 같은 시나리오(명단 가져오기, 전송, 일괄 전송,
+  학생 보관함 전송, 일괄 삭제 미리보기/삭제, 관리자 공지)를 돌리고, 클라이언트마다 받은 이벤트를 단계별로 비교한다.
+  id/시각/sid처럼 실행마다 달라지는 값은 비교 전에 지운다.
+"""
+import asyncio
+import inspect
+import itertools
+import json
+import os
+import re
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from http.cookiejar import CookieJar
+
+import pytest
+
+import fake_io
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STEP_WAIT = 0.8  # 단계마다 이벤트가 다 도착하기를 기다리는 시간 (STUDENT_REPLY_WINDOW, 미리보기 지연보다 길게)
+ADMIN_TOKEN = 'parity-' + secrets.token_hex(8)
+PASSWORD = 'parity-pw'
+# 실행마다 달라지는 값: 비교에서 뺀다
+VOLATILE_KEYS = {'id', 'message_id', 'student_id', 'timestamp', 'trace_id', 'sid', 'session_token', 'joined_at',
+                 'connected_at', 'last_seen', 'teacher_code', 'client_key', 'socket_id'}
+ID_MAPS = {'accepted', 'duplicates'}  # client_key -> message id
+
+
+def test_asgi_registers_main_handlers():
+    import asgi
+    import main
+    sio = asgi.create_app().engineio_server
+    registered = sio.handlers['/']
+    assert set(registered) == {event for event, _ in main.socket_handlers}
+    # 래퍼(메트릭, 앱 컨텍스트, 실행기)를 벗기면 main의 핸들러 그 자체다
+    for event, handler in main.socket_handlers:
+        assert inspect.unwrap(registered[event]) is handler, event
+
+
+def test_bridge_covers_main_socketio_surface():
+    import asgi
+    import main
+    sio = asgi.create_app().engineio_server
+    # Flask 라우트(/teacher/roster, /admin/broadcast)의 socketio.emit이 Flask-SocketIO가 아닌 AsyncServer로 간다
+    bridge = sio.flask_app.extensions['socketio']
+    assert isinstance(bridge, asgi.MainSocketBridge)
+    with open(os.path.join(ROOT, 'main.py'), encoding='utf-8') as f:
+        used = set(re.findall(r'\bsocketio\.(\w+)\(', f.read()))
+    # route_io()의 EventIO도 emit/sleep/start_background_task만 서버로 넘긴다
+    used |= {'emit', 'sleep', 'start_background_task'}
+    assert not {name for name in used if not callable(getattr(bridge, name, None))}
+
+
+def test_bridge_runs_route_calls_on_the_server():
+    import asgi
+    import flask
+    log, tasks = [], []
+    server = fake_io.FakeAsyncServer(log, tasks)
+    bridge = asgi.MainSocketBridge(server)
+    server.flask_app = flask.Flask('bridge-test')
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    try:
+        bridge.loop = loop
+        # WSGI 스레드의 emit은 서버의 이벤트 루프에서 실행된다
+        bridge.emit('receive_message', {'message': '공지'}, to='students_T1').result(5)
+        assert log == [('emit', 'receive_message', {'message': '공지'}, 'students_T1', None)]
+
+        seen = []
+        bridge.start_background_task(lambda value: seen.append((flask.current_app.name, value)), 1).join(5)
+        assert seen == [('bridge-test', 1)]
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+
+
+def parity_db():
+    ids = itertools.count(101)
+    return fake_io.FakeDB(
+        ('FROM teacher_settings', [(True,)]),
+        ('FROM students WHERE teacher_code', [('1', '나래', 8, 's-gone', '2026-01-01 08:00:00')]),
+        ('FROM classes cl', [('1', '1반', 2)]),
+        ('SELECT teacher_name FROM teachers', [('교사',)]),
+        ('FROM class_students WHERE teacher_code = %s AND student_name', [('1',)]),
+        ('INSERT INTO student_identities', [(7,)]),
+        ('FROM student_identities', [(8, '나래')]),
+        ('INSERT INTO message_client_keys', lambda params: [(key, None, True) for key in params[1]]),
+        ('INSERT INTO messages', lambda params: [(next(ids),)]),
+        ('SELECT teacher_code FROM messages WHERE id', [('T1',)]),
+        ("SELECT id FROM messages WHERE teacher_code = %s AND sender_type = 'teacher'", [(101,), (102,)]),
+        ('FROM message_daily_counts', [(2,)]),
+        ("recipient_type = 'teacher' ORDER BY id DESC LIMIT 100", [(104, '가람', '질문', '2026-01-01 09:00:00', 7)]),
+    )
+
+
+PARITY_STEPS = [
+    ('t1', 'connect', None),
+    ('t1', 'teacher_join', {'teacher_code': 'T1', 'teacher_name': '교사'}),
+    ('s1', 'connect', None),
+    ('s1', 'student_join', {'teacher_code': 'T1', 'student_name': '가람'}),
+    'drain',
+    ('t1', 'send_message', {'sender_type': 'teacher', 'teacher_code': 'T1', 'message': '전체', 'recipients': ['all'],
+                            'client_key': 'k1'}),
+    ('t1', 'send_message', {'sender_type': 'teacher', 'teacher_code': 'T1', 'message': '나래에게',
+                            'recipients': ['나래'], 'is_manual_recipient': True}),
+    ('t1', 'send_message_batch', {'items': [{'recipients': ['s1'], 'message': '가람에게'}]}),
+    # 창이 열린 동안 온 보관함 전송은 drain(창이 닫힘)에서 한 번에 저장된다
+    ('s1', 'send_message', {'sender_type': 'student', 'teacher_code': 'T1', 'student_name': '가람', 'message': '질문',
+                            'client_key': 'k2'}),
+    ('s1', 'send_messages_batch', {'messages': [{'client_key': 'k3', 'message': '보관1'}, {'client_key': 'k4', 'message': '보관2'}]}),
+    'drain',
+    ('t1', 'get_teacher_messages', {}),
+    ('t1', 'get_bulk_delete_preview', {'filter_type': 'all'}),
+    'drain',
+    ('t1', 'get_bulk_delete_preview', {'filter_type': 'all'}),
+    ('t1', 'cancel_bulk_delete_preview', None),
+    'drain',
+    ('t1', 'delete_message_teacher', {'message_id': 101}),
+    ('t1', 'bulk_delete_messages', {'filter_type': 'all'}),
+    ('t1', 'kick_student', {'student_socket_id': 's1'}),
+    ('s1', 'disconnect'),
+    ('t1', 'disconnect'),
+]
+
+
+def run_parity_steps(stack):
+    for step in PARITY_STEPS:
+        if step == 'drain':
+            stack.drain()
+            continue
+        sid, event, *args = step
+        stack.db.log.append(('event', sid, event))
+        stack.call(sid, fake_io.handler(event), *args)
+    stack.drain()
+
+
+@pytest.mark.parametrize('first', [stack.name for stack in fake_io.STACKS])
+def test_handlers_match_on_both_stacks_with_fake_db(monkeypatch, first):
+    import main
+    logs = {}
+    for stack_class in sorted(fake_io.STACKS, key=lambda stack: stack.name != first):
+        fake_io.reset_state(monkeypatch)
+        monkeypatch.setattr(main, 'STUDENT_REPLY_WINDOW', 0.2)
+        db = parity_db()
+        stack = stack_class(db, monkeypatch)
+        run_parity_steps(stack)
+        logs[stack.name] = db.log
+    assert logs['gevent'] == logs['asgi']
+
+    # 양쪽이 똑같이 아무 일도 안 한 것이 아닌지
+    db = fake_io.FakeDB()
+    db.log = logs['asgi']
+    assert db.emits('student_join_success')[0][2] == 's1'
+    assert db.emits('receive_message')[0][2] == 'students_T1'
+    assert [data for _, data, _ in db.emits('new_messages_from_students')] == [{'messages': [
+        {'id': 105, 'student_id': 7, 'student_name': '가람', 'message': '보관1', 'timestamp': '2026-01-01 09:00:00'},
+        {'id': 106, 'student_id': 7, 'student_name': '가람', 'message': '보관2', 'timestamp': '2026-01-01 09:00:00'},
+    ]}]
+    assert [data for _, data, _ in db.emits('bulk_delete_preview')] == [{'count': 2}]  # 취소된 미리보기는 답하지 않는다
+    assert db.emits('bulk_delete_result')[0][1] == {'status': 'success', 'deleted_count': 2}
+    assert ('disconnect', 's1') in logs['asgi']
+    assert logs['asgi'].count(('commit',)) > 5
+
+
+needs_db = pytest.mark.skipif(not os.environ.get('DATABASE_URL'), reason='DATABASE_URL is not set')
+
+
+@needs_db
+def test_scenario_matches_on_both_stacks():
+    pytest.importorskip('aiohttp')  # socketio.AsyncClient
+    pytest.importorskip('uvicorn')
+    results = {}
+    for stack in ('gevent', 'asgi'):
+        with run_server(stack) as url:
+            results[stack] = asyncio.run(scenario(url, create_teacher()))
+    assert [step for step, _ in results['gevent']] == [step for step, _ in results['asgi']]
+    for (step, gevent_events), (_, asgi_events) in zip(results['gevent'], results['asgi']):
+        assert gevent_events == asgi_events, step
+    # 양쪽이 똑같이 아무것도 못 받은 것이 아닌지: 옮긴 이벤트와 Flask 라우트의 emit이 실제로 도착했다
+    received = {step: events for step, events in results['asgi']}
+    assert 'class_list_update' in received['roster']['teacher'][0]
+    for step in ('send_messages_batch', 'send_message_batch', 'get_bulk_delete_preview', 'bulk_delete_messages',
+                 'admin broadcast'):
+        assert received[step]['teacher'] or received[step]['나래'], step
+    assert not received['cancel_bulk_delete_preview']['teacher']  # 취소된 미리보기는 답하지 않는다
+
+
+# ---- 서버 ----
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class run_server:
+    def __init__(self, stack):
+        self.stack = stack
+        self.port = free_port()
+
+    def __enter__(self):
+        env = dict(os.environ, PYTHONPATH=ROOT, PORT=str(self.port), ADMIN_TOKEN=ADMIN_TOKEN, STUDENT_REPLY_WINDOW='0.2')
+        if self.stack == 'gevent':
+            command = [sys.executable, 'main.py']
+        else:
+            command = [sys.executable, '-m', 'uvicorn', '--factory', 'asgi:create_app', '--port', str(self.port),
+                       '--log-level', 'warning']
+        self.proc = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        url = f'http://127.0.0.1:{self.port}'
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                urllib.request.urlopen(url + '/metrics', timeout=1).read()
+                return url
+            except OSError:
+                if self.proc.poll() is not None:
+                    raise RuntimeError(self.proc.stderr.read().decode())
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError(f'{self.stack} server did not start')
+
+    def __exit__(self, *exc):
+        self.proc.terminate()
+        try:
+            self.proc.wait(10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+def create_teacher():
+    """시나리오마다 새 교사 (다른 실행과 기록이 섞이지 않도록)"""
+    import psycopg
+    from werkzeug.security import generate_password_hash
+    code = f'{secrets.randbelow(900000) + 100000}'
+    with psycopg.connect(os.environ['DATABASE_URL'], sslmode=os.environ.get('DB_SSLMODE', 'prefer')) as conn:
+        conn.execute(
+            'INSERT INTO teachers (teacher_code, teacher_name, password_hash) VALUES (%s, %s, %s)',
+            (code, '비교교사', generate_password_hash(PASSWORD))
+        )
+    return code
+
+
+# ---- 시나리오 ----
+
+def normalize(value):
+    if isinstance(value, dict):
+        return {
+            key: '*' if key in VOLATILE_KEYS else dict.fromkeys(item, '*') if key in ID_MAPS else normalize(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [normalize(item) for item in value]
+    return value
+
+
+class Recorder:
+    def __init__(self):
+        self.events = {}
+
+    def client(self, name):
+        import socketio
+        sio = socketio.AsyncClient(reconnection=False)
+        self.events[name] = []
+
+        @sio.on('*')
+        async def record(event, data=None):
+            self.events[name].append(json.dumps([event, normalize(data)], ensure_ascii=False, sort_keys=True))
+        return sio
+
+    def take(self):
+        taken = {name: sorted(events) for name, events in self.events.items()}
+        for events in self.events.values():
+            events.clear()
+        return taken
+
+
+def http(opener, url, data=None, headers=None):
+    request = urllib.request.Request(url, data=data, headers=headers or {})
+    try:
+        with opener.open(request) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+async def scenario(url, teacher_code):
+    recorder = Recorder()
+    steps = []
+
+    async def step(name):
+        await asyncio.sleep(STEP_WAIT)
+        steps.append((name, recorder.take()))
+
+    teacher = recorder.client('teacher')
+    await teacher.connect(url, transports=['websocket'])
+    await teacher.emit('teacher_join', {'teacher_code': teacher_code, 'teacher_name': '비교교사'})
+    await step('teacher_join')
+    # 이벤트는 서로 다른 태스크에서 처리되므로 참여가 끝난 뒤에 설정을 바꾼다
+    await teacher.emit('teacher_toggle_receive', {'teacher_code': teacher_code, 'allow': True})
+    await teacher.emit('set_trace_sample_rate', {'rate': 0})  # 표본 추출은 무작위라 끈다
+    await step('teacher settings')
+
+    # 명단 가져오기: Flask 라우트에서 class_list_update를 보낸다
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+    login = urllib.parse.urlencode({'teacher_code': teacher_code, 'password': PASSWORD}).encode()
+    await asyncio.to_thread(http, opener, url + '/teacher/login', login)
+    roster = urllib.parse.urlencode({'roster_text': '1,가람\n1,나래\n2,다온'}).encode()
+    status, _ = await asyncio.to_thread(http, opener, url + '/teacher/roster', roster)
+    steps.append(('roster_status', {'http': [status]}))
+    await step('roster')
+
+    students = {}
+    for name, class_number in (('가람', '1'), ('나래', '1')):
+        students[name] = recorder.client(name)
+        await students[name].connect(url, transports=['websocket'])
+        await students[name].emit('student_join', {'teacher_code': teacher_code, 'student_name': name,
+                                                   'class_number': class_number})
+        await step(f'student_join {name}')
+    garam, narae = students['가람'], students['나래']
+
+    await teacher.emit('send_message', {'sender_type': 'teacher', 'teacher_code': teacher_code, 'message': '전체',
+                                        'recipients': ['all'], 'client_key': uuid.uuid4().hex})
+    await step('send_message all')
+    await teacher.emit('send_message', {'sender_type': 'teacher', 'teacher_code': teacher_code, 'message': '오타',
+                                        'recipients': ['없는학생'], 'is_manual_recipient': True})
+    await step('send_message unknown name')
+
+    # 키는 결과 dict의 키로도 돌아오므로 고정값을 쓴다 (교사가 실행마다 새로 만들어져 겹치지 않는다)
+    key = 'parity-student'
+    student_message = {'sender_type': 'student', 'teacher_code': teacher_code, 'student_name': '가람',
+                       'message': '질문', 'client_key': key}
+    await garam.emit('send_message', student_message)
+    await step('student send_message')
+    await garam.emit('send_message', student_message)
+    await step('student send_message duplicate')
+
+    keys = ['parity-1', 'parity-2']
+    await narae.emit('send_messages_batch', {'messages': [
+        {'client_key': keys[0], 'message': '보관1'}, {'client_key': keys[1], 'message': '보관2'},
+        {'client_key': keys[0], 'message': '보관1 다시'}, {'message': '키 없음'},
+    ]})
+    await step('send_messages_batch')
+    await narae.emit('send_messages_batch', {'messages': [{'client_key': keys[1], 'message': '보관2'}]})
+    await step('send_messages_batch duplicate')
+
+    await teacher.emit('send_message_batch', {'items': [
+        {'recipients': [garam.get_sid('/')], 'message': '가람에게'},
+        {'recipients': ['나래'], 'message': '나래에게', 'is_manual_recipient': True},
+    ]})
+    await step('send_message_batch')
+    await teacher.emit('send_message_batch', {'items': [
+        {'recipients': ['없는학생'], 'message': '오타', 'is_manual_recipient': True},
+    ]})
+    await step('send_message_batch unknown name')
+    await teacher.emit('send_message_batch', {'items': []})
+    await step('send_message_batch empty')
+
+    await teacher.emit('get_bulk_delete_preview', {'filter_type': 'all'})
+    await step('get_bulk_delete_preview')
+    await teacher.emit('get_bulk_delete_preview', {'filter_type': 'all'})
+    await teacher.emit('cancel_bulk_delete_preview')
+    await step('cancel_bulk_delete_preview')
+    await teacher.emit('bulk_delete_messages', {'filter_type': 'all'})
+    await step('bulk_delete_messages')
+    await teacher.emit('bulk_delete_messages', {'filter_type': 'all'})
+    await step('bulk_delete_messages nothing left')
+
+    # 관리자 공지: Flask 라우트에서 receive_message를 보낸다
+    body = json.dumps({'scope': 'teacher', 'teacher_code': teacher_code, 'message': '공지'}).encode()
+    status, _ = await asyncio.to_thread(http, opener, url + '/admin/broadcast', body, {
+        'Content-Type': 'application/json', 'Authorization': f'Bearer {ADMIN_TOKEN}'})
+    steps.append(('broadcast_status', {'http': [status]}))
+    await step('admin broadcast')
+
+    for client in (teacher, garam, narae):
+        await client.disconnect()
+    return steps
@@ -0,0 +1,233 @@
+"""첨부 업로드/저장/전송 (attachments.py, main.py의 /uploads, /files)
+
+- 나눠 올리기와 끊긴 뒤 이어 올리기, 같은 내용의 중복 저장, 썸네일 (파일 시스템만, DB 없이)
+- gevent 패치된 프로세스에서 finalize가 허브 스레드가 아닌 스레드 풀에서 도는지 (자식 프로세스)
+- /files는 서명된 key가 있어야 보내고, ETag/Range/private 캐시 (DB 계층은 fake_io로 대신)
+- sha256으로 올리기를 건너뛰는 것은 같은 교사가 올린 파일만 (DB 계층 가짜 + DATABASE_URL이 있으면 실제 쿼리)
+"""
+import hashlib
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+
+import fake_io
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import attachments  # noqa: E402
+import main  # noqa: E402
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(attachments, 'ATTACHMENT_DIR', str(tmp_path))
+    monkeypatch.setattr(attachments, 'UPLOAD_CHUNK_SIZE', 4)
+    return tmp_path
+
+
+def upload_bytes(data, teacher_code='T1', name='a.txt'):
+    upload = attachments.create_upload(teacher_code, name, len(data))
+    offset = 0
+    while offset < len(data):
+        chunk = data[offset:offset + attachments.UPLOAD_CHUNK_SIZE]
+        offset = attachments.write_chunk(upload, offset, io.BytesIO(chunk), len(chunk))
+    return attachments.finalize(attachments.get_upload(upload['upload_id'], teacher_code))
+
+
+def png_bytes(size=(640, 480)):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_chunked_upload_resumes_from_received_offset(upload_dir):
+    data = b'0123456789'
+    upload = attachments.create_upload('T1', '../학습지.txt', len(data))
+    assert upload['name'] == '학습지.txt'
+    assert attachments.write_chunk(upload, 0, io.BytesIO(data[:4]), 4) == 4
+    # 조각이 중간에 끊김: 받은 만큼만 남는다
+    assert attachments.write_chunk(upload, 4, io.BytesIO(data[4:6]), 4) == 6
+
+    resumed = attachments.get_upload(upload['upload_id'], 'T1')
+    assert resumed['offset'] == 6
+    with pytest.raises(attachments.UploadError) as error:
+        attachments.write_chunk(resumed, 4, io.BytesIO(data[4:8]), 4)
+    assert (error.value.status, error.value.offset) == (409, 6)
+    with pytest.raises(attachments.UploadError) as error:
+        attachments.get_upload(upload['upload_id'], 'T2')  # 다른 교사의 업로드는 보이지 않는다
+    assert error.value.status == 404
+
+    assert attachments.write_chunk(resumed, 6, io.BytesIO(data[6:]), 4) == len(data)
+    meta = attachments.finalize(attachments.get_upload(upload['upload_id'], 'T1'))
+    assert meta['id'] == hashlib.sha256(data).hexdigest()
+    assert meta['size'] == len(data) and meta['uploaded_by'] == 'T1'
+    with open(attachments.object_path(meta['id']), 'rb') as f:
+        assert f.read() == data
+    assert os.listdir(upload_dir / 'partial') == []
+
+
+def test_same_content_is_stored_once(upload_dir):
+    before = attachments.stored_files.values.get(('deduplicated',), 0)
+    first = upload_bytes(b'same worksheet', 'T1')
+    second = upload_bytes(b'same worksheet', 'T2', 'copy.txt')
+    assert first['id'] == second['id']
+    assert second['uploaded_by'] == 'T2'  # 소유 기록은 교사마다 (attachments.save)
+    assert os.listdir(upload_dir / 'objects' / first['id'][:2]) == [first['id']]
+    assert attachments.stored_files.values[('deduplicated',)] == before + 1
+
+
+def test_image_upload_gets_thumbnail(upload_dir):
+    pytest.importorskip('PIL')
+    meta = upload_bytes(png_bytes(), name='photo.png')
+    assert (meta['content_type'], meta['width'], meta['height'], meta['has_thumbnail']) == ('image/png', 640, 480, True)
+    from PIL import Image
+    with Image.open(attachments.thumbnail_path(meta['id'])) as thumb:
+        assert thumb.format == 'JPEG'
+        assert max(thumb.size) == attachments.THUMBNAIL_SIZE
+
+    # 이름만 .png인 파일은 이미지로 보내지 않는다
+    fake = upload_bytes(b'not an image', name='fake.png')
+    assert (fake['content_type'], fake['has_thumbnail']) == ('application/octet-stream', False)
+
+
+def test_finalize_runs_off_the_gevent_hub(tmp_path):
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), 'finalize_thread'],
+        cwd=ROOT, capture_output=True, text=True, timeout=60,
+        env={**os.environ, 'PYTHONPATH': ROOT, 'ATTACHMENT_DIR': str(tmp_path)})
+    assert proc.returncode == 0, proc.stderr
+    hub_thread, finalize_thread = proc.stdout.split()
+    assert hub_thread != finalize_thread
+
+
+# ---- 라우트 ----
+
+@pytest.fixture
+def client(upload_dir, monkeypatch):
+    fake_io.reset_state(monkeypatch)
+    app = main.create_app({'TESTING': True}, setup_db=False, background=False)
+    main.attachment_content_type.cache_clear()
+    yield app.test_client()
+    main.attachment_content_type.cache_clear()
+
+
+def stored_attachment(monkeypatch, data, content_type):
+    meta = upload_bytes(data, name='file')
+    db = fake_io.FakeDB(('SELECT content_type FROM attachments', [(content_type,)]))
+    monkeypatch.setattr(main, 'get_db', lambda: fake_io.FakeConnection(db))
+    return meta['id']
+
+
+def key_for(client, attachment_id):
+    with client.application.app_context():
+        return main.with_attachment_keys([{'id': attachment_id}])[0]['key']
+
+
+def test_files_need_signed_key(client, monkeypatch):
+    attachment_id = stored_attachment(monkeypatch, b'secret worksheet', 'text/plain')
+    assert client.get(f'/files/{attachment_id}').status_code == 403
+    assert client.get(f'/files/{attachment_id}?key=forged').status_code == 403
+    other = hashlib.sha256(b'other').hexdigest()
+    assert client.get(f'/files/{attachment_id}?key={key_for(client, other)}').status_code == 403
+    assert client.get(f'/files/{attachment_id}/thumb').status_code == 403
+
+    response = client.get(f'/files/{attachment_id}?key={key_for(client, attachment_id)}&name=w.txt')
+    assert response.status_code == 200
+    assert response.data == b'secret worksheet'
+    assert response.headers['Cache-Control'] == f'private, max-age={main.ATTACHMENT_MAX_AGE}'
+    assert 'attachment' in response.headers['Content-Disposition']
+
+
+def test_files_support_etag_and_range(client, monkeypatch):
+    data = bytes(range(256)) * 4
+    attachment_id = stored_attachment(monkeypatch, data, 'application/pdf')
+    url = f'/files/{attachment_id}?key={key_for(client, attachment_id)}'
+
+    response = client.get(url)
+    assert response.headers['ETag'] == f'"{attachment_id}"'
+    assert client.get(url, headers={'If-None-Match': f'"{attachment_id}"'}).status_code == 304
+
+    response = client.get(url, headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(data)}'
+    assert response.data == data[100:200]
+
+
+def test_thumbnail_uses_the_same_key(client, monkeypatch):
+    pytest.importorskip('PIL')
+    attachment_id = stored_attachment(monkeypatch, png_bytes(), 'image/png')
+    response = client.get(f'/files/{attachment_id}/thumb?key={key_for(client, attachment_id)}')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    assert response.headers['Cache-Control'].startswith('private')
+    assert response.headers['ETag'] == f'"{attachment_id}-thumb"'
+
+
+def test_known_sha256_skips_upload_only_for_the_owner(client, monkeypatch):
+    attachment_id = stored_attachment(monkeypatch, b'owned by T1', 'text/plain')
+    db = fake_io.FakeDB((
+        'JOIN attachment_owners',
+        lambda params: [(attachment_id, 11, 'text/plain', False)] if params[0] == 'T1' else [],
+    ))
+    monkeypatch.setattr(main, 'get_db', lambda: fake_io.FakeConnection(db))
+    body = {'name': 'w.txt', 'size': 11, 'sha256': attachment_id}
+
+    for teacher_code, complete in (('T2', False), ('T1', True)):
+        with client.session_transaction() as sess:
+            sess['teacher_code'] = teacher_code
+        result = client.post('/uploads', json=body).get_json()
+        assert result['complete'] is complete, teacher_code
+    assert result['attachment']['key'] == key_for(client, attachment_id)
+    assert [params[0] for params in db.statements('JOIN attachment_owners')] == ['T2', 'T1']
+
+
+needs_db = pytest.mark.skipif(not os.environ.get('DATABASE_URL'), reason='DATABASE_URL is not set')
+
+
+@needs_db
+def test_attachment_owners_limit_select():
+    main.init_db()
+    meta = {'id': hashlib.sha256(os.urandom(16)).hexdigest(), 'size': 3, 'content_type': 'text/plain', 'width': None,
+            'height': None, 'has_thumbnail': False, 'uploaded_by': 'T1'}
+    conn = main.get_db()
+    try:
+        c = conn.cursor()
+        attachments.save(c, meta)
+        attachments.save(c, dict(meta, uploaded_by='T3'))  # 같은 내용을 다른 교사가 올림
+        found = {}
+        for teacher_code in ('T1', 'T2', 'T3'):
+            attachments.select(c, [meta['id']], teacher_code)
+            found[teacher_code] = [row[0] for row in c.fetchall()]
+        conn.rollback()
+    finally:
+        conn.close()
+    assert found == {'T1': [meta['id']], 'T2': [], 'T3': [meta['id']]}
+
+
+def child(case):
+    # finalize_thread: 허브 스레드와 describe(해시 뒤 썸네일 단계)를 실행한 스레드의 id를 출력
+    from gevent import monkey
+    monkey.patch_all()
+    import attachments
+
+    get_ident = monkey.get_original('threading', 'get_ident')
+    seen = []
+    describe = attachments.describe
+
+    def recording_describe(*args):
+        seen.append(get_ident())
+        return describe(*args)
+    attachments.describe = recording_describe
+    upload = attachments.create_upload('T1', 'a.txt', 3)
+    attachments.write_chunk(upload, 0, io.BytesIO(b'abc'), 3)
+    attachments.finalize(attachments.get_upload(upload['upload_id'], 'T1'))
+    print(get_ident(), seen[0])
+
+
+if __name__ == '__main__':
+    child(sys.argv[1])
@@ -0,0 +1,150 @@
+"""일괄 삭제 미리보기와 일별 집계 (main.get_bulk_delete_preview, count_bulk_delete_targets, message_rollups)
+
+- 미리보기는 지연 뒤 마지막 요청만 계산해 보내고, 취소하면 보내지 않는다 (DB 계층은 fake_io로 대신)
+- 수신자 필터는 이름 부분 일치가 아니라 이름으로 찾은 학생 id로 센다
+- DATABASE_URL이 있으면 저장/삭제할 때 message_daily_counts가 함께 바뀌는지
+"""
+import os
+import sys
+
+import pytest
+
+import fake_io
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import identities  # noqa: E402
+import main  # noqa: E402
+import message_rollups  # noqa: E402
+import sessions  # noqa: E402
+
+
+def preview_db():
+    return fake_io.FakeDB(
+        ('FROM message_daily_counts', [(12,)]),
+        ('FROM student_identities', lambda params: [(7, '가람'), (9, '가람')] if params[1] == ['가람'] else []),
+        ('FROM messages', lambda params: [(len(params[1]) * 2,)]),
+    )
+
+
+@pytest.fixture
+def stack(monkeypatch):
+    fake_io.reset_state(monkeypatch)
+    main.teachers['t1'] = sessions.TeacherSession('T1', '교사', 't1')
+    return fake_io.SyncStack(preview_db(), monkeypatch)
+
+
+def preview(stack, data):
+    stack.call('t1', fake_io.handler('get_bulk_delete_preview'), data)
+
+
+def previews(db):
+    return [data['count'] for _, data, _ in db.emits('bulk_delete_preview')]
+
+
+def test_preview_sends_only_the_latest_request(stack):
+    preview(stack, {'filter_type': 'recipient', 'recipient_name': '가'})
+    preview(stack, {'filter_type': 'recipient', 'recipient_name': '가람'})
+    preview(stack, {'filter_type': 'all'})
+    stack.drain()
+    assert previews(stack.db) == [12]
+    # 앞의 두 요청은 지연 뒤 아무 쿼리도 하지 않는다
+    assert stack.db.statements('FROM student_identities') == []
+    assert stack.db.statements('FROM message_daily_counts') == [['T1', 'teacher']]
+
+
+def test_cancel_drops_pending_preview(stack):
+    preview(stack, {'filter_type': 'all'})
+    stack.call('t1', fake_io.handler('cancel_bulk_delete_preview'))
+    stack.drain()
+    assert previews(stack.db) == []
+    assert stack.db.statements('FROM message_daily_counts') == []
+
+
+def test_recipient_preview_counts_by_student_id(stack):
+    preview(stack, {'filter_type': 'recipient', 'recipient_name': '가람'})
+    stack.drain()
+    assert previews(stack.db) == [4]
+    [params] = stack.db.statements('recipient_student_ids &&')
+    assert params == ('T1', [7, 9])
+    assert stack.db.statements('LIKE') == []
+
+
+def test_unknown_recipient_previews_zero_without_counting(stack):
+    preview(stack, {'filter_type': 'recipient', 'recipient_name': '없음'})
+    stack.drain()
+    assert previews(stack.db) == [0]
+    assert stack.db.statements('SELECT COUNT(*) FROM messages') == []
+
+
+needs_db = pytest.mark.skipif(not os.environ.get('DATABASE_URL'), reason='DATABASE_URL is not set')
+
+
+def rollup_total(teacher_code, direction):
+    conn = main.get_db()
+    try:
+        c = conn.cursor()
+        message_rollups.count_messages(c, teacher_code, direction)
+        return c.fetchone()[0]
+    finally:
+        conn.close()
+
+
+@needs_db
+def test_rollups_follow_saves_and_deletes():
+    main.init_db()
+    teacher_code = 'B29001'
+    conn = main.get_db()
+    try:
+        c = conn.cursor()
+        c.execute('DELETE FROM messages WHERE teacher_code = %s', (teacher_code,))
+        c.execute('DELETE FROM message_daily_counts WHERE teacher_code = %s', (teacher_code,))
+        c.execute('DELETE FROM student_identities WHERE teacher_code = %s', (teacher_code,))
+        student_ids = {}
+        for class_number, name in (('1', '가람'), ('2', '가람'), ('1', '가람이')):
+            identities.issue(c, teacher_code, class_number, name)
+            student_ids[class_number, name] = c.fetchone()[0]
+        conn.commit()
+    finally:
+        conn.close()
+
+    io = main.EventIO(None)
+    server = fake_io.FakeSocketIO([], [])
+    try:
+        saved = [main.drive(main.save_message_multi_teacher(io, teacher_code, 'teacher', 'student', recipients, text))
+                 for recipients, text in (([(student_ids['1', '가람'], '가람')], '1반 가람'),
+                                          ([(student_ids['2', '가람'], '가람')], '2반 가람'),
+                                          ([(student_ids['1', '가람이'], '가람이')], '가람이'),
+                                          (None, '전체'))]
+        main.drive(main.save_student_messages(io, teacher_code, [
+            ((student_ids['1', '가람'], '가람'), None, '질문'),
+        ]))
+        counts = [(rollup_total(teacher_code, 'teacher'), rollup_total(teacher_code, 'student'))]
+
+        # 수신자 '가람'은 두 반의 가람만 (예전 LIKE는 '가람이'도 셌다)
+        recipient = {'filter_type': 'recipient', 'recipient_name': '가람'}
+        previewed = main.drive(main.count_bulk_delete_targets(io, teacher_code, recipient))
+        deleted = main.drive(main.delete_messages_bulk(io, teacher_code, recipient))
+        counts.append((rollup_total(teacher_code, 'teacher'), rollup_total(teacher_code, 'student')))
+
+        main.teachers['b1'] = sessions.TeacherSession(teacher_code, '교사', 'b1')
+        main.drive(main.delete_message_teacher(main.EventIO(server, 'b1'), {'message_id': saved[2][0]}))
+        counts.append((rollup_total(teacher_code, 'teacher'), rollup_total(teacher_code, 'student')))
+        all_count = main.drive(main.count_bulk_delete_targets(io, teacher_code, {'filter_type': 'all'}))
+    finally:
+        main.teachers.pop('b1', None)
+        conn = main.get_db()
+        try:
+            c = conn.cursor()
+            c.execute('DELETE FROM messages WHERE teacher_code = %s', (teacher_code,))
+            c.execute('DELETE FROM message_daily_counts WHERE teacher_code = %s', (teacher_code,))
+            c.execute('DELETE FROM student_identities WHERE teacher_code = %s', (teacher_code,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    assert previewed == 2
+    assert sorted(deleted) == sorted(message_id for message_id, _ in saved[:2])
+    assert counts == [(4, 1), (2, 1), (1, 1)]
+    assert all_count == 1
@@ -0,0 +1,133 @@
+"""DB 대기가 gevent 허브를 막지 않는지 확인하는 회귀 테스트 (db_io.py)
+
+gevent 패치는 프로세스 전체에 걸리므로 각 경우를 자식 프로세스에서 돌린다:
+    python tests/test_db_io.py <case>
+자식은 psycopg를 패치 전에 import해 (wait_c가 골라지는 상황) 50ms 티커 그린렛을 돌리면서 느린 대기를 하고,
+틱 사이 최대 간격(초)을 마지막 줄에 출력한다.
+"""
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SLOW = 1.0  # pg_sleep 대신 기다릴 시간
+TICK = 0.05
+MAX_GAP = 0.5  # 허브가 막히면 SLOW 가까이 벌어진다
+
+
+def run_case(case, **env):
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), case],
+        cwd=ROOT, capture_output=True, text=True, timeout=60,
+        env={**os.environ, 'PYTHONPATH': ROOT, **env})
+    assert proc.returncode == 0, proc.stderr
+    return proc.stdout.split()
+
+
+def test_wait_in_thread_keeps_ticking():
+    gap, = map(float, run_case('thread'))
+    assert gap < MAX_GAP
+
+
+def test_patched_wait_keeps_ticking():
+    gap, = map(float, run_case('gevent'))
+    assert gap < MAX_GAP
+
+
+def test_wait_c_blocks_hub():
+    # 대조군: 고치기 전 동작(허브 스레드에서 wait_c)이 실제로 틱을 멈추는지 확인해 위 두 테스트가 의미 있게 한다
+    gap, = map(float, run_case('blocking'))
+    assert gap > SLOW * 0.8
+
+
+needs_db = pytest.mark.skipif(not os.environ.get('DATABASE_URL'), reason='DATABASE_URL is not set')
+
+
+@needs_db
+def test_tracked_connection_pg_sleep_keeps_ticking():
+    gap, = map(float, run_case('pg_sleep', DB_IO_MODE='threads'))
+    assert gap < MAX_GAP
+
+
+@needs_db
+def test_tracked_connection_cancels_interrupted_query():
+    elapsed, status = run_case('cancel', DB_IO_MODE='threads')
+    assert float(elapsed) < 3  # pg_sleep(10)을 끝까지 기다리지 않음
+    assert status != 'ACTIVE'  # 서버에서 취소돼 연결을 다시 쓸 수 있다
+
+
+# ---- 자식 프로세스 ----
+
+def slow_query(fileno):
+    """pg_sleep 대신: fd가 읽을 수 있게 될 때까지 Wait.R을 내는 psycopg 생성기"""
+    from psycopg import waiting
+    ready = yield waiting.Wait.R
+    while not ready:
+        ready = yield waiting.Wait.R
+    return os.read(fileno, 1)
+
+
+def slow_pipe():
+    # 네이티브 프로세스가 SLOW초 뒤에 쓰므로 gevent와 무관하게 블로킹 대기가 된다
+    return subprocess.Popen(['sh', '-c', f'sleep {SLOW}; printf x'], stdout=subprocess.PIPE)
+
+
+def measure(work):
+    import gevent
+    ticks = []
+
+    def ticker():
+        while True:
+            ticks.append(time.perf_counter())
+            gevent.sleep(TICK)
+
+    t = gevent.spawn(ticker)
+    gevent.sleep(TICK)
+    result = work()
+    gevent.sleep(TICK)
+    t.kill()
+    print(max(b - a for a, b in zip(ticks, ticks[1:])))
+    return result
+
+
+def child(case):
+    from psycopg import waiting  # 패치 전에 import (문제가 되는 상황)
+    from gevent import monkey
+    monkey.patch_all()
+    import db_io
+
+    if case in ('thread', 'gevent', 'blocking'):
+        db_io.install()
+        proc = slow_pipe()
+        fileno = proc.stdout.fileno()
+        if case == 'thread':
+            measure(lambda: db_io.wait_in_thread(slow_query(fileno), fileno))
+        elif case == 'gevent':
+            measure(lambda: waiting.wait(slow_query(fileno), fileno))
+        else:
+            measure(lambda: waiting.wait_c(slow_query(fileno), fileno))
+        proc.wait()
+        return
+
+    import gevent
+    import psycopg
+    import main
+    assert db_io.mode == 'threads'
+    conn = main.get_db()
+    try:
+        if case == 'pg_sleep':
+            measure(lambda: conn.execute('SELECT pg_sleep(%s)', (SLOW,)).fetchone())
+        elif case == 'cancel':
+            started = time.perf_counter()
+            with gevent.Timeout(0.3, False):  # 쿼리를 기다리던 그린렛이 중단된다
+                conn.execute('SELECT pg_sleep(10)')
+            print(round(time.perf_counter() - started, 3), psycopg.pq.TransactionStatus(conn.pgconn.transaction_status).name)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    child(sys.argv[1])
@@ -0,0 +1,109 @@
+"""교사 → 학생 전달 추적 (delivery_trace.py, main.on_message_receipt)
+
+- 샘플링 비율과 대상이 없는 메시지
+- 확인은 대상 소켓에서 온 첫 확인만 세고, 모두 확인하면 마감, 창이 지나면 일부 확인으로 마감
+- 교사가 보낸 메시지의 trace를 다른 학생 소켓이 확인해도 세지 않는지 (DB 계층은 fake_io로 대신)
+"""
+import collections
+import os
+import sys
+
+import pytest
+
+import fake_io
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import delivery_trace  # noqa: E402
+import main  # noqa: E402
+import sessions  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """delivery_trace.now_ms를 고정한다 (clock[0]을 바꿔 시간을 보낸다)"""
+    now = [1_000_000]
+    monkeypatch.setattr(delivery_trace, 'now_ms', lambda: now[0])
+    monkeypatch.setattr(delivery_trace, 'sample_rates', {})
+    monkeypatch.setattr(delivery_trace, 'open_traces', collections.OrderedDict())
+    monkeypatch.setattr(delivery_trace, 'latency_samples', {})
+    monkeypatch.setattr(delivery_trace, 'ack_ratio_samples', {})
+    monkeypatch.setattr(delivery_trace, 'DEFAULT_SAMPLE_RATE', 1.0)
+    return now
+
+
+def ratios(teacher_code='T1'):
+    return list(delivery_trace.ack_ratio_samples.get(teacher_code, ()))
+
+
+def test_sampling(clock):
+    assert delivery_trace.start('T1', 1, 0, 0, []) is None  # 받을 소켓이 없으면 추적하지 않는다
+    trace = delivery_trace.start('T1', 1, 10, 20, ['s1'])
+    assert trace['received'] == 10 and trace['persisted'] == 20 and trace['emitted'] == clock[0]
+    assert list(delivery_trace.open_traces) == [trace['id']]
+
+    assert delivery_trace.set_sample_rate('T1', 5) == 1.0
+    assert delivery_trace.set_sample_rate('T2', -1) == 0.0
+    assert delivery_trace.start('T2', 2, 0, 0, ['s1']) is None
+    assert delivery_trace.summary('T2')['sample_rate'] == 0.0
+
+
+def test_ack_counts_only_expected_sids_once(clock):
+    trace_id = delivery_trace.start('T1', 1, 0, 0, ['s1', 's2'])['id']
+    clock[0] += 40
+    assert delivery_trace.ack(trace_id, 's3') is None  # 이 메시지를 받지 않은 소켓
+    assert delivery_trace.ack('unknown', 's1') is None
+    assert delivery_trace.ack(trace_id, 's1') == 0.04
+    assert delivery_trace.ack(trace_id, 's1') is None  # 같은 소켓의 두 번째 확인
+    assert trace_id in delivery_trace.open_traces and ratios() == []
+
+    clock[0] += 60
+    assert delivery_trace.ack(trace_id, 's2') == 0.1
+    assert trace_id not in delivery_trace.open_traces
+    assert ratios() == [1.0]
+    summary = delivery_trace.summary('T1')
+    assert (summary['receipts'], summary['p50_ms'], summary['max_ms'], summary['ack_percent']) == (2, 40, 100, 100.0)
+
+
+def test_unacknowledged_traces_finish_after_window(clock):
+    first = delivery_trace.start('T1', 1, 0, 0, ['s1', 's2', 's3', 's4'])['id']
+    delivery_trace.ack(first, 's1')
+    delivery_trace.ack(first, 'other')
+    clock[0] += delivery_trace.TRACE_WINDOW_SECONDS * 1000 - 1
+    second = delivery_trace.start('T1', 2, 0, 0, ['s1'])['id']
+    assert list(delivery_trace.open_traces) == [first, second]
+
+    clock[0] += 1
+    assert delivery_trace.summary('T1')['pending_traces'] == 1
+    assert ratios() == [0.25]
+    assert delivery_trace.ack(first, 's2') is None  # 마감된 추적
+
+
+def test_open_traces_are_bounded(clock, monkeypatch):
+    monkeypatch.setattr(delivery_trace, 'MAX_OPEN_TRACES', 2)
+    ids = [delivery_trace.start('T1', n, 0, 0, ['s1'])['id'] for n in range(3)]
+    assert list(delivery_trace.open_traces) == ids[1:]
+    assert ratios() == [0.0]
+
+
+def test_receipt_from_another_student_is_ignored(clock, monkeypatch):
+    fake_io.reset_state(monkeypatch)
+    monkeypatch.setattr(delivery_trace, 'DEFAULT_SAMPLE_RATE', 1.0)
+    stack = fake_io.SyncStack(fake_io.FakeDB(('INSERT INTO messages', [(301,)])), monkeypatch)
+    main.teachers['t1'] = sessions.TeacherSession('T1', '교사', 't1')
+    main.students['s1'] = sessions.StudentSession('T1', '1', '가람', 's1', '교사', 7)
+    main.students['s2'] = sessions.StudentSession('T1', '1', '나래', 's2', '교사', 8)
+
+    stack.call('t1', fake_io.handler('send_message'),
+               {'sender_type': 'teacher', 'teacher_code': 'T1', 'recipients': ['s1'], 'message': '가람에게만'})
+    [(_, payload, to)] = stack.db.emits('receive_message')
+    assert to == 's1'
+    trace_id = payload['trace']['id']
+
+    receipt = fake_io.handler('message_receipt')
+    stack.call('s2', receipt, {'trace_id': trace_id, 'message_id': 301})
+    assert trace_id in delivery_trace.open_traces and ratios() == []
+    stack.call('s1', receipt, {'trace_id': trace_id, 'message_id': 301})
+    assert trace_id not in delivery_trace.open_traces
+    assert ratios() == [1.0]
@@ -0,0 +1,165 @@
+"""월 파티션 생성, 기본 파티션 비우기, 보관/복원 (message_partitions.py)
+
+실제 messages 테이블을 쓰므로 DATABASE_URL이 있어야 한다. 운영 데이터와 겹치지 않도록 2001년 월과
+테스트용 교사 코드만 쓰고, 끝나면 만든 파티션과 집계 행을 지운다.
+"""
+import gzip
+import os
+import sys
+from datetime import date
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+pytestmark = pytest.mark.skipif(not os.environ.get('DATABASE_URL'), reason='DATABASE_URL is not set')
+
+TEACHER = 'ptest'
+MONTHS = [date(2001, 1, 1), date(2001, 2, 1)]
+
+
+@pytest.fixture
+def conn():
+    import psycopg
+    import main
+    import message_partitions as mp
+    with psycopg.connect(os.environ['DATABASE_URL'], sslmode=os.environ.get('DB_SSLMODE', 'prefer')) as conn:
+        c = conn.cursor()
+        c.execute("SELECT to_regclass('messages') IS NULL")
+        if c.fetchone()[0]:
+            conn.commit()
+            main.init_db()
+        conn.commit()
+        cleanup(conn)
+        yield conn
+        conn.rollback()
+        cleanup(conn)
+
+
+def cleanup(conn):
+    import message_partitions as mp
+    c = conn.cursor()
+    mp.lock(c)
+    for month in MONTHS:
+        c.execute(f'DROP TABLE IF EXISTS {mp.partition_name(month)}')
+    c.execute('DELETE FROM messages_default WHERE teacher_code = %s', (TEACHER,))
+    c.execute('DELETE FROM message_daily_counts WHERE teacher_code = %s', (TEACHER,))
+    conn.commit()
+
+
+def insert(conn, timestamp, message):
+    import message_rollups
+    c = conn.cursor()
+    c.execute(
+        '''INSERT INTO messages (teacher_code, sender_type, sender_id, recipient_type, recipient_id, message, timestamp)
+           VALUES (%s, 'teacher', %s, 'student', 'all', %s, %s) RETURNING id''',
+        (TEACHER, TEACHER, message, timestamp)
+    )
+    msg_id = c.fetchone()[0]
+    c.execute(
+        message_rollups.UPSERT_SQL.format(source='VALUES (%s, %s::date, %s, 1)'),
+        (TEACHER, timestamp, 'teacher')
+    )
+    conn.commit()
+    return msg_id
+
+
+def partition_of(conn, msg_id):
+    c = conn.cursor()
+    c.execute('SELECT tableoid::regclass::text FROM messages WHERE id = %s', (msg_id,))
+    row = c.fetchone()
+    return row and row[0]
+
+
+def rollup_count(conn):
+    import message_rollups
+    c = conn.cursor()
+    message_rollups.count_messages(c, TEACHER, 'teacher', '2001-01-01', '2001-12-31')
+    return int(c.fetchone()[0])
+
+
+def test_create_partition_routes_rows(conn):
+    import message_partitions as mp
+    c = conn.cursor()
+    mp.lock(c)
+    mp.create_partition(c, MONTHS[0])
+    conn.commit()
+    msg_id = insert(conn, '2001-01-15 10:00:00', 'january')
+    assert partition_of(conn, msg_id) == mp.partition_name(MONTHS[0])
+    assert (mp.partition_name(MONTHS[0]), MONTHS[0]) in mp.list_partitions(conn.cursor())
+
+
+def test_drain_moves_default_rows_into_month_partition(conn):
+    import message_partitions as mp
+    msg_id = insert(conn, '2001-02-03 09:00:00', 'no partition yet')
+    assert partition_of(conn, msg_id) == mp.DEFAULT_PARTITION
+
+    c = conn.cursor()
+    mp.lock(c)
+    assert MONTHS[1] in mp.drain_default_partition(c)
+    conn.commit()
+    assert partition_of(conn, msg_id) == mp.partition_name(MONTHS[1])
+
+
+def test_archive_and_restore_round_trip(conn, tmp_path):
+    import message_partitions as mp
+    c = conn.cursor()
+    mp.lock(c)
+    mp.create_partition(c, MONTHS[0])
+    conn.commit()
+    ids = [insert(conn, f'2001-01-{day:02d} 12:00:00', f'message {day}') for day in (1, 10, 31)]
+    assert rollup_count(conn) == 3
+
+    path = mp.archive_partition(conn, MONTHS[0], str(tmp_path))
+    assert path == mp.archive_path(str(tmp_path), MONTHS[0])
+    assert os.listdir(tmp_path) == [os.path.basename(path)]  # 임시 파일이 남지 않는다
+    with gzip.open(path, 'rt') as f:
+        lines = f.read().splitlines()
+    assert lines[0].split(',') == list(mp.MESSAGE_COLUMNS)
+    assert len(lines) == 4
+    assert all(partition_of(conn, msg_id) is None for msg_id in ids)
+    assert rollup_count(conn) == 0
+    assert mp.partition_name(MONTHS[0]) not in [name for name, _ in mp.list_partitions(conn.cursor())]
+
+    mp.restore_partition(conn, MONTHS[0], str(tmp_path))
+    assert all(partition_of(conn, msg_id) == mp.partition_name(MONTHS[0]) for msg_id in ids)
+    assert rollup_count(conn) == 3
+
+
+def test_archive_publishes_file_only_after_commit(conn, tmp_path):
+    import psycopg
+    import message_partitions as mp
+    c = conn.cursor()
+    mp.lock(c)
+    mp.create_partition(c, MONTHS[0])
+    conn.commit()
+    msg_id = insert(conn, '2001-01-20 08:00:00', 'kept')
+
+    class FailingCommit:
+        def cursor(self):
+            return conn.cursor()
+
+        def commit(self):
+            raise psycopg.OperationalError('commit failed')
+
+    with pytest.raises(psycopg.OperationalError):
+        mp.archive_partition(FailingCommit(), MONTHS[0], str(tmp_path))
+    conn.rollback()
+    assert os.listdir(tmp_path) == []
+    assert partition_of(conn, msg_id) == mp.partition_name(MONTHS[0])  # 분리/삭제도 되돌려졌다
+
+
+def test_expire_without_archive_dir_drops(conn):
+    import message_partitions as mp
+    c = conn.cursor()
+    mp.lock(c)
+    mp.create_partition(c, MONTHS[0])
+    conn.commit()
+    insert(conn, '2001-01-05 08:00:00', 'old')
+
+    today = date.today()
+    retention = (today.year * 12 + today.month) - (2001 * 12 + 2)  # 2001-02 이전 파티션만 만료
+    dropped = mp.expire_partitions(conn, retention, None)
+    assert mp.partition_name(MONTHS[0]) in dropped
+    assert rollup_count(conn) == 0
@@ -0,0 +1,173 @@
+"""학생 → 교사 메시지 저장/전달 (main.on_send_message, send_messages_batch, deliver_student_messages)
+
+- 보낸 학생은 소켓이 참여한 학생(students[sid])이다: 같은 이름의 학생이 있어도 학생 id로 구분해 저장하고,
+  페이로드의 student_name은 쓰지 않는다 (DB 계층은 fake_io로 대신)
+- 교사별 창(STUDENT_REPLY_WINDOW): 창이 닫혀 있을 때 온 메시지는 바로 보내고, 창이 열린 동안 모인 메시지는
+  창이 닫힐 때 new_messages_from_students 한 번으로 보낸다
+- DATABASE_URL이 있으면 sender_student_id가 실제로 저장되고, 이름만 있던 행은 이름이 한 명뿐일 때만 채워지는지
+"""
+import itertools
+import os
+import sys
+
+import pytest
+from psycopg import sql
+
+import fake_io
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import identities  # noqa: E402
+import main  # noqa: E402
+import sessions  # noqa: E402
+
+
+def student_db():
+    ids = itertools.count(201)
+    return fake_io.FakeDB(
+        ('FROM teacher_settings', [(True,)]),
+        ('INSERT INTO message_client_keys', lambda params: [(key, None, True) for key in params[1]]),
+        ('INSERT INTO messages', lambda params: [(next(ids),)]),
+    )
+
+
+@pytest.fixture
+def stack(monkeypatch):
+    fake_io.reset_state(monkeypatch)
+    monkeypatch.setattr(main, 'STUDENT_REPLY_WINDOW', 0)
+    # 1반과 2반에 같은 이름의 학생
+    main.students['s1'] = sessions.StudentSession('T1', '1', '가람', 's1', '교사', 7)
+    main.students['s2'] = sessions.StudentSession('T1', '2', '가람', 's2', '교사', 9)
+    return fake_io.SyncStack(student_db(), monkeypatch)
+
+
+def send(stack, sid, message, **data):
+    stack.call(sid, fake_io.handler('send_message'),
+               dict({'sender_type': 'student', 'teacher_code': 'T1', 'message': message}, **data))
+
+
+def inserted(db):
+    """저장한 (sender_id, sender_student_id, message)"""
+    return [(params[1], params[2], params[4]) for params in db.statements('INSERT INTO messages')]
+
+
+def test_same_name_students_are_stored_by_id(stack):
+    send(stack, 's1', '1반 가람')
+    send(stack, 's2', '2반 가람')
+    assert inserted(stack.db) == [('가람', 7, '1반 가람'), ('가람', 9, '2반 가람')]
+    assert [(data['student_id'], data['student_name']) for _, data, _ in stack.db.emits('new_message_from_student')] == [
+        (7, '가람'), (9, '가람')]
+
+
+def test_payload_name_and_teacher_code_are_ignored(stack):
+    send(stack, 's2', '이름을 바꿔 보냄', student_name='나래', teacher_code='T2')
+    assert inserted(stack.db) == [('가람', 9, '이름을 바꿔 보냄')]
+    [(_, data, room)] = stack.db.emits('new_message_from_student')
+    assert (data['student_name'], room) == ('가람', 'teacher_T1')
+
+
+def test_batch_uses_the_joined_student(stack):
+    stack.call('s2', fake_io.handler('send_messages_batch'),
+               {'student_name': '나래', 'messages': [{'client_key': 'k1', 'message': '보관'}]})
+    assert inserted(stack.db) == [('가람', 9, '보관')]
+
+
+def test_unjoined_socket_cannot_send(stack):
+    send(stack, 's3', '누구?', student_name='가람')
+    assert inserted(stack.db) == []
+    assert stack.db.emits('student_message_error') == [
+        ('student_message_error', {'message': '먼저 교사 코드로 접속해주세요.'}, 's3')]
+
+
+@pytest.fixture
+def windowed(stack, monkeypatch):
+    monkeypatch.setattr(main, 'STUDENT_REPLY_WINDOW', 0.5)
+    return stack
+
+
+def teacher_emits(db):
+    return [(event, data) for event, data, _ in db.emits()
+            if event in ('new_message_from_student', 'new_messages_from_students')]
+
+
+def sent_replies(db):
+    return [(to, data['message_id']) for _, data, to in db.emits('student_message_sent')]
+
+
+def test_isolated_message_is_delivered_immediately(windowed):
+    send(windowed, 's1', '질문 있어요')
+    # 창을 닫는 작업이 돌기 전에 이미 교사에게 갔다
+    assert teacher_emits(windowed.db) == [('new_message_from_student', {
+        'id': 201, 'student_id': 7, 'student_name': '가람', 'message': '질문 있어요', 'timestamp': '2026-01-01 09:00:00'})]
+    assert sent_replies(windowed.db) == [('s1', 201)]
+    windowed.drain()
+    assert len(teacher_emits(windowed.db)) == 1
+    assert main.student_reply_windows == {}
+
+
+def test_burst_is_delivered_as_one_event(windowed):
+    send(windowed, 's1', '첫 질문')
+    send(windowed, 's2', '저도요', client_key='k1')
+    windowed.call('s1', fake_io.handler('send_messages_batch'),
+                  {'messages': [{'client_key': 'k2', 'message': '보관 1'}, {'client_key': 'k3', 'message': '보관 2'}]})
+    send(windowed, 's1', '하나 더')
+    assert len(teacher_emits(windowed.db)) == 1  # 창이 열린 동안은 모아 둔다
+
+    windowed.drain()
+    [first, (event, data)] = teacher_emits(windowed.db)
+    assert event == 'new_messages_from_students'
+    assert [(item['id'], item['student_id'], item['message']) for item in data['messages']] == [
+        (202, 9, '저도요'), (203, 7, '보관 1'), (204, 7, '보관 2'), (205, 7, '하나 더')]
+    # 한 건 전송의 응답은 제 메시지 id (앞의 묶음 전송 결과가 섞이지 않음)
+    assert sent_replies(windowed.db) == [('s1', 201), ('s2', 202), ('s1', 205)]
+    [(_, result, to)] = windowed.db.emits('student_messages_batch_result')
+    assert (to, result['accepted']) == ('s1', {'k2': 203, 'k3': 204})
+    assert len(windowed.db.statements('INSERT INTO messages')) == 5
+    assert main.student_reply_windows == {}
+
+
+needs_db = pytest.mark.skipif(not os.environ.get('DATABASE_URL'), reason='DATABASE_URL is not set')
+
+
+@needs_db
+def test_sender_student_id_is_saved_and_backfilled():
+    main.init_db()
+    teacher_code = 'S50001'
+    conn = main.get_db()
+    try:
+        c = conn.cursor()
+        c.execute('DELETE FROM messages WHERE teacher_code = %s', (teacher_code,))
+        c.execute('DELETE FROM student_identities WHERE teacher_code = %s', (teacher_code,))
+        student_ids = {}
+        for class_number, name in (('1', '가람'), ('2', '가람'), ('1', '나래')):
+            identities.issue(c, teacher_code, class_number, name)
+            student_ids[class_number, name] = c.fetchone()[0]
+        conn.commit()
+
+        saved = main.drive(main.save_student_messages(main.EventIO(None), teacher_code, [
+            ((student_ids['2', '가람'], '가람'), None, '2반 가람'),
+        ]))
+        # 이름만 있던 예전 행: 나래는 한 명이라 채워지고, 가람은 두 명이라 비워 둔다
+        for name in ('가람', '나래'):
+            c.execute(
+                '''INSERT INTO messages (teacher_code, sender_type, sender_id, recipient_type, recipient_id, message)
+                   VALUES (%s, 'student', %s, 'teacher', %s, 'old')''',
+                (teacher_code, name, teacher_code)
+            )
+        identities.backfill_senders(c, sql.Identifier('messages'))
+        c.execute(
+            '''SELECT sender_id, sender_student_id, message FROM messages
+               WHERE teacher_code = %s ORDER BY id''',
+            (teacher_code,)
+        )
+        rows = c.fetchall()
+        c.execute('DELETE FROM messages WHERE teacher_code = %s', (teacher_code,))
+        c.execute('DELETE FROM message_daily_counts WHERE teacher_code = %s', (teacher_code,))
+        c.execute('DELETE FROM student_identities WHERE teacher_code = %s', (teacher_code,))
+        conn.commit()
+    finally:
+        conn.close()
+    assert saved[0][1] is True
+    assert rows == [('가람', student_ids['2', '가람'], '2반 가람'), ('가람', None, 'old'),
+                    ('나래', student_ids['1', '나래'], 'old')]